@@ -14,6 +14,10 @@ from src.api.server import run_server, setup_logging
 
 if __name__ == "__main__":
     import argparse
+    import multiprocessing
+    
+    # 打包后的可执行文件中启动子进程（Embedding 工作进程）需要
+    multiprocessing.freeze_support()
     import socket
     
     def is_port_in_use(port, host='127.0.0.1'):
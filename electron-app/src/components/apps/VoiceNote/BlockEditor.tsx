@@ -1380,73 +1380,62 @@ export const BlockEditor = forwardRef<BlockEditorHandle, BlockEditorProps>(({
         if (!file) continue;
 
         try {
-          // 读取图片为 Base64
-          const reader = new FileReader();
-          reader.onload = async (event) => {
-            const base64Data = event.target?.result as string;
-            
-            // 调用后端 API 保存图片
-            const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:8765';
-            const response = await fetch(`${API_BASE_URL}/api/images/save`, {
-              method: 'POST',
-              headers: {
-                'Content-Type': 'application/json',
-              },
-              body: JSON.stringify({
-                image_data: base64Data,
-              }),
-            });
+          // 以 multipart 直接上传原始文件（后端按内容哈希去重）
+          const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:8765';
+          const formData = new FormData();
+          formData.append('file', file);
+          const response = await fetch(`${API_BASE_URL}/api/images/upload`, {
+            method: 'POST',
+            body: formData,
+          });
 
-            const result = await response.json();
-            
-            if (result.success && result.image_url) {
-              // 创建图片 block
-              const newImageBlock: Block = {
-                id: `block-${Date.now()}-${Math.random()}`,
-                type: 'image',
-                content: '', // 图片块的 content 为空
-                imageUrl: result.image_url,
-              };
-
-              // 在当前光标所在的 block 之后插入图片块
-              setBlocks((prev) => {
-                const updated = [...prev];
-                let insertIndex = updated.length;
-                
-                // 如果有聚焦的 block，在其后面插入
-                const focusedBlockId = focusedBlockIdRef.current;
-                if (focusedBlockId) {
-                  const focusedIndex = updated.findIndex(b => b.id === focusedBlockId);
-                  if (focusedIndex !== -1) {
-                    insertIndex = focusedIndex + 1;
-                  }
-                }
-                
-                // 如果没有找到聚焦的 block，在最后一个非缓冲块之后插入
-                if (insertIndex === updated.length && updated[updated.length - 1]?.isBufferBlock) {
-                  insertIndex = updated.length - 1;
+          const result = await response.json();
+          
+          if (result.success && result.image_url) {
+            // 创建图片 block
+            const newImageBlock: Block = {
+              id: `block-${Date.now()}-${Math.random()}`,
+              type: 'image',
+              content: '', // 图片块的 content 为空
+              imageUrl: result.image_url,
+            };
+
+            // 在当前光标所在的 block 之后插入图片块
+            setBlocks((prev) => {
+              const updated = [...prev];
+              let insertIndex = updated.length;
+              
+              // 如果有聚焦的 block，在其后面插入
+              const focusedBlockId = focusedBlockIdRef.current;
+              if (focusedBlockId) {
+                const focusedIndex = updated.findIndex(b => b.id === focusedBlockId);
+                if (focusedIndex !== -1) {
+                  insertIndex = focusedIndex + 1;
                 }
-                
-                updated.splice(insertIndex, 0, newImageBlock);
-                const result = ensureBottomBufferBlock(updated);
-                
-                // 延迟调用 onContentChange 到下一个事件循环
-                setTimeout(() => {
-                  const content = blocksToContent(result);
-                  onContentChange?.(content, false);
-                }, 0);
-                
-                return result;
-              });
-
-              console.log('[BlockEditor] 图片已插入:', result.image_url);
-            } else {
-              console.error('[BlockEditor] 保存图片失败:', result.message);
-              alert(`保存图片失败: ${result.message}`);
-            }
-          };
+              }
+              
+              // 如果没有找到聚焦的 block，在最后一个非缓冲块之后插入
+              if (insertIndex === updated.length && updated[updated.length - 1]?.isBufferBlock) {
+                insertIndex = updated.length - 1;
+              }
+              
+              updated.splice(insertIndex, 0, newImageBlock);
+              const result = ensureBottomBufferBlock(updated);
+              
+              // 延迟调用 onContentChange 到下一个事件循环
+              setTimeout(() => {
+                const content = blocksToContent(result);
+                onContentChange?.(content, false);
+              }, 0);
+              
+              return result;
+            });
 
-          reader.readAsDataURL(file);
+            console.log('[BlockEditor] 图片已插入:', result.image_url);
+          } else {
+            console.error('[BlockEditor] 保存图片失败:', result.message);
+            alert(`保存图片失败: ${result.message}`);
+          }
         } catch (error) {
           console.error('[BlockEditor] 处理图片粘贴失败:', error);
           alert('处理图片失败，请重试');
@@ -104,6 +104,9 @@ export class AutoSaveService {
   
   private editingItemId: string | null = null;
   
+  // 上次成功保存的块快照（用于计算块级增量）
+  private savedBlocksSnapshot: { recordId: string; blocks: Map<string, string>; order: string[] } | null = null;
+  
   // 回调：当 recordId 首次创建时通知外部
   private onRecordIdCreatedCallback?: (recordId: string) => void;
   
@@ -261,6 +264,40 @@ export class AutoSaveService {
     }
   }
   
+  /**
+   * 记录已保存的块快照
+   */
+  private rememberSavedBlocks(recordId: string, blocks: any[]) {
+    if (!blocks.every((b) => b && b.id)) {
+      this.savedBlocksSnapshot = null;
+      return;
+    }
+    this.savedBlocksSnapshot = {
+      recordId,
+      blocks: new Map(blocks.map((b) => [b.id, JSON.stringify(b)])),
+      order: blocks.map((b) => b.id),
+    };
+  }
+  
+  /**
+   * 计算相对上次保存的块级增量
+   * 无可用快照时返回 null（使用整篇保存）
+   */
+  private buildBlockPatch(recordId: string, blocks: any[]): { upserts: any[]; deletes: string[]; order?: string[] } | null {
+    const snapshot = this.savedBlocksSnapshot;
+    if (!snapshot || snapshot.recordId !== recordId || !blocks.every((b) => b && b.id)) {
+      return null;
+    }
+    
+    const upserts = blocks.filter((b) => snapshot.blocks.get(b.id) !== JSON.stringify(b));
+    const currentIds = new Set(blocks.map((b) => b.id));
+    const deletes = snapshot.order.filter((id) => !currentIds.has(id));
+    const order = blocks.map((b) => b.id);
+    const orderChanged = order.length !== snapshot.order.length || order.some((id, i) => id !== snapshot.order[i]);
+    
+    return orderChanged ? { upserts, deletes, order } : { upserts, deletes };
+  }
+  
   /**
    * 保存到数据库
    */
@@ -324,15 +361,39 @@ export class AutoSaveService {
         
         // 更新或创建记录
         if (this.currentRecordId) {
-          // 更新现有记录
-          const response = await fetch(
-            `http://127.0.0.1:8765/api/records/${this.currentRecordId}`,
-            {
-              method: 'PUT',
-              headers: { 'Content-Type': 'application/json' },
-              body: JSON.stringify(saveData),
+          // 更新现有记录：块文档优先使用块级增量保存，失败时回退为整篇保存
+          const blocks = saveData.metadata?.blocks;
+          const patch = Array.isArray(blocks) ? this.buildBlockPatch(this.currentRecordId, blocks) : null;
+          let response: Response | null = null;
+          let mode: 'patch' | 'full' = 'patch';
+          
+          if (patch) {
+            const { blocks: _blocks, ...restMetadata } = saveData.metadata;
+            response = await fetch(
+              `http://127.0.0.1:8765/api/records/${this.currentRecordId}/blocks`,
+              {
+                method: 'PATCH',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ ...patch, metadata: restMetadata, flush: immediate }),
+              }
+            );
+            if (!response.ok) {
+              console.warn(`[AutoSave-${this.appType}] 增量保存失败（${response.status}），回退为整篇保存`);
+              response = null;
             }
-          );
+          }
+          
+          if (!response) {
+            mode = 'full';
+            response = await fetch(
+              `http://127.0.0.1:8765/api/records/${this.currentRecordId}`,
+              {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(saveData),
+              }
+            );
+          }
           
           const saveEndTime = Date.now();
           const duration = saveEndTime - saveStartTime;
@@ -340,9 +401,13 @@ export class AutoSaveService {
           if (response.ok) {
             console.log(`[AutoSave-${this.appType}] ✅ 更新记录成功`, {
               recordId: this.currentRecordId,
+              mode,
               duration: `${duration}ms`,
               trigger,
             });
+            if (Array.isArray(blocks)) {
+              this.rememberSavedBlocks(this.currentRecordId, blocks);
+            }
             this.resetPeriodicTimer();
           } else {
             const errorResult = await response.json().catch(() => ({}));
@@ -372,6 +437,9 @@ export class AutoSaveService {
               trigger,
             });
             this.currentRecordId = result.record_id;
+            if (Array.isArray(saveData.metadata?.blocks)) {
+              this.rememberSavedBlocks(result.record_id, saveData.metadata.blocks);
+            }
             this.resetPeriodicTimer();
             
             // 通知外部：记录ID已生成
@@ -526,6 +594,7 @@ export class AutoSaveService {
   reset() {
     console.log(`[AutoSave-${this.appType}] 重置会话`);
     this.currentRecordId = null;
+    this.savedBlocksSnapshot = null;
     this.currentSessionId = this.generateSessionId();
     localStorage.removeItem(this.getLocalStorageKey());
   }
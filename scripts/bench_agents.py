@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Agent 接口压测（配合 scripts/llm_stub_server.py 使用，不消耗真实 token）
+
+按逐级增加的并发数请求 API 服务的 LLM 相关接口，统计：
+- 吞吐（成功请求数/秒）
+- 首 token 时间 TTFT（流式请求为收到第一个文本片段的时间，非流式为完整响应时间）
+- 完整响应时间
+- API 服务端事件循环延迟（读取 /api/admin/diagnostics/loop-lag，每个阶段开始前清零）
+
+使用方法：
+    # 1. 启动模拟 LLM 服务，并在 config.yml 中将 llm.base_url 指向它（见 llm_stub_server.py）
+    python scripts/llm_stub_server.py --port 9000
+    # 2. 启动 API 服务
+    python api_server.py
+    # 3. 压测
+    python scripts/bench_agents.py --endpoints simple_chat,summary --concurrency 1,4,16 --requests 32
+
+每个请求的文本都带有序号，避免命中 LLM 响应缓存。
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+SUMMARY_TEXT = "今天的会议讨论了项目进度、预算调整和下一阶段的人员安排，大家对上线时间达成了一致。"
+TRANSLATE_TEXT = "这个功能需要在下周之前完成测试并发布到生产环境。"
+
+# 接口名 -> (路径, 请求体构造函数(序号, 是否流式))
+ENDPOINTS: Dict[str, Any] = {
+    'llm_chat': ('/api/llm/chat', lambda i, stream: {
+        'messages': [{'role': 'user', 'content': f"[{i}] 请用一句话介绍你自己"}],
+    }),
+    'simple_chat': ('/api/llm/simple-chat', lambda i, stream: {
+        'message': f"[{i}] 请用一句话介绍你自己", 'stream': stream,
+    }),
+    'summary': ('/api/summary/generate', lambda i, stream: {
+        'message': f"[{i}] " + SUMMARY_TEXT * 20, 'stream': stream,
+    }),
+    'translate': ('/api/translate', lambda i, stream: {
+        'text': f"[{i}] {TRANSLATE_TEXT}", 'language_pair': 'zh-en', 'stream': stream,
+    }),
+    'smartchat': ('/api/smartchat/chat', lambda i, stream: {
+        'message': f"[{i}] 帮我规划一下明天的工作", 'stream': stream,
+        'use_history': False, 'use_knowledge': False,
+    }),
+}
+
+# 只支持非流式的接口
+NON_STREAMING = {'llm_chat'}
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class RequestResult:
+    """单次请求结果"""
+
+    def __init__(self, ok: bool, ttft: Optional[float], latency: float, error: Optional[str] = None):
+        self.ok = ok
+        self.ttft = ttft
+        self.latency = latency
+        self.error = error
+
+
+async def run_request(client: httpx.AsyncClient, path: str, payload: Dict[str, Any], stream: bool) -> RequestResult:
+    start = time.perf_counter()
+    try:
+        if not stream:
+            response = await client.post(path, json=payload)
+            latency = time.perf_counter() - start
+            data = response.json()
+            if response.status_code != 200 or data.get('success') is False:
+                return RequestResult(False, None, latency, str(data.get('error') or response.status_code))
+            return RequestResult(True, latency, latency)
+
+        ttft = None
+        async with client.stream('POST', path, json=payload) as response:
+            if response.status_code != 200:
+                return RequestResult(False, None, time.perf_counter() - start, str(response.status_code))
+            async for line in response.aiter_lines():
+                if not line.startswith('data: ') or line == 'data: [DONE]':
+                    continue
+                event = json.loads(line[6:])
+                if 'error' in event:
+                    return RequestResult(False, ttft, time.perf_counter() - start, str(event['error']))
+                if 'chunk' in event and ttft is None:
+                    ttft = time.perf_counter() - start
+        return RequestResult(ttft is not None, ttft, time.perf_counter() - start,
+                             None if ttft is not None else 'empty stream')
+    except Exception as e:
+        return RequestResult(False, None, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+async def get_loop_lag(client: httpx.AsyncClient, reset: bool) -> Optional[Dict[str, Any]]:
+    """读取服务端事件循环延迟（诊断接口未启用时返回 None）"""
+    try:
+        response = await client.get('/api/admin/diagnostics/loop-lag', params={'reset': reset})
+        if response.status_code == 200:
+            return response.json().get('data')
+    except Exception:
+        pass
+    return None
+
+
+async def run_stage(client: httpx.AsyncClient, name: str, stream: bool, concurrency: int,
+                    total: int, offset: int) -> Dict[str, Any]:
+    """以固定并发数发送 total 个请求"""
+    path, build = ENDPOINTS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> RequestResult:
+        async with semaphore:
+            return await run_request(client, path, build(offset + i, stream), stream)
+
+    await get_loop_lag(client, reset=True)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    lag = await get_loop_lag(client, reset=True)
+
+    ok = [r for r in results if r.ok]
+    errors = [r.error for r in results if not r.ok]
+    ttfts = [r.ttft * 1000 for r in ok if r.ttft is not None]
+    latencies = [r.latency * 1000 for r in ok]
+    return {
+        'endpoint': name,
+        'stream': stream,
+        'concurrency': concurrency,
+        'requests': total,
+        'ok': len(ok),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'ttft_p50_ms': percentile(ttfts, 0.5),
+        'ttft_p95_ms': percentile(ttfts, 0.95),
+        'latency_p50_ms': percentile(latencies, 0.5),
+        'latency_p95_ms': percentile(latencies, 0.95),
+        'loop_lag_p99_ms': lag.get('p99_ms') if lag else None,
+        'loop_lag_max_ms': lag.get('max_ms') if lag else None,
+    }
+
+
+def format_row(row: Dict[str, Any]) -> str:
+    def ms(value):
+        return f"{value:8.0f}" if value is not None else f"{'-':>8}"
+
+    return (f"{row['endpoint']:<12} {'流式' if row['stream'] else '普通':<4} {row['concurrency']:>4} "
+            f"{row['ok']:>5}/{row['requests']:<5} {row['throughput_rps']:>8.2f} "
+            f"{ms(row['ttft_p50_ms'])} {ms(row['ttft_p95_ms'])} "
+            f"{ms(row['latency_p50_ms'])} {ms(row['latency_p95_ms'])} "
+            f"{ms(row['loop_lag_p99_ms'])} {ms(row['loop_lag_max_ms'])}")
+
+
+async def run_benchmark(base_url: str, endpoints: List[str], levels: List[int], total: int,
+                        stream: bool, timeout: float, on_row: Optional[Callable] = None) -> List[Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=max(levels) + 4, max_keepalive_connections=max(levels) + 4)
+    rows = []
+    offset = int(time.time())  # 每次运行使用不同的序号，避免命中上一次运行的缓存
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for name in endpoints:
+            endpoint_stream = stream and name not in NON_STREAMING
+            for concurrency in levels:
+                row = await run_stage(client, name, endpoint_stream, concurrency, total, offset)
+                offset += total
+                rows.append(row)
+                if on_row:
+                    on_row(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent 接口压测")
+    parser.add_argument("--api", default="http://127.0.0.1:8765", help="API 服务地址")
+    parser.add_argument("--endpoints", default=','.join(ENDPOINTS),
+                        help=f"要压测的接口，逗号分隔（可选: {', '.join(ENDPOINTS)}）")
+    parser.add_argument("--concurrency", default="1,4,16,32", help="并发级别，逗号分隔")
+    parser.add_argument("--requests", type=int, default=32, help="每个并发级别的请求数")
+    parser.add_argument("--no-stream", action="store_true", help="使用非流式请求")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求超时（秒）")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        print(f"未知接口: {', '.join(unknown)}")
+        return 1
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    print(f"{'接口':<12} {'模式':<4} {'并发':>4} {'成功/总数':>11} {'吞吐/s':>8} "
+          f"{'TTFT50':>8} {'TTFT95':>8} {'耗时50':>8} {'耗时95':>8} {'lag99':>8} {'lagMax':>8}")
+    rows = asyncio.run(run_benchmark(
+        args.api, endpoints, levels, args.requests, not args.no_stream, args.timeout,
+        on_row=lambda row: print(format_row(row) + (f"  错误: {row['first_error']}" if row['errors'] else ''))
+    ))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json}")
+    return 0 if all(row['errors'] == 0 for row in rows) else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Embedding 后端基准：对比 sentence_transformers（PyTorch）与 onnx（int8 动态量化）
+
+每个后端在独立子进程中运行，避免互相影响内存统计，输出：
+- 加载耗时
+- 吞吐（文本块/秒）
+- 常驻内存 RSS：启动后、加载模型后、编码后
+- 与第一个后端向量的平均 / 最小余弦相似度
+
+文本块来自 scripts/data/knowledge_bench.json（按知识库默认规则分块后重复至 --chunks 个）。
+
+使用方法：
+    python scripts/bench_embedding.py --backends sentence_transformers,onnx --chunks 512
+    python scripts/bench_embedding.py --backends onnx --option threads=4 --option quantize=false
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+CORPUS = Path(__file__).parent / 'data' / 'knowledge_bench.json'
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB）"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # 无法获取当前值时退回峰值（Linux 为 KB，macOS 为字节）
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def load_chunks(count: int) -> List[str]:
+    from src.services.text_chunker import iter_chunks
+    corpus = json.loads(CORPUS.read_text(encoding='utf-8'))
+    chunks = [c for doc in corpus['documents'] for c in iter_chunks([doc['content']], 64, 1)]
+    return [f"{chunks[i % len(chunks)]} #{i}" for i in range(count)]
+
+
+def worker(args) -> Dict[str, Any]:
+    """子进程：加载单个后端并编码"""
+    import numpy as np
+    from src.providers.embedding import create_embedding_provider
+
+    result: Dict[str, Any] = {'backend': args.worker, 'rss_start_mb': round(rss_mb(), 1)}
+    texts = load_chunks(args.chunks)
+
+    provider = create_embedding_provider(args.worker, args.model, json.loads(args.options_json))
+    start = time.perf_counter()
+    provider.load()
+    result['load_s'] = round(time.perf_counter() - start, 2)
+    result['rss_loaded_mb'] = round(rss_mb(), 1)
+
+    provider.encode(texts[:8])  # 预热
+    start = time.perf_counter()
+    vectors = provider.encode(texts)
+    elapsed = time.perf_counter() - start
+    result['chunks_per_sec'] = round(len(texts) / elapsed, 1)
+    result['rss_encoded_mb'] = round(rss_mb(), 1)
+
+    np.save(args.vectors_out, vectors)
+    return result
+
+
+def parse_options(values: List[str]) -> Dict[str, Any]:
+    options: Dict[str, Any] = {}
+    for item in values:
+        key, _, raw = item.partition('=')
+        try:
+            options[key] = json.loads(raw)
+        except ValueError:
+            options[key] = raw
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embedding 后端基准（吞吐、内存、一致性）')
+    parser.add_argument('--backends', default='sentence_transformers,onnx', help='后端，逗号分隔')
+    parser.add_argument('--model', default='all-MiniLM-L6-v2', help='模型名称')
+    parser.add_argument('--chunks', type=int, default=512, help='编码的文本块数')
+    parser.add_argument('--option', action='append', default=[], help='后端选项 key=value（可多次指定）')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--options-json', default='{}', help=argparse.SUPPRESS)
+    parser.add_argument('--vectors-out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args)))
+        return
+
+    import numpy as np
+
+    options = parse_options(args.option)
+    rows, vectors = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in [b.strip() for b in args.backends.split(',') if b.strip()]:
+            backend_options = dict(options)
+            if backend == 'onnx':
+                backend_options.setdefault('quantized_dir', str(Path(tmp) / 'onnx'))
+            vectors_out = str(Path(tmp) / f'{backend}.npy')
+            proc = subprocess.run(
+                [sys.executable, __file__, '--worker', backend, '--model', args.model,
+                 '--chunks', str(args.chunks), '--options-json', json.dumps(backend_options),
+                 '--vectors-out', vectors_out],
+                capture_output=True, text=True, env={**os.environ, 'TOKENIZERS_PARALLELISM': 'false'},
+            )
+            if proc.returncode != 0:
+                print(f"[{backend}] 运行失败:\n{proc.stderr.strip()[-2000:]}")
+                continue
+            row = json.loads(proc.stdout.strip().splitlines()[-1])
+            current = np.load(vectors_out)
+            if vectors:
+                base = vectors[0]
+                cosine = (base * current).sum(axis=1) / (
+                    np.linalg.norm(base, axis=1) * np.linalg.norm(current, axis=1)
+                )
+                row['cos_mean'] = round(float(cosine.mean()), 4)
+                row['cos_min'] = round(float(cosine.min()), 4)
+            vectors.append(current)
+            rows.append(row)
+
+    if not rows:
+        sys.exit(1)
+    columns = ['load_s', 'chunks_per_sec', 'rss_start_mb', 'rss_loaded_mb', 'rss_encoded_mb', 'cos_mean', 'cos_min']
+    print(f"{'backend':<22}" + ''.join(f"{c:>16}" for c in columns))
+    for row in rows:
+        print(f"{row['backend']:<22}" + ''.join(f"{str(row.get(c, '-')):>16}" for c in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+知识库检索基准：对比 vector / lexical / hybrid 三种模式的召回率与延迟
+
+使用自带的中英文语料（scripts/data/knowledge_bench.json，含产品型号、错误码等精确词），
+在临时目录中建立知识库（需要安装 sentence-transformers 和 chromadb），统计：
+- Recall@k：相关文档出现在前 k 个结果中的查询比例
+- MRR：相关文档首次出现名次的倒数的平均值
+- 延迟 p50 / p95（关闭检索缓存，每个查询重复 --repeat 次）
+
+使用方法：
+    python scripts/bench_knowledge_search.py --top-k 3 --repeat 5
+    python scripts/bench_knowledge_search.py --model paraphrase-multilingual-MiniLM-L12-v2
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.knowledge_service import KnowledgeService
+
+DEFAULT_CORPUS = Path(__file__).parent / 'data' / 'knowledge_bench.json'
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+async def run(args) -> Dict[str, Dict[str, float]]:
+    corpus = json.loads(Path(args.corpus).read_text(encoding='utf-8'))
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = KnowledgeService(
+            data_dir=Path(tmp),
+            knowledge_relative_path=Path('knowledge'),
+            embedding_model=args.model,
+            lazy_load=False,
+            embedding_cache=False,
+            search_cache_size=0,
+        )
+
+        # 文件名 -> 文档 id（按来源文件判断是否命中）
+        source_to_doc = {}
+        for doc in corpus['documents']:
+            await service.upload_file(doc['filename'], doc['content'])
+            source_to_doc[doc['filename']] = doc['id']
+
+        report = {}
+        for mode in modes:
+            hits, reciprocal_ranks, latencies = 0, [], []
+            for item in corpus['queries']:
+                results = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    results = await service.search(item['query'], top_k=args.top_k, mode=mode)
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+                ranked_docs = [source_to_doc.get(r['source']) for r in results]
+                rank = next((i for i, doc_id in enumerate(ranked_docs, 1) if doc_id in item['relevant']), None)
+                if rank is not None:
+                    hits += 1
+                    reciprocal_ranks.append(1 / rank)
+                else:
+                    reciprocal_ranks.append(0.0)
+                    if args.verbose:
+                        print(f"  [{mode}] 未命中: {item['query']} -> {ranked_docs}")
+
+            total = len(corpus['queries'])
+            report[mode] = {
+                f'recall@{args.top_k}': round(hits / total, 3),
+                'mrr': round(sum(reciprocal_ranks) / total, 3),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+            }
+        service.cleanup()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='知识库检索基准（召回率与延迟）')
+    parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='基准语料 JSON')
+    parser.add_argument('--model', default='all-MiniLM-L6-v2', help='Embedding 模型')
+    parser.add_argument('--modes', default='vector,lexical,hybrid', help='检索模式，逗号分隔')
+    parser.add_argument('--top-k', type=int, default=3, help='每次返回的结果数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个查询重复次数（统计延迟）')
+    parser.add_argument('--verbose', action='store_true', help='打印未命中的查询')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    columns = list(next(iter(report.values())).keys())
+    print(f"{'mode':<8}" + ''.join(f"{c:>12}" for c in columns))
+    for mode, row in report.items():
+        print(f"{mode:<8}" + ''.join(f"{row[c]:>12}" for c in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容的 LLM 模拟服务（用于压测，不消耗真实 token）
+
+模拟 /v1/chat/completions（含流式），可配置首 token 延迟、生成速度、输出长度和错误率，
+返回的 usage 与 OpenAI 格式一致（流式请求带 stream_options.include_usage 时在最后一个 chunk 返回）。
+
+使用方法：
+    python scripts/llm_stub_server.py --port 9000 --first-token-ms 300 --tokens-per-sec 50
+
+然后在 config.yml 中将 LLM 指向模拟服务：
+    llm:
+      provider: stub
+      api_key: stub
+      base_url: http://127.0.0.1:9000/v1
+      model: openai/stub-model
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.token_estimate import estimate_tokens
+
+
+class StubStats:
+    """请求统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.streams = 0
+        self.errors = 0
+        self.active = 0
+        self.max_active = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def create_app(
+    first_token_ms: float = 300,
+    tokens_per_sec: float = 50,
+    completion_tokens: int = 64,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    include_usage: bool = True,
+) -> FastAPI:
+    """创建模拟服务
+
+    Args:
+        first_token_ms: 首 token 延迟（毫秒）
+        tokens_per_sec: 生成速度（每秒 token 数，0 为不限速）
+        completion_tokens: 默认输出 token 数（请求的 max_tokens 更小时以 max_tokens 为准）
+        jitter: 延迟随机抖动比例（0.2 表示 ±20%）
+        error_rate: 返回 503 错误的概率
+        include_usage: 是否返回 usage
+    """
+    app = FastAPI(title="MindVoice LLM Stub")
+    app.state.stats = StubStats()
+    stats = app.state.stats
+
+    def delay(seconds: float) -> float:
+        if jitter:
+            seconds *= random.uniform(1 - jitter, 1 + jitter)
+        return max(0.0, seconds)
+
+    def usage_block(prompt: int, completion: int):
+        return {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion}
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {'object': 'list', 'data': [{'id': 'stub-model', 'object': 'model', 'owned_by': 'stub'}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.to_dict()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get('model', 'stub-model')
+        stream = bool(body.get('stream'))
+        prompt = sum(estimate_tokens(str(m.get('content', ''))) for m in body.get('messages', []))
+        n = min(completion_tokens, body.get('max_tokens') or completion_tokens)
+        interval = 1 / tokens_per_sec if tokens_per_sec > 0 else 0
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        stats.requests += 1
+        if random.random() < error_rate:
+            stats.errors += 1
+            return JSONResponse(status_code=503, content={
+                'error': {'message': 'stub: service unavailable', 'type': 'server_error', 'code': 503}
+            })
+        stats.prompt_tokens += prompt
+        stats.completion_tokens += n
+
+        def chunk(delta, finish_reason=None):
+            return {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+
+        if not stream:
+            stats.active += 1
+            stats.max_active = max(stats.max_active, stats.active)
+            try:
+                await asyncio.sleep(delay(first_token_ms / 1000) + delay(interval * max(0, n - 1)))
+            finally:
+                stats.active -= 1
+            response = {
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(f"词{i} " for i in range(n))},
+                    'finish_reason': 'stop',
+                }],
+            }
+            if include_usage:
+                response['usage'] = usage_block(prompt, n)
+            return response
+
+        want_usage = include_usage and (body.get('stream_options') or {}).get('include_usage')
+
+        async def events():
+            stats.streams += 1
+            stats.active += 1
+            stats.max_active = max(stats.max_active, stats.active)
+            try:
+                await asyncio.sleep(delay(first_token_ms / 1000))
+                yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n"
+                for i in range(n):
+                    if i and interval:
+                        await asyncio.sleep(delay(interval))
+                    yield f"data: {json.dumps(chunk({'content': f'词{i} '}))}\n\n"
+                yield f"data: {json.dumps(chunk({}, 'stop'))}\n\n"
+                if want_usage:
+                    final = chunk({})
+                    final['choices'] = []
+                    final['usage'] = usage_block(prompt, n)
+                    yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                stats.active -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容的 LLM 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--first-token-ms", type=float, default=300, help="首 token 延迟（毫秒）")
+    parser.add_argument("--tokens-per-sec", type=float, default=50, help="生成速度（0 为不限速）")
+    parser.add_argument("--completion-tokens", type=int, default=64, help="默认输出 token 数")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机抖动比例（如 0.2）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--no-usage", action="store_true", help="不返回 usage")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(
+        first_token_ms=args.first_token_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        completion_tokens=args.completion_tokens,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        include_usage=not args.no_usage,
+    )
+    print(f"LLM 模拟服务: http://{args.host}:{args.port}/v1 "
+          f"(首 token {args.first_token_ms}ms, {args.tokens_per_sec} tokens/s)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
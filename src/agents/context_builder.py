@@ -0,0 +1,228 @@
+"""
+对话上下文构建器
+
+按 token 预算为 SmartChat 组装提示词，优先级从高到低：
+1. 系统提示词 + 当前用户消息（必选）
+2. 最近几轮对话（从新到旧）
+3. 知识库检索结果（按相关度顺序）
+4. 更早的对话：压缩为滚动摘要，尚未被摘要覆盖的轮次在预算允许时原文保留
+
+每次构建都会给出报告：预算、实际 token、与"全部历史 + 全部知识"相比节省的 token。
+"""
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from ..utils.token_estimate import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_TEMPLATE = "\n## 对话历史\n\n{history}\n---\n"
+DEFAULT_KNOWLEDGE_TEMPLATE = "\n## 相关知识库内容\n\n{knowledge_content}\n---\n"
+DEFAULT_SUMMARY_TEMPLATE = "\n## 更早的对话摘要\n\n{summary}\n---\n"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """加载分词器（只加载一次）
+
+    使用 litellm 自带的 cl100k_base 编码（离线可用），不可用时返回 None，改用估算。
+    """
+    try:
+        import litellm
+        return litellm.encoding
+    except Exception as e:
+        logger.warning(f"[ContextBuilder] 分词器不可用，使用字符估算: {e}")
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """计算文本 token 数（结果按文本缓存，历史消息不会被重复分词）"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    try:
+        return len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return estimate_tokens(text)
+
+
+def format_history_turn(messages: List[Dict[str, str]]) -> str:
+    """格式化一轮对话（用户 + 助手）"""
+    return "\n".join(
+        f"{'用户' if msg['role'] == 'user' else '助手'}: {msg['content']}"
+        for msg in messages
+    )
+
+
+def format_knowledge_results(results: List[Dict[str, Any]]) -> str:
+    """格式化知识库检索结果（按列表顺序编号）"""
+    lines = []
+    for i, result in enumerate(results, 1):
+        source = result.get('source', '未知来源')
+        content = result.get('content', '')
+        score = result.get('score', 0.0)
+        lines.append(f"### {i}. 来源: {source} (相关度: {score:.2f})")
+        lines.append(f"{content}")
+        lines.append("")  # 空行
+    return "\n".join(lines)
+
+
+def group_turns(history: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """将消息列表按轮次分组，每轮以用户消息开始"""
+    turns: List[List[Dict[str, str]]] = []
+    for msg in history:
+        if msg['role'] == 'user' or not turns:
+            turns.append([msg])
+        else:
+            turns[-1].append(msg)
+    return turns
+
+
+class ContextResult:
+    """上下文构建结果"""
+
+    def __init__(self, prompt: str, report: Dict[str, Any]):
+        self.prompt = prompt
+        self.report = report
+
+
+class ContextBuilder:
+    """按优先级填充上下文窗口"""
+
+    def __init__(
+        self,
+        history_template: str = DEFAULT_HISTORY_TEMPLATE,
+        knowledge_template: str = DEFAULT_KNOWLEDGE_TEMPLATE,
+        summary_template: str = DEFAULT_SUMMARY_TEMPLATE,
+        recent_turns: int = 4,
+        token_counter: Callable[[str], int] = count_tokens,
+    ):
+        """
+        Args:
+            history_template: 对话历史模板（含 {history}）
+            knowledge_template: 知识库模板（含 {knowledge_content}）
+            summary_template: 滚动摘要模板（含 {summary}）
+            recent_turns: 优先保留的最近轮数
+            token_counter: token 计数函数
+        """
+        self.history_template = history_template
+        self.knowledge_template = knowledge_template
+        self.summary_template = summary_template
+        self.recent_turns = max(0, int(recent_turns))
+        self.count = token_counter
+
+    def render(self, user_message: str, turns: List[str],
+               chunks: List[Dict[str, Any]], summary: Optional[str] = None) -> str:
+        """组装用户侧输入：知识库 → 摘要 → 对话历史 → 当前消息"""
+        parts = []
+        if chunks:
+            parts.append(self.knowledge_template.format(knowledge_content=format_knowledge_results(chunks)))
+        if summary:
+            parts.append(self.summary_template.format(summary=summary))
+        if turns:
+            parts.append(self.history_template.format(history="\n".join(turns)))
+        parts.append(user_message)
+        return "\n".join(parts)
+
+    def warm(self, system_prompt: str, history: Optional[List[Dict[str, str]]] = None,
+             summary: Optional[str] = None):
+        """预先计算固定部分的 token 数（count_tokens 按文本缓存）
+
+        与知识库检索并发调用，build() 时只需对新内容分词。
+        """
+        self.count(system_prompt)
+        self.count(self.history_template.format(history=''))
+        self.count(self.knowledge_template.format(knowledge_content=''))
+        if summary:
+            self.count(self.summary_template.format(summary=summary))
+        for turn in group_turns(history or []):
+            self.count(format_history_turn(turn))
+
+    def build(
+        self,
+        system_prompt: str,
+        user_message: str,
+        budget_tokens: int,
+        history: Optional[List[Dict[str, str]]] = None,
+        knowledge: Optional[List[Dict[str, Any]]] = None,
+        summary: Optional[str] = None,
+        summary_turns: int = 0,
+    ) -> ContextResult:
+        """构建提示词
+
+        Args:
+            system_prompt: 系统提示词（计入预算，但不包含在返回的 prompt 中）
+            user_message: 当前用户消息
+            budget_tokens: 输入 token 预算（已扣除输出预留）
+            history: 对话历史消息列表
+            knowledge: 知识库检索结果（按相关度排序）
+            summary: 滚动摘要
+            summary_turns: 摘要覆盖的最早轮数（history 中前 N 轮）
+
+        Returns:
+            ContextResult，prompt 为用户侧输入，report 为 token 统计
+        """
+        turns = [format_history_turn(t) for t in group_turns(history or [])]
+        chunks = list(knowledge or [])
+        summary_turns = min(max(0, summary_turns), len(turns))
+
+        remaining = budget_tokens - self.count(system_prompt) - self.count(user_message)
+
+        def take(cost: int) -> bool:
+            nonlocal remaining
+            if cost > remaining:
+                return False
+            remaining -= cost
+            return True
+
+        history_overhead = self.count(self.history_template.format(history=''))
+        knowledge_overhead = self.count(self.knowledge_template.format(knowledge_content=''))
+
+        # 2. 最近几轮（从新到旧，放不下即停止，避免中间出现断档）
+        included = set()
+        recent_start = max(0, len(turns) - self.recent_turns)
+        for i in range(len(turns) - 1, recent_start - 1, -1):
+            if not take(self.count(turns[i]) + (0 if included else history_overhead)):
+                break
+            included.add(i)
+
+        # 3. 知识库结果（按相关度，放不下的跳过）
+        selected_chunks = []
+        for chunk in chunks:
+            cost = self.count(format_knowledge_results([chunk])) + (0 if selected_chunks else knowledge_overhead)
+            if take(cost):
+                selected_chunks.append(chunk)
+
+        # 4. 更早的对话：摘要 + 未被摘要覆盖的轮次（从新到旧）
+        summary_used = False
+        if summary and summary_turns > 0 and len(included) == len(turns) - recent_start:
+            summary_used = take(self.count(self.summary_template.format(summary=summary)))
+        if len(included) == len(turns) - recent_start:
+            start = summary_turns if summary_used else 0
+            for i in range(recent_start - 1, start - 1, -1):
+                if not take(self.count(turns[i]) + (0 if included else history_overhead)):
+                    break
+                included.add(i)
+
+        kept_turns = [turns[i] for i in sorted(included)]
+        prompt = self.render(user_message, kept_turns, selected_chunks, summary if summary_used else None)
+        prompt_tokens = self.count(system_prompt) + self.count(prompt)
+        naive_tokens = self.count(system_prompt) + self.count(self.render(user_message, turns, chunks))
+
+        report = {
+            'budget_tokens': budget_tokens,
+            'prompt_tokens': prompt_tokens,
+            'naive_tokens': naive_tokens,
+            'saved_tokens': naive_tokens - prompt_tokens,
+            'turns_total': len(turns),
+            'turns_included': len(included),
+            'turns_summarized': summary_turns if summary_used else 0,
+            'chunks_total': len(chunks),
+            'chunks_included': len(selected_chunks),
+            'summary_used': summary_used,
+        }
+        return ContextResult(prompt, report)
@@ -0,0 +1,57 @@
+"""
+检索判定（轻量规则分类器）
+
+判断一条消息是否需要检索知识库。寒暄、确认、针对上文的追问等消息不需要知识库，
+跳过检索可以省去查询向量计算和向量库查询，缩短首 token 时间。
+规则只做保守判断：无法确定时一律检索。
+"""
+import re
+from typing import Tuple
+
+# 寒暄 / 确认 / 致谢（整条消息只有这些内容时不检索）
+_SMALL_TALK = {
+    '你好', '您好', '嗨', '哈喽', '早上好', '下午好', '晚上好', '在吗', '在不在',
+    '谢谢', '谢谢你', '多谢', '感谢', '好的', '好', '嗯', '嗯嗯', '行', '可以', '没问题', '知道了',
+    '明白了', '收到', '再见', '拜拜', '晚安', '辛苦了', '不错', '很好', '太好了', '哈哈', '哈哈哈',
+    'hi', 'hello', 'hey', 'thanks', 'thank you', 'thx', 'ok', 'okay', 'yes', 'no', 'bye', 'good night',
+    'cool', 'nice', 'great', 'got it',
+}
+
+# 针对上文的指令（答案来自对话历史，不需要知识库）
+_FOLLOW_UP = re.compile(
+    r'^(继续|接着说|接着写|再来|再说|展开|详细说说|说详细|换个说法|重新回答|再简短|简短一点|'
+    r'翻译(一下)?(上面|刚才|这段)|总结(一下)?(上面|刚才|我们的对话)|(上面|刚才)(的|那)|'
+    r'continue|go on|more|shorter|rephrase|translate (that|the above)|summarize (that|the above))',
+    re.IGNORECASE
+)
+
+_PUNCTUATION = re.compile(r'[\s　-〿＀-／：-＠!-/:-@\[-`{-~]+')
+_QUESTION = re.compile(r'[?？吗呢么什谁哪几怎为如]|\b(what|why|how|who|where|when|which)\b', re.IGNORECASE)
+
+
+def classify_retrieval(message: str) -> Tuple[bool, str]:
+    """判断消息是否需要检索知识库
+
+    Args:
+        message: 用户消息（已清理）
+
+    Returns:
+        (是否检索, 判定原因)
+    """
+    text = message.strip()
+    normalized = _PUNCTUATION.sub(' ', text).strip().lower()
+    if not normalized:
+        return False, 'empty'
+    if normalized in _SMALL_TALK:
+        return False, 'small_talk'
+    if _FOLLOW_UP.match(text):
+        return False, 'follow_up'
+    # 很短且不是问句（如"好的，明白"）
+    if len(normalized.replace(' ', '')) <= 3 and not _QUESTION.search(text):
+        return False, 'too_short'
+    return True, 'default'
+
+
+def needs_retrieval(message: str) -> bool:
+    """classify_retrieval 的简化版本，只返回是否检索"""
+    return classify_retrieval(message)[0]
@@ -3,12 +3,30 @@ SmartChat Agent
 
 智能对话助手，支持上下文记忆和知识库检索增强(RAG)
 """
-from typing import AsyncIterator, Union, Optional, Dict, Any, List
+from typing import AsyncIterator, Union, Optional, Dict, Any, List, Callable
 import uuid
 import json
+import asyncio
 from datetime import datetime
 from .base_agent import BaseAgent
 from .prompts import PromptLoader
+from .context_builder import (
+    ContextBuilder, ContextResult, format_history_turn, format_knowledge_results, group_turns,
+    DEFAULT_HISTORY_TEMPLATE, DEFAULT_KNOWLEDGE_TEMPLATE, DEFAULT_SUMMARY_TEMPLATE
+)
+from .retrieval_gate import classify_retrieval
+from ..utils.stage_timer import StageTimer
+
+
+class PreparedChat:
+    """LLM 调用前阶段的结果（prepare_context 返回，传给 chat 使用）"""
+    
+    def __init__(self, user_message: str, context: ContextResult,
+                 knowledge: List[Dict[str, Any]], retrieval: str):
+        self.user_message = user_message
+        self.context = context
+        self.knowledge = knowledge
+        self.retrieval = retrieval  # used / skipped:<原因> / disabled
 
 
 class SmartChatAgent(BaseAgent):
@@ -17,6 +35,7 @@ class SmartChatAgent(BaseAgent):
     功能：
     - 多轮对话管理（上下文记忆）
     - 知识库检索增强（RAG）
+    - 按 token 预算组装上下文（更早的对话压缩为滚动摘要）
     - 多种对话模式（简洁/专业/创意）
     - 支持流式和非流式输出
     """
@@ -26,7 +45,8 @@ class SmartChatAgent(BaseAgent):
         llm_service, 
         knowledge_service=None,
         storage_provider=None,
-        config: Optional[Dict[str, Any]] = None
+        config: Optional[Dict[str, Any]] = None,
+        on_summary_usage: Optional[Callable[[str, str, Dict[str, Any]], None]] = None
     ):
         """初始化 SmartChatAgent
         
@@ -35,6 +55,7 @@ class SmartChatAgent(BaseAgent):
             knowledge_service: 知识库服务实例（可选）
             storage_provider: 存储服务实例（可选，用于保存对话记录）
             config: Agent配置（可选）
+            on_summary_usage: 滚动摘要完成后的用量回调 (user_id, device_id, usage)，用于记录 LLM 消费（可选）
         """
         super().__init__(llm_service, config)
         
@@ -70,6 +91,26 @@ class SmartChatAgent(BaseAgent):
         self.conversation_history: List[Dict[str, str]] = []
         self.max_history_turns = config.get('max_history_turns', 10) if config else 10
         
+        # 上下文构建（按 token 预算填充）
+        self.context_builder = ContextBuilder(
+            history_template=self.prompt_config.get('conversation_history_template', DEFAULT_HISTORY_TEMPLATE),
+            knowledge_template=self.prompt_config.get('knowledge_context_template', DEFAULT_KNOWLEDGE_TEMPLATE),
+            summary_template=self.prompt_config.get('running_summary_template', DEFAULT_SUMMARY_TEMPLATE),
+            recent_turns=self.config.get('recent_turns', 4),
+        )
+        self.last_context_report: Optional[Dict[str, Any]] = None  # 仅用于统计视图，单次请求的报告见 PreparedChat.context.report
+        self.last_timings: Optional[Dict[str, float]] = None  # 最近一次请求的分阶段耗时（毫秒）
+        self.retrieval_gate = self.config.get('retrieval_gate', False)  # 用规则判断是否需要检索知识库
+        self.context_stats = {'requests': 0, 'prompt_tokens': 0, 'naive_tokens': 0, 'saved_tokens': 0}
+        
+        # 滚动摘要：覆盖从会话开始到 summary_covered_turns（绝对轮次）的对话
+        self.running_summary: Optional[str] = None
+        self.summary_covered_turns = 0
+        self.summary_tokens_used = 0
+        self._removed_messages = 0  # 因截断被移出 conversation_history 的消息数
+        self._summary_task: Optional[asyncio.Task] = None
+        self.on_summary_usage = on_summary_usage
+        
         # 当前对话会话
         self.current_record_id: Optional[str] = None
         self.session_start_time: Optional[float] = None
@@ -107,7 +148,9 @@ class SmartChatAgent(BaseAgent):
         # 限制历史长度（保留最近的N轮对话）
         if len(self.conversation_history) > self.max_history_turns * 2:
             # 每轮对话包含 user + assistant 两条消息
+            removed = len(self.conversation_history) - self.max_history_turns * 2
             self.conversation_history = self.conversation_history[-(self.max_history_turns * 2):]
+            self._removed_messages += removed
             self.logger.info(f"[{self.name}] 对话历史已截断，保留最近 {self.max_history_turns} 轮")
     
     def clear_history(self):
@@ -115,8 +158,20 @@ class SmartChatAgent(BaseAgent):
         self.conversation_history = []
         self.current_record_id = None
         self.session_start_time = None
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
+        self._summary_task = None
+        self.running_summary = None
+        self.summary_covered_turns = 0
+        self._removed_messages = 0
+        self.last_context_report = None
         self.logger.info(f"[{self.name}] 对话历史已清空")
     
+    @property
+    def _history_offset_turns(self) -> int:
+        """已被截断的轮数（对话历史第一轮对应的绝对轮次）"""
+        return self._removed_messages // 2
+    
     def set_user_info(self, user_id: str, device_id: str):
         """设置用户信息（用于保存记录）"""
         self.user_id = user_id
@@ -235,16 +290,33 @@ class SmartChatAgent(BaseAgent):
         if not self.conversation_history:
             return ""
         
-        history_lines = []
-        for msg in self.conversation_history:
-            role_name = "用户" if msg['role'] == 'user' else "助手"
-            history_lines.append(f"{role_name}: {msg['content']}")
-        
-        history_text = "\n".join(history_lines)
+        history_text = "\n".join(format_history_turn(turn) for turn in group_turns(self.conversation_history))
         
         # 使用模板格式化
-        template = self.prompt_config.get('conversation_history_template', "\n## 对话历史\n\n{history}\n---\n")
-        return template.format(history=history_text)
+        return self.context_builder.history_template.format(history=history_text)
+    
+    async def retrieve_knowledge(
+        self, 
+        query: str, 
+        top_k: int = 3
+    ) -> List[Dict[str, Any]]:
+        """从知识库检索相关内容（原始结果）
+        
+        Args:
+            query: 查询文本
+            top_k: 返回前K个结果
+            
+        Returns:
+            检索结果列表（按相关度排序），失败或无结果返回空列表
+        """
+        if not self.knowledge_service:
+            return []
+        
+        try:
+            return await self.knowledge_service.search(query, top_k=top_k) or []
+        except Exception as e:
+            self.logger.error(f"[{self.name}] 知识库检索失败: {e}")
+            return []
     
     async def search_knowledge(
         self, 
@@ -260,36 +332,118 @@ class SmartChatAgent(BaseAgent):
         Returns:
             格式化的知识库内容，如果没有结果返回None
         """
-        if not self.knowledge_service:
+        results = await self.retrieve_knowledge(query, top_k=top_k)
+        if not results:
             return None
         
+        # 使用模板格式化
+        return self.context_builder.knowledge_template.format(knowledge_content=format_knowledge_results(results))
+    
+    def get_context_budget(self, max_tokens: Optional[int] = None) -> int:
+        """计算输入 token 预算
+        
+        预算 = min(context_budget_tokens, max_context_tokens - 输出预留)
+        
+        Args:
+            max_tokens: 本次调用的输出上限（为空时使用配置值）
+        """
+        reserved = max_tokens or self.config.get('max_tokens', 2000)
+        budget = self.config.get('max_context_tokens', 128000) - reserved
+        configured = self.config.get('context_budget_tokens')
+        if configured:
+            budget = min(budget, configured)
+        return max(0, budget)
+    
+    def build_context(
+        self,
+        user_message: str,
+        knowledge: Optional[List[Dict[str, Any]]] = None,
+        use_history: bool = True,
+        max_tokens: Optional[int] = None
+    ):
+        """按预算组装本次请求的输入，并记录 token 节省情况
+        
+        Returns:
+            ContextResult
+        """
+        covered = max(0, self.summary_covered_turns - self._history_offset_turns)
+        result = self.context_builder.build(
+            system_prompt=self.get_system_prompt(),
+            user_message=user_message,
+            budget_tokens=self.get_context_budget(max_tokens),
+            history=self.conversation_history if use_history else [],
+            knowledge=knowledge,
+            summary=self.running_summary if use_history else None,
+            summary_turns=covered,
+        )
+        
+        report = result.report
+        self.last_context_report = report
+        self.context_stats['requests'] += 1
+        for key in ('prompt_tokens', 'naive_tokens', 'saved_tokens'):
+            self.context_stats[key] += report[key]
+        self.logger.info(
+            f"[{self.name}] 上下文: {report['prompt_tokens']}/{report['budget_tokens']} tokens，"
+            f"历史 {report['turns_included']}/{report['turns_total']} 轮，"
+            f"知识 {report['chunks_included']}/{report['chunks_total']} 条，"
+            f"摘要={'有' if report['summary_used'] else '无'}，节省 {report['saved_tokens']} tokens"
+        )
+        return result
+    
+    def _schedule_running_summary(self):
+        """最近窗口之外的未摘要轮次足够多时，在后台更新滚动摘要"""
+        if not self.config.get('running_summary', True):
+            return
+        if self._summary_task and not self._summary_task.done():
+            return
+        
+        turns = group_turns(self.conversation_history)
+        covered = max(0, self.summary_covered_turns - self._history_offset_turns)
+        end = len(turns) - self.context_builder.recent_turns
+        if end - covered < self.config.get('summary_trigger_turns', 2):
+            return
+        
+        self._summary_task = asyncio.create_task(
+            self._update_running_summary(turns[covered:end], self._history_offset_turns + end,
+                                         self.user_id, self.device_id)
+        )
+    
+    async def _update_running_summary(self, turns: List[List[Dict[str, str]]], covered_turns: int,
+                                      user_id: Optional[str] = None, device_id: Optional[str] = None):
+        """把新移出最近窗口的轮次合并进滚动摘要
+        
+        Args:
+            turns: 需要合并的轮次
+            covered_turns: 合并后摘要覆盖到的绝对轮次
+            user_id: 触发摘要的请求所属用户（用于记录 LLM 消费）
+            device_id: 触发摘要的请求所属设备
+        """
+        template = self.prompt_config.get('running_summary_prompt',
+                                          "已有摘要：\n{summary}\n\n新增对话：\n{history}\n\n请输出更新后的摘要。")
+        prompt = template.format(
+            summary=self.running_summary or "（无）",
+            history="\n".join(format_history_turn(t) for t in turns)
+        )
         try:
-            results = await self.knowledge_service.search(query, top_k=top_k)
-            
-            if not results:
-                return None
-            
-            # 格式化知识库内容
-            knowledge_lines = []
-            for i, result in enumerate(results, 1):
-                source = result.get('source', '未知来源')
-                content = result.get('content', '')
-                score = result.get('score', 0.0)
-                
-                knowledge_lines.append(f"### {i}. 来源: {source} (相关度: {score:.2f})")
-                knowledge_lines.append(f"{content}")
-                knowledge_lines.append("")  # 空行
-            
-            knowledge_content = "\n".join(knowledge_lines)
-            
-            # 使用模板格式化
-            template = self.prompt_config.get('knowledge_context_template', 
-                                             "\n## 相关知识库内容\n\n{knowledge_content}\n---\n")
-            return template.format(knowledge_content=knowledge_content)
-            
+            # 摘要在后台进行，用量单独统计，不计入触发它的那次请求，通过 on_summary_usage 单独记录消费
+            with self.llm_service.track_usage() as usage:
+                summary = await self.llm_service.simple_chat(
+                    user_message=prompt,
+                    system_prompt=self.prompt_config.get('running_summary_system_prompt', "你负责压缩对话历史。"),
+                    stream=False,
+                    temperature=0.3,
+                    max_tokens=self.config.get('summary_max_tokens', 300)
+                )
+            self.summary_tokens_used += usage.total_tokens
+            if summary and summary.strip():
+                self.running_summary = summary.strip()
+                self.summary_covered_turns = covered_turns
+                self.logger.info(f"[{self.name}] 滚动摘要已更新，覆盖前 {covered_turns} 轮")
+            billed = usage.to_usage()
+            if billed and self.on_summary_usage and user_id and device_id:
+                self.on_summary_usage(user_id, device_id, billed)
         except Exception as e:
-            self.logger.error(f"[{self.name}] 知识库检索失败: {e}")
-            return None
+            self.logger.warning(f"[{self.name}] 滚动摘要更新失败，下次重试: {e}")
     
     def preprocess_input(self, input_text: str) -> str:
         """预处理输入文本
@@ -313,6 +467,75 @@ class SmartChatAgent(BaseAgent):
         
         return cleaned
     
+    async def prepare_context(
+        self,
+        user_message: str,
+        use_history: bool = True,
+        use_knowledge: bool = True,
+        knowledge_top_k: int = 3,
+        max_tokens: Optional[int] = None,
+        timer: Optional[StageTimer] = None
+    ) -> PreparedChat:
+        """LLM 调用前的准备：知识库检索与对话历史分词并发进行，完成后按预算组装输入
+        
+        Args:
+            user_message: 用户消息
+            use_history: 是否使用对话历史
+            use_knowledge: 是否检索知识库
+            knowledge_top_k: 知识库检索数量
+            max_tokens: 本次调用的输出上限
+            timer: 阶段计时器（为空时新建，结果写入 last_timings）
+            
+        Returns:
+            PreparedChat
+        """
+        timer = timer or StageTimer()
+        
+        with timer.stage('preprocess'):
+            user_message = self.preprocess_input(user_message)
+        
+        async def retrieve() -> List[Dict[str, Any]]:
+            with timer.stage('retrieval'):
+                return await self.retrieve_knowledge(user_message, top_k=knowledge_top_k)
+        
+        retrieval = 'disabled'
+        stages = []
+        if use_knowledge and self.knowledge_service:
+            retrieval = 'used'
+            if self.retrieval_gate:
+                with timer.stage('classify'):
+                    need, reason = classify_retrieval(user_message)
+                if not need:
+                    retrieval = f"skipped:{reason}"
+            if retrieval == 'used':
+                stages.append(retrieve())
+        
+        if use_history and self.conversation_history:
+            # 预先对历史消息分词（结果缓存），与检索并发，组装时不再重复计算
+            history = list(self.conversation_history)
+            stages.append(self._timed_thread(timer, 'history', self.context_builder.warm,
+                                             self.get_system_prompt(), history, self.running_summary))
+        
+        results = await asyncio.gather(*stages)
+        knowledge = results[0] if retrieval == 'used' else []
+        
+        # 按 token 预算组装输入（最近对话 → 知识库 → 更早对话的摘要）
+        with timer.stage('context'):
+            context = self.build_context(
+                user_message,
+                knowledge=knowledge,
+                use_history=use_history,
+                max_tokens=max_tokens
+            )
+        timer.mark('pre_llm')
+        self.last_timings = timer.to_dict()
+        return PreparedChat(user_message, context, knowledge, retrieval)
+    
+    @staticmethod
+    async def _timed_thread(timer: StageTimer, name: str, func, *args):
+        with timer.stage(name):
+            return await asyncio.to_thread(func, *args)
+    
     async def chat(
         self,
         user_message: str,
@@ -320,6 +543,8 @@ class SmartChatAgent(BaseAgent):
         use_history: bool = True,
         use_knowledge: bool = True,
         knowledge_top_k: int = 3,
+        prepared: Optional[PreparedChat] = None,
+        timer: Optional[StageTimer] = None,
         **kwargs
     ) -> Union[str, AsyncIterator[str]]:
         """智能对话主方法
@@ -330,47 +555,52 @@ class SmartChatAgent(BaseAgent):
             use_history: 是否使用对话历史
             use_knowledge: 是否检索知识库
             knowledge_top_k: 知识库检索数量
+            prepared: 已完成的准备结果（调用方与其他阶段并发执行 prepare_context 时传入）
+            timer: 阶段计时器（首 token 与生成耗时写入 last_timings）
             **kwargs: 其他参数
             
         Returns:
             助手回复（字符串或流式迭代器）
         """
-        # 1. 预处理用户输入
-        user_message = self.preprocess_input(user_message)
-        
-        # 2. 构建完整的输入
-        enhanced_input = user_message
+        timer = timer or StageTimer()
         
-        # 2.1 添加对话历史
-        if use_history and self.conversation_history:
-            history_text = self.get_history_text()
-            enhanced_input = history_text + "\n" + enhanced_input
-        
-        # 2.2 检索并添加知识库内容
-        knowledge_text = None
-        if use_knowledge and self.knowledge_service:
-            knowledge_text = await self.search_knowledge(user_message, top_k=knowledge_top_k)
-            if knowledge_text:
-                enhanced_input = knowledge_text + "\n" + enhanced_input
-                self.logger.info(f"[{self.name}] 已添加知识库上下文")
+        # 1. 检索知识库并按 token 预算组装输入
+        if prepared is None:
+            prepared = await self.prepare_context(
+                user_message,
+                use_history=use_history,
+                use_knowledge=use_knowledge,
+                knowledge_top_k=knowledge_top_k,
+                max_tokens=kwargs.get('max_tokens'),
+                timer=timer
+            )
+        user_message = prepared.user_message
+        knowledge = prepared.knowledge
+        enhanced_input = prepared.context.prompt
         
-        # 3. 调用LLM生成回复
-        self.logger.info(f"[{self.name}] 开始生成回复，历史={len(self.conversation_history)//2}轮，知识库={'有' if knowledge_text else '无'}")
+        # 2. 调用LLM生成回复
+        self.logger.info(f"[{self.name}] 开始生成回复，历史={len(self.conversation_history)//2}轮，"
+                         f"知识库={'有' if knowledge else '无'}（{prepared.retrieval}）")
         
         if stream:
             # 流式生成
             async def stream_chat():
                 accumulated = ""
-                result = await self.generate(enhanced_input, stream=True, **kwargs)
-                
-                async for chunk in result:
-                    accumulated += chunk
-                    yield chunk
+                with timer.stage('llm'):
+                    result = await self.generate(enhanced_input, stream=True, **kwargs)
+                    
+                    async for chunk in result:
+                        if not accumulated:
+                            timer.mark('first_token')
+                        accumulated += chunk
+                        yield chunk
+                self.last_timings = timer.to_dict()
                 
                 # 生成完成后，更新对话历史
                 if use_history:
                     self.add_to_history('user', user_message)
                     self.add_to_history('assistant', accumulated)
+                    self._schedule_running_summary()
                 
                 # 自动保存对话
                 await self.save_conversation(use_knowledge=use_knowledge)
@@ -380,12 +610,15 @@ class SmartChatAgent(BaseAgent):
             return stream_chat()
         else:
             # 非流式生成
-            response = await self.generate(enhanced_input, stream=False, **kwargs)
+            with timer.stage('llm'):
+                response = await self.generate(enhanced_input, stream=False, **kwargs)
+            self.last_timings = timer.to_dict()
             
             # 更新对话历史
             if use_history:
                 self.add_to_history('user', user_message)
                 self.add_to_history('assistant', response)
+                self._schedule_running_summary()
             
             # 自动保存对话
             await self.save_conversation(use_knowledge=use_knowledge)
@@ -403,6 +636,12 @@ class SmartChatAgent(BaseAgent):
             'total_turns': len(self.conversation_history) // 2,
             'total_messages': len(self.conversation_history),
             'has_knowledge_service': self.knowledge_service is not None,
-            'max_history_turns': self.max_history_turns
+            'max_history_turns': self.max_history_turns,
+            'context': {
+                'last_request': self.last_context_report,
+                'totals': dict(self.context_stats),
+                'running_summary_turns': self.summary_covered_turns if self.running_summary else 0,
+                'summary_tokens_used': self.summary_tokens_used,
+            }
         }
 
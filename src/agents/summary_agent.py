@@ -3,10 +3,14 @@
 
 专门用于生成会议记录和笔记的结构化小结
 """
-from typing import AsyncIterator, Union, Optional, Dict, Any
+from typing import AsyncIterator, Callable, Union, Optional, Dict, Any, List
 import re
+import asyncio
+import hashlib
 from .base_agent import BaseAgent
 from .prompts import PromptLoader
+from .context_builder import count_tokens
+from ..utils.batch_executor import run_batch
 
 
 class SummaryAgent(BaseAgent):
@@ -17,6 +21,7 @@ class SummaryAgent(BaseAgent):
     - 生成结构化、易读的小结
     - 使用emoji作为视觉标记
     - 支持流式和非流式输出
+    - 长文本分段并发提炼后再汇总（map-reduce），分段结果可复用
     """
     
     # 小结块的标记（用于识别和过滤）
@@ -133,7 +138,8 @@ class SummaryAgent(BaseAgent):
     ) -> Union[str, AsyncIterator[str]]:
         """生成会议小结
         
-        这是一个语义化的别名方法，内部调用generate()
+        短文本直接调用 generate()；超过 map_reduce_threshold_tokens 的长文本
+        先分段提炼要点，再基于要点生成小结。
         
         Args:
             content: 会议记录内容
@@ -143,7 +149,170 @@ class SummaryAgent(BaseAgent):
         Returns:
             小结内容（字符串或流式迭代器）
         """
-        return await self.generate(content, stream=stream, **kwargs)
+        reduce_input = await self.prepare_reduce_input(self.preprocess_input(content))
+        return await self.generate(reduce_input, stream=stream, **kwargs)
+    
+    async def generate_summary_events(self, content: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成小结，并推送分段处理进度
+        
+        Yields:
+            {'progress': {...}} 进度事件（仅长文本），{'chunk': str} 小结内容片段
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(
+            self.prepare_reduce_input(self.preprocess_input(content), on_progress=queue.put_nowait)
+        )
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield {'progress': event}
+            reduce_input = task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+        
+        async for chunk in await self.generate(reduce_input, stream=True, **kwargs):
+            yield {'chunk': chunk}
+    
+    # ==================== 长文本分段汇总 ====================
+    
+    # 句末标点（段落过长时在此处切分）
+    _SENTENCE_END = re.compile(r'(?<=[。！？!?；;.])\s*')
+    
+    def split_chunks(self, text: str, max_tokens: Optional[int] = None) -> List[str]:
+        """按段落（每行一句话/一段）切分长文本
+        
+        切分点由内容决定：段落累计到 max_tokens 的三分之一后，遇到哈希值满足条件的段落即切分；
+        放不下下一段时强制切分。这样编辑某处只会改变附近的分段，其余分段的提炼结果可以复用缓存。
+        
+        Args:
+            text: 预处理后的文本
+            max_tokens: 每段最大 token 数（默认 chunk_max_tokens）
+            
+        Returns:
+            分段列表
+        """
+        max_tokens = max_tokens or self.config.get('chunk_max_tokens', 3000)
+        min_tokens = max_tokens // 3
+        
+        paragraphs = []
+        for line in text.split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            if count_tokens(line) <= max_tokens:
+                paragraphs.append(line)
+                continue
+            # 超长段落按句切分，单句仍超长则硬切
+            for sentence in self._SENTENCE_END.split(line):
+                while sentence:
+                    piece = sentence
+                    while count_tokens(piece) > max_tokens:
+                        piece = piece[:len(piece) * 3 // 4]
+                    paragraphs.append(piece)
+                    sentence = sentence[len(piece):]
+        
+        chunks: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+        for paragraph in paragraphs:
+            tokens = count_tokens(paragraph) + 1
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append('\n'.join(current))
+                current, current_tokens = [], 0
+            current.append(paragraph)
+            current_tokens += tokens
+            digest = hashlib.sha1(paragraph.encode('utf-8')).digest()
+            if current_tokens >= min_tokens and digest[0] % 4 == 0:
+                chunks.append('\n'.join(current))
+                current, current_tokens = [], 0
+        if current:
+            chunks.append('\n'.join(current))
+        return chunks
+    
+    async def summarize_chunks(
+        self,
+        chunks: List[str],
+        level: int = 1,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[str]:
+        """并发提炼各分段要点（map）
+        
+        提炼请求使用固定的温度和输出长度并开启响应缓存，
+        相同内容的分段再次提炼时直接命中缓存（按内容哈希）。
+        
+        Args:
+            chunks: 分段列表
+            level: 汇总层级（第 1 层为原文分段）
+            on_progress: 进度回调，每完成一段调用一次
+            
+        Returns:
+            各分段要点（与输入顺序一致）
+        """
+        done = 0
+        
+        async def summarize_one(chunk: str) -> str:
+            nonlocal done
+            with self.llm_service.track_usage(propagate=True) as usage:
+                result = await self.llm_service.simple_chat(
+                    user_message=chunk,
+                    system_prompt=self.prompt_config.get('map_system_prompt', "请提炼以下片段的要点。"),
+                    stream=False,
+                    temperature=self.config.get('map_temperature', 0.2),
+                    max_tokens=self.config.get('map_max_tokens', 600),
+                    cache=True
+                )
+            done += 1
+            if on_progress:
+                on_progress({
+                    'stage': 'map', 'level': level, 'done': done, 'total': len(chunks),
+                    'cached': usage.cached_calls > 0
+                })
+            return result.strip()
+        
+        return await run_batch(
+            chunks,
+            summarize_one,
+            concurrency=self.config.get('map_concurrency', 4),
+            max_retries=self.config.get('map_max_retries', 3),
+        )
+    
+    async def prepare_reduce_input(
+        self,
+        cleaned: str,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> str:
+        """生成最终小结的输入
+        
+        不超过 map_reduce_threshold_tokens 时原样返回；否则分段提炼，
+        提炼结果仍然过长时再分组提炼（最多 map_max_levels 层）。
+        
+        Args:
+            cleaned: 预处理后的文本
+            on_progress: 进度回调
+        """
+        threshold = self.config.get('map_reduce_threshold_tokens', 6000)
+        if count_tokens(cleaned) <= threshold:
+            return cleaned
+        
+        text = cleaned
+        for level in range(1, self.config.get('map_max_levels', 3) + 1):
+            chunks = self.split_chunks(text)
+            self.logger.info(f"[{self.name}] 长文本分段汇总：第 {level} 层，{len(chunks)} 段")
+            if on_progress:
+                on_progress({'stage': 'split', 'level': level, 'total': len(chunks)})
+            partials = await self.summarize_chunks(chunks, level=level, on_progress=on_progress)
+            text = '\n\n'.join(partials)
+            if count_tokens(text) <= threshold or len(chunks) == 1:
+                break
+        
+        if on_progress:
+            on_progress({'stage': 'reduce', 'level': level})
+        instruction = self.prompt_config.get('reduce_instruction', "以下是一份长记录按顺序分段提炼的要点：\n\n{content}")
+        return instruction.format(content=text)
     
     @staticmethod
     def wrap_summary_for_storage(summary: str) -> str:
@@ -7,6 +7,8 @@ from typing import AsyncIterator, Union, Optional, Dict, Any, Tuple
 import re
 from .base_agent import BaseAgent
 from .prompts import PromptLoader
+from ..utils.batch_executor import run_batch, is_rate_limit_error
+from ..utils.token_estimate import estimate_tokens
 
 
 class TranslationAgent(BaseAgent):
@@ -281,11 +283,150 @@ class TranslationAgent(BaseAgent):
         # 调用标准翻译方法
         return await self.translate(text, source_lang, target_lang, stream, **kwargs)
     
+    async def _run_batch(self, texts: list[str], worker) -> list:
+        """有限并发执行批量翻译
+        
+        并发数和限流重试次数由 batch_concurrency / batch_max_retries 配置。
+        """
+        return await run_batch(
+            texts,
+            worker,
+            concurrency=self.config.get('batch_concurrency', 8),
+            max_retries=self.config.get('batch_max_retries', 3),
+        )
+    
+    # ==================== 打包翻译 ====================
+    
+    # 打包格式的编号标记：<<1>>、<<2>> ...
+    _PACK_MARKER = re.compile(r'^[ \t]*<<(\d+)>>[ \t]*', re.MULTILINE)
+    
+    def build_packs(self, items: list[Tuple[int, str]]) -> list[list[Tuple[int, str]]]:
+        """按 token 预算将短文本分组
+        
+        Args:
+            items: (原始序号, 文本) 列表
+            
+        Returns:
+            分组列表；单条超出预算的文本单独成组
+        """
+        budget = self.config.get('pack_max_tokens', 1200)
+        max_segments = self.config.get('pack_max_segments', 30)
+        
+        packs: list[list[Tuple[int, str]]] = []
+        current: list[Tuple[int, str]] = []
+        current_tokens = 0
+        for item in items:
+            # 每段额外计入编号标记和换行
+            tokens = estimate_tokens(item[1]) + 4
+            if current and (current_tokens + tokens > budget or len(current) >= max_segments):
+                packs.append(current)
+                current, current_tokens = [], 0
+            current.append(item)
+            current_tokens += tokens
+        if current:
+            packs.append(current)
+        return packs
+    
+    @staticmethod
+    def format_pack(segments: list[str]) -> str:
+        """将多段文本格式化为带编号标记的输入"""
+        return '\n'.join(f"<<{i}>> {text}" for i, text in enumerate(segments, 1))
+    
+    @classmethod
+    def parse_pack(cls, response: str, count: int) -> Dict[int, str]:
+        """解析打包翻译的输出
+        
+        只返回通过校验的段落（编号在范围内、只出现一次、内容非空且不含残留标记），
+        缺失的编号由调用方逐条重新翻译。
+        
+        Returns:
+            {编号(从1开始): 译文}
+        """
+        matches = list(cls._PACK_MARKER.finditer(response or ''))
+        parsed: Dict[int, str] = {}
+        duplicated = set()
+        for pos, match in enumerate(matches):
+            number = int(match.group(1))
+            end = matches[pos + 1].start() if pos + 1 < len(matches) else len(response)
+            text = response[match.end():end].strip()
+            if number in parsed:
+                duplicated.add(number)
+            parsed[number] = text
+        
+        return {
+            number: text for number, text in parsed.items()
+            if 1 <= number <= count and number not in duplicated
+            and text and '<<' not in text
+        }
+    
+    def get_packed_system_prompt(self, source_lang: str, target_lang: str) -> str:
+        """打包翻译使用的系统提示词（在普通提示词后追加格式说明）"""
+        return self.get_system_prompt(source_lang, target_lang) + self.prompt_config.get('packed_instruction', '')
+    
+    async def _pack_translate(
+        self,
+        items: list[Tuple[int, str]],
+        source_lang: str,
+        target_lang: str,
+        **kwargs
+    ) -> Dict[int, str]:
+        """打包翻译同一方向的多条文本，对齐失败的段落回退为逐条翻译
+        
+        Args:
+            items: (原始序号, 文本) 列表，文本已去除首尾空白且非空
+            
+        Returns:
+            {原始序号: 译文}
+        """
+        packs = self.build_packs(items)
+        system_prompt = self.get_packed_system_prompt(source_lang, target_lang)
+        
+        async def translate_pack(pack: list[Tuple[int, str]]) -> Dict[int, str]:
+            if len(pack) == 1:
+                # 单条无需打包
+                return {}
+            try:
+                response = await self.llm_service.simple_chat(
+                    user_message=self.format_pack([text for _, text in pack]),
+                    system_prompt=system_prompt,
+                    stream=False,
+                    **kwargs
+                )
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    raise
+                self.logger.warning(f"[{self.name}] 打包翻译失败，回退逐条翻译: {e}")
+                return {}
+            parsed = self.parse_pack(response, len(pack))
+            if len(parsed) < len(pack):
+                self.logger.warning(
+                    f"[{self.name}] 打包翻译对齐失败 {len(pack) - len(parsed)}/{len(pack)} 段，回退逐条翻译"
+                )
+            return {pack[number - 1][0]: text for number, text in parsed.items()}
+        
+        translated: Dict[int, str] = {}
+        for result in await self._run_batch(packs, translate_pack):
+            translated.update(result)
+        
+        fallback = [item for item in items if item[0] not in translated]
+        if fallback:
+            async def translate_one(item: Tuple[int, str]) -> str:
+                return await self.translate(item[1], source_lang, target_lang, stream=False, **kwargs)
+            
+            for (index, _), text in zip(fallback, await self._run_batch(fallback, translate_one)):
+                translated[index] = text
+        
+        self.logger.info(
+            f"[{self.name}] 打包翻译: {len(items)} 条 -> {len(packs)} 个请求，逐条回退 {len(fallback)} 条"
+        )
+        return translated
+    
     async def batch_translate(
         self,
         texts: list[str],
         source_lang: str,
         target_lang: str,
+        packed: bool = False,
         **kwargs
     ) -> list[str]:
         """批量翻译（指定源语言和目标语言）
@@ -294,22 +435,28 @@ class TranslationAgent(BaseAgent):
             texts: 待翻译文本列表
             source_lang: 源语言代码
             target_lang: 目标语言代码
+            packed: 是否将多条短文本打包为一次请求（共享系统提示词）
             **kwargs: 其他参数
             
         Returns:
-            翻译结果列表
+            翻译结果列表（顺序与输入一致）
         """
-        results = []
-        for text in texts:
+        if packed:
+            items = [(i, text.strip()) for i, text in enumerate(texts) if text.strip()]
+            translated = await self._pack_translate(items, source_lang, target_lang, **kwargs)
+            results = [translated.get(i, "") for i in range(len(texts))]
+            self.logger.info(f"[{self.name}] 批量翻译完成: {len(texts)} 条")
+            return results
+        
+        async def translate_one(text: str) -> str:
             if not text.strip():
-                results.append("")
-                continue
-            
-            result = await self.translate(
-                text, source_lang, target_lang, 
+                return ""
+            return await self.translate(
+                text, source_lang, target_lang,
                 stream=False, **kwargs
             )
-            results.append(result)
+        
+        results = await self._run_batch(texts, translate_one)
         
         self.logger.info(f"[{self.name}] 批量翻译完成: {len(texts)} 条")
         return results
@@ -318,6 +465,7 @@ class TranslationAgent(BaseAgent):
         self,
         texts: list[str],
         pair_key: str,
+        packed: bool = False,
         **kwargs
     ) -> list[Union[str, Dict[str, Any]]]:
         """批量翻译（使用语言对，自动检测每条文本的翻译方向）
@@ -325,6 +473,7 @@ class TranslationAgent(BaseAgent):
         Args:
             texts: 待翻译文本列表
             pair_key: 语言对键（如 'zh-en', 'en-ja'）
+            packed: 是否将同一翻译方向的短文本打包为一次请求
             **kwargs: 其他参数
             
         Returns:
@@ -332,19 +481,41 @@ class TranslationAgent(BaseAgent):
             - 成功：返回翻译后的字符串
             - 失败：返回 {"error": "language_not_detected", "message": "..."}
         """
-        results = []
-        for text in texts:
-            if not text.strip():
-                results.append("")
-                continue
+        if packed:
+            results: list[Union[str, Dict[str, Any]]] = [""] * len(texts)
+            groups: Dict[Tuple[str, str], list[Tuple[int, str]]] = {}
+            for i, text in enumerate(texts):
+                if not text.strip():
+                    continue
+                source_lang, target_lang, is_valid = self.resolve_translation_direction(pair_key, text)
+                if not is_valid:
+                    results[i] = {
+                        "error": "language_not_detected",
+                        "message": f"未检测到互译语种（{pair_key}）",
+                        "detected_lang": self.detect_language(text),
+                        "expected_langs": [source_lang, target_lang]
+                    }
+                    continue
+                groups.setdefault((source_lang, target_lang), []).append((i, text.strip()))
+            
+            for (source_lang, target_lang), items in groups.items():
+                translated = await self._pack_translate(items, source_lang, target_lang, **kwargs)
+                for index, text in translated.items():
+                    results[index] = text
             
+            self.logger.info(f"[{self.name}] 批量翻译完成: {len(texts)} 条，语言对={pair_key}")
+            return results
+        
+        async def translate_one(text: str) -> Union[str, Dict[str, Any]]:
+            if not text.strip():
+                return ""
             # 每条文本单独判断翻译方向
-            result = await self.translate_with_pair(
-                text, pair_key, 
+            return await self.translate_with_pair(
+                text, pair_key,
                 stream=False, **kwargs
             )
-            results.append(result)
+        
+        results = await self._run_batch(texts, translate_one)
         
         self.logger.info(f"[{self.name}] 批量翻译完成: {len(texts)} 条，语言对={pair_key}")
         return results
-
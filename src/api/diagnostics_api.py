@@ -0,0 +1,191 @@
+"""
+运行时诊断API接口
+
+提供栈采样分析（火焰图折叠栈）、tracemalloc 内存快照及对象探针查询
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from src.services.diagnostics_service import DiagnosticsService, ProfilerBusyError
+from src.core.config import Config
+from src.core.logger import get_logger
+
+logger = get_logger("DiagnosticsAPI")
+
+# 创建API路由器
+router = APIRouter(prefix="/api/admin/diagnostics", tags=["运行时诊断"])
+
+# 全局服务实例（由主应用初始化）
+diagnostics_service: Optional[DiagnosticsService] = None
+
+
+def init_diagnostics_service(config: Config) -> Optional[DiagnosticsService]:
+    """初始化诊断服务（由主应用调用）
+
+    Returns:
+        诊断服务实例；配置禁用时返回 None
+    """
+    global diagnostics_service
+
+    if not config.get('diagnostics.enabled', True):
+        diagnostics_service = None
+        logger.info("[诊断API] 诊断接口已禁用")
+        return None
+
+    try:
+        diagnostics_service = DiagnosticsService(
+            max_snapshots=config.get('diagnostics.max_snapshots', 5),
+            loop_lag_interval_ms=config.get('diagnostics.loop_lag_interval_ms', 50)
+        )
+        logger.info("[诊断API] 服务初始化完成")
+        return diagnostics_service
+    except Exception as e:
+        logger.error(f"[诊断API] 服务初始化失败: {e}", exc_info=True)
+        raise
+
+
+def _require_service() -> DiagnosticsService:
+    if not diagnostics_service:
+        raise HTTPException(status_code=503, detail="诊断服务未启用")
+    return diagnostics_service
+
+
+# ==================== 请求/响应模型 ====================
+
+class DiagnosticsResponse(BaseModel):
+    """诊断响应"""
+    success: bool
+    data: Optional[dict] = None
+    error: Optional[str] = None
+
+
+class TracemallocStartRequest(BaseModel):
+    """启动内存追踪请求"""
+    nframes: int = Field(25, ge=1, le=100, description="每次分配记录的栈深度")
+
+
+class SnapshotRequest(BaseModel):
+    """拍摄快照请求"""
+    label: Optional[str] = Field(None, max_length=100, description="快照标签")
+
+
+class SnapshotDiffRequest(BaseModel):
+    """快照对比请求"""
+    base_id: int = Field(..., description="基准快照ID")
+    target_id: Optional[int] = Field(None, description="目标快照ID（为空时使用最新快照）")
+    key_type: str = Field('lineno', description="分组方式: lineno / filename / traceback")
+    limit: int = Field(30, ge=1, le=500, description="返回条目数")
+    path_filters: Optional[List[str]] = Field(
+        None,
+        description="仅统计路径包含这些子串的分配，如 ['src/api/server.py', 'smart_chat_agent.py']"
+    )
+
+
+# ==================== API端点 ====================
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def run_profile(
+    seconds: float = Query(10.0, gt=0, description="采样时长（秒）"),
+    interval_ms: float = Query(5.0, ge=1, le=1000, description="采样间隔（毫秒）"),
+    thread: Optional[str] = Query(None, description="仅采样线程名包含该子串的线程"),
+):
+    """对所有线程执行栈采样，返回火焰图兼容的折叠栈文本
+
+    采样在线程池中执行，事件循环线程（MainThread）会被正常采样。
+    输出可直接用于 flamegraph.pl 或导入 speedscope。
+    """
+    service = _require_service()
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(None, service.profile, seconds, interval_ms, thread)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filename = f"mindvoice-profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return PlainTextResponse(
+        service.sampler.to_collapsed(result['stacks']),
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Profile-Samples': str(result['samples']),
+            'X-Profile-Duration': str(result['duration']),
+        }
+    )
+
+
+@router.get("/probes", response_model=DiagnosticsResponse)
+async def get_probes():
+    """获取关键对象（消息缓冲区、对话历史、录音缓冲区等）的当前大小"""
+    service = _require_service()
+    return DiagnosticsResponse(success=True, data={
+        'probes': service.collect_probes(),
+        'tracing': service.memory.is_tracing,
+        'profiling': service.sampler.is_running,
+    })
+
+
+@router.get("/loop-lag", response_model=DiagnosticsResponse)
+async def get_loop_lag(reset: bool = Query(False, description="读取后是否清零统计")):
+    """获取事件循环延迟统计（压测时按阶段 reset，衡量同步代码对事件循环的阻塞）"""
+    service = _require_service()
+    return DiagnosticsResponse(success=True, data=service.loop_lag.get_stats(reset=reset))
+
+
+@router.post("/tracemalloc/start", response_model=DiagnosticsResponse)
+async def start_tracemalloc(request: TracemallocStartRequest):
+    """开始追踪内存分配（会带来一定的运行开销，排查完成后请停止）"""
+    service = _require_service()
+    return DiagnosticsResponse(success=True, data=service.memory.start(request.nframes))
+
+
+@router.post("/tracemalloc/stop", response_model=DiagnosticsResponse)
+async def stop_tracemalloc():
+    """停止追踪内存分配并清除快照"""
+    service = _require_service()
+    return DiagnosticsResponse(success=True, data=service.memory.stop())
+
+
+@router.post("/tracemalloc/snapshots", response_model=DiagnosticsResponse)
+async def take_snapshot(request: SnapshotRequest):
+    """拍摄内存快照（同时记录当前探针数据，便于对照）"""
+    service = _require_service()
+    try:
+        loop = asyncio.get_running_loop()
+        info = await loop.run_in_executor(None, service.memory.take, request.label)
+        return DiagnosticsResponse(success=True, data={**info, 'probes': service.collect_probes()})
+    except RuntimeError as e:
+        return DiagnosticsResponse(success=False, error=str(e))
+
+
+@router.get("/tracemalloc/snapshots", response_model=DiagnosticsResponse)
+async def list_snapshots():
+    """列出已保存的内存快照"""
+    service = _require_service()
+    return DiagnosticsResponse(success=True, data={'snapshots': service.memory.list()})
+
+
+@router.post("/tracemalloc/diff", response_model=DiagnosticsResponse)
+async def diff_snapshots(request: SnapshotDiffRequest):
+    """对比两个内存快照，按增长量降序返回分配位置"""
+    service = _require_service()
+    try:
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            None,
+            lambda: service.memory.diff(
+                request.base_id,
+                target_id=request.target_id,
+                key_type=request.key_type,
+                limit=request.limit,
+                path_filters=request.path_filters,
+            )
+        )
+        return DiagnosticsResponse(success=True, data=data)
+    except (KeyError, ValueError) as e:
+        return DiagnosticsResponse(success=False, error=str(e).strip("'"))
@@ -8,13 +8,12 @@ import sys
 import os
 import json
 import base64
-import uuid
 import signal
 from datetime import datetime
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional, Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Form, Header
 from fastapi.responses import StreamingResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
@@ -30,18 +29,26 @@ from src.core.logger import get_logger
 from src.core.error_codes import SystemError, SystemErrorInfo
 from src.services.voice_service import VoiceService
 from src.services.llm_service import LLMService
+from src.services.live_summary_service import LiveSummaryService
 from src.services.knowledge_service import KnowledgeService
 from src.services.export_service import MarkdownExportService, HtmlExportService
+from src.services.bulk_export_service import BulkExportService
+from src.services.image_store_service import ImageStoreService, ImageTooLargeError, UnsupportedImageTypeError
+from src.services.record_patch_service import RecordPatchService, RecordPatchConflictError
+from src.services.record_indexer import RecordIndexer
 from src.services.cleanup_service import CleanupService
 from src.services.consumption_service import ConsumptionService
 from src.services.tts_service import TTSService
 from src.utils.audio_recorder import SoundDeviceRecorder
+from src.utils.stage_timer import StageTimer
 from src.agents import SummaryAgent, SmartChatAgent
 from src.agents.translation_agent import TranslationAgent
 from src.api.membership_api import router as membership_router, init_membership_services
 from src.api.user_api import router as user_router, init_user_service
 from src.api import user_api
+from src.api import membership_api
 from src.api.tag_api import router as tag_router, init_tag_service
+from src.api.diagnostics_api import router as diagnostics_router, init_diagnostics_service
 
 logger = get_logger("API")
 
@@ -65,6 +72,9 @@ async def lifespan(app: FastAPI):
         setup_llm_service()
         logger.info("[API] LLM服务已初始化")
         
+        setup_live_summary_service()
+        logger.info("[API] 滚动小结服务已初始化")
+        
         setup_tts_service()
         logger.info("[API] TTS服务已初始化")
         
@@ -80,6 +90,17 @@ async def lifespan(app: FastAPI):
         setup_tag_service()
         logger.info("[API] 标签服务已初始化")
         
+        setup_diagnostics_service()
+        logger.info("[API] 诊断服务已初始化")
+        
+        setup_image_store()
+        logger.info("[API] 图片存储已初始化")
+        
+        setup_record_patch_service()
+        logger.info("[API] 增量保存服务已初始化")
+        
+        setup_record_indexer()
+        
         # 在异步上下文中启动知识库模型的后台加载（不阻塞）
         if knowledge_service and hasattr(knowledge_service, 'start_background_load'):
             load_task = knowledge_service.start_background_load()
@@ -94,6 +115,20 @@ async def lifespan(app: FastAPI):
             except Exception as e:
                 logger.error(f"[API] 启动清理服务失败: {e}")
         
+        # 启动增量保存后台任务
+        if record_patch_service:
+            try:
+                await record_patch_service.start()
+            except Exception as e:
+                logger.error(f"[API] 启动增量保存服务失败: {e}")
+        
+        # 启动笔记记录索引（低优先级后台任务）
+        if record_indexer:
+            try:
+                await record_indexer.start()
+            except Exception as e:
+                logger.error(f"[API] 启动笔记记录索引失败: {e}")
+        
         logger.info("[API] 所有服务初始化完成，服务器准备就绪")
     except Exception as e:
         logger.error(f"[API] 服务初始化失败: {e}", exc_info=True)
@@ -113,6 +148,28 @@ async def lifespan(app: FastAPI):
             except Exception as e:
                 logger.error(f"停止清理服务失败: {e}")
         
+        # 写入未落库的增量保存（必须在关闭存储之前）
+        if record_patch_service:
+            try:
+                await asyncio.wait_for(record_patch_service.stop(), timeout=5.0)
+            except asyncio.TimeoutError:
+                logger.warning("[API] 增量保存写入超时，部分修改可能丢失")
+            except Exception as e:
+                logger.error(f"停止增量保存服务失败: {e}")
+        
+        # 停止笔记记录索引（水位线已按批保存，下次启动继续）
+        if record_indexer:
+            try:
+                await asyncio.wait_for(record_indexer.stop(), timeout=2.0)
+            except asyncio.TimeoutError:
+                logger.warning("[API] 笔记记录索引停止超时")
+            except Exception as e:
+                logger.error(f"停止笔记记录索引失败: {e}")
+        
+        # 释放图片存储线程池
+        if image_store:
+            image_store.shutdown()
+        
         # 清理知识库服务（同步操作，快速执行）
         if knowledge_service:
             try:
@@ -178,6 +235,9 @@ app.include_router(user_router)
 # 注册标签管理API路由
 app.include_router(tag_router)
 
+# 注册运行时诊断API路由
+app.include_router(diagnostics_router)
+
 # 全局服务实例
 voice_service: Optional[VoiceService] = None
 llm_service: Optional[LLMService] = None
@@ -188,6 +248,10 @@ summary_agent: Optional[SummaryAgent] = None
 smart_chat_agent: Optional[SmartChatAgent] = None
 translation_agent: Optional[TranslationAgent] = None
 cleanup_service: Optional[CleanupService] = None
+image_store: Optional[ImageStoreService] = None
+record_patch_service: Optional[RecordPatchService] = None
+record_indexer: Optional[RecordIndexer] = None
+live_summary_service: Optional[LiveSummaryService] = None
 config: Optional[Config] = None
 recorder: Optional[SoundDeviceRecorder] = None
 
@@ -203,6 +267,25 @@ def get_user_id_by_device(device_id: str) -> Optional[str]:
         logger.error(f"[API] 获取user_id失败: {e}", exc_info=True)
         return None
 
+
+def check_llm_quota_for_user(user_id: str, estimated_tokens: int) -> Optional[Dict[str, Any]]:
+    """检查用户LLM额度，额度不足时返回错误信息（会员服务不可用或检查失败时不拦截）"""
+    if not user_id or not membership_api.membership_service:
+        return None
+    try:
+        result = membership_api.membership_service.check_quota(
+            user_id=user_id,
+            consumption_type='llm',
+            estimated_amount=estimated_tokens
+        )
+    except Exception as e:
+        logger.error(f"[API] LLM额度检查失败: {e}", exc_info=True)
+        return None
+    if result.get('allowed', True):
+        return None
+    logger.warning(f"[API] LLM额度不足: user_id={user_id}, {result.get('reason')}")
+    return {'code': 'QUOTA_EXCEEDED', 'message': 'LLM额度不足，请升级会员或等待下月重置'}
+
 # WebSocket连接管理（单连接模式）
 current_connection: Optional[WebSocket] = None
 
@@ -279,6 +362,8 @@ class ChatResponse(BaseModel):
     success: bool
     message: Optional[str] = None
     error: Optional[Dict[str, Any]] = None  # 可以是字符串或 SystemErrorInfo 对象
+    context: Optional[Dict[str, Any]] = None  # SmartChat 上下文 token 报告（预算、实际、节省）
+    debug: Optional[Dict[str, Any]] = None  # SmartChat 调试信息（分阶段耗时、是否检索），请求 debug=true 时返回
 
 
 class SimpleChatRequest(BaseModel):
@@ -319,6 +404,7 @@ class BatchTranslateRequest(BaseModel):
     source_lang: Optional[str] = Field(None, description="源语言代码（zh/en/ja/ko），与language_pair二选一")
     target_lang: Optional[str] = Field(None, description="目标语言代码（zh/en/ja/ko），与language_pair二选一")
     language_pair: Optional[str] = Field(None, description="语言对（如 zh-en, en-ja），自动检测翻译方向")
+    packed: Optional[bool] = Field(None, description="是否将多条短文本打包为一次请求（默认读取 llm.batch_packing）")
     device_id: Optional[str] = Field(default=None, description="设备ID（用于消费记录）")
 
 
@@ -555,6 +641,125 @@ def setup_tag_service():
         # 不抛出异常，允许应用继续运行
 
 
+def setup_diagnostics_service():
+    """初始化运行时诊断服务，并注册关键对象探针"""
+    global config
+    
+    logger.info("[API] 初始化诊断服务...")
+    
+    try:
+        if config is None:
+            config = Config()
+        
+        service = init_diagnostics_service(config)
+        if not service:
+            return
+        
+        # 探针在调用时读取全局变量，服务重建后仍能拿到最新实例
+        service.register_probe('message_buffer', lambda: {
+            'messages': len(message_buffer.messages),
+            'max_size': message_buffer.max_size,
+            'counter': message_buffer.counter,
+        })
+        service.register_probe('smart_chat_history', lambda: {
+            'turns': len(smart_chat_agent.conversation_history),
+            'chars': sum(len(m.get('content', '')) for m in smart_chat_agent.conversation_history),
+            'max_history_turns': smart_chat_agent.max_history_turns,
+            'context': smart_chat_agent.get_conversation_summary()['context'],
+        } if smart_chat_agent else {'available': False})
+        service.register_probe('llm_cache', lambda: llm_service.get_cache_stats()
+                               if llm_service else {'available': False})
+        service.register_probe('llm_routing', lambda: llm_service.get_routing_stats()
+                               if llm_service else {'available': False})
+        service.register_probe('recorder', lambda: {
+            'audio_buffer_bytes': len(recorder.audio_buffer),
+            'max_buffer_bytes': recorder.max_buffer_size,
+            'audio_queue_size': recorder.audio_queue.qsize(),
+        } if recorder else {'available': False})
+        service.register_probe('event_loop', lambda: service.loop_lag.get_stats())
+        
+        # 在 lifespan 的事件循环中启动延迟监控（interval 配置为 0 时不启动）
+        if service.loop_lag.interval > 0:
+            service.loop_lag.start()
+        
+        logger.info("[API] 诊断服务初始化完成")
+    except Exception as e:
+        logger.error(f"[API] 诊断服务初始化失败: {e}")
+        # 不抛出异常，允许应用继续运行
+
+
+def setup_image_store():
+    """初始化图片存储（内容寻址）"""
+    global image_store, config
+    
+    try:
+        if config is None:
+            config = Config()
+        
+        data_dir = Path(config.get('storage.data_dir')).expanduser()
+        images_dir = data_dir / config.get('storage.images', 'images')
+        image_store = ImageStoreService(
+            images_dir,
+            thumbnail_widths=tuple(config.get('storage.thumbnail_widths', [320]))
+        )
+        logger.info(f"[API] 图片存储初始化完成: {images_dir}")
+    except Exception as e:
+        logger.error(f"[API] 图片存储初始化失败: {e}", exc_info=True)
+        image_store = None
+
+
+def setup_record_patch_service():
+    """初始化增量保存服务（依赖语音服务的存储提供者）"""
+    global record_patch_service, config
+    
+    try:
+        if config is None:
+            config = Config()
+        
+        if not voice_service or not voice_service.storage_provider:
+            logger.warning("[API] 存储服务不可用，增量保存服务未启用")
+            return
+        
+        record_patch_service = RecordPatchService(voice_service.storage_provider, config._config)
+    except Exception as e:
+        logger.error(f"[API] 增量保存服务初始化失败: {e}", exc_info=True)
+        record_patch_service = None
+
+
+def setup_record_indexer():
+    """初始化笔记记录索引（依赖知识库服务与语音服务的存储提供者）"""
+    global record_indexer, config
+    
+    try:
+        if config is None:
+            config = Config()
+        
+        indexer_config = config.get('knowledge.record_indexer', {}) or {}
+        if not indexer_config.get('enabled', False):
+            return
+        if not knowledge_service or not voice_service or not voice_service.storage_provider:
+            logger.warning("[API] 知识库或存储服务不可用，笔记记录索引未启用")
+            return
+        
+        # 录音进行中暂停索引，不与实时识别争用 CPU
+        record_indexer = RecordIndexer(
+            voice_service.storage_provider,
+            knowledge_service,
+            indexer_config,
+            is_busy=lambda: voice_service is not None and voice_service.get_state() != RecordingState.IDLE
+        )
+        logger.info("[API] 笔记记录索引已初始化")
+    except Exception as e:
+        logger.error(f"[API] 笔记记录索引初始化失败: {e}", exc_info=True)
+        record_indexer = None
+
+
+async def flush_record_patches(record_id: Optional[str] = None):
+    """写入未落库的增量保存（读取或整篇覆盖记录前调用，保证读到最新内容）"""
+    if record_patch_service and record_patch_service.has_pending(record_id):
+        await record_patch_service.flush(record_id)
+
+
 def setup_knowledge_service():
     """初始化知识库服务（独立于LLM服务）"""
     global knowledge_service, config
@@ -575,12 +780,24 @@ def setup_knowledge_service():
                 data_dir=data_dir,
                 knowledge_relative_path=knowledge_relative,
                 embedding_model=config.get('knowledge.embedding_model', 'all-MiniLM-L6-v2'),
-                lazy_load=config.get('knowledge.lazy_load', True)
+                lazy_load=config.get('knowledge.lazy_load', True),
+                embedding_cache=config.get('knowledge.embedding_cache', True),
+                search_cache_size=config.get('knowledge.search_cache_size', 512),
+                search_result_ttl=config.get('knowledge.search_result_ttl_seconds', 60),
+                embed_batch_size=config.get('knowledge.embed_batch_size', 64),
+                search_mode=config.get('knowledge.search_mode', 'hybrid'),
+                rrf_k=config.get('knowledge.rrf_k', 60),
+                embedding_backend=config.get('knowledge.embedding_backend', 'sentence_transformers'),
+                embedding_options=config.get('knowledge.embedding_options', {}) or {},
+                include_records=config.get('knowledge.record_indexer.enabled', False),
+                embedding_worker=config.get('knowledge.embedding_worker', {}) or {},
+                reranker=config.get('knowledge.reranker', {}) or {}
             )
             logger.info(f"[API] 知识库服务初始化成功（延迟加载模式，路径: {data_dir / knowledge_relative}）")
         except ImportError as e:
             logger.warning(f"[API] 知识库服务初始化失败（依赖未安装）: {e}")
-            logger.warning("[API] 如需使用知识库功能，请安装: pip install sentence-transformers chromadb")
+            logger.warning("[API] 如需使用知识库功能，请安装: pip install sentence-transformers chromadb"
+                           "（或 onnxruntime tokenizers，并设置 knowledge.embedding_backend: onnx）")
             knowledge_service = None
         except Exception as e:
             logger.error(f"[API] 知识库服务初始化失败: {e}", exc_info=True)
@@ -613,16 +830,44 @@ def setup_llm_service():
             summary_agent = SummaryAgent(llm_service)
             logger.info(f"[API] {summary_agent.name} 初始化完成")
             
+            def on_summary_usage(user_id: str, device_id: str, usage: dict):
+                # 滚动摘要在后台完成，用量单独记录到触发它的请求所属用户
+                if not consumption_service or not llm_service.llm_provider:
+                    return
+                try:
+                    consumption_service.record_llm_consumption(
+                        user_id=user_id,
+                        device_id=device_id,
+                        prompt_tokens=usage.get('prompt_tokens', 0),
+                        completion_tokens=usage.get('completion_tokens', 0),
+                        total_tokens=usage.get('total_tokens', 0),
+                        model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                        provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
+                        model_source='vendor'
+                    )
+                except Exception as e:
+                    logger.error(f"[SmartChat] 记录滚动摘要LLM消费失败: {e}", exc_info=True)
+            
             # 初始化 SmartChatAgent（使用 voice_service 的 storage_provider）
             smart_chat_agent = SmartChatAgent(
                 llm_service=llm_service,
                 knowledge_service=knowledge_service,  # 使用已初始化的知识库服务
-                storage_provider=voice_service.storage_provider if voice_service else None
+                storage_provider=voice_service.storage_provider if voice_service else None,
+                config={
+                    'max_context_tokens': config.get('llm.max_context_tokens', 128000),
+                    **(config.get('smart_chat', {}) or {}),
+                },
+                on_summary_usage=on_summary_usage
             )
             logger.info(f"[API] {smart_chat_agent.name} 初始化完成")
             
             # 初始化 TranslationAgent
-            translation_agent = TranslationAgent(llm_service)
+            translation_agent = TranslationAgent(llm_service, config={
+                'batch_concurrency': config.get('llm.batch_concurrency', 8),
+                'batch_max_retries': config.get('llm.batch_max_retries', 3),
+                'pack_max_tokens': config.get('llm.pack_max_tokens', 1200),
+                'pack_max_segments': config.get('llm.pack_max_segments', 30),
+            })
             logger.info(f"[API] {translation_agent.name} 初始化完成")
         else:
             logger.warning("[API] LLM 服务不可用，相关功能将受限")
@@ -634,6 +879,53 @@ def setup_llm_service():
         translation_agent = None
 
 
+def setup_live_summary_service():
+    """初始化滚动小结服务（录音过程中增量更新小结，依赖语音服务和 LLM 服务）"""
+    global live_summary_service, config
+    
+    try:
+        if config is None:
+            config = Config()
+        
+        live_config = config.get('live_summary', {}) or {}
+        if not live_config.get('enabled', False):
+            logger.info("[API] 滚动小结未启用")
+            return
+        if not voice_service or not llm_service or not llm_service.is_available():
+            logger.warning("[API] 语音服务或 LLM 服务不可用，滚动小结未启用")
+            return
+        
+        def on_live_summary(state: dict):
+            usage = state.pop('usage', None)
+            broadcast({"type": "live_summary", **state})
+            
+            # 每次增量更新单独记录 LLM 消费（录音设备对应的用户）
+            device_id = voice_service._device_id
+            if usage and device_id and consumption_service and llm_service.llm_provider:
+                try:
+                    user_id = get_user_id_by_device(device_id)
+                    if user_id:
+                        consumption_service.record_llm_consumption(
+                            user_id=user_id,
+                            device_id=device_id,
+                            prompt_tokens=usage.get('prompt_tokens', 0),
+                            completion_tokens=usage.get('completion_tokens', 0),
+                            total_tokens=usage.get('total_tokens', 0),
+                            model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                            provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
+                            model_source='vendor'
+                        )
+                except Exception as e:
+                    logger.error(f"[LiveSummary] 记录LLM消费失败: {e}", exc_info=True)
+        
+        live_summary_service = LiveSummaryService(llm_service, live_config, on_update=on_live_summary)
+        voice_service.set_live_summary_service(live_summary_service)
+        logger.info("[API] 滚动小结服务初始化完成")
+    except Exception as e:
+        logger.error(f"[API] 滚动小结服务初始化失败: {e}", exc_info=True)
+        live_summary_service = None
+
+
 def setup_tts_service():
     """初始化 TTS 服务"""
     global tts_service, config
@@ -1059,6 +1351,11 @@ async def update_record(record_id: str, request: SaveTextRequest):
         )
     
     try:
+        # 整篇保存会覆盖增量保存的内容：先写入待落库的补丁，再丢弃内存文档
+        if record_patch_service:
+            await record_patch_service.flush(record_id)
+            record_patch_service.discard(record_id)
+        
         # 检查记录是否存在
         existing_record = voice_service.storage_provider.get_record(record_id)
         if not existing_record:
@@ -1161,6 +1458,46 @@ async def update_record(record_id: str, request: SaveTextRequest):
         )
 
 
+class PatchRecordBlocksRequest(BaseModel):
+    """块级增量保存请求"""
+    upserts: list[Dict[str, Any]] = Field(default_factory=list, description="新增或修改的块（按 id 匹配，整块替换）")
+    deletes: list[str] = Field(default_factory=list, description="删除的块ID")
+    order: Optional[list[str]] = Field(None, description="完整的块ID顺序（块有移动或新增时提供）")
+    metadata: Optional[Dict[str, Any]] = Field(None, description="需要合并的顶层元数据（如 noteInfo、trigger）")
+    flush: bool = Field(False, description="是否立即落库（如关闭笔记时）")
+
+
+@app.patch("/api/records/{record_id}/blocks", response_model=dict)
+async def patch_record_blocks(record_id: str, request: PatchRecordBlocksRequest):
+    """块级增量保存（用于自动保存）
+    
+    只传输变化的块，服务端在内存中合并连续编辑，静默一段时间后统一落库；
+    全文索引在空闲时重建。返回 409 时前端应回退为整篇保存（PUT）。
+    """
+    if not record_patch_service:
+        raise HTTPException(status_code=503, detail="增量保存服务未启用")
+    
+    try:
+        result = await record_patch_service.apply_patch(
+            record_id,
+            upserts=request.upserts,
+            deletes=request.deletes,
+            order=request.order,
+            metadata=request.metadata
+        )
+        if request.flush:
+            await record_patch_service.flush(record_id)
+            result['pending'] = False
+        return {"success": True, "record_id": record_id, **result}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="记录不存在")
+    except RecordPatchConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"[API] 增量保存失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"增量保存失败: {str(e)}")
+
+
 @app.get("/api/records", response_model=ListRecordsResponse)
 async def list_records(
     limit: int = 50, 
@@ -1192,6 +1529,8 @@ async def list_records(
         )
     
     try:
+        await flush_record_patches()
+        
         # 获取 user_id
         user_id = None
         device_id_to_use = device_id or globals().get('device_id')  # 使用请求参数或全局变量
@@ -1272,6 +1611,7 @@ async def get_record(record_id: str):
         )
     
     try:
+        await flush_record_patches(record_id)
         record = voice_service.storage_provider.get_record(record_id)
         if not record:
             return GetRecordResponse(
@@ -1299,6 +1639,41 @@ async def get_record(record_id: str):
         )
 
 
+@app.get("/api/records/blocks/search")
+async def search_record_blocks(q: str, user_id: Optional[str] = None,
+                               app_type: Optional[str] = None, limit: int = 50):
+    """块级搜索：返回命中的块及所属记录ID"""
+    if not voice_service or not voice_service.storage_provider:
+        raise HTTPException(status_code=503, detail="存储服务未初始化")
+    storage = voice_service.storage_provider
+    if not hasattr(storage, 'search_record_blocks'):
+        raise HTTPException(status_code=501, detail="当前存储不支持块级搜索")
+    if not q.strip():
+        return {"success": True, "blocks": []}
+    
+    await flush_record_patches()
+    blocks = await asyncio.to_thread(
+        storage.search_record_blocks, q.strip(), user_id, app_type, max(1, min(limit, 200))
+    )
+    return {"success": True, "blocks": blocks}
+
+
+@app.get("/api/records/{record_id}/blocks")
+async def get_record_blocks(record_id: str, type: Optional[str] = None, summary_only: bool = False):
+    """按块读取记录（不返回整篇 metadata）"""
+    if not voice_service or not voice_service.storage_provider:
+        raise HTTPException(status_code=503, detail="存储服务未初始化")
+    storage = voice_service.storage_provider
+    if not hasattr(storage, 'get_record_blocks'):
+        raise HTTPException(status_code=501, detail="当前存储不支持块级读取")
+    
+    await flush_record_patches(record_id)
+    blocks = await asyncio.to_thread(storage.get_record_blocks, record_id, type, summary_only)
+    if not blocks and not storage.get_record(record_id):
+        raise HTTPException(status_code=404, detail="记录不存在")
+    return {"success": True, "record_id": record_id, "blocks": blocks}
+
+
 @app.get("/api/records/{record_id}/export")
 async def export_record_markdown(record_id: str, format: str = 'md'):
     """
@@ -1316,6 +1691,7 @@ async def export_record_markdown(record_id: str, format: str = 'md'):
     
     try:
         # 获取记录
+        await flush_record_patches(record_id)
         record = voice_service.storage_provider.get_record(record_id)
         if not record:
             raise HTTPException(status_code=404, detail="记录不存在")
@@ -1407,6 +1783,81 @@ async def export_record_markdown(record_id: str, format: str = 'md'):
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
 
+class BulkExportRequest(BaseModel):
+    """批量导出请求"""
+    record_ids: Optional[list[str]] = None  # 指定记录；为空时按筛选条件导出
+    format: str = 'md'  # 笔记格式：'md' 或 'html'
+    app_type: Optional[str] = None
+    user_id: Optional[str] = None
+
+
+@app.post("/api/records/export")
+async def export_records_bulk(request: BulkExportRequest):
+    """
+    批量导出记录为 ZIP（流式输出）
+    
+    边打包边发送：记录逐条读取，图片在线程池中分块读取并跨记录去重，
+    内存占用与导出数量无关。
+    """
+    if not voice_service or not voice_service.storage_provider:
+        raise HTTPException(status_code=503, detail="存储服务未初始化")
+    
+    if request.format not in ('md', 'html'):
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {request.format}")
+    
+    await flush_record_patches()
+    storage = voice_service.storage_provider
+    record_ids = request.record_ids
+    if not record_ids:
+        # 按筛选条件分页收集记录ID（只保留ID，避免一次加载全部记录）
+        record_ids = []
+        page_size = 200
+        offset = 0
+        while True:
+            page = await asyncio.to_thread(
+                storage.list_records,
+                limit=page_size, offset=offset,
+                app_type=request.app_type, user_id=request.user_id
+            )
+            record_ids.extend(r['id'] for r in page)
+            if len(page) < page_size:
+                break
+            offset += page_size
+    
+    if not record_ids:
+        raise HTTPException(status_code=404, detail="没有可导出的记录")
+    
+    data_dir = Path((config or Config()).get('storage.data_dir', '~/Library/Application Support/MindVoice')).expanduser()
+    exporter = BulkExportService(storage, data_dir)
+    
+    async def generate():
+        try:
+            async for chunk in exporter.stream_zip(record_ids, note_format=request.format):
+                if chunk:
+                    yield chunk
+        except Exception as e:
+            # 响应头已发送，只能中断传输；客户端会得到不完整的压缩包
+            logger.error(f"[Export] 批量导出中断: {e}", exc_info=True)
+            raise
+        finally:
+            exporter.shutdown()
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"笔记导出_{len(record_ids)}条_{timestamp}.zip"
+    logger.info(f"[Export] 开始批量导出 {len(record_ids)} 条记录: {filename}")
+    
+    from urllib.parse import quote
+    encoded_filename = quote(filename.encode('utf-8'))
+    
+    return StreamingResponse(
+        generate(),
+        media_type='application/zip',
+        headers={
+            'Content-Disposition': f"attachment; filename*=UTF-8''{encoded_filename}"
+        }
+    )
+
+
 @app.delete("/api/records/{record_id}")
 async def delete_record(record_id: str):
     """删除记录"""
@@ -1414,6 +1865,8 @@ async def delete_record(record_id: str):
         raise HTTPException(status_code=503, detail="存储服务未初始化")
     
     try:
+        if record_patch_service:
+            record_patch_service.discard(record_id)
         success = voice_service.storage_provider.delete_record(record_id)
         if not success:
             raise HTTPException(status_code=404, detail="记录不存在")
@@ -1459,6 +1912,10 @@ async def delete_records(request: DeleteRecordsRequest):
                 "error": error_info.to_dict()
             }
         
+        if record_patch_service:
+            for record_id in request.record_ids:
+                record_patch_service.discard(record_id)
+        
         # 检查存储提供者是否支持批量删除
         if hasattr(voice_service.storage_provider, 'delete_records'):
             deleted_count = voice_service.storage_provider.delete_records(request.record_ids)
@@ -1498,7 +1955,7 @@ async def delete_records(request: DeleteRecordsRequest):
 class SaveImageRequest(BaseModel):
     """保存图片请求"""
     image_data: str = Field(..., description="Base64编码的图片数据")
-    filename: Optional[str] = Field(None, description="可选的文件名")
+    filename: Optional[str] = Field(None, description="已废弃：文件名由图片内容哈希决定")
 
 
 class SaveImageResponse(BaseModel):
@@ -1541,30 +1998,17 @@ async def save_image(request: SaveImageRequest):
                 }
             )
         
-        # 创建图片存储目录
-        data_dir = Path(config.get('storage.data_dir')).expanduser()
-        images_relative = Path(config.get('storage.images'))
-        images_dir = data_dir / images_relative
-        images_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 生成唯一文件名
-        if request.filename:
-            filename = request.filename
-        else:
-            # 使用时间戳 + UUID 生成唯一文件名
-            timestamp = int(asyncio.get_event_loop().time() * 1000)
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"{timestamp}-{unique_id}.png"
-        
-        # 保存图片
-        image_path = images_dir / filename
-        with open(image_path, 'wb') as f:
-            f.write(image_bytes)
-        
-        # 返回相对路径（前端可以通过 /api/images/{filename} 访问）
-        relative_url = f"images/{filename}"
+        if not image_store:
+            return SaveImageResponse(
+                success=False,
+                message="图片存储未初始化",
+                error={"code": "IMAGE_STORE_UNAVAILABLE", "details": "image_store is None"}
+            )
         
-        logger.info(f"[API] 已保存图片: {relative_url}, 大小: {len(image_bytes)} bytes")
+        # 按内容哈希保存（相同图片只存储一份），文件写入在线程池中进行
+        # filename 参数已废弃：文件名由内容决定
+        saved = await image_store.save_bytes(image_bytes)
+        relative_url = saved['image_url']
         
         return SaveImageResponse(
             success=True,
@@ -1584,30 +2028,116 @@ async def save_image(request: SaveImageRequest):
         )
 
 
+@app.post("/api/images/upload", response_model=SaveImageResponse)
+async def upload_image(file: UploadFile = File(...)):
+    """以 multipart 方式上传图片
+    
+    分块读取上传内容并流式写入，按 SHA-256 命名，相同内容直接复用已有文件。
+    
+    Returns:
+        保存后的图片URL（相对路径）
+    """
+    if not image_store:
+        return SaveImageResponse(
+            success=False,
+            message="图片存储未初始化",
+            error={"code": "IMAGE_STORE_UNAVAILABLE", "details": "image_store is None"}
+        )
+    
+    async def chunks():
+        while True:
+            chunk = await file.read(ImageStoreService.CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    try:
+        saved = await image_store.save_stream(chunks())
+        return SaveImageResponse(
+            success=True,
+            image_url=saved['image_url'],
+            message="图片已存在" if saved['deduplicated'] else "图片已保存"
+        )
+    except ImageTooLargeError as e:
+        return SaveImageResponse(
+            success=False,
+            message=str(e),
+            error={"code": "IMAGE_TOO_LARGE", "details": str(e)}
+        )
+    except UnsupportedImageTypeError as e:
+        return SaveImageResponse(
+            success=False,
+            message=str(e),
+            error={"code": "UNSUPPORTED_IMAGE_TYPE", "details": str(e)}
+        )
+    except ValueError as e:
+        return SaveImageResponse(
+            success=False,
+            message="图片数据格式错误",
+            error={"code": "INVALID_IMAGE_DATA", "details": str(e)}
+        )
+    except Exception as e:
+        logger.error(f"上传图片失败: {e}", exc_info=True)
+        return SaveImageResponse(
+            success=False,
+            message="保存图片失败",
+            error={"code": "SAVE_IMAGE_FAILED", "details": str(e)}
+        )
+    finally:
+        await file.close()
+
+
 @app.get("/api/images/{filename}")
-async def get_image(filename: str):
+async def get_image(filename: str, w: Optional[int] = None,
+                    if_none_match: Optional[str] = Header(None)):
     """获取图片文件
     
+    支持 ETag / If-None-Match 条件请求（304）和 Range 请求；
+    内容寻址的图片可被客户端长期缓存。
+    
     Args:
         filename: 图片文件名
+        w: 缩略图宽度（可选，列表视图使用；缩略图未生成时返回原图并在后台生成）
     
     Returns:
         图片文件
     """
+    if not image_store:
+        raise HTTPException(status_code=503, detail="图片存储未初始化")
+    
     try:
         # 安全检查：防止路径遍历攻击
         if '..' in filename or '/' in filename or '\\' in filename:
             raise HTTPException(status_code=400, detail="无效的文件名")
         
-        # 从配置读取图片目录
-        data_dir = Path(config.get('storage.data_dir')).expanduser()
-        images_relative = Path(config.get('storage.images'))
-        image_path = data_dir / images_relative / filename
-        
-        if not image_path.exists():
+        image_path = image_store.resolve(filename)
+        if not image_path:
             raise HTTPException(status_code=404, detail="图片不存在")
         
-        return FileResponse(image_path)
+        width = None
+        cache_control = image_store.get_cache_control(filename)
+        if w:
+            width = image_store.normalize_width(w)
+            thumbnail = image_store.get_thumbnail(filename, width)
+            if thumbnail:
+                image_path = thumbnail
+            else:
+                # 缩略图尚未生成，返回原图但不允许长期缓存
+                width = None
+                cache_control = 'no-cache'
+        
+        etag = image_store.get_etag(filename, image_path, width)
+        headers = {'ETag': etag, 'Cache-Control': cache_control}
+        if filename.lower().endswith('.svg'):
+            # 升级前已保存的 SVG：禁止脚本执行并作为附件下载，避免在 API 同源下运行
+            headers['Content-Security-Policy'] = 'sandbox'
+            headers['Content-Disposition'] = 'attachment'
+            headers['X-Content-Type-Options'] = 'nosniff'
+        
+        if image_store.etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        
+        return FileResponse(image_path, headers=headers)
         
     except HTTPException:
         raise
@@ -1871,6 +2401,33 @@ async def get_llm_info():
         return LLMInfoResponse(available=False)
 
 
+@app.get("/api/llm/cache/stats")
+async def get_llm_cache_stats():
+    """获取LLM响应缓存统计（命中率、节省的token）"""
+    if not llm_service:
+        return {"success": True, "stats": {"enabled": False}}
+    stats = await asyncio.to_thread(llm_service.get_cache_stats)
+    return {"success": True, "stats": stats}
+
+
+@app.get("/api/llm/routing/stats")
+async def get_llm_routing_stats():
+    """获取多端点路由统计（各端点延迟、错误率、熔断状态、对冲次数）"""
+    if not llm_service:
+        return {"success": True, "stats": {"enabled": False}}
+    return {"success": True, "stats": llm_service.get_routing_stats()}
+
+
+@app.delete("/api/llm/cache")
+async def clear_llm_cache():
+    """清空LLM响应缓存"""
+    if not llm_service or not llm_service.response_cache:
+        return {"success": True, "cleared": 0}
+    cleared = await asyncio.to_thread(llm_service.response_cache.clear)
+    logger.info(f"[API] 已清空LLM响应缓存: {cleared} 条")
+    return {"success": True, "cleared": cleared}
+
+
 @app.post("/api/llm/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """LLM对话接口（非流式）
@@ -1918,12 +2475,13 @@ async def chat(request: ChatRequest):
         messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
         
         # 调用LLM服务
-        response = await llm_service.chat(
-            messages=messages,
-            stream=False,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens
-        )
+        with llm_service.track_usage() as call_usage:
+            response = await llm_service.chat(
+                messages=messages,
+                stream=False,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens
+            )
         
         # 记录LLM消费（如果提供了device_id）
         if device_id and consumption_service and llm_service.llm_provider:
@@ -1932,7 +2490,7 @@ async def chat(request: ChatRequest):
                 if not user_id:
                     logger.warning(f"[API] 无法获取user_id，跳过LLM消费记录: device_id={device_id}")
                 else:
-                    usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
+                    usage = call_usage.to_usage()
                     if usage:
                         consumption_service.record_llm_consumption(
                             user_id=user_id,
@@ -1940,7 +2498,7 @@ async def chat(request: ChatRequest):
                             prompt_tokens=usage.get('prompt_tokens', 0),
                             completion_tokens=usage.get('completion_tokens', 0),
                             total_tokens=usage.get('total_tokens', 0),
-                            model=llm_service.llm_provider._config.get('model', 'unknown')
+                            model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown')
                         )
                         logger.info(f"[API] ✅ LLM消费已记录: user_id={user_id}, {usage['total_tokens']} tokens")
             except Exception as e:
@@ -2027,7 +2585,8 @@ async def simple_chat(request: SimpleChatRequest):
                         system_prompt=request.system_prompt,
                         stream=True,
                         temperature=request.temperature,
-                        max_tokens=request.max_tokens
+                        max_tokens=request.max_tokens,
+                        cache=True
                     ):
                         # 使用SSE格式发送数据
                         yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
@@ -2058,7 +2617,8 @@ async def simple_chat(request: SimpleChatRequest):
                 system_prompt=request.system_prompt,
                 stream=False,
                 temperature=request.temperature,
-                max_tokens=request.max_tokens
+                max_tokens=request.max_tokens,
+                cache=True
             )
             
             return ChatResponse(success=True, message=response)
@@ -2095,6 +2655,14 @@ async def simple_chat(request: SimpleChatRequest):
         return ChatResponse(success=False, error=error_info.to_dict())
 
 
+@app.get("/api/summary/live")
+async def get_live_summary():
+    """获取录音过程中的滚动小结（停止录音后 final=true 即为最终小结）"""
+    if not live_summary_service:
+        return {"success": False, "enabled": False}
+    return {"success": True, "enabled": True, **live_summary_service.get_state()}
+
+
 @app.post("/api/summary/generate")
 async def generate_summary(request: SummaryRequest):
     """生成多场景小结（使用专门的SummaryAgent）
@@ -2141,6 +2709,7 @@ async def generate_summary(request: SummaryRequest):
         from src.agents.summary_agent import SummaryAgent
         
         agent_config = {
+            **((config.get('summary', {}) if config else {}) or {}),  # 长文本分段汇总参数
             'prompt_variant': summary_type,
             'temperature': request.temperature,
             'max_tokens': request.max_tokens
@@ -2156,16 +2725,17 @@ async def generate_summary(request: SummaryRequest):
             # 返回流式响应
             async def generate():
                 try:
-                    # generate_summary 返回 AsyncIterator，直接迭代
-                    async for chunk in await current_agent.generate_summary(
-                        content=request.message,
-                        stream=True,
-                        temperature=request.temperature,
-                        max_tokens=request.max_tokens
-                    ):
-                        # 使用SSE格式发送数据
-                        yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
-                    yield "data: [DONE]\n\n"
+                    # 长文本先推送分段进度事件 {'progress': ...}，再推送小结内容 {'chunk': ...}
+                    with llm_service.track_usage() as call_usage:
+                        async for event in current_agent.generate_summary_events(
+                            content=request.message,
+                            temperature=request.temperature,
+                            max_tokens=request.max_tokens,
+                            cache=True
+                        ):
+                            # 使用SSE格式发送数据
+                            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                        yield "data: [DONE]\n\n"
                     
                     # 记录LLM消费（流式响应完成后）
                     if request.device_id and consumption_service and llm_service and llm_service.llm_provider:
@@ -2174,7 +2744,7 @@ async def generate_summary(request: SummaryRequest):
                             if not user_id:
                                 logger.warning(f"[Summary] 无法获取user_id，跳过LLM消费记录: device_id={request.device_id}")
                             else:
-                                usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
+                                usage = call_usage.to_usage()
                                 if usage:
                                     consumption_service.record_llm_consumption(
                                         user_id=user_id,
@@ -2182,8 +2752,8 @@ async def generate_summary(request: SummaryRequest):
                                         prompt_tokens=usage.get('prompt_tokens', 0),
                                         completion_tokens=usage.get('completion_tokens', 0),
                                         total_tokens=usage.get('total_tokens', 0),
-                                        model=llm_service.llm_provider._config.get('model', 'unknown'),
-                                        provider=llm_service.llm_provider._config.get('provider', 'unknown'),
+                                        model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                                        provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
                                         model_source='vendor'
                                     )
                                     logger.info(f"[Summary] ✅ LLM消费已记录: user_id={user_id}, {usage['total_tokens']} tokens")
@@ -2209,12 +2779,14 @@ async def generate_summary(request: SummaryRequest):
             )
         else:
             # 非流式响应
-            summary = await current_agent.generate_summary(
-                content=request.message,
-                stream=False,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens
-            )
+            with llm_service.track_usage() as call_usage:
+                summary = await current_agent.generate_summary(
+                    content=request.message,
+                    stream=False,
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens,
+                    cache=True
+                )
             
             # 记录LLM消费（非流式响应后）
             if request.device_id and consumption_service and llm_service and llm_service.llm_provider:
@@ -2223,7 +2795,7 @@ async def generate_summary(request: SummaryRequest):
                     if not user_id:
                         logger.warning(f"[Summary] 无法获取user_id，跳过LLM消费记录: device_id={request.device_id}")
                     else:
-                        usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
+                        usage = call_usage.to_usage()
                         if usage:
                             consumption_service.record_llm_consumption(
                                 user_id=user_id,
@@ -2231,8 +2803,8 @@ async def generate_summary(request: SummaryRequest):
                                 prompt_tokens=usage.get('prompt_tokens', 0),
                                 completion_tokens=usage.get('completion_tokens', 0),
                                 total_tokens=usage.get('total_tokens', 0),
-                                model=llm_service.llm_provider._config.get('model', 'unknown'),
-                                provider=llm_service.llm_provider._config.get('provider', 'unknown'),
+                                model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                                provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
                                 model_source='vendor'
                             )
                             logger.info(f"[Summary] ✅ LLM消费已记录: user_id={user_id}, {usage['total_tokens']} tokens")
@@ -2307,11 +2879,13 @@ async def translate_text(request: TranslateRequest):
                 raise ValueError("流式翻译暂不支持 language_pair 参数")
             else:
                 # 非流式翻译
-                result = await translation_agent.translate_with_pair(
-                    text=request.text,
-                    pair_key=request.language_pair,
-                    stream=False
-                )
+                with llm_service.track_usage() as call_usage:
+                    result = await translation_agent.translate_with_pair(
+                        text=request.text,
+                        pair_key=request.language_pair,
+                        stream=False,
+                        cache=True
+                    )
                 
                 # 检查是否是错误结果（语种不匹配）
                 if isinstance(result, dict) and 'error' in result:
@@ -2333,7 +2907,7 @@ async def translate_text(request: TranslateRequest):
                         if not user_id:
                             logger.warning(f"[Translation] 无法获取user_id，跳过LLM消费记录: device_id={request.device_id}")
                         else:
-                            usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
+                            usage = call_usage.to_usage()
                             if usage:
                                 consumption_service.record_llm_consumption(
                                     user_id=user_id,
@@ -2341,8 +2915,8 @@ async def translate_text(request: TranslateRequest):
                                     prompt_tokens=usage.get('prompt_tokens', 0),
                                     completion_tokens=usage.get('completion_tokens', 0),
                                     total_tokens=usage.get('total_tokens', 0),
-                                    model=llm_service.llm_provider._config.get('model', 'unknown'),
-                                    provider=llm_service.llm_provider._config.get('provider', 'unknown'),
+                                    model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                                    provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
                                     model_source='vendor'
                                 )
                                 logger.info(f"[Translation] ✅ LLM消费已记录: user_id={user_id}, {usage['total_tokens']} tokens")
@@ -2362,17 +2936,19 @@ async def translate_text(request: TranslateRequest):
                 # 流式翻译
                 async def generate():
                     try:
-                        result = await translation_agent.translate(
-                            text=request.text,
-                            source_lang=request.source_lang,
-                            target_lang=request.target_lang,
-                            stream=True
-                        )
+                        with llm_service.track_usage() as call_usage:
+                            result = await translation_agent.translate(
+                                text=request.text,
+                                source_lang=request.source_lang,
+                                target_lang=request.target_lang,
+                                stream=True,
+                                cache=True
+                            )
                         
-                        async for chunk in result:
-                            yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
+                            async for chunk in result:
+                                yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
                         
-                        yield "data: [DONE]\n\n"
+                            yield "data: [DONE]\n\n"
                         
                         # 记录LLM消费（流式翻译完成后）
                         if request.device_id and consumption_service and llm_service and llm_service.llm_provider:
@@ -2381,7 +2957,7 @@ async def translate_text(request: TranslateRequest):
                                 if not user_id:
                                     logger.warning(f"[Translation] 无法获取user_id，跳过LLM消费记录: device_id={request.device_id}")
                                 else:
-                                    usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
+                                    usage = call_usage.to_usage()
                                     if usage:
                                         consumption_service.record_llm_consumption(
                                             user_id=user_id,
@@ -2389,8 +2965,8 @@ async def translate_text(request: TranslateRequest):
                                             prompt_tokens=usage.get('prompt_tokens', 0),
                                             completion_tokens=usage.get('completion_tokens', 0),
                                             total_tokens=usage.get('total_tokens', 0),
-                                            model=llm_service.llm_provider._config.get('model', 'unknown'),
-                                            provider=llm_service.llm_provider._config.get('provider', 'unknown'),
+                                            model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                                            provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
                                             model_source='vendor'
                                         )
                                         logger.info(f"[Translation] ✅ LLM消费已记录: user_id={user_id}, {usage['total_tokens']} tokens")
@@ -2416,12 +2992,14 @@ async def translate_text(request: TranslateRequest):
                 )
             else:
                 # 非流式翻译
-                result = await translation_agent.translate(
-                    text=request.text,
-                    source_lang=request.source_lang,
-                    target_lang=request.target_lang,
-                    stream=False
-                )
+                with llm_service.track_usage() as call_usage:
+                    result = await translation_agent.translate(
+                        text=request.text,
+                        source_lang=request.source_lang,
+                        target_lang=request.target_lang,
+                        stream=False,
+                        cache=True
+                    )
                 
                 # 记录LLM消费（非流式翻译完成后）
                 if request.device_id and consumption_service and llm_service and llm_service.llm_provider:
@@ -2430,7 +3008,7 @@ async def translate_text(request: TranslateRequest):
                         if not user_id:
                             logger.warning(f"[Translation] 无法获取user_id，跳过LLM消费记录: device_id={request.device_id}")
                         else:
-                            usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
+                            usage = call_usage.to_usage()
                             if usage:
                                 consumption_service.record_llm_consumption(
                                     user_id=user_id,
@@ -2438,8 +3016,8 @@ async def translate_text(request: TranslateRequest):
                                     prompt_tokens=usage.get('prompt_tokens', 0),
                                     completion_tokens=usage.get('completion_tokens', 0),
                                     total_tokens=usage.get('total_tokens', 0),
-                                    model=llm_service.llm_provider._config.get('model', 'unknown'),
-                                    provider=llm_service.llm_provider._config.get('provider', 'unknown'),
+                                    model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                                    provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
                                     model_source='vendor'
                                 )
                                 logger.info(f"[Translation] ✅ LLM消费已记录: user_id={user_id}, {usage['total_tokens']} tokens")
@@ -2481,48 +3059,53 @@ async def batch_translate(request: BatchTranslateRequest):
         return {"success": False, "error": error_info.to_dict()}
     
     try:
-        # 优先使用 language_pair（双向互译）
-        if request.language_pair:
-            logger.info(f"[API] 使用语言对批量翻译: {request.language_pair}, 文本数={len(request.texts)}")
-            results = await translation_agent.batch_translate_with_pair(
-                texts=request.texts,
-                pair_key=request.language_pair
-            )
-        # 否则使用固定方向翻译（向后兼容）
-        elif request.source_lang and request.target_lang:
-            logger.info(f"[API] 使用固定方向批量翻译: {request.source_lang} -> {request.target_lang}")
-            results = await translation_agent.batch_translate(
-                texts=request.texts,
-                source_lang=request.source_lang,
-                target_lang=request.target_lang
-            )
-        else:
-            raise ValueError("必须提供 language_pair 或 (source_lang + target_lang)")
+        packed = request.packed
+        if packed is None:
+            packed = (config or Config()).get('llm.batch_packing', False)
+        
+        # 累计批量翻译中每次调用的用量，合并为一条消费记录
+        with llm_service.track_usage() as usage:
+            # 优先使用 language_pair（双向互译）
+            if request.language_pair:
+                logger.info(f"[API] 使用语言对批量翻译: {request.language_pair}, 文本数={len(request.texts)}")
+                results = await translation_agent.batch_translate_with_pair(
+                    texts=request.texts,
+                    pair_key=request.language_pair,
+                    packed=packed,
+                    cache=True
+                )
+            # 否则使用固定方向翻译（向后兼容）
+            elif request.source_lang and request.target_lang:
+                logger.info(f"[API] 使用固定方向批量翻译: {request.source_lang} -> {request.target_lang}")
+                results = await translation_agent.batch_translate(
+                    texts=request.texts,
+                    source_lang=request.source_lang,
+                    target_lang=request.target_lang,
+                    packed=packed,
+                    cache=True
+                )
+            else:
+                raise ValueError("必须提供 language_pair 或 (source_lang + target_lang)")
         
         # 记录LLM消费（批量翻译完成后）
-        # 注意：批量翻译是循环调用单条翻译，get_last_usage()只能获取最后一次调用的token使用量
-        # 如果需要精确统计，需要在批量翻译循环中累加每次调用的token使用量
         if request.device_id and consumption_service and llm_service and llm_service.llm_provider:
             try:
                 user_id = get_user_id_by_device(request.device_id)
                 if not user_id:
                     logger.warning(f"[Translation] 无法获取user_id，跳过LLM消费记录: device_id={request.device_id}")
-                else:
-                    usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
-                    if usage:
-                        # 注意：这里只记录了最后一次翻译的token使用量
-                        # 批量翻译实际消耗的token可能更多（等于所有单条翻译的token总和）
-                        consumption_service.record_llm_consumption(
-                            user_id=user_id,
-                            device_id=request.device_id,
-                            prompt_tokens=usage.get('prompt_tokens', 0),
-                            completion_tokens=usage.get('completion_tokens', 0),
-                            total_tokens=usage.get('total_tokens', 0),
-                            model=llm_service.llm_provider._config.get('model', 'unknown'),
-                            provider=llm_service.llm_provider._config.get('provider', 'unknown'),
-                            model_source='vendor'
-                        )
-                        logger.info(f"[Translation] ✅ LLM消费已记录（批量翻译，仅最后一次）: user_id={user_id}, {usage['total_tokens']} tokens")
+                elif usage.calls:
+                    consumption_service.record_llm_consumption(
+                        user_id=user_id,
+                        device_id=request.device_id,
+                        prompt_tokens=usage.prompt_tokens,
+                        completion_tokens=usage.completion_tokens,
+                        total_tokens=usage.total_tokens,
+                        model=usage.model or llm_service.llm_provider._config.get('model', 'unknown'),
+                        provider=usage.provider or llm_service.llm_provider._config.get('provider', 'unknown'),
+                        model_source='vendor'
+                    )
+                    logger.info(f"[Translation] ✅ LLM消费已记录（批量翻译 {usage.calls} 次调用，"
+                                f"缓存命中 {usage.cached_calls} 次）: user_id={user_id}, {usage.total_tokens} tokens")
             except Exception as e:
                 logger.error(f"[Translation] 记录LLM消费失败: {e}", exc_info=True)
         
@@ -2553,6 +3136,7 @@ class SmartChatRequest(BaseModel):
     temperature: Optional[float] = Field(default=None, description="温度参数")
     max_tokens: Optional[int] = Field(default=None, description="最大token数")
     device_id: Optional[str] = Field(default=None, description="设备ID（用于消费记录）")
+    debug: bool = Field(default=False, description="是否返回分阶段耗时等调试信息")
 
 
 class SmartChatHistoryResponse(BaseModel):
@@ -2561,6 +3145,8 @@ class SmartChatHistoryResponse(BaseModel):
     total_turns: int
     total_messages: int
     has_knowledge_service: bool
+    max_history_turns: Optional[int] = None
+    context: Optional[Dict[str, Any]] = None
 
 
 @app.post("/api/smartchat/chat")
@@ -2571,6 +3157,7 @@ async def smart_chat(request: SmartChatRequest):
     - 支持多轮对话（自动管理上下文）
     - 自动检索知识库（如果可用）
     - 流式和非流式输出
+    - 用户查询、额度检查与知识库检索/上下文组装并发进行，debug=true 时返回分阶段耗时
     
     请求示例：
     {
@@ -2592,11 +3179,7 @@ async def smart_chat(request: SmartChatRequest):
         )
     
     try:
-        # 设置用户信息（用于保存记录）
-        if request.device_id:
-            user_id = get_user_id_by_device(request.device_id)
-            if user_id:
-                smart_chat_agent.set_user_info(user_id, request.device_id)
+        timer = StageTimer()
         
         # 准备参数
         kwargs = {}
@@ -2605,33 +3188,82 @@ async def smart_chat(request: SmartChatRequest):
         if request.max_tokens is not None:
             kwargs['max_tokens'] = request.max_tokens
         
+        async def lookup_user():
+            """设备 → 用户查询，之后检查额度（均为数据库查询，在线程中执行）"""
+            if not request.device_id:
+                return None, None
+            with timer.stage('user_lookup'):
+                found = await asyncio.to_thread(get_user_id_by_device, request.device_id)
+            if not found:
+                return None, None
+            with timer.stage('quota'):
+                # 预估token数（与 /api/llm/chat 相同的简单估算）
+                quota_error = await asyncio.to_thread(check_llm_quota_for_user, found, len(request.message) * 2)
+            return found, quota_error
+        
+        # LLM 调用前的各阶段并发执行：用户查询/额度检查 与 知识库检索/历史分词/上下文组装
+        prepared, (user_id, quota_error) = await asyncio.gather(
+            smart_chat_agent.prepare_context(
+                request.message,
+                use_history=request.use_history,
+                use_knowledge=request.use_knowledge,
+                knowledge_top_k=request.knowledge_top_k,
+                max_tokens=request.max_tokens,
+                timer=timer
+            ),
+            lookup_user()
+        )
+        
+        if quota_error:
+            if request.stream:
+                async def quota_exceeded():
+                    yield f"data: {json.dumps({'error': quota_error}, ensure_ascii=False)}\n\n"
+                return StreamingResponse(quota_exceeded(), media_type="text/event-stream")
+            return ChatResponse(success=False, error=quota_error)
+        
+        # 设置用户信息（用于保存记录）
+        if user_id:
+            smart_chat_agent.set_user_info(user_id, request.device_id)
+        
+        def debug_info():
+            return {'timings': timer.to_dict(), 'retrieval': prepared.retrieval} if request.debug else None
+        
         if request.stream:
             # 流式响应
             async def generate():
                 try:
-                    result = await smart_chat_agent.chat(
-                        user_message=request.message,
-                        stream=True,
-                        use_history=request.use_history,
-                        use_knowledge=request.use_knowledge,
-                        knowledge_top_k=request.knowledge_top_k,
-                        **kwargs
-                    )
+                    with llm_service.track_usage() as call_usage:
+                        result = await smart_chat_agent.chat(
+                            user_message=request.message,
+                            stream=True,
+                            use_history=request.use_history,
+                            use_knowledge=request.use_knowledge,
+                            knowledge_top_k=request.knowledge_top_k,
+                            prepared=prepared,
+                            timer=timer,
+                            **kwargs
+                        )
+                        
+                        # 先推送本次请求的上下文 token 报告（取本次的准备结果，不读 Agent 上被并发请求覆盖的字段）
+                        if prepared.context.report:
+                            yield f"data: {json.dumps({'context': prepared.context.report}, ensure_ascii=False)}\n\n"
                     
-                    async for chunk in result:
-                        yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
+                        async for chunk in result:
+                            yield f"data: {json.dumps({'chunk': chunk}, ensure_ascii=False)}\n\n"
+                        
+                        if request.debug:
+                            yield f"data: {json.dumps({'debug': debug_info()}, ensure_ascii=False)}\n\n"
                     
-                    yield "data: [DONE]\n\n"
+                        yield "data: [DONE]\n\n"
                     
                     # 记录LLM消费（如果提供了device_id）
                     logger.info(f"[SmartChat] 准备记录LLM消费: device_id={request.device_id}, consumption_service={consumption_service is not None}, llm_service={llm_service is not None}")
                     if request.device_id and consumption_service and llm_service and llm_service.llm_provider:
                         try:
-                            user_id = get_user_id_by_device(request.device_id)
                             if not user_id:
                                 logger.warning(f"[SmartChat] 无法获取user_id，跳过LLM消费记录: device_id={request.device_id}")
                             else:
-                                usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
+                                usage = call_usage.to_usage()
                                 logger.info(f"[SmartChat] 获取usage: {usage}")
                                 if usage:
                                     consumption_service.record_llm_consumption(
@@ -2640,8 +3272,8 @@ async def smart_chat(request: SmartChatRequest):
                                         prompt_tokens=usage.get('prompt_tokens', 0),
                                         completion_tokens=usage.get('completion_tokens', 0),
                                         total_tokens=usage.get('total_tokens', 0),
-                                        model=llm_service.llm_provider._config.get('model', 'unknown'),
-                                        provider=llm_service.llm_provider._config.get('provider', 'unknown'),
+                                        model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                                        provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
                                         model_source='vendor'
                                     )
                                     logger.info(f"[SmartChat] ✅ LLM消费已记录: user_id={user_id}, {usage['total_tokens']} tokens")
@@ -2668,23 +3300,25 @@ async def smart_chat(request: SmartChatRequest):
             )
         else:
             # 非流式响应
-            response = await smart_chat_agent.chat(
-                user_message=request.message,
-                stream=False,
-                use_history=request.use_history,
-                use_knowledge=request.use_knowledge,
-                knowledge_top_k=request.knowledge_top_k,
-                **kwargs
-            )
+            with llm_service.track_usage() as call_usage:
+                response = await smart_chat_agent.chat(
+                    user_message=request.message,
+                    stream=False,
+                    use_history=request.use_history,
+                    use_knowledge=request.use_knowledge,
+                    knowledge_top_k=request.knowledge_top_k,
+                    prepared=prepared,
+                    timer=timer,
+                    **kwargs
+                )
             
             # 记录LLM消费（如果提供了device_id）
             if request.device_id and consumption_service and llm_service and llm_service.llm_provider:
                 try:
-                    user_id = get_user_id_by_device(request.device_id)
                     if not user_id:
                         logger.warning(f"[SmartChat] 无法获取user_id，跳过LLM消费记录: device_id={request.device_id}")
                     else:
-                        usage = llm_service.llm_provider.get_last_usage() if hasattr(llm_service.llm_provider, 'get_last_usage') else None
+                        usage = call_usage.to_usage()
                         if usage:
                             consumption_service.record_llm_consumption(
                                 user_id=user_id,
@@ -2692,15 +3326,16 @@ async def smart_chat(request: SmartChatRequest):
                                 prompt_tokens=usage.get('prompt_tokens', 0),
                                 completion_tokens=usage.get('completion_tokens', 0),
                                 total_tokens=usage.get('total_tokens', 0),
-                                model=llm_service.llm_provider._config.get('model', 'unknown'),
-                                provider=llm_service.llm_provider._config.get('provider', 'unknown'),
+                                model=usage.get('model') or llm_service.llm_provider._config.get('model', 'unknown'),
+                                provider=usage.get('provider') or llm_service.llm_provider._config.get('provider', 'unknown'),
                                 model_source='vendor'
                             )
                             logger.info(f"[SmartChat] ✅ LLM消费已记录: user_id={user_id}, {usage['total_tokens']} tokens")
                 except Exception as e:
                     logger.error(f"[SmartChat] 记录LLM消费失败: {e}", exc_info=True)
             
-            return ChatResponse(success=True, message=response)
+            return ChatResponse(success=True, message=response, context=prepared.context.report,
+                                debug=debug_info())
     
     except Exception as e:
         logger.error(f"SmartChat 对话失败: {e}", exc_info=True)
@@ -2861,6 +3496,8 @@ class KnowledgeSearchRequest(BaseModel):
     """知识库搜索请求"""
     query: str = Field(..., description="搜索查询")
     top_k: int = Field(default=3, description="返回结果数量")
+    mode: Optional[str] = Field(default=None, description="检索模式：vector / lexical / hybrid（默认使用 knowledge.search_mode）")
+    rerank: Optional[bool] = Field(default=None, description="是否使用交叉编码器重排（默认启用了 knowledge.reranker 即重排）")
 
 
 @app.post("/api/knowledge/upload")
@@ -2895,11 +3532,78 @@ async def upload_knowledge_file(request: KnowledgeUploadRequest):
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
 
 
+def _knowledge_ingest_response(file_id: str) -> StreamingResponse:
+    """以 SSE 推送知识库导入进度（started / progress / done / error）"""
+    async def generate():
+        try:
+            async for event in knowledge_service.ingest_file(file_id):
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            logger.error(f"导入知识库文件失败: {e}", exc_info=True)
+            error = {'event': 'error', 'file_id': file_id, 'error': str(e), 'resumable': True}
+            yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@app.post("/api/knowledge/upload/stream")
+async def upload_knowledge_file_stream(
+    file: UploadFile = File(...),
+    metadata: Optional[str] = Form(default=None)
+):
+    """流式上传大文件到知识库（multipart）
+    
+    文件按块写入磁盘后流式分块、按批计算向量并增量写入向量库，通过 SSE 推送进度。
+    导入中断后可调用 /api/knowledge/files/{file_id}/resume 继续。
+    """
+    if not knowledge_service or not knowledge_service.is_available():
+        raise HTTPException(status_code=503, detail="知识库服务不可用")
+    
+    try:
+        meta = json.loads(metadata) if metadata else None
+        file_id = await knowledge_service.save_upload_stream(
+            filename=file.filename or 'upload.txt',
+            read=file.read,
+            metadata=meta
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"保存上传文件失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+    finally:
+        await file.close()
+    
+    return _knowledge_ingest_response(file_id)
+
+
+@app.post("/api/knowledge/files/{file_id}/resume")
+async def resume_knowledge_ingest(file_id: str):
+    """继续导入中断或失败的知识库文件（从已写入的文本块之后继续，SSE 推送进度）"""
+    if not knowledge_service or not knowledge_service.is_available():
+        raise HTTPException(status_code=503, detail="知识库服务不可用")
+    
+    entry = knowledge_service.manifest.get(file_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    return _knowledge_ingest_response(file_id)
+
+
 @app.post("/api/knowledge/search")
 async def search_knowledge(request: KnowledgeSearchRequest):
     """搜索知识库
     
-    使用语义相似度搜索
+    语义检索、词法检索（FTS5）或两者按倒数排名融合（mode），可选交叉编码器重排（rerank）
     """
     if not knowledge_service or not knowledge_service.is_available():
         raise HTTPException(status_code=503, detail="知识库服务不可用")
@@ -2907,14 +3611,33 @@ async def search_knowledge(request: KnowledgeSearchRequest):
     try:
         results = await knowledge_service.search(
             query=request.query,
-            top_k=request.top_k
+            top_k=request.top_k,
+            mode=request.mode,
+            rerank=request.rerank
         )
         return {"success": True, "results": results}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"搜索知识库失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
 
 
+@app.get("/api/knowledge/stats")
+async def get_knowledge_stats():
+    """知识库统计（文本块数量、向量缓存与检索缓存命中率）"""
+    if not knowledge_service or not knowledge_service.is_available():
+        raise HTTPException(status_code=503, detail="知识库服务不可用")
+    
+    try:
+        stats = await asyncio.to_thread(knowledge_service.get_stats)
+        stats['record_indexer'] = await asyncio.to_thread(record_indexer.get_stats) if record_indexer else None
+        return {"success": True, "data": stats}
+    except Exception as e:
+        logger.error(f"获取知识库统计失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"获取统计失败: {str(e)}")
+
+
 @app.get("/api/knowledge/files")
 async def list_knowledge_files():
     """列出所有知识库文件"""
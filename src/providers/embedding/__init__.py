@@ -0,0 +1,56 @@
+"""
+Embedding 提供商模块
+
+- sentence_transformers：PyTorch 后端（默认）
+- onnx：ONNX Runtime 后端，int8 动态量化，CPU 部署内存占用与启动时间更低
+
+ProcessEmbeddingProvider 可包装任一后端，在独立子进程中加载模型和计算向量。
+"""
+from typing import Any, Dict, Optional, Type
+
+from .base_embedding import BaseEmbeddingProvider
+from .sentence_transformer_provider import SentenceTransformerEmbeddingProvider
+from .onnx_provider import ONNXEmbeddingProvider
+from .process_provider import ProcessEmbeddingProvider
+
+_AVAILABLE_PROVIDERS: Dict[str, Type[BaseEmbeddingProvider]] = {
+    'sentence_transformers': SentenceTransformerEmbeddingProvider,
+    'onnx': ONNXEmbeddingProvider,
+}
+
+__all__ = [
+    'BaseEmbeddingProvider', 'SentenceTransformerEmbeddingProvider', 'ONNXEmbeddingProvider',
+    'ProcessEmbeddingProvider', 'get_embedding_provider_class', 'create_embedding_provider',
+]
+
+
+def get_embedding_provider_class(backend: str) -> Optional[Type[BaseEmbeddingProvider]]:
+    """获取 Embedding 提供商类
+
+    Args:
+        backend: 后端名称（'sentence_transformers', 'onnx'）
+
+    Returns:
+        提供商类，如果不存在则返回None
+    """
+    return _AVAILABLE_PROVIDERS.get(backend.lower())
+
+
+def create_embedding_provider(backend: str, model_name: str,
+                              options: Optional[Dict[str, Any]] = None) -> BaseEmbeddingProvider:
+    """创建 Embedding 提供商（不加载模型）
+
+    Raises:
+        ValueError: 未知的后端
+        ImportError: 后端依赖未安装
+    """
+    provider_class = get_embedding_provider_class(backend)
+    if provider_class is None:
+        raise ValueError(f"不支持的 Embedding 后端: {backend}，可选: {', '.join(_AVAILABLE_PROVIDERS)}")
+    if not provider_class.is_installed():
+        raise ImportError(
+            "sentence-transformers 未安装。请运行: pip install sentence-transformers"
+            if backend == 'sentence_transformers'
+            else "onnxruntime 未安装。请运行: pip install onnxruntime tokenizers"
+        )
+    return provider_class(model_name, options)
@@ -0,0 +1,70 @@
+"""
+Embedding 提供商基类
+"""
+import os
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def configure_hf_hub():
+    """下载模型前配置 HuggingFace Hub：关闭进度条，未设置时使用国内镜像"""
+    os.environ['TRANSFORMERS_VERBOSITY'] = 'error'
+    os.environ['HF_HUB_DISABLE_PROGRESS_BARS'] = '1'
+    if not os.getenv('HF_ENDPOINT'):
+        os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
+        logger.info("[Embedding] 已设置 HuggingFace 镜像源: https://hf-mirror.com")
+
+
+class BaseEmbeddingProvider:
+    """Embedding 提供商基类
+
+    子类实现 load()（同步，可能耗时，由调用方放入线程池）和 encode()。
+    """
+
+    def __init__(self, model_name: str, options: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            model_name: 模型名称（HuggingFace 模型 ID 或本地路径）
+            options: 后端相关选项
+        """
+        self.model_name = model_name
+        self.options = dict(options or {})
+
+    @property
+    def name(self) -> str:
+        """后端名称，子类应重写"""
+        return "base"
+
+    @property
+    def cache_key(self) -> str:
+        """向量缓存键中的模型标识（不同后端 / 量化方式的向量不互相复用）"""
+        return f"{self.model_name}#{self.name}"
+
+    @classmethod
+    def is_installed(cls) -> bool:
+        """后端依赖是否已安装"""
+        return False
+
+    @property
+    def is_loaded(self) -> bool:
+        raise NotImplementedError("Subclass must implement is_loaded")
+
+    def load(self):
+        """加载模型（同步方法）"""
+        raise NotImplementedError("Subclass must implement load method")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """批量计算向量
+
+        Returns:
+            float32 数组，形状 (len(texts), dim)
+        """
+        raise NotImplementedError("Subclass must implement encode method")
+
+    def close(self):
+        """释放资源（默认无操作）"""
+        pass
@@ -0,0 +1,162 @@
+"""
+ONNX Runtime Embedding 提供商（CPU，int8 动态量化）
+
+不依赖 PyTorch：使用 tokenizers 分词，onnxruntime 推理，按 attention mask 做均值池化并 L2 归一化，
+与 sentence-transformers 的 Transformer → Pooling(mean) → Normalize 流程一致。
+
+模型来源（按优先级）：
+1. options.model_dir：包含 tokenizer.json 和 model.onnx（或 onnx/model.onnx）的本地目录
+2. model_name 为本地目录
+3. 从 HuggingFace Hub 下载 sentence-transformers/<model_name> 仓库自带的 onnx/model.onnx
+
+quantize 为 True 时首次加载会用 onnxruntime.quantization 生成 int8 动态量化模型并缓存（quantized_dir）。
+"""
+import logging
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from .base_embedding import BaseEmbeddingProvider, configure_hf_hub
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def mean_pool(hidden_states: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """按 attention mask 对 token 向量求平均（忽略 padding）"""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (hidden_states * mask).sum(axis=1)
+    counts = np.clip(mask.sum(axis=1), 1e-9, None)
+    return summed / counts
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class ONNXEmbeddingProvider(BaseEmbeddingProvider):
+    """基于 ONNX Runtime 的 Embedding 提供商
+
+    Options:
+        model_dir: 本地模型目录（可选）
+        quantize: 是否使用 int8 动态量化模型（默认 True）
+        quantized_dir: 量化模型缓存目录（默认与原模型同目录）
+        max_seq_length: 最大 token 数（默认 256，与 all-MiniLM-L6-v2 一致）
+        batch_size: 每次推理的文本数（默认 32）
+        threads: 推理线程数（默认 0，由 onnxruntime 决定）
+        normalize: 是否 L2 归一化（默认 True）
+    """
+
+    def __init__(self, model_name: str, options=None):
+        super().__init__(model_name, options)
+        self.quantize = bool(self.options.get('quantize', True))
+        self.session = None
+        self.tokenizer = None
+        self._input_names = set()
+
+    @property
+    def name(self) -> str:
+        return "onnx"
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.model_name}#onnx-int8" if self.quantize else f"{self.model_name}#onnx"
+
+    @classmethod
+    def is_installed(cls) -> bool:
+        return ONNX_AVAILABLE
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.session is not None
+
+    def _resolve_model_dir(self) -> Path:
+        if self.options.get('model_dir'):
+            return Path(self.options['model_dir']).expanduser()
+        if Path(self.model_name).expanduser().is_dir():
+            return Path(self.model_name).expanduser()
+
+        from huggingface_hub import snapshot_download
+        configure_hf_hub()
+        repo_id = self.model_name if '/' in self.model_name else f"sentence-transformers/{self.model_name}"
+        logger.info(f"[Embedding] 下载 ONNX 模型: {repo_id}")
+        return Path(snapshot_download(
+            repo_id=repo_id,
+            allow_patterns=['tokenizer.json', 'config.json', 'onnx/model.onnx'],
+        ))
+
+    def _quantized_path(self, model_path: Path) -> Path:
+        quantized_dir = Path(self.options.get('quantized_dir') or model_path.parent).expanduser()
+        quantized_dir.mkdir(parents=True, exist_ok=True)
+        return quantized_dir / f"{model_path.stem}_int8.onnx"
+
+    def load(self):
+        if self.session is not None:
+            return
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime 未安装。请运行: pip install onnxruntime tokenizers")
+
+        model_dir = self._resolve_model_dir()
+        model_path = next(
+            (p for p in (model_dir / 'onnx' / 'model.onnx', model_dir / 'model.onnx') if p.exists()), None
+        )
+        if model_path is None:
+            raise FileNotFoundError(f"未找到 ONNX 模型: {model_dir}/onnx/model.onnx")
+
+        if self.quantize:
+            quantized_path = self._quantized_path(model_path)
+            if not quantized_path.exists():
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                logger.info(f"[Embedding] 生成 int8 动态量化模型: {quantized_path}")
+                quantize_dynamic(str(model_path), str(quantized_path), weight_type=QuantType.QInt8)
+            model_path = quantized_path
+
+        tokenizer = Tokenizer.from_file(str(model_dir / 'tokenizer.json'))
+        tokenizer.enable_truncation(max_length=int(self.options.get('max_seq_length', 256)))
+        pad_id = tokenizer.token_to_id('[PAD]')
+        tokenizer.enable_padding(pad_id=pad_id if pad_id is not None else 0)
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = int(self.options.get('threads', 0))
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(
+            str(model_path), session_options, providers=['CPUExecutionProvider']
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = tokenizer
+        logger.info(f"[Embedding] ONNX 模型加载完成: {model_path.name}")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        batch_size = max(1, int(self.options.get('batch_size', 32)))
+        outputs: List[np.ndarray] = []
+        for start in range(0, len(texts), batch_size):
+            outputs.append(self._encode_batch(texts[start:start + batch_size]))
+        if not outputs:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(outputs)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self._input_names:
+            feeds['token_type_ids'] = np.zeros_like(input_ids)
+        hidden_states = self.session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+
+        vectors = mean_pool(hidden_states, attention_mask)
+        if self.options.get('normalize', True):
+            vectors = l2_normalize(vectors)
+        return vectors.astype(np.float32)
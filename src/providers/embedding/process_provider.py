@@ -0,0 +1,378 @@
+"""
+子进程 Embedding 提供商
+
+模型加载和向量计算放在独立的工作进程中（spawn 启动），不与 API 服务、ASR 回调、TTS 争用 GIL 和默认线程池：
+- 请求队列：调用方线程提交文本后等待结果，分发线程把同时到达的请求合并成一批发给工作进程
+- 结果通过共享内存（multiprocessing.shared_memory）传回，队列中只传递共享内存名称和形状
+- 工作进程崩溃或超时后自动重启（连续失败超过 max_restarts 次后不再重启）
+- 预热：每次（重新）启动加载模型后先编码 warmup_texts，首个真实请求不承担初始化耗时
+"""
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+import numpy as np
+
+from .base_embedding import BaseEmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(provider_class: Type[BaseEmbeddingProvider], model_name: str, options: Dict[str, Any],
+                 warmup_texts: Sequence[str], nice: int, requests, results):
+    """工作进程入口：加载模型、预热，然后循环处理请求
+
+    请求为 (请求ID, 文本列表, 可释放的共享内存名称列表)，None 表示退出。
+    结果为 ('ready', None, pid) / ('load_error', None, 错误) / ('result', 请求ID, (共享内存名称, 形状)) /
+    ('error', 请求ID, 错误)。
+    """
+    # Ctrl+C 由主进程处理，工作进程随主进程的关闭流程退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if nice and hasattr(os, 'nice'):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+    try:
+        provider = provider_class(model_name, options)
+        provider.load()
+        if warmup_texts:
+            provider.encode(list(warmup_texts))
+    except Exception as e:
+        results.put(('load_error', None, f"{type(e).__name__}: {e}"))
+        return
+    results.put(('ready', None, os.getpid()))
+
+    # 已发送但主进程尚未读取的共享内存（Windows 上所有句柄关闭后共享内存即被回收，需保留到主进程读取完毕）
+    outstanding: Dict[str, shared_memory.SharedMemory] = {}
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        request_id, texts, release = item
+        for name in release:
+            shm = outstanding.pop(name, None)
+            if shm is not None:
+                shm.close()
+        try:
+            vectors = np.ascontiguousarray(provider.encode(texts), dtype=np.float32)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, vectors.nbytes))
+            np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[...] = vectors
+            outstanding[shm.name] = shm
+            results.put(('result', request_id, (shm.name, vectors.shape)))
+        except Exception as e:
+            results.put(('error', request_id, f"{type(e).__name__}: {e}"))
+
+    for shm in outstanding.values():
+        shm.close()
+
+
+class _Request:
+    """一次 encode 调用"""
+
+    __slots__ = ('texts', 'done', 'vectors', 'error')
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class ProcessEmbeddingProvider(BaseEmbeddingProvider):
+    """在子进程中运行另一个 Embedding 提供商
+
+    向量与被包装的提供商完全一致，cache_key 不变（开启 / 关闭子进程不影响向量缓存）。
+
+    Options:
+        max_batch_texts: 合并请求时每批最多的文本数（默认 64，单个更大的请求不拆分）
+        batch_wait_ms: 收到第一个请求后等待其他请求合并的时间（默认 5）
+        request_timeout_seconds: 单批请求超时（默认 120），超时后重启工作进程
+        load_timeout_seconds: 启动并加载模型的超时（默认 600，首次运行可能需要下载模型）
+        max_restarts: 连续失败时最多重启次数（默认 3，成功处理一批后清零）
+        warmup_texts: 加载后预热编码的文本（默认 ['warmup']，为空则不预热）
+        nice: 工作进程的 nice 增量（默认 5，仅 POSIX，让实时转写优先获得 CPU）
+    """
+
+    def __init__(self, provider: BaseEmbeddingProvider, options: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            provider: 被包装的提供商（不需要加载，工作进程按其类型、模型名和选项重新创建）
+            options: 子进程选项
+        """
+        super().__init__(provider.model_name, options)
+        self.provider = provider
+        self.max_batch_texts = max(1, int(self.options.get('max_batch_texts', 64)))
+        self.batch_wait = max(0.0, float(self.options.get('batch_wait_ms', 5))) / 1000
+        self.request_timeout = float(self.options.get('request_timeout_seconds', 120))
+        self.load_timeout = float(self.options.get('load_timeout_seconds', 600))
+        self.max_restarts = max(0, int(self.options.get('max_restarts', 3)))
+        self.warmup_texts = list(self.options.get('warmup_texts', ['warmup']) or [])
+        self.nice = int(self.options.get('nice', 5))
+
+        self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._requests = None
+        self._results = None
+        self._start_lock = threading.Lock()
+        self._pending: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._closed = False
+        self._release: List[str] = []
+        self._next_id = 0
+        self._failures = 0
+
+        self.stats = {'starts': 0, 'restarts': 0, 'requests': 0, 'batches': 0, 'texts': 0, 'errors': 0}
+        self.last_error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    @property
+    def cache_key(self) -> str:
+        return self.provider.cache_key
+
+    def is_installed(self) -> bool:
+        return self.provider.is_installed()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def load(self):
+        """启动工作进程并等待模型加载、预热完成（同步方法）"""
+        if self._closed:
+            raise RuntimeError("Embedding 工作进程已关闭")
+        with self._start_lock:
+            if not self.is_loaded:
+                self._start_worker()
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_loop, name="embedding-dispatch", daemon=True
+                )
+                self._dispatcher.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not self.is_loaded or self._dispatcher is None:
+            self.load()
+        request = _Request(list(texts))
+        self._pending.put(request)
+        # 分发线程负责超时和重启，这里只兜底等待
+        if not request.done.wait(self.request_timeout * 2 + self.load_timeout):
+            raise TimeoutError("Embedding 工作进程无响应")
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def close(self):
+        """停止分发线程和工作进程，未完成的请求以错误结束"""
+        self._closed = True
+        self._pending.put(None)
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=5)
+        self._stop_worker()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """工作进程统计（重启次数、合并批次、平均批大小）"""
+        batches = self.stats['batches']
+        return {
+            **self.stats,
+            'pid': self._process.pid if self._process is not None else None,
+            'alive': self.is_loaded,
+            'avg_batch_texts': round(self.stats['texts'] / batches, 1) if batches else 0.0,
+            'last_error': self.last_error,
+        }
+
+    # ---- 工作进程管理 ----
+
+    def _start_worker(self):
+        """启动工作进程并等待就绪（调用方持有 _start_lock）"""
+        self._stop_worker()
+        self._requests = self._context.Queue()
+        self._results = self._context.Queue()
+        self._release = []
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(type(self.provider), self.provider.model_name, self.provider.options,
+                  self.warmup_texts, self.nice, self._requests, self._results),
+            name="embedding-worker",
+            daemon=True,
+        )
+        self._process.start()
+        self.stats['starts'] += 1
+        logger.info(f"[Embedding] 工作进程已启动 (pid={self._process.pid})，加载模型: {self.model_name}")
+
+        deadline = time.monotonic() + self.load_timeout
+        while True:
+            try:
+                kind, _, payload = self._results.get(timeout=0.5)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    error = f"工作进程加载模型时退出 (exitcode={self._process.exitcode})"
+                    self._stop_worker()
+                    raise RuntimeError(error)
+                if time.monotonic() > deadline:
+                    self._stop_worker()
+                    raise TimeoutError(f"Embedding 工作进程加载模型超时（{self.load_timeout:.0f} 秒）")
+                continue
+            if kind == 'ready':
+                logger.info(f"[Embedding] 工作进程就绪 (pid={payload})")
+                return
+            if kind == 'load_error':
+                self._stop_worker()
+                raise RuntimeError(f"Embedding 工作进程加载模型失败: {payload}")
+
+    def _stop_worker(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        if process.is_alive():
+            try:
+                self._requests.put(None)
+            except (OSError, ValueError):
+                pass
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=2)
+        for q in (self._requests, self._results):
+            q.close()
+            q.cancel_join_thread()
+
+    def _restart_worker(self, reason: str):
+        """工作进程异常后重启（连续失败超过 max_restarts 次时抛出 RuntimeError）"""
+        if self._closed:
+            raise RuntimeError("Embedding 工作进程已关闭")
+        self.last_error = reason
+        self._failures += 1
+        if self._failures > self.max_restarts:
+            with self._start_lock:
+                self._stop_worker()
+            raise RuntimeError(f"Embedding 工作进程连续失败 {self._failures} 次，不再自动重启: {reason}")
+        logger.warning(f"[Embedding] 工作进程异常（{reason}），正在重启（第 {self._failures} 次）")
+        self.stats['restarts'] += 1
+        with self._start_lock:
+            self._start_worker()
+
+    # ---- 请求分发 ----
+
+    def _dispatch_loop(self):
+        """合并同时到达的请求，逐批发给工作进程"""
+        while True:
+            first = self._pending.get()
+            if first is None:
+                break
+            batch = [first]
+            count = len(first.texts)
+            stop = False
+            deadline = time.monotonic() + self.batch_wait
+            while count < self.max_batch_texts:
+                try:
+                    item = self._pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                count += len(item.texts)
+
+            self._run_batch(batch)
+            if stop:
+                break
+
+        # 关闭后仍在排队的请求
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item.error = RuntimeError("Embedding 工作进程已关闭")
+                item.done.set()
+
+    def _run_batch(self, batch: List[_Request]):
+        texts = [text for request in batch for text in request.texts]
+        self.stats['requests'] += len(batch)
+        try:
+            vectors = self._encode_in_worker(texts) if texts else np.zeros((0, 0), dtype=np.float32)
+        except Exception as e:
+            self.stats['errors'] += 1
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+
+        self.stats['batches'] += 1
+        self.stats['texts'] += len(texts)
+        offset = 0
+        for request in batch:
+            request.vectors = vectors[offset:offset + len(request.texts)]
+            offset += len(request.texts)
+            request.done.set()
+
+    def _encode_in_worker(self, texts: List[str]) -> np.ndarray:
+        """发送一批文本并等待结果（工作进程崩溃时重启后重试）"""
+        while True:
+            if self._closed:
+                raise RuntimeError("Embedding 工作进程已关闭")
+            if not self.is_loaded:
+                self._restart_worker("工作进程未运行")
+            self._next_id += 1
+            request_id = self._next_id
+            release, self._release = self._release, []
+            self._requests.put((request_id, texts, release))
+
+            reason = self._wait_result(request_id)
+            if isinstance(reason, np.ndarray):
+                self._failures = 0
+                return reason
+            # 崩溃 / 超时：重启后重试同一批
+            self._restart_worker(reason)
+
+    def _wait_result(self, request_id: int):
+        """等待指定请求的结果，返回向量数组，或工作进程异常时返回原因（字符串）"""
+        process, results = self._process, self._results
+        deadline = time.monotonic() + self.request_timeout
+        while True:
+            try:
+                kind, result_id, payload = results.get(timeout=0.5)
+            except queue.Empty:
+                if not process.is_alive():
+                    return f"工作进程退出 (exitcode={process.exitcode})"
+                if time.monotonic() > deadline:
+                    return f"请求超时（{self.request_timeout:.0f} 秒）"
+                continue
+            except (OSError, ValueError, EOFError):
+                # 队列已随工作进程关闭
+                return "工作进程已停止"
+
+            if kind == 'result':
+                vectors = self._read_shared(*payload)
+                if result_id == request_id:
+                    return vectors
+            elif kind == 'error' and result_id == request_id:
+                # 编码本身出错（如输入异常）不重启工作进程
+                self._failures = 0
+                raise RuntimeError(f"Embedding 计算失败: {payload}")
+
+    def _read_shared(self, name: str, shape) -> np.ndarray:
+        """从共享内存复制结果，并释放该共享内存"""
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            return np.ndarray(tuple(shape), dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+            self._release.append(name)
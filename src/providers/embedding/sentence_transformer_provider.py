@@ -0,0 +1,77 @@
+"""
+SentenceTransformer（PyTorch）Embedding 提供商
+"""
+import io
+import os
+import sys
+import logging
+from typing import List
+
+import numpy as np
+
+from .base_embedding import BaseEmbeddingProvider, configure_hf_hub
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class SentenceTransformerEmbeddingProvider(BaseEmbeddingProvider):
+    """基于 sentence-transformers 的 Embedding 提供商（默认后端）"""
+
+    def __init__(self, model_name: str, options=None):
+        super().__init__(model_name, options)
+        self.model = None
+
+    @property
+    def name(self) -> str:
+        return "sentence_transformers"
+
+    @property
+    def cache_key(self) -> str:
+        # 默认后端沿用模型名作为缓存键，升级前缓存的向量继续有效
+        return self.model_name
+
+    @classmethod
+    def is_installed(cls) -> bool:
+        return SENTENCE_TRANSFORMERS_AVAILABLE
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self):
+        if self.model is not None:
+            return
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise ImportError("sentence-transformers 未安装。请运行: pip install sentence-transformers")
+
+        logger.info(f"[Embedding] 开始加载 SentenceTransformer 模型: {self.model_name}")
+
+        # 禁用进度条（避免在后台线程中访问 stderr 失败），配置镜像源
+        configure_hf_hub()
+
+        # 如果设置了代理，也配置给 huggingface_hub
+        if os.getenv('HTTP_PROXY') or os.getenv('HTTPS_PROXY'):
+            logger.debug(f"[Embedding] 检测到代理设置: HTTP_PROXY={os.getenv('HTTP_PROXY')}, HTTPS_PROXY={os.getenv('HTTPS_PROXY')}")
+
+        # 临时重定向 stderr（避免 tqdm 访问失败）
+        original_stderr = sys.stderr
+        try:
+            sys.stderr = io.StringIO()
+            self.model = SentenceTransformer(self.model_name, device=self.options.get('device'))
+            logger.info("[Embedding] SentenceTransformer 模型加载完成")
+        finally:
+            sys.stderr = original_stderr
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=int(self.options.get('batch_size', 32)),
+            show_progress_bar=False,
+        )
+        return np.asarray(vectors, dtype=np.float32)
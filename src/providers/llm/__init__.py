@@ -2,6 +2,6 @@
 LLM Provider 模块
 """
 from .litellm_provider import LiteLLMProvider
+from .router_provider import LLMRouterProvider
 
-__all__ = ['LiteLLMProvider']
-
+__all__ = ['LiteLLMProvider', 'LLMRouterProvider']
@@ -1,10 +1,29 @@
 """
 LLM 提供商基类实现
 """
-from typing import Dict, Any, AsyncIterator, Union
+from typing import Dict, Any, AsyncIterator, Optional, Union
 from ...core.base import LLMProvider
 
 
+class LLMResponse:
+    """单次 LLM 调用的结果
+    
+    每次调用都有独立的结果对象，并发调用之间的用量不会互相覆盖。
+    
+    Attributes:
+        text: 完整响应文本（非流式）
+        stream: 文本片段异步迭代器（流式）
+        usage: token 使用量 {prompt_tokens, completion_tokens, total_tokens}；
+            流式调用在迭代结束后（收到最后一个带 usage 的 chunk）才有值，未返回时为 None
+    """
+    
+    def __init__(self, text: Optional[str] = None, stream: Optional[AsyncIterator[str]] = None,
+                 usage: Optional[Dict[str, int]] = None):
+        self.text = text
+        self.stream = stream
+        self.usage = usage
+
+
 class BaseLLMProvider(LLMProvider):
     """LLM 提供商基类，提供通用功能"""
     
@@ -27,6 +46,16 @@ class BaseLLMProvider(LLMProvider):
         """对话接口，子类必须实现"""
         raise NotImplementedError("Subclass must implement chat method")
     
+    async def chat_with_usage(self, messages: list[Dict[str, str]], stream: bool = False, **kwargs) -> LLMResponse:
+        """对话接口（返回包含用量的结果对象）
+        
+        默认实现不提供用量，支持用量统计的子类应重写。
+        """
+        result = await self.chat(messages, stream=stream, **kwargs)
+        if stream:
+            return LLMResponse(stream=result)
+        return LLMResponse(text=result)
+    
     def is_available(self) -> bool:
         """检查服务是否可用"""
         return self._initialized
@@ -4,7 +4,7 @@ LiteLLM 提供商实现
 """
 import logging
 from typing import Dict, Any, AsyncIterator, Union, Tuple, Optional
-from .base_llm import BaseLLMProvider
+from .base_llm import BaseLLMProvider, LLMResponse
 
 logger = logging.getLogger(__name__)
 
@@ -48,16 +48,10 @@ class LiteLLMProvider(BaseLLMProvider):
             import litellm
             
             self._config = config
-            
-            # 配置 LiteLLM
-            if config.get('api_key'):
-                # 设置 API key（LiteLLM 会根据模型名称自动推断使用哪个 key）
-                litellm.api_key = config['api_key']
-            
-            if config.get('base_url'):
-                # 设置自定义 base_url
-                litellm.api_base = config['base_url']
-            
+
+            # api_key / base_url 随每次请求传递（见 chat_with_usage），不写入 litellm 全局配置，
+            # 多个端点（LLMRouterProvider）各自使用自己的凭据，互不覆盖
+
             # 验证配置
             if not config.get('model'):
                 logger.error("[LiteLLM] 缺少 model 配置")
@@ -93,6 +87,30 @@ class LiteLLMProvider(BaseLLMProvider):
         Returns:
             如果 stream=True，返回 AsyncIterator[str]
             如果 stream=False，返回完整响应文本 str
+            
+        注意：需要用量时请使用 chat_with_usage()，本方法仅更新 get_last_usage()（并发不安全）
+        """
+        response = await self.chat_with_usage(messages, stream=stream, **kwargs)
+        if stream:
+            return self._stream_with_last_usage(response)
+        self._last_usage = response.usage
+        return response.text
+    
+    async def chat_with_usage(
+        self,
+        messages: list[Dict[str, str]],
+        stream: bool = False,
+        **kwargs
+    ) -> LLMResponse:
+        """对话接口，返回本次调用独立的结果对象（含 token 用量）
+        
+        Args:
+            messages: 消息列表
+            stream: 是否流式返回
+            **kwargs: 同 chat()
+            
+        Returns:
+            LLMResponse；流式调用的 usage 在 stream 迭代结束后填充
         """
         if not self._initialized:
             raise RuntimeError("LiteLLM provider not initialized")
@@ -132,37 +150,46 @@ class LiteLLMProvider(BaseLLMProvider):
             
             if stream:
                 # 流式返回
-                return self._stream_chat(request_params)
+                result = LLMResponse()
+                result.stream = self._stream_chat(request_params, result)
+                return result
             else:
                 # 非流式返回
                 response = await litellm.acompletion(**request_params)
                 content = response.choices[0].message.content
                 
                 # 提取token使用信息
-                if hasattr(response, 'usage') and response.usage:
-                    self._last_usage = {
-                        'prompt_tokens': response.usage.prompt_tokens,
-                        'completion_tokens': response.usage.completion_tokens,
-                        'total_tokens': response.usage.total_tokens
-                    }
-                    logger.info(f"[LiteLLM] Token使用: prompt={self._last_usage['prompt_tokens']}, "
-                              f"completion={self._last_usage['completion_tokens']}, "
-                              f"total={self._last_usage['total_tokens']}")
-                else:
-                    self._last_usage = None
+                usage = self._extract_usage(response)
+                if usage:
+                    logger.info(f"[LiteLLM] Token使用: prompt={usage['prompt_tokens']}, "
+                              f"completion={usage['completion_tokens']}, "
+                              f"total={usage['total_tokens']}")
                 
                 logger.info(f"[LiteLLM] 收到响应，长度: {len(content)}")
-                return content
+                return LLMResponse(text=content, usage=usage)
                 
         except Exception as e:
             logger.error(f"[LiteLLM] 对话请求失败: {e}")
             raise
     
-    async def _stream_chat(self, request_params: Dict[str, Any]) -> AsyncIterator[str]:
+    @staticmethod
+    def _extract_usage(response) -> Optional[Dict[str, int]]:
+        """从响应或 chunk 中提取 token 使用信息"""
+        usage = getattr(response, 'usage', None)
+        if not usage:
+            return None
+        return {
+            'prompt_tokens': usage.prompt_tokens or 0,
+            'completion_tokens': usage.completion_tokens or 0,
+            'total_tokens': usage.total_tokens or 0
+        }
+    
+    async def _stream_chat(self, request_params: Dict[str, Any], result: LLMResponse) -> AsyncIterator[str]:
         """流式对话生成器
         
         Args:
             request_params: 请求参数
+            result: 本次调用的结果对象，迭代结束后写入 usage
             
         Yields:
             生成的文本片段
@@ -172,35 +199,38 @@ class LiteLLMProvider(BaseLLMProvider):
             
             response = await litellm.acompletion(**request_params)
             
-            # 重置token使用信息
-            self._last_usage = None
-            
             async for chunk in response:
                 # 提取token使用信息（流式响应中通常在最后一个chunk）
-                if hasattr(chunk, 'usage') and chunk.usage:
-                    self._last_usage = {
-                        'prompt_tokens': chunk.usage.prompt_tokens,
-                        'completion_tokens': chunk.usage.completion_tokens,
-                        'total_tokens': chunk.usage.total_tokens
-                    }
+                usage = self._extract_usage(chunk)
+                if usage:
+                    result.usage = usage
                 
-                if chunk.choices[0].delta.content:
+                if chunk.choices and chunk.choices[0].delta.content:
                     content = chunk.choices[0].delta.content
                     yield content
             
             # 流式结束后记录token使用
-            if self._last_usage:
-                logger.info(f"[LiteLLM] 流式完成，Token使用: prompt={self._last_usage['prompt_tokens']}, "
-                          f"completion={self._last_usage['completion_tokens']}, "
-                          f"total={self._last_usage['total_tokens']}")
+            if result.usage:
+                logger.info(f"[LiteLLM] 流式完成，Token使用: prompt={result.usage['prompt_tokens']}, "
+                          f"completion={result.usage['completion_tokens']}, "
+                          f"total={result.usage['total_tokens']}")
                     
         except Exception as e:
             logger.error(f"[LiteLLM] 流式响应错误: {e}")
             raise
     
+    async def _stream_with_last_usage(self, response: LLMResponse) -> AsyncIterator[str]:
+        """兼容旧接口：流式结束后更新 get_last_usage()"""
+        async for chunk in response.stream:
+            yield chunk
+        self._last_usage = response.usage
+    
     def get_last_usage(self) -> Optional[Dict[str, int]]:
         """获取最后一次调用的token使用情况
         
+        已废弃：并发调用时会互相覆盖，请使用 chat_with_usage() 返回的 usage，
+        或 LLMService.track_usage() 统计一组调用的用量。
+        
         Returns:
             包含 prompt_tokens, completion_tokens, total_tokens 的字典，
             如果没有可用数据则返回 None
@@ -0,0 +1,348 @@
+"""
+多端点 LLM 路由
+在多个配置的端点（不同厂商、区域或模型）之间选择、故障转移和对冲请求
+
+功能：
+- 每个端点记录健康状态：首 token 延迟（EWMA）、错误率（EWMA）、连续失败次数
+- 连续失败达到阈值后熔断，冷却时间按指数退避，冷却结束后重新尝试
+- 首 token 之前失败时自动切换到下一个端点（首 token 之后失败无法无缝切换，直接抛出）
+- 可选对冲：第一个端点在 hedge_after_ms 内没有产出首 token 时，同时向下一个端点发送请求，
+  先产出的一方胜出，另一方立即取消
+- 返回的 usage 只包含胜出端点的用量，并标注实际服务的 model/provider，计费不会重复
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Tuple
+from .base_llm import BaseLLMProvider, LLMResponse
+from .litellm_provider import LiteLLMProvider
+
+logger = logging.getLogger(__name__)
+
+# 流式响应在首个片段之前就结束（空响应）
+_EMPTY = object()
+
+
+class EndpointStats:
+    """单个端点的健康统计"""
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency_ms: Optional[float] = None  # 首 token 延迟（非流式为完整响应延迟）
+        self.error_rate = 0.0
+        self.open_until = 0.0  # 熔断截止时间（time.monotonic）
+        self.hedges = 0        # 作为对冲请求被发出的次数
+        self.hedge_wins = 0    # 作为对冲请求胜出的次数
+        self.cancelled = 0     # 落败后被取消的次数
+        self.last_error: Optional[str] = None
+
+    def record_success(self, latency_ms: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.error_rate *= 1 - self.alpha
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += self.alpha * (latency_ms - self.latency_ms)
+
+    def record_failure(self, error: Exception, threshold: int, cooldown: float, max_cooldown: float):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.error_rate += self.alpha * (1 - self.error_rate)
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.consecutive_failures >= threshold:
+            backoff = min(cooldown * 2 ** (self.consecutive_failures - threshold), max_cooldown)
+            self.open_until = time.monotonic() + backoff
+
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'successes': self.successes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'circuit_open': self.is_open(),
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'cancelled': self.cancelled,
+            'last_error': self.last_error,
+        }
+
+
+class LLMEndpoint:
+    """一个路由端点：名称 + 提供商实例 + 健康统计"""
+
+    def __init__(self, name: str, provider: BaseLLMProvider, config: Dict[str, Any], alpha: float = 0.3):
+        self.name = name
+        self.provider = provider
+        self.config = config
+        self.stats = EndpointStats(alpha)
+
+    @property
+    def model(self) -> str:
+        return self.config.get('model', 'unknown')
+
+    @property
+    def provider_name(self) -> str:
+        return self.config.get('provider', 'unknown')
+
+
+class LLMRouterProvider(BaseLLMProvider):
+    """多端点路由提供商
+
+    对外与 LiteLLMProvider 接口一致，_config 为主端点配置（兼容按 _config 读取 model 的调用方）。
+    """
+
+    def __init__(self, provider_factory: Optional[Callable[[], BaseLLMProvider]] = None):
+        """
+        Args:
+            provider_factory: 创建端点提供商实例的工厂（默认 LiteLLMProvider）
+        """
+        super().__init__()
+        self.provider_factory = provider_factory or LiteLLMProvider
+        self.endpoints: List[LLMEndpoint] = []
+        self.strategy = 'priority'
+        self.hedge_after_ms = 0
+        self.failure_threshold = 3
+        self.cooldown_seconds = 30.0
+        self.max_cooldown_seconds = 300.0
+
+    @property
+    def name(self) -> str:
+        return "router"
+
+    def initialize(self, config: Dict[str, Any]) -> bool:
+        """初始化所有端点
+
+        Args:
+            config: llm 配置，顶层的 model/api_key/base_url/provider 为主端点，另包含：
+                - endpoints: 备用端点列表，每项包含 name/model/api_key/base_url/provider
+                  （未配置 model 时沿用主端点的模型）
+                - routing: 路由参数
+                    - strategy: priority（按配置顺序，跳过熔断端点）或 latency（按延迟和错误率）
+                    - hedge_after_ms: 首 token 超过该时间后向下一个端点发送对冲请求（0 为不对冲）
+                    - failure_threshold: 连续失败多少次后熔断（默认 3）
+                    - cooldown_seconds: 首次熔断的冷却时间（默认 30，之后指数增长）
+                    - max_cooldown_seconds: 冷却时间上限（默认 300）
+                    - latency_alpha: 延迟/错误率 EWMA 系数（默认 0.3）
+
+        Returns:
+            是否至少有一个端点初始化成功
+        """
+        routing = config.get('routing', {}) or {}
+        self.strategy = routing.get('strategy', 'priority')
+        self.hedge_after_ms = int(routing.get('hedge_after_ms', 0) or 0)
+        self.failure_threshold = max(1, int(routing.get('failure_threshold', 3)))
+        self.cooldown_seconds = float(routing.get('cooldown_seconds', 30))
+        self.max_cooldown_seconds = float(routing.get('max_cooldown_seconds', 300))
+        alpha = float(routing.get('latency_alpha', 0.3))
+
+        primary = {k: v for k, v in config.items() if k not in ('endpoints', 'routing')}
+        endpoint_configs = [{'name': primary.pop('name', 'primary'), **primary}]
+        for i, endpoint in enumerate(config.get('endpoints') or []):
+            endpoint_configs.append({
+                'name': f"endpoint-{i + 1}",
+                'model': primary.get('model'),
+                'max_context_tokens': primary.get('max_context_tokens'),
+                **endpoint,
+            })
+
+        self.endpoints = []
+        for endpoint_config in endpoint_configs:
+            name = endpoint_config.pop('name')
+            provider = self.provider_factory()
+            if not provider.initialize(endpoint_config):
+                logger.error(f"[LLMRouter] 端点初始化失败，已跳过: {name}")
+                continue
+            self.endpoints.append(LLMEndpoint(name, provider, endpoint_config, alpha))
+
+        if not self.endpoints:
+            logger.error("[LLMRouter] 没有可用的端点")
+            return False
+
+        self._config = {**self.endpoints[0].config, 'name': self.endpoints[0].name}
+        self._initialized = True
+        logger.info(f"[LLMRouter] 初始化成功，端点: {[e.name for e in self.endpoints]}, "
+                    f"策略: {self.strategy}, 对冲: {self.hedge_after_ms}ms")
+        return True
+
+    def is_available(self) -> bool:
+        return self._initialized and any(e.provider.is_available() for e in self.endpoints)
+
+    def _candidates(self) -> List[LLMEndpoint]:
+        """按选择顺序排列端点：未熔断的在前，熔断中的按冷却结束时间排在最后（全部熔断时仍会尝试）"""
+        available = [e for e in self.endpoints if e.provider.is_available()]
+        healthy = [e for e in available if not e.stats.is_open()]
+        if self.strategy == 'latency':
+            # 没有延迟数据的端点按 0 处理，优先探测一次
+            healthy.sort(key=lambda e: (e.stats.latency_ms or 0.0) * (1 + 4 * e.stats.error_rate))
+        tripped = sorted((e for e in available if e.stats.is_open()), key=lambda e: e.stats.open_until)
+        return healthy + tripped
+
+    async def chat(self, messages: list[Dict[str, str]], stream: bool = False, **kwargs):
+        response = await self.chat_with_usage(messages, stream=stream, **kwargs)
+        return response.stream if stream else response.text
+
+    async def chat_with_usage(
+        self,
+        messages: list[Dict[str, str]],
+        stream: bool = False,
+        **kwargs
+    ) -> LLMResponse:
+        """按路由策略发送请求，返回胜出端点的结果
+
+        Returns:
+            LLMResponse；usage 额外包含 model/provider/endpoint 字段，标注实际服务的端点
+        """
+        if not self._initialized:
+            raise RuntimeError("LLM router not initialized")
+
+        endpoint, response, first = await self._race(messages, stream, kwargs)
+
+        if not stream:
+            return LLMResponse(text=response.text, usage=self._tag_usage(response.usage, endpoint))
+
+        result = LLMResponse()
+        result.stream = self._continue_stream(endpoint, response, first, result)
+        return result
+
+    async def _race(self, messages, stream: bool, kwargs) -> Tuple[LLMEndpoint, LLMResponse, Any]:
+        """依次（或对冲）尝试各端点，返回首个产出结果的端点"""
+        candidates = self._candidates()
+        if not candidates:
+            raise RuntimeError("没有可用的 LLM 端点")
+
+        pending: Dict[asyncio.Task, Tuple[LLMEndpoint, bool]] = {}
+        next_index = 0
+        last_error: Optional[Exception] = None
+
+        def launch(hedge: bool):
+            nonlocal next_index
+            endpoint = candidates[next_index]
+            next_index += 1
+            endpoint.stats.requests += 1
+            if hedge:
+                endpoint.stats.hedges += 1
+                logger.info(f"[LLMRouter] 首 token 超过 {self.hedge_after_ms}ms，对冲请求: {endpoint.name}")
+            task = asyncio.ensure_future(self._attempt(endpoint, messages, stream, kwargs))
+            pending[task] = (endpoint, hedge)
+
+        launch(hedge=False)
+        try:
+            while pending:
+                can_hedge = self.hedge_after_ms > 0 and next_index < len(candidates)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_after_ms / 1000 if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch(hedge=True)
+                    continue
+
+                for task in done:
+                    endpoint, hedge = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        response, first, latency_ms = task.result()
+                        endpoint.stats.record_success(latency_ms)
+                        if hedge:
+                            endpoint.stats.hedge_wins += 1
+                        if endpoint is not candidates[0]:
+                            logger.info(f"[LLMRouter] 由端点 {endpoint.name} 响应（{latency_ms:.0f}ms）")
+                        return endpoint, response, first
+
+                    last_error = error
+                    self._record_failure(endpoint, error)
+                    logger.warning(f"[LLMRouter] 端点 {endpoint.name} 请求失败: {error}")
+
+                # 所有进行中的请求都失败时切换到下一个端点
+                if not pending and next_index < len(candidates):
+                    launch(hedge=False)
+        finally:
+            # 胜出后取消落败的请求（或调用方取消时全部取消）
+            for task, (endpoint, _) in pending.items():
+                task.cancel()
+                endpoint.stats.cancelled += 1
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                # 同一轮中已经完成的落败请求，关闭其流式响应
+                for task in pending:
+                    if stream and not task.cancelled() and task.exception() is None:
+                        await self._close(task.result()[0].stream)
+
+        raise last_error
+
+    async def _attempt(self, endpoint: LLMEndpoint, messages, stream: bool, kwargs) -> Tuple[LLMResponse, Any, float]:
+        """向单个端点发送请求；流式请求等到首个片段产出才算完成"""
+        start = time.monotonic()
+        response = await endpoint.provider.chat_with_usage(messages, stream=stream, **kwargs)
+        first = None
+        if stream:
+            try:
+                first = await response.stream.__anext__()
+            except StopAsyncIteration:
+                first = _EMPTY
+            except asyncio.CancelledError:
+                await self._close(response.stream)
+                raise
+        return response, first, (time.monotonic() - start) * 1000
+
+    async def _continue_stream(self, endpoint: LLMEndpoint, response: LLMResponse, first: Any,
+                               result: LLMResponse) -> AsyncIterator[str]:
+        """输出胜出端点的剩余片段，结束后写入带端点标注的 usage"""
+        try:
+            if first is not _EMPTY:
+                yield first
+                async for chunk in response.stream:
+                    yield chunk
+        except Exception as e:
+            # 首 token 之后失败无法切换端点，只记录健康状态
+            self._record_failure(endpoint, e)
+            raise
+        finally:
+            await self._close(response.stream)
+            # 中途断开时已产出部分的用量同样返回，由调用方计费
+            result.usage = self._tag_usage(response.usage, endpoint)
+
+    def _record_failure(self, endpoint: LLMEndpoint, error: Exception):
+        endpoint.stats.record_failure(error, self.failure_threshold,
+                                      self.cooldown_seconds, self.max_cooldown_seconds)
+        if endpoint.stats.is_open():
+            logger.warning(f"[LLMRouter] 端点 {endpoint.name} 连续失败 "
+                           f"{endpoint.stats.consecutive_failures} 次，暂停使用")
+
+    @staticmethod
+    async def _close(stream):
+        aclose = getattr(stream, 'aclose', None)
+        if aclose:
+            try:
+                await aclose()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _tag_usage(usage: Optional[Dict[str, Any]], endpoint: LLMEndpoint) -> Optional[Dict[str, Any]]:
+        if not usage:
+            return usage
+        return {**usage, 'model': endpoint.model, 'provider': endpoint.provider_name, 'endpoint': endpoint.name}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取路由与各端点的健康统计"""
+        return {
+            'strategy': self.strategy,
+            'hedge_after_ms': self.hedge_after_ms,
+            'endpoints': [
+                {'name': e.name, 'model': e.model, 'provider': e.provider_name, **e.stats.to_dict()}
+                for e in self.endpoints
+            ],
+        }
@@ -98,6 +98,8 @@ class SQLiteStorageProvider(BaseStorageProvider):
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_starred ON records(user_id, is_starred DESC) WHERE is_starred = 1')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_archived ON records(user_id, is_archived) WHERE is_archived = 1')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_app_type ON records(app_type, user_id, created_at DESC)')
+        # 按修改时间增量读取（知识库记录索引的水位线查询）
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_records_changed ON records(COALESCE(updated_at, created_at), id)')
         
         # 2. 全文搜索虚拟表（FTS5）
         cursor.execute('''
@@ -116,9 +118,22 @@ class SQLiteStorageProvider(BaseStorageProvider):
             END
         ''')
         
+        # 更新时不直接重写全文索引，只登记到待重建队列，由空闲时批量重建
+        # （自动保存频繁更新长文档时，逐次重建索引是主要的写放大来源）
         cursor.execute('''
-            CREATE TRIGGER IF NOT EXISTS records_au AFTER UPDATE ON records BEGIN
-                UPDATE records_fts SET text = new.text WHERE record_id = old.id;
+            CREATE TABLE IF NOT EXISTS records_fts_pending (
+                record_id TEXT PRIMARY KEY,
+                queued_at TIMESTAMP NOT NULL
+            )
+        ''')
+        
+        # 旧版本的 records_au 触发器会立即更新 FTS，需要替换
+        cursor.execute('DROP TRIGGER IF EXISTS records_au')
+        cursor.execute('''
+            CREATE TRIGGER records_au AFTER UPDATE OF text ON records
+            WHEN old.text IS NOT new.text BEGIN
+                INSERT OR REPLACE INTO records_fts_pending(record_id, queued_at)
+                VALUES (new.id, datetime('now', 'localtime'));
             END
         ''')
         
@@ -128,6 +143,59 @@ class SQLiteStorageProvider(BaseStorageProvider):
             END
         ''')
         
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS records_ad_fts_pending AFTER DELETE ON records BEGIN
+                DELETE FROM records_fts_pending WHERE record_id = old.id;
+            END
+        ''')
+        
+        # 永久删除登记（按修改时间增量读取的消费方无法感知已删除的行）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS records_tombstones (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_id TEXT NOT NULL,
+                deleted_at TIMESTAMP NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS records_ad_tombstone AFTER DELETE ON records BEGIN
+                INSERT INTO records_tombstones(record_id, deleted_at)
+                VALUES (old.id, datetime('now', 'localtime'));
+            END
+        ''')
+
+        # 2.1 record_blocks 表（笔记块，按块规范化存储）
+        # records.metadata.blocks 仍是完整文档；本表随保存同步，
+        # 供块级读取、图片引用检查、小结块筛选和块级搜索使用，避免解析整篇 JSON
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS record_blocks (
+                record_id TEXT NOT NULL,
+                block_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                text TEXT,
+                image_url TEXT,
+                is_summary INTEGER NOT NULL DEFAULT 0,
+                content_hash TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (record_id, block_id),
+                FOREIGN KEY (record_id) REFERENCES records(id) ON DELETE CASCADE
+            )
+        ''')
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_blocks_position ON record_blocks(record_id, position)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_blocks_image ON record_blocks(image_url) WHERE image_url IS NOT NULL')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_blocks_summary ON record_blocks(record_id, position) WHERE is_summary = 1')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_record_blocks_type ON record_blocks(type)')
+        
+        # 业务连接未开启 foreign_keys，使用触发器保证删除记录时同步删除块
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS records_ad_blocks AFTER DELETE ON records BEGIN
+                DELETE FROM record_blocks WHERE record_id = old.id;
+            END
+        ''')
+        
         # ==================== 标签系统 ====================
         
         # 3. tags 表（标签）
@@ -337,10 +405,243 @@ class SQLiteStorageProvider(BaseStorageProvider):
             VALUES ('1.2.1', datetime('now', 'localtime'), '会员系统重构：会员等级绑定到用户而非设备，支持多设备共享会员权益')
         ''')
         
-        logger.info(f"[Storage] 数据表已初始化 (v1.2.1): {self.db_path}")
+        cursor.execute('''
+            INSERT OR IGNORE INTO schema_versions (version, applied_at, description)
+            VALUES ('1.2.2', datetime('now', 'localtime'), '全文索引延迟重建：文本更新登记到 records_fts_pending，空闲时批量重建')
+        ''')
+        
+        # 迁移：为已有记录生成 record_blocks（只执行一次）
+        cursor.execute("SELECT 1 FROM schema_versions WHERE version = '1.3.0'")
+        if cursor.fetchone() is None:
+            migrated = self._migrate_record_blocks(cursor)
+            cursor.execute('''
+                INSERT OR IGNORE INTO schema_versions (version, applied_at, description)
+                VALUES ('1.3.0', datetime('now', 'localtime'), '笔记块规范化存储：新增 record_blocks 表并迁移已有记录')
+            ''')
+            logger.info(f"[Storage] record_blocks 迁移完成: {migrated} 条记录")
+        
+        logger.info(f"[Storage] 数据表已初始化 (v1.3.0): {self.db_path}")
         conn.commit()
         conn.close()
     
+    def _migrate_record_blocks(self, cursor, batch_size: int = 200) -> int:
+        """为已有记录生成 record_blocks 行
+        
+        Returns:
+            迁移的记录数
+        """
+        migrated = 0
+        last_rowid = 0
+        while True:
+            cursor.execute('''
+                SELECT rowid, id, metadata, created_at, updated_at FROM records
+                WHERE rowid > ? ORDER BY rowid LIMIT ?
+            ''', (last_rowid, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for rowid, record_id, metadata_json, created_at, updated_at in rows:
+                last_rowid = rowid
+                try:
+                    metadata = json.loads(metadata_json) if metadata_json else {}
+                except json.JSONDecodeError:
+                    continue
+                timestamp = updated_at or created_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                if self._sync_record_blocks(cursor, record_id, metadata, timestamp):
+                    migrated += 1
+        return migrated
+    
+    @staticmethod
+    def _block_rows(metadata: Dict[str, Any]) -> List[tuple]:
+        """将 metadata.blocks 转换为 record_blocks 行
+        
+        Returns:
+            (block_id, position, type, text, image_url, is_summary, content_hash) 列表
+        """
+        import hashlib
+        
+        blocks = metadata.get('blocks') if isinstance(metadata, dict) else None
+        if not isinstance(blocks, list):
+            return []
+        
+        rows = []
+        seen_ids = set()
+        for position, block in enumerate(blocks):
+            if not isinstance(block, dict):
+                continue
+            block_id = str(block.get('id') or f'pos-{position}')
+            if block_id in seen_ids:
+                # 重复的块ID（历史数据）按位置区分
+                block_id = f'{block_id}#{position}'
+            seen_ids.add(block_id)
+            
+            content_hash = hashlib.sha1(
+                json.dumps(block, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            ).hexdigest()
+            rows.append((
+                block_id,
+                position,
+                block.get('type') or 'paragraph',
+                block.get('content') or '',
+                block.get('imageUrl') or None,
+                1 if block.get('isSummary') else 0,
+                content_hash,
+            ))
+        return rows
+    
+    def _sync_record_blocks(self, cursor, record_id: str, metadata: Dict[str, Any], now: str) -> int:
+        """同步记录的 record_blocks（只写入有变化的块）
+        
+        Args:
+            cursor: 当前事务的游标（与记录写入在同一事务中）
+            record_id: 记录 ID
+            metadata: 记录元数据
+            now: 时间戳
+        
+        Returns:
+            写入（新增/更新/删除）的块数
+        """
+        rows = self._block_rows(metadata)
+        
+        cursor.execute(
+            'SELECT block_id, position, content_hash FROM record_blocks WHERE record_id = ?',
+            (record_id,)
+        )
+        existing = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        
+        changed = 0
+        current_ids = set()
+        for block_id, position, block_type, text, image_url, is_summary, content_hash in rows:
+            current_ids.add(block_id)
+            old = existing.get(block_id)
+            if old is None:
+                cursor.execute('''
+                    INSERT INTO record_blocks (
+                        record_id, block_id, position, type, text, image_url,
+                        is_summary, content_hash, created_at, updated_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (record_id, block_id, position, block_type, text, image_url,
+                      is_summary, content_hash, now, now))
+                changed += 1
+            elif old[1] != content_hash:
+                cursor.execute('''
+                    UPDATE record_blocks
+                    SET position = ?, type = ?, text = ?, image_url = ?,
+                        is_summary = ?, content_hash = ?, updated_at = ?
+                    WHERE record_id = ? AND block_id = ?
+                ''', (position, block_type, text, image_url, is_summary, content_hash, now,
+                      record_id, block_id))
+                changed += 1
+            elif old[0] != position:
+                # 仅移动位置，不算内容更新
+                cursor.execute(
+                    'UPDATE record_blocks SET position = ? WHERE record_id = ? AND block_id = ?',
+                    (position, record_id, block_id)
+                )
+                changed += 1
+        
+        stale_ids = [block_id for block_id in existing if block_id not in current_ids]
+        if stale_ids:
+            placeholders = ','.join(['?'] * len(stale_ids))
+            cursor.execute(
+                f'DELETE FROM record_blocks WHERE record_id = ? AND block_id IN ({placeholders})',
+                [record_id, *stale_ids]
+            )
+            changed += len(stale_ids)
+        
+        return changed
+    
+    def get_record_blocks(self, record_id: str, block_type: Optional[str] = None,
+                          summary_only: bool = False) -> List[Dict[str, Any]]:
+        """按块读取记录内容（无需解析整篇 metadata）
+        
+        Args:
+            record_id: 记录 ID
+            block_type: 块类型筛选（可选）
+            summary_only: 只返回小结块
+        
+        Returns:
+            块列表，按位置排序
+        """
+        conditions = ['record_id = ?']
+        params: list = [record_id]
+        if block_type:
+            conditions.append('type = ?')
+            params.append(block_type)
+        if summary_only:
+            conditions.append('is_summary = 1')
+        
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT block_id, position, type, text, image_url, is_summary, created_at, updated_at
+                FROM record_blocks
+                WHERE {' AND '.join(conditions)}
+                ORDER BY position
+            ''', params)
+            return [
+                {
+                    'block_id': row[0],
+                    'position': row[1],
+                    'type': row[2],
+                    'text': row[3],
+                    'image_url': row[4],
+                    'is_summary': bool(row[5]),
+                    'created_at': row[6],
+                    'updated_at': row[7],
+                }
+                for row in cursor.fetchall()
+            ]
+        finally:
+            conn.close()
+    
+    def search_record_blocks(self, query: str, user_id: Optional[str] = None,
+                             app_type: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """块级文本搜索（返回命中的块及所属记录）
+        
+        Args:
+            query: 搜索关键词（子串匹配）
+            user_id: 用户ID筛选（可选）
+            app_type: 应用类型筛选（可选）
+            limit: 返回数量限制
+        """
+        conditions = ["b.text LIKE ? ESCAPE '\\'", 'r.is_deleted = 0']
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params: list = [f'%{escaped}%']
+        if user_id:
+            conditions.append('r.user_id = ?')
+            params.append(user_id)
+        if app_type:
+            conditions.append('r.app_type = ?')
+            params.append(app_type)
+        params.append(limit)
+        
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT b.record_id, b.block_id, b.position, b.type, b.text, b.updated_at
+                FROM record_blocks b
+                INNER JOIN records r ON r.id = b.record_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY b.updated_at DESC
+                LIMIT ?
+            ''', params)
+            return [
+                {
+                    'record_id': row[0],
+                    'block_id': row[1],
+                    'position': row[2],
+                    'type': row[3],
+                    'text': row[4],
+                    'updated_at': row[5],
+                }
+                for row in cursor.fetchall()
+            ]
+        finally:
+            conn.close()
+    
     def _get_connection(self):
         """获取数据库连接"""
         conn = sqlite3.connect(str(self.db_path), timeout=30.0)
@@ -388,6 +689,7 @@ class SQLiteStorageProvider(BaseStorageProvider):
             0, None, 0, 0,  # is_deleted, deleted_at, is_starred, is_archived
             now, now  # created_at, updated_at
         ))
+        self._sync_record_blocks(cursor, record_id, metadata, now)
         conn.commit()
         conn.close()
         
@@ -438,12 +740,133 @@ class SQLiteStorageProvider(BaseStorageProvider):
         cursor.execute(query, params)
         
         success = cursor.rowcount > 0
+        if success:
+            self._sync_record_blocks(cursor, record_id, metadata, now)
         conn.commit()
         conn.close()
         
         logger.debug(f"[Storage] 记录已更新: id={record_id}, success={success}")
         return success
     
+    def reindex_pending_fts(self, limit: int = 200) -> int:
+        """批量重建待更新记录的全文索引
+        
+        Args:
+            limit: 单次最多处理的记录数
+        
+        Returns:
+            已重建的记录数
+        """
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT record_id, queued_at FROM records_fts_pending ORDER BY queued_at LIMIT ?',
+                (limit,)
+            )
+            pending = cursor.fetchall()
+            if not pending:
+                return 0
+            
+            for record_id, queued_at in pending:
+                cursor.execute('''
+                    UPDATE records_fts SET text = (SELECT text FROM records WHERE id = ?)
+                    WHERE record_id = ?
+                ''', (record_id, record_id))
+                # 只删除本次处理时的登记，处理期间再次更新的记录保留在队列中
+                cursor.execute(
+                    'DELETE FROM records_fts_pending WHERE record_id = ? AND queued_at = ?',
+                    (record_id, queued_at)
+                )
+            conn.commit()
+            logger.debug(f"[Storage] 全文索引已重建: {len(pending)} 条记录")
+            return len(pending)
+        finally:
+            conn.close()
+
+    def list_records_changed_since(self, since: str = '', after_id: str = '',
+                                   limit: int = 100) -> List[Dict[str, Any]]:
+        """按修改时间增量读取记录（包括已软删除的记录）
+
+        按 (修改时间, ID) 排序，调用方以最后一条的 (changed_at, id) 作为下一次的起点。
+
+        Args:
+            since: 修改时间起点（'YYYY-MM-DD HH:MM:SS'）
+            after_id: 修改时间等于 since 时，只返回 ID 大于该值的记录
+            limit: 返回数量限制
+
+        Returns:
+            记录列表（含 is_deleted 与 changed_at）
+        """
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, text, metadata, app_type, user_id, is_deleted, created_at,
+                       COALESCE(updated_at, created_at) AS changed_at
+                FROM records
+                WHERE COALESCE(updated_at, created_at) > ?
+                   OR (COALESCE(updated_at, created_at) = ? AND id > ?)
+                ORDER BY COALESCE(updated_at, created_at), id
+                LIMIT ?
+            ''', (since, since, after_id, limit))
+            return [
+                {
+                    'id': row[0],
+                    'text': row[1] or '',
+                    'metadata': json.loads(row[2]) if row[2] else {},
+                    'app_type': row[3] or 'voice-note',
+                    'user_id': row[4],
+                    'is_deleted': bool(row[5]),
+                    'created_at': row[6],
+                    'changed_at': row[7],
+                }
+                for row in cursor.fetchall()
+            ]
+        finally:
+            conn.close()
+
+    def list_record_tombstones(self, after_seq: int = 0, limit: int = 500) -> List[tuple]:
+        """读取永久删除登记
+
+        Returns:
+            [(序号, 记录ID)]，按序号递增
+        """
+        conn = self._get_connection()
+        try:
+            cursor = conn.execute(
+                'SELECT seq, record_id FROM records_tombstones WHERE seq > ? ORDER BY seq LIMIT ?',
+                (after_seq, limit)
+            )
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def prune_record_tombstones(self, up_to_seq: int) -> int:
+        """清除已处理的永久删除登记"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.execute('DELETE FROM records_tombstones WHERE seq <= ?', (up_to_seq,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def get_existing_record_ids(self, record_ids: List[str]) -> set:
+        """返回仍存在（未被永久删除）的记录 ID"""
+        if not record_ids:
+            return set()
+        conn = self._get_connection()
+        try:
+            placeholders = ','.join(['?'] * len(record_ids))
+            cursor = conn.execute(f'SELECT id FROM records WHERE id IN ({placeholders})', list(record_ids))
+            return {row[0] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
     def get_record(self, record_id: str) -> Optional[Dict[str, Any]]:
         """获取单条记录
         
@@ -555,7 +978,7 @@ class SQLiteStorageProvider(BaseStorageProvider):
         
         # 2. 提取并删除关联图片
         image_urls = self._extract_image_urls(record)
-        deleted_images = self._delete_images(image_urls)
+        deleted_images = self._delete_images(image_urls, exclude_record_ids=[record_id])
         if deleted_images:
             logger.info(f"[Storage] 删除记录 {record_id} 的关联图片: {deleted_images}")
         
@@ -605,11 +1028,39 @@ class SQLiteStorageProvider(BaseStorageProvider):
         
         return image_urls
     
-    def _delete_images(self, image_urls: List[str]) -> List[str]:
-        """删除图片文件
+    def _is_image_referenced(self, filename: str, exclude_record_ids: List[str]) -> bool:
+        """检查图片是否仍被其他记录引用
+        
+        图片按内容哈希命名后，同一文件可能被多条记录共享，
+        删除记录时只能删除不再被引用的图片。只查询 record_blocks 的 image_url 索引
+        （升级前的记录已由 1.3.0 迁移生成图片块，不再对 records.text 做 LIKE 全表扫描）。
+        
+        Args:
+            filename: 图片文件名
+            exclude_record_ids: 需要排除的记录ID（即将被删除的记录）
+        """
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            exclude_clause = ''
+            if exclude_record_ids:
+                exclude_clause = f"AND record_id NOT IN ({','.join(['?'] * len(exclude_record_ids))})"
+            
+            cursor.execute(f'''
+                SELECT 1 FROM record_blocks
+                WHERE image_url IN (?, ?) {exclude_clause}
+                LIMIT 1
+            ''', [filename, f'images/{filename}', *(exclude_record_ids or [])])
+            return cursor.fetchone() is not None
+        finally:
+            conn.close()
+    
+    def _delete_images(self, image_urls: List[str], exclude_record_ids: Optional[List[str]] = None) -> List[str]:
+        """删除图片文件（跳过仍被其他记录引用的图片）
         
         Args:
             image_urls: 图片URL列表（相对路径，如 'images/xxx.png'）
+            exclude_record_ids: 引用检查时排除的记录ID（即将被删除的记录）
         
         Returns:
             成功删除的图片URL列表
@@ -626,9 +1077,16 @@ class SQLiteStorageProvider(BaseStorageProvider):
                 else:
                     filename = url
                 
+                if self._is_image_referenced(filename, exclude_record_ids or []):
+                    logger.debug(f"[Storage] 图片仍被其他记录引用，保留: {url}")
+                    continue
+                
                 image_path = self.images_dir / filename
                 if image_path.exists() and image_path.is_file():
                     image_path.unlink()
+                    # 同时删除缩略图
+                    for thumb_path in (self.images_dir / '.thumbs').glob(f'*/{filename}'):
+                        thumb_path.unlink()
                     deleted.append(url)
                     logger.debug(f"[Storage] 已删除图片文件: {url}")
                 else:
@@ -701,7 +1159,7 @@ class SQLiteStorageProvider(BaseStorageProvider):
                 all_image_urls.extend(image_urls)
         
         # 2. 删除所有关联图片
-        deleted_images = self._delete_images(all_image_urls)
+        deleted_images = self._delete_images(list(dict.fromkeys(all_image_urls)), exclude_record_ids=record_ids)
         if deleted_images:
             logger.info(f"[Storage] 批量删除 {len(record_ids)} 条记录的关联图片: {len(deleted_images)} 个")
         
@@ -0,0 +1,200 @@
+"""
+批量导出服务
+将多条记录流式打包为 ZIP，边生成边输出，内存占用与记录/图片数量无关
+"""
+import io
+import re
+import json
+import asyncio
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from src.services.export_service import MarkdownExportService, HtmlExportService
+from src.core.logger import get_logger
+
+logger = get_logger("BulkExport")
+
+
+class _ChunkSink(io.RawIOBase):
+    """只写、不可 seek 的输出缓冲
+
+    zipfile 检测到输出不可 seek 时会改用数据描述符（data descriptor）写法，
+    因此每写完一段即可取出已生成的字节交给客户端，无需整包驻留内存。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        """取出并清空已写入的数据"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BulkExportService:
+    """批量导出服务
+
+    ZIP 结构：
+        <标题>_<记录ID前8位>.md / .html   每条记录一个笔记文件
+        images/...                        所有记录引用的图片（跨记录去重，只写一次）
+        manifest.json                     导出清单（含缺失的记录和图片）
+
+    笔记中的图片保持 images/xxx.png 相对路径，解压后可直接查看。
+    """
+
+    # 图片读取分块大小
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, storage_provider, data_dir: Path, max_workers: int = 4):
+        """
+        Args:
+            storage_provider: 存储提供者（需提供 get_record）
+            data_dir: 数据根目录（用于查找图片文件）
+            max_workers: 读取记录和图片的线程数
+        """
+        self.storage_provider = storage_provider
+        self.data_dir = Path(data_dir)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ExportIO")
+
+    def shutdown(self):
+        """释放线程池"""
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def get_note_title(record: Dict[str, Any]) -> str:
+        """从记录的 note-info 块提取文件名安全的标题"""
+        metadata = record.get('metadata') or {}
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except Exception:
+                metadata = {}
+
+        blocks = metadata.get('blocks', [])
+        note_info_block = next((b for b in blocks if b.get('type') == 'note-info'), None)
+        if note_info_block and note_info_block.get('noteInfo', {}).get('title'):
+            title = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '', note_info_block['noteInfo']['title']).strip()
+            if title:
+                return title[:80]
+        return "笔记"
+
+    def _render_note(self, record: Dict[str, Any], note_format: str) -> tuple:
+        """生成单条记录的笔记文件（在线程池中执行）"""
+        base_name = f"{self.get_note_title(record)}_{str(record.get('id', ''))[:8]}"
+        if note_format == 'html':
+            content = HtmlExportService.export_record_to_html(record, self.data_dir, inline_images=False)
+            return f"{base_name}.html", content.encode('utf-8')
+        content = MarkdownExportService._export_with_relative_paths(record)
+        return f"{base_name}.md", content.encode('utf-8')
+
+    def _resolve_image(self, image_rel_path: str) -> Optional[Path]:
+        """解析图片路径，拒绝越出数据目录的路径"""
+        try:
+            full_path = (self.data_dir / image_rel_path).resolve()
+            full_path.relative_to(self.data_dir.resolve())
+        except (ValueError, OSError):
+            return None
+        return full_path if full_path.is_file() else None
+
+    async def _write_image(self, zf: zipfile.ZipFile, sink: _ChunkSink,
+                           arcname: str, image_path: Path) -> AsyncIterator[bytes]:
+        """分块读取图片并写入 ZIP
+
+        读取在线程池中进行，并预读下一块，使磁盘读取与网络发送重叠；
+        任意时刻最多持有两块数据。图片本身已是压缩格式，使用 STORED 避免无效的 CPU 开销。
+        """
+        loop = asyncio.get_running_loop()
+        zinfo = zipfile.ZipInfo(arcname, date_time=datetime.fromtimestamp(image_path.stat().st_mtime).timetuple()[:6])
+        zinfo.compress_type = zipfile.ZIP_STORED
+
+        src = await loop.run_in_executor(self._executor, open, image_path, 'rb')
+        try:
+            with zf.open(zinfo, 'w') as dest:
+                pending = loop.run_in_executor(self._executor, src.read, self.CHUNK_SIZE)
+                while True:
+                    chunk = await pending
+                    if not chunk:
+                        break
+                    pending = loop.run_in_executor(self._executor, src.read, self.CHUNK_SIZE)
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+        finally:
+            src.close()
+        # 文件尾部的数据描述符在 dest 关闭时写入
+        data = sink.drain()
+        if data:
+            yield data
+
+    async def stream_zip(self, record_ids: Iterable[str], note_format: str = 'md') -> AsyncIterator[bytes]:
+        """流式生成 ZIP
+
+        Args:
+            record_ids: 记录ID序列
+            note_format: 笔记格式，'md' 或 'html'
+
+        Yields:
+            ZIP 字节块
+        """
+        loop = asyncio.get_running_loop()
+        sink = _ChunkSink()
+        written_images: Set[str] = set()
+        missing_records: List[str] = []
+        missing_images: List[str] = []
+        exported = 0
+        started = datetime.now()
+
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for record_id in record_ids:
+                # 逐条读取记录，处理完即释放
+                record = await loop.run_in_executor(self._executor, self.storage_provider.get_record, record_id)
+                if not record:
+                    missing_records.append(record_id)
+                    continue
+
+                arcname, content = await loop.run_in_executor(self._executor, self._render_note, record, note_format)
+                zf.writestr(arcname, content)
+                exported += 1
+                yield sink.drain()
+
+                for image_rel_path in MarkdownExportService._extract_image_paths(record):
+                    if image_rel_path in written_images:
+                        continue
+                    written_images.add(image_rel_path)
+
+                    image_path = await loop.run_in_executor(self._executor, self._resolve_image, image_rel_path)
+                    if image_path is None:
+                        missing_images.append(image_rel_path)
+                        logger.warning(f"[BulkExport] 图片不存在: {image_rel_path}")
+                        continue
+
+                    async for data in self._write_image(zf, sink, image_rel_path, image_path):
+                        yield data
+
+            manifest = {
+                'exported_at': started.isoformat(),
+                'format': note_format,
+                'records': exported,
+                'images': len(written_images) - len(missing_images),
+                'missing_records': missing_records,
+                'missing_images': missing_images,
+            }
+            zf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+        # 关闭时写入中央目录
+        yield sink.drain()
+        logger.info(f"[BulkExport] 批量导出完成: {exported} 条记录, {manifest['images']} 张图片, "
+                    f"耗时 {(datetime.now() - started).total_seconds():.2f}s")
@@ -25,6 +25,7 @@ class CleanupService:
     定期执行清理任务：
     1. 清理旧日志文件
     2. 清理孤儿图片文件
+    3. 清理过期的记录删除登记（records_tombstones）
     """
     
     def __init__(self, config: dict):
@@ -36,6 +37,7 @@ class CleanupService:
                 - cleanup.interval_hours: 清理间隔（小时）
                 - cleanup.log_retention_days: 日志保留天数
                 - cleanup.orphan_images: 是否清理孤儿图片
+                - cleanup.tombstone_retention_days: 记录删除登记保留天数
                 - storage.data_dir: 数据根目录
                 - storage.database: 数据库路径
                 - storage.images: 图片目录
@@ -46,6 +48,7 @@ class CleanupService:
         self.interval_hours = config.get('cleanup', {}).get('interval_hours', 24)
         self.log_retention_days = config.get('cleanup', {}).get('log_retention_days', 7)
         self.orphan_images_enabled = config.get('cleanup', {}).get('orphan_images', True)
+        self.tombstone_retention_days = config.get('cleanup', {}).get('tombstone_retention_days', 7)
         
         # 路径配置
         self.data_dir = Path(config.get('storage', {}).get('data_dir', '~/Library/Application Support/MindVoice')).expanduser()
@@ -120,16 +123,21 @@ class CleanupService:
             else:
                 image_stats = {'deleted': 0, 'size_freed': 0}
             
+            # 3. 清理过期的记录删除登记
+            tombstones = await asyncio.to_thread(self._cleanup_record_tombstones)
+            
             logger.info(
                 f"[Cleanup] 清理完成 - "
                 f"日志: 删除 {log_stats['deleted']} 个文件 ({log_stats['size_freed']:.2f} MB), "
-                f"图片: 删除 {image_stats['deleted']} 个文件 ({image_stats['size_freed']:.2f} MB)"
+                f"图片: 删除 {image_stats['deleted']} 个文件 ({image_stats['size_freed']:.2f} MB), "
+                f"删除登记: {tombstones} 条"
             )
             
             return {
                 'success': True,
                 'logs': log_stats,
-                'images': image_stats
+                'images': image_stats,
+                'tombstones': tombstones
             }
         except Exception as e:
             logger.error(f"[Cleanup] 清理任务失败: {e}", exc_info=True)
@@ -193,7 +201,8 @@ class CleanupService:
             size_freed = 0
             
             for image_file in self.images_dir.glob('*'):
-                if not image_file.is_file():
+                # 跳过隐藏文件（ImageStoreService 正在写入的 .upload-* 临时文件）
+                if image_file.name.startswith('.') or not image_file.is_file():
                     continue
                 
                 # 构造相对路径（images/xxx.png）
@@ -207,6 +216,15 @@ class CleanupService:
                     size_freed += file_size
                     logger.debug(f"[Cleanup] 删除孤儿图片: {image_file.name}")
             
+            # 3. 清理原图已不存在的缩略图
+            thumbs_dir = self.images_dir / '.thumbs'
+            if thumbs_dir.exists():
+                for thumb_file in thumbs_dir.glob('*/*'):
+                    if thumb_file.is_file() and not (self.images_dir / thumb_file.name).exists():
+                        size_freed += thumb_file.stat().st_size
+                        thumb_file.unlink()
+                        logger.debug(f"[Cleanup] 删除孤儿缩略图: {thumb_file.name}")
+            
             size_freed_mb = size_freed / (1024 * 1024)
             if deleted_count > 0:
                 logger.info(f"[Cleanup] 清理孤儿图片: 删除 {deleted_count} 个文件，释放 {size_freed_mb:.2f} MB")
@@ -216,6 +234,36 @@ class CleanupService:
             logger.error(f"[Cleanup] 清理孤儿图片失败: {e}", exc_info=True)
             return {'deleted': 0, 'size_freed': 0}
     
+    def _cleanup_record_tombstones(self) -> int:
+        """删除超过保留天数的记录删除登记
+        
+        删除登记只由笔记记录索引（默认关闭）消费并清理；未启用索引时登记会一直累积。
+        索引任务停用期间被清理的登记由其定期对账兜底，不会遗留向量。
+        
+        Returns:
+            删除的登记条数
+        """
+        if not self.db_path.exists():
+            return 0
+        
+        cutoff = (datetime.now() - timedelta(days=self.tombstone_retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+            try:
+                cursor = conn.execute('DELETE FROM records_tombstones WHERE deleted_at < ?', (cutoff,))
+                conn.commit()
+                deleted = cursor.rowcount
+            finally:
+                conn.close()
+        except sqlite3.OperationalError as e:
+            # 旧数据库（尚无 records_tombstones 表）
+            logger.debug(f"[Cleanup] 跳过删除登记清理: {e}")
+            return 0
+        
+        if deleted:
+            logger.info(f"[Cleanup] 清理记录删除登记: {deleted} 条（早于 {cutoff}）")
+        return deleted
+    
     def _get_referenced_images(self) -> Set[str]:
         """从数据库中获取所有被引用的图片URL
         
@@ -232,7 +280,17 @@ class CleanupService:
             conn = sqlite3.connect(str(self.db_path), timeout=30.0)
             conn.execute('PRAGMA journal_mode=WAL')
             cursor = conn.cursor()
-            cursor.execute('SELECT text, metadata FROM records')
+            try:
+                # 图片块已同步到 record_blocks，无需解析每条记录的 metadata
+                cursor.execute('SELECT DISTINCT image_url FROM record_blocks WHERE image_url IS NOT NULL')
+                for (image_url,) in cursor.fetchall():
+                    referenced.add(image_url)
+                    if '/' in image_url:
+                        referenced.add(image_url.split('/')[-1])
+                cursor.execute('SELECT text, NULL FROM records')
+            except sqlite3.OperationalError:
+                # 旧数据库（尚无 record_blocks 表）
+                cursor.execute('SELECT text, metadata FROM records')
             rows = cursor.fetchall()
             conn.close()
             
@@ -0,0 +1,399 @@
+"""
+运行时诊断服务
+
+功能：
+- 统计式栈采样分析器：按固定间隔采样所有线程的调用栈，输出火焰图兼容的折叠栈（collapsed stacks）
+- tracemalloc 内存快照：拍摄、对比快照，定位内存增长位置
+- 对象探针：上报 MessageBuffer、对话历史、录音缓冲区等关键容器的当前大小
+- 事件循环延迟监控：周期性定时器的实际唤醒时间与预期时间之差，反映同步代码阻塞事件循环的程度
+
+打包后的应用无法挂载 py-spy 等外部工具，因此在进程内实现采样。
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from src.core.logger import get_logger
+
+logger = get_logger("Diagnostics")
+
+
+class ProfilerBusyError(RuntimeError):
+    """已有采样任务在运行"""
+
+
+class StackSampler:
+    """统计式栈采样器
+
+    基于 sys._current_frames() 周期性读取所有线程的栈帧，
+    采样线程本身不计入结果。输出格式与 flamegraph.pl / speedscope 兼容：
+    每行 "线程名;最外层帧;...;最内层帧 次数"。
+    """
+
+    def __init__(self, root_dir: Optional[str] = None):
+        """
+        Args:
+            root_dir: 项目根目录，用于缩短帧中的文件路径
+        """
+        self.root_dir = os.path.abspath(root_dir) if root_dir else os.getcwd()
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        """是否有采样任务在运行"""
+        return self._lock.locked()
+
+    def _format_frame(self, frame) -> str:
+        """格式化单个栈帧为 "函数名 (文件:定义行)" """
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(self.root_dir):
+            filename = os.path.relpath(filename, self.root_dir)
+        else:
+            # 第三方库/标准库只保留包内相对路径，避免不同机器路径差异
+            for marker in ('site-packages' + os.sep, 'dist-packages' + os.sep):
+                idx = filename.find(marker)
+                if idx >= 0:
+                    filename = filename[idx + len(marker):]
+                    break
+            else:
+                filename = os.path.basename(filename)
+        # 使用函数定义行而非当前执行行，使同一函数的样本能够合并
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+    @staticmethod
+    def _thread_names() -> Dict[int, str]:
+        return {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+
+    def sample(self, duration: float, interval: float = 0.005,
+               thread_filter: Optional[str] = None) -> Dict[str, Any]:
+        """执行一次采样（阻塞调用，应在线程池中运行）
+
+        Args:
+            duration: 采样时长（秒）
+            interval: 采样间隔（秒）
+            thread_filter: 仅保留线程名包含该子串的线程（可选）
+
+        Returns:
+            包含 stacks（折叠栈计数）、samples、threads 等字段的字典
+
+        Raises:
+            ProfilerBusyError: 已有采样任务在运行
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("已有采样任务在运行")
+
+        try:
+            counts: Counter = Counter()
+            own_ident = threading.get_ident()
+            names = self._thread_names()
+            names_refreshed_at = time.perf_counter()
+            seen_threads = set()
+            samples = 0
+
+            started = time.perf_counter()
+            deadline = started + duration
+            while time.perf_counter() < deadline:
+                now = time.perf_counter()
+                # 线程可能动态创建（如线程池扩容），定期刷新线程名
+                if now - names_refreshed_at > 1.0:
+                    names = self._thread_names()
+                    names_refreshed_at = now
+
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    thread_name = names.get(ident, f"thread-{ident}")
+                    if thread_filter and thread_filter not in thread_name:
+                        continue
+
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._format_frame(frame))
+                        frame = frame.f_back
+                    stack.append(thread_name.replace(';', '_').replace(' ', '_'))
+                    stack.reverse()
+                    counts[';'.join(stack)] += 1
+                    seen_threads.add(thread_name)
+
+                samples += 1
+                time.sleep(interval)
+
+            elapsed = time.perf_counter() - started
+            logger.info(f"[Diagnostics] 栈采样完成: {samples} 次采样, {len(counts)} 个不同栈, 耗时 {elapsed:.2f}s")
+            return {
+                'stacks': dict(counts),
+                'samples': samples,
+                'duration': round(elapsed, 3),
+                'interval': interval,
+                'threads': sorted(seen_threads),
+            }
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def to_collapsed(stacks: Dict[str, int]) -> str:
+        """将采样结果转换为折叠栈文本（按样本数降序）"""
+        lines = [f"{stack} {count}" for stack, count in
+                 sorted(stacks.items(), key=lambda item: item[1], reverse=True)]
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+
+class MemorySnapshotManager:
+    """tracemalloc 快照管理
+
+    快照保存在内存中（最多 max_snapshots 个，超出后淘汰最早的），
+    通过快照 ID 进行对比。
+    """
+
+    def __init__(self, max_snapshots: int = 5):
+        self.max_snapshots = max_snapshots
+        self._snapshots: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, nframes: int = 25) -> Dict[str, Any]:
+        """开始追踪内存分配"""
+        if tracemalloc.is_tracing():
+            return {'tracing': True, 'nframes': tracemalloc.get_traceback_limit(), 'already_started': True}
+        tracemalloc.start(nframes)
+        logger.info(f"[Diagnostics] tracemalloc 已启动 (nframes={nframes})")
+        return {'tracing': True, 'nframes': nframes, 'already_started': False}
+
+    def stop(self) -> Dict[str, Any]:
+        """停止追踪并清空已保存的快照"""
+        with self._lock:
+            self._snapshots.clear()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("[Diagnostics] tracemalloc 已停止")
+        return {'tracing': False}
+
+    def take(self, label: Optional[str] = None) -> Dict[str, Any]:
+        """拍摄快照
+
+        Raises:
+            RuntimeError: tracemalloc 未启动
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc 未启动")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+
+        with self._lock:
+            self._counter += 1
+            snapshot_id = self._counter
+            info = {
+                'id': snapshot_id,
+                'label': label or '',
+                'created_at': datetime.now().isoformat(),
+                'traced_current': current,
+                'traced_peak': peak,
+            }
+            self._snapshots[snapshot_id] = {'info': info, 'snapshot': snapshot}
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+
+        logger.info(f"[Diagnostics] 已拍摄内存快照 #{snapshot_id} (当前 {current / 1024 / 1024:.1f}MB)")
+        return info
+
+    def list(self) -> List[Dict[str, Any]]:
+        """列出已保存的快照"""
+        with self._lock:
+            return [item['info'] for item in self._snapshots.values()]
+
+    def diff(self, base_id: int, target_id: Optional[int] = None,
+             key_type: str = 'lineno', limit: int = 30,
+             path_filters: Optional[List[str]] = None) -> Dict[str, Any]:
+        """对比两个快照
+
+        Args:
+            base_id: 基准快照ID
+            target_id: 目标快照ID（为空时使用最新快照）
+            key_type: 分组方式（lineno / filename / traceback）
+            limit: 返回的条目数量
+            path_filters: 仅保留文件路径包含其中任一子串的分配（可选）
+
+        Raises:
+            KeyError: 快照不存在
+            ValueError: 参数无效
+        """
+        if key_type not in ('lineno', 'filename', 'traceback'):
+            raise ValueError(f"不支持的 key_type: {key_type}")
+
+        with self._lock:
+            if base_id not in self._snapshots:
+                raise KeyError(f"快照不存在: {base_id}")
+            if target_id is None:
+                if not self._snapshots:
+                    raise KeyError("没有可用的快照")
+                target_id = next(reversed(self._snapshots))
+            if target_id not in self._snapshots:
+                raise KeyError(f"快照不存在: {target_id}")
+            base = self._snapshots[base_id]['snapshot']
+            target = self._snapshots[target_id]['snapshot']
+
+        if path_filters:
+            filters = [tracemalloc.Filter(True, f"*{pattern}*", all_frames=True) for pattern in path_filters]
+            base = base.filter_traces(filters)
+            target = target.filter_traces(filters)
+
+        stats = target.compare_to(base, key_type)
+        total_diff = sum(stat.size_diff for stat in stats)
+
+        entries = []
+        for stat in stats[:limit]:
+            entries.append({
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size': stat.size,
+                'count': stat.count,
+                'traceback': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            })
+
+        return {
+            'base_id': base_id,
+            'target_id': target_id,
+            'key_type': key_type,
+            'total_size_diff': total_diff,
+            'stats': entries,
+        }
+
+
+class EventLoopLagMonitor:
+    """事件循环延迟监控
+
+    每隔 interval 秒 sleep 一次，记录实际唤醒时间超出预期的部分（毫秒）。
+    统计在 get_stats(reset=True) 时清零，便于按测试阶段分别统计。
+    """
+
+    def __init__(self, interval: float = 0.05, max_samples: int = 10000):
+        self.interval = interval
+        self.max_samples = max_samples
+        self._samples: List[float] = []
+        self._max_lag = 0.0
+        self._since = time.time()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """在当前事件循环中启动监控（需在事件循环内调用）"""
+        if self.is_running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, (loop.time() - expected) * 1000)
+            self._max_lag = max(self._max_lag, lag)
+            self._samples.append(lag)
+            if len(self._samples) > self.max_samples:
+                # 超出上限时丢弃较早的一半样本（最大值单独保留）
+                del self._samples[:self.max_samples // 2]
+
+    def get_stats(self, reset: bool = False) -> Dict[str, Any]:
+        """获取延迟统计
+
+        Args:
+            reset: 读取后是否清零
+        """
+        samples = sorted(self._samples)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+
+        stats = {
+            'running': self.is_running,
+            'interval_ms': self.interval * 1000,
+            'since': datetime.fromtimestamp(self._since).isoformat(),
+            'samples': len(samples),
+            'mean_ms': round(sum(samples) / len(samples), 2) if samples else 0.0,
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(self._max_lag, 2),
+        }
+        if reset:
+            self._samples = []
+            self._max_lag = 0.0
+            self._since = time.time()
+        return stats
+
+
+class DiagnosticsService:
+    """运行时诊断服务
+
+    组合栈采样器、内存快照管理器和对象探针。
+    探针由主应用注册，返回关键容器的当前大小，用于配合内存快照判断增长来源。
+    """
+
+    # 单次采样的最大时长（秒），避免误操作长时间占用CPU
+    MAX_SAMPLE_SECONDS = 120
+
+    def __init__(self, root_dir: Optional[str] = None, max_snapshots: int = 5,
+                 loop_lag_interval_ms: float = 50.0):
+        self.sampler = StackSampler(root_dir=root_dir)
+        self.memory = MemorySnapshotManager(max_snapshots=max_snapshots)
+        self.loop_lag = EventLoopLagMonitor(interval=loop_lag_interval_ms / 1000.0)
+        self._probes: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def register_probe(self, name: str, probe: Callable[[], Dict[str, Any]]):
+        """注册对象探针
+
+        Args:
+            name: 探针名称（如 message_buffer）
+            probe: 无参函数，返回描述对象大小的字典
+        """
+        self._probes[name] = probe
+
+    def collect_probes(self) -> Dict[str, Any]:
+        """收集所有探针数据（单个探针失败不影响其他探针）"""
+        result = {}
+        for name, probe in self._probes.items():
+            try:
+                result[name] = probe()
+            except Exception as e:
+                result[name] = {'error': str(e)}
+        return result
+
+    def profile(self, seconds: float, interval_ms: float = 5.0,
+                thread_filter: Optional[str] = None) -> Dict[str, Any]:
+        """执行栈采样（阻塞调用）
+
+        Raises:
+            ValueError: 参数超出范围
+            ProfilerBusyError: 已有采样任务在运行
+        """
+        if seconds <= 0 or seconds > self.MAX_SAMPLE_SECONDS:
+            raise ValueError(f"采样时长必须在 (0, {self.MAX_SAMPLE_SECONDS}] 秒之间")
+        if interval_ms < 1 or interval_ms > 1000:
+            raise ValueError("采样间隔必须在 [1, 1000] 毫秒之间")
+        return self.sampler.sample(seconds, interval_ms / 1000.0, thread_filter=thread_filter)
@@ -0,0 +1,181 @@
+"""
+Embedding 向量缓存
+
+功能：
+- 以 (模型名, 文本块 SHA-256) 为键持久化文本块向量
+- 向量以 float16 BLOB 存入 SQLite（体积为 float32 的一半），读取时还原为 float32
+- 批量查询 / 写入，上传文件时只对未命中的文本块调用模型
+- 命中率统计
+
+同一文件重复上传或上传修订版本时，未改动的文本块直接复用已有向量。
+"""
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from src.core.logger import get_logger
+
+logger = get_logger("EmbeddingCache")
+
+# SQLite 单条语句的参数上限较低，批量查询按此大小分批
+_QUERY_BATCH = 500
+
+
+def chunk_hash(text: str) -> str:
+    """计算文本块哈希（缓存键的一部分）"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """文本块向量缓存（SQLite）"""
+
+    def __init__(self, db_path: Path):
+        """
+        Args:
+            db_path: 缓存数据库路径
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+
+        self._init_db()
+
+    def _get_connection(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_db(self):
+        conn = self._get_connection()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model TEXT NOT NULL,
+                    chunk_hash TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (model, chunk_hash)
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """批量读取向量
+
+        Returns:
+            {chunk_hash: float32 向量}，只包含命中的条目
+        """
+        keys = list(dict.fromkeys(hashes))
+        found: Dict[str, np.ndarray] = {}
+        if not keys:
+            return found
+
+        conn = self._get_connection()
+        try:
+            for i in range(0, len(keys), _QUERY_BATCH):
+                batch = keys[i:i + _QUERY_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = conn.execute(
+                    f'SELECT chunk_hash, dim, vector FROM embedding_cache '
+                    f'WHERE model = ? AND chunk_hash IN ({placeholders})',
+                    (model, *batch)
+                ).fetchall()
+                for key, dim, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float16)
+                    if vector.size == dim:
+                        found[key] = vector.astype(np.float32)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._hits += len(found)
+            self._misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]):
+        """批量写入向量（已存在的键会被覆盖）"""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            array = np.asarray(vector, dtype=np.float16).ravel()
+            rows.append((model, key, int(array.size), array.tobytes(), now))
+
+        conn = self._get_connection()
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO embedding_cache (model, chunk_hash, dim, vector, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stores += len(rows)
+
+    def encode(self, model: str, texts: List[str],
+               encode_fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> Tuple[List[List[float]], int]:
+        """读取缓存，只对未命中的文本调用 encode_fn，并写回缓存
+
+        Args:
+            model: 模型名（不同模型的向量互不复用）
+            texts: 文本块列表
+            encode_fn: 批量向量化函数（同步）
+
+        Returns:
+            (与 texts 一一对应的向量列表, 命中的文本块数)
+        """
+        hashes = [chunk_hash(t) for t in texts]
+        cached = self.get_many(model, hashes)
+
+        # 同一批内重复的文本块只计算一次
+        missing: Dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = encode_fn(list(missing.values()))
+            fresh = {key: np.asarray(vec, dtype=np.float32) for key, vec in zip(missing, vectors)}
+            self.put_many(model, fresh)
+            cached.update(fresh)
+
+        embeddings = [cached[key].tolist() for key in hashes]
+        hit_count = sum(1 for key in hashes if key not in missing)
+        return embeddings, hit_count
+
+    def get_stats(self) -> Dict[str, float]:
+        """缓存统计"""
+        conn = self._get_connection()
+        try:
+            entries, size = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache'
+            ).fetchone()
+        finally:
+            conn.close()
+
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'entries': entries,
+                'vector_bytes': size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'stores': self._stores,
+                'hit_rate': round(self._hits / total, 4) if total else 0.0,
+            }
@@ -292,13 +292,14 @@ class HtmlExportService:
     """HTML 导出服务（纯 Python 实现，零依赖）"""
     
     @staticmethod
-    def export_record_to_html(record: Dict[str, Any], data_dir: Path) -> str:
+    def export_record_to_html(record: Dict[str, Any], data_dir: Path, inline_images: bool = True) -> str:
         """
         将 record 转换为单文件 HTML（图片 Base64 嵌入）
         
         Args:
             record: 数据库记录
             data_dir: 数据根目录（用于读取图片文件）
+            inline_images: 是否 Base64 内嵌图片；为 False 时保留相对路径引用（用于打包导出，图片单独写入压缩包）
             
         Returns:
             完整的 HTML 字符串
@@ -345,7 +346,7 @@ class HtmlExportService:
                 html_parts.append(HtmlExportService._format_summary_block_html(block))
                 continue
             
-            formatted = HtmlExportService._format_block_html(block, data_dir)
+            formatted = HtmlExportService._format_block_html(block, data_dir, inline_images)
             if formatted:
                 html_parts.append(formatted)
         
@@ -590,7 +591,7 @@ class HtmlExportService:
 </div>'''
     
     @staticmethod
-    def _format_block_html(block: Dict[str, Any], data_dir: Path) -> str:
+    def _format_block_html(block: Dict[str, Any], data_dir: Path, inline_images: bool = True) -> str:
         """格式化普通块为 HTML"""
         block_type = block.get('type')
         content = block.get('content', '').strip()
@@ -622,19 +623,26 @@ class HtmlExportService:
             return f'<pre><code>{escaped_content}</code></pre>'
         
         elif block_type == 'image':
-            return HtmlExportService._format_image_html(block, data_dir)
+            return HtmlExportService._format_image_html(block, data_dir, inline_images)
         
         return ''
     
     @staticmethod
-    def _format_image_html(block: Dict[str, Any], data_dir: Path) -> str:
-        """格式化图片块为 HTML（Base64 嵌入）"""
+    def _format_image_html(block: Dict[str, Any], data_dir: Path, inline_images: bool = True) -> str:
+        """格式化图片块为 HTML（默认 Base64 嵌入）"""
         image_url = block.get('imageUrl', '')
         image_caption = block.get('imageCaption', '图片')
         
         if not image_url:
             return ''
         
+        if not inline_images:
+            # 引用相对路径，不读取图片内容
+            html = f'<img src="{HtmlExportService._escape_html(image_url)}" alt="{HtmlExportService._escape_html(image_caption)}" />'
+            if image_caption:
+                html += f'\n<span class="image-caption">{HtmlExportService._escape_html(image_caption)}</span>'
+            return html
+        
         # 读取图片并转为 Base64
         try:
             # 构建图片完整路径
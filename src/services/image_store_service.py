@@ -0,0 +1,284 @@
+"""
+图片存储服务（内容寻址）
+
+功能：
+- 按 SHA-256 命名图片（<sha256>.<ext>），相同内容只存储一份
+- 流式写入：边接收边计算哈希，写入临时文件后原子重命名
+- 后台生成缩略图（需要 Pillow，未安装时直接返回原图）
+- 为读取接口提供 ETag / Cache-Control 信息
+
+兼容旧的 <timestamp>-<uuid>.png 文件：读取和删除逻辑不变，仅 ETag 策略不同。
+"""
+import os
+import re
+import asyncio
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from src.core.logger import get_logger
+
+logger = get_logger("ImageStore")
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+class ImageTooLargeError(ValueError):
+    """图片超过大小限制"""
+
+
+class UnsupportedImageTypeError(ValueError):
+    """不接受的图片格式（SVG 可包含脚本，从 API 同源提供会造成存储型 XSS）"""
+
+
+class ImageStoreService:
+    """内容寻址图片存储"""
+
+    # 单张图片最大大小
+    MAX_IMAGE_SIZE = 50 * 1024 * 1024
+    # 写入分块大小
+    CHUNK_SIZE = 256 * 1024
+    # 缩略图目录（位于图片目录下，隐藏目录不参与孤儿图片扫描）
+    THUMBNAIL_DIR = '.thumbs'
+    # 允许的缩略图宽度，请求宽度会向上取整到其中一档，避免缓存无限增长
+    THUMBNAIL_WIDTHS = (160, 320, 640, 1280)
+
+    # 文件头魔数 -> 扩展名
+    _MAGIC = (
+        (b'\x89PNG\r\n\x1a\n', 'png'),
+        (b'\xff\xd8\xff', 'jpg'),
+        (b'GIF87a', 'gif'),
+        (b'GIF89a', 'gif'),
+    )
+    _CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+    def __init__(self, images_dir: Path, thumbnail_widths: Tuple[int, ...] = (320,), max_workers: int = 2):
+        """
+        Args:
+            images_dir: 图片目录
+            thumbnail_widths: 上传后自动生成的缩略图宽度
+            max_workers: 文件写入和缩略图生成的线程数
+        """
+        self.images_dir = Path(images_dir)
+        self.images_dir.mkdir(parents=True, exist_ok=True)
+        self.thumbnails_dir = self.images_dir / self.THUMBNAIL_DIR
+        self.auto_thumbnail_widths = tuple(w for w in thumbnail_widths if w in self.THUMBNAIL_WIDTHS)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ImageStore")
+        self._pending_thumbnails: Set[Tuple[str, int]] = set()
+
+        if not PIL_AVAILABLE:
+            logger.info("[ImageStore] Pillow 未安装，缩略图功能不可用（pip install Pillow）")
+
+    def shutdown(self):
+        """释放线程池"""
+        self._executor.shutdown(wait=False)
+
+    # ==================== 写入 ====================
+
+    @classmethod
+    def detect_extension(cls, head: bytes, default: str = 'png') -> str:
+        """根据文件头识别图片格式"""
+        for magic, ext in cls._MAGIC:
+            if head.startswith(magic):
+                return ext
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'webp'
+        if head.lstrip()[:5] in (b'<?xml', b'<svg ') or head.lstrip()[:4] == b'<svg':
+            return 'svg'
+        return default
+
+    async def save_stream(self, chunks: AsyncIterator[bytes]) -> Dict[str, object]:
+        """流式保存图片
+
+        边接收边计算 SHA-256，写入临时文件；完成后若同哈希文件已存在则丢弃临时文件。
+
+        Args:
+            chunks: 图片数据块异步迭代器
+
+        Returns:
+            {'filename', 'image_url', 'size', 'sha256', 'deduplicated'}
+
+        Raises:
+            ImageTooLargeError: 超过大小限制
+            UnsupportedImageTypeError: SVG 图片
+            ValueError: 内容为空
+        """
+        loop = asyncio.get_running_loop()
+        hasher = hashlib.sha256()
+        size = 0
+        head = b''
+
+        fd, tmp_name = tempfile.mkstemp(prefix='.upload-', dir=str(self.images_dir))
+        tmp_path = Path(tmp_name)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > self.MAX_IMAGE_SIZE:
+                        raise ImageTooLargeError(f"图片超过大小限制（{self.MAX_IMAGE_SIZE // 1024 // 1024}MB）")
+                    if len(head) < 32:
+                        head += chunk[:32 - len(head)]
+                    hasher.update(chunk)
+                    await loop.run_in_executor(self._executor, tmp_file.write, chunk)
+
+            if size == 0:
+                raise ValueError("图片内容为空")
+
+            extension = self.detect_extension(head)
+            if extension == 'svg':
+                raise UnsupportedImageTypeError("不支持 SVG 图片，请转换为 PNG / JPEG 后上传")
+            digest = hasher.hexdigest()
+            filename = f"{digest}.{extension}"
+            final_path = self.images_dir / filename
+            deduplicated = await loop.run_in_executor(self._executor, self._commit, tmp_path, final_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        if deduplicated:
+            logger.info(f"[ImageStore] 图片已存在，复用: {filename}")
+        else:
+            logger.info(f"[ImageStore] 已保存图片: {filename}, 大小: {size} bytes")
+            self.schedule_thumbnails(filename)
+
+        return {
+            'filename': filename,
+            'image_url': f"images/{filename}",
+            'size': size,
+            'sha256': digest,
+            'deduplicated': deduplicated,
+        }
+
+    async def save_bytes(self, data: bytes) -> Dict[str, object]:
+        """保存内存中的图片数据（兼容 Base64 上传接口）"""
+        async def _chunks():
+            for offset in range(0, len(data), self.CHUNK_SIZE):
+                yield data[offset:offset + self.CHUNK_SIZE]
+        return await self.save_stream(_chunks())
+
+    @staticmethod
+    def _commit(tmp_path: Path, final_path: Path) -> bool:
+        """将临时文件移动到最终位置，返回是否命中去重"""
+        if final_path.exists():
+            return True
+        os.replace(tmp_path, final_path)
+        return False
+
+    # ==================== 读取 ====================
+
+    def resolve(self, filename: str) -> Optional[Path]:
+        """解析图片路径（拒绝路径遍历）"""
+        if not filename or '..' in filename or '/' in filename or '\\' in filename:
+            return None
+        path = self.images_dir / filename
+        return path if path.is_file() else None
+
+    def is_content_addressed(self, filename: str) -> bool:
+        return bool(self._CONTENT_ADDRESSED.match(filename))
+
+    def get_etag(self, filename: str, path: Path, width: Optional[int] = None) -> str:
+        """计算 ETag
+
+        内容寻址文件直接使用哈希（强 ETag）；旧文件使用修改时间和大小。
+        """
+        suffix = f"-w{width}" if width else ''
+        if self.is_content_addressed(filename):
+            return f'"{filename.split(".", 1)[0]}{suffix}"'
+        stat = path.stat()
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'
+
+    def get_cache_control(self, filename: str) -> str:
+        """内容寻址文件内容永不变化，可长期缓存；旧文件每次需要验证"""
+        if self.is_content_addressed(filename):
+            return 'public, max-age=31536000, immutable'
+        return 'no-cache'
+
+    @staticmethod
+    def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+        """检查 If-None-Match 是否命中（弱比较）"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        normalized = etag[2:] if etag.startswith('W/') else etag
+        return any((tag[2:] if tag.startswith('W/') else tag) == normalized for tag in candidates)
+
+    # ==================== 缩略图 ====================
+
+    @classmethod
+    def normalize_width(cls, width: int) -> int:
+        """将请求宽度向上取整到允许的档位"""
+        for allowed in cls.THUMBNAIL_WIDTHS:
+            if width <= allowed:
+                return allowed
+        return cls.THUMBNAIL_WIDTHS[-1]
+
+    def thumbnail_path(self, filename: str, width: int) -> Path:
+        return self.thumbnails_dir / str(width) / filename
+
+    def get_thumbnail(self, filename: str, width: int) -> Optional[Path]:
+        """获取缩略图路径；不存在时安排后台生成并返回 None（调用方返回原图）"""
+        if not PIL_AVAILABLE or filename.endswith('.svg'):
+            return None
+        path = self.thumbnail_path(filename, width)
+        if path.is_file():
+            return path
+        self._schedule_thumbnail(filename, width)
+        return None
+
+    def schedule_thumbnails(self, filename: str):
+        """为新图片安排生成默认宽度的缩略图"""
+        if not PIL_AVAILABLE or filename.endswith('.svg'):
+            return
+        for width in self.auto_thumbnail_widths:
+            self._schedule_thumbnail(filename, width)
+
+    def _schedule_thumbnail(self, filename: str, width: int):
+        key = (filename, width)
+        if key in self._pending_thumbnails:
+            return
+        self._pending_thumbnails.add(key)
+        future = self._executor.submit(self._generate_thumbnail, filename, width)
+        future.add_done_callback(lambda _: self._pending_thumbnails.discard(key))
+
+    def _generate_thumbnail(self, filename: str, width: int):
+        """生成缩略图（在线程池中执行）"""
+        source = self.images_dir / filename
+        target = self.thumbnail_path(filename, width)
+        if target.exists() or not source.is_file():
+            return
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with Image.open(source) as img:
+                if img.width <= width:
+                    # 原图已足够小，直接复用原图内容
+                    thumb = img.copy()
+                else:
+                    height = max(1, round(img.height * width / img.width))
+                    thumb = img.resize((width, height), Image.LANCZOS)
+                fmt = img.format or 'PNG'
+                if fmt == 'GIF':
+                    fmt = 'PNG'
+                fd, tmp_name = tempfile.mkstemp(prefix='.thumb-', dir=str(target.parent))
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    thumb.save(tmp_file, format=fmt)
+                os.replace(tmp_name, target)
+            logger.debug(f"[ImageStore] 已生成缩略图: {filename} (w={width})")
+        except Exception as e:
+            logger.warning(f"[ImageStore] 生成缩略图失败: {filename} (w={width}): {e}")
+
+    def delete_thumbnails(self, filename: str):
+        """删除图片的所有缩略图"""
+        for width in self.THUMBNAIL_WIDTHS:
+            path = self.thumbnail_path(filename, width)
+            if path.exists():
+                path.unlink()
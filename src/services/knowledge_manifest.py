@@ -0,0 +1,199 @@
+"""
+知识库文件清单
+
+每个上传的文件在清单中占一行（file_id, 文件名, 文本块数, 大小, 内容哈希, 创建时间, 元数据，
+以及流式导入的状态与已写入的文本块数），上传和删除时同步维护。列出文件只读清单，不再从向量库拉取全部文本块的元数据，
+开销与文件数成正比，与文本块数无关。
+"""
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.core.logger import get_logger
+
+logger = get_logger("KnowledgeManifest")
+
+
+class KnowledgeManifest:
+    """知识库文件清单（SQLite）"""
+
+    def __init__(self, db_path: Path):
+        """
+        Args:
+            db_path: 清单数据库路径
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _get_connection(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_db(self):
+        conn = self._get_connection()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS knowledge_files (
+                    file_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    chunks INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    content_hash TEXT,
+                    metadata TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_files_created ON knowledge_files(created_at)')
+            # 流式导入：状态（ingesting / ready / failed）与已写入向量库的文本块数
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(knowledge_files)')}
+            if 'status' not in columns:
+                conn.execute("ALTER TABLE knowledge_files ADD COLUMN status TEXT NOT NULL DEFAULT 'ready'")
+            if 'ingested_chunks' not in columns:
+                conn.execute('ALTER TABLE knowledge_files ADD COLUMN ingested_chunks INTEGER NOT NULL DEFAULT 0')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add(self, file_id: str, filename: str, chunks: int, size: int,
+            content_hash: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None,
+            created_at: Optional[float] = None, status: str = 'ready'):
+        """添加或覆盖一个文件条目"""
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO knowledge_files '
+                    '(file_id, filename, chunks, size, content_hash, metadata, created_at, status, ingested_chunks) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (file_id, filename, int(chunks), int(size), content_hash,
+                     json.dumps(metadata or {}, ensure_ascii=False),
+                     created_at if created_at is not None else time.time(),
+                     status, int(chunks) if status == 'ready' else 0)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+    def update_progress(self, file_id: str, ingested_chunks: int, status: Optional[str] = None,
+                        content_hash: Optional[str] = None):
+        """更新导入进度；status 为 ready 时同时写入最终文本块数"""
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                if status == 'ready':
+                    conn.execute(
+                        'UPDATE knowledge_files SET ingested_chunks = ?, chunks = ?, status = ?, '
+                        'content_hash = COALESCE(?, content_hash) WHERE file_id = ?',
+                        (int(ingested_chunks), int(ingested_chunks), status, content_hash, file_id)
+                    )
+                else:
+                    conn.execute(
+                        'UPDATE knowledge_files SET ingested_chunks = ?, status = COALESCE(?, status) '
+                        'WHERE file_id = ?',
+                        (int(ingested_chunks), status, file_id)
+                    )
+                conn.commit()
+            finally:
+                conn.close()
+
+    def remove(self, file_id: str) -> bool:
+        """删除文件条目
+
+        Returns:
+            条目是否存在
+        """
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                cursor = conn.execute('DELETE FROM knowledge_files WHERE file_id = ?', (file_id,))
+                conn.commit()
+                return cursor.rowcount > 0
+            finally:
+                conn.close()
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """读取单个文件条目，不存在返回 None"""
+        conn = self._get_connection()
+        try:
+            row = conn.execute(
+                'SELECT file_id, filename, chunks, size, content_hash, metadata, created_at, '
+                'status, ingested_chunks FROM knowledge_files WHERE file_id = ?',
+                (file_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """按创建时间列出全部文件"""
+        conn = self._get_connection()
+        try:
+            rows = conn.execute(
+                'SELECT file_id, filename, chunks, size, content_hash, metadata, created_at, '
+                'status, ingested_chunks FROM knowledge_files ORDER BY created_at'
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_dict(row) for row in rows]
+
+    def count(self) -> int:
+        conn = self._get_connection()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM knowledge_files').fetchone()[0]
+        finally:
+            conn.close()
+
+    def rebuild(self, chunk_metadatas: List[Dict[str, Any]],
+                sizes: Optional[Dict[str, int]] = None) -> int:
+        """从文本块元数据重建清单（用于升级前已存在的知识库，只执行一次）
+
+        Args:
+            chunk_metadatas: 向量库中全部文本块的元数据
+            sizes: {file_id: 原始文件大小}（可选）
+
+        Returns:
+            重建的文件数
+        """
+        files: Dict[str, Dict[str, Any]] = {}
+        for meta in chunk_metadatas:
+            file_id = (meta or {}).get('file_id')
+            if not file_id:
+                continue
+            entry = files.setdefault(file_id, {
+                'filename': meta.get('filename', 'unknown'),
+                'chunks': meta.get('total_chunks', 0),
+                'metadata': {k: v for k, v in meta.items()
+                             if k not in ('file_id', 'filename', 'chunk_index', 'total_chunks')},
+                'seen': 0,
+            })
+            entry['seen'] += 1
+
+        for file_id, entry in files.items():
+            self.add(file_id, entry['filename'], entry['chunks'] or entry['seen'],
+                     (sizes or {}).get(file_id, 0), metadata=entry['metadata'])
+        return len(files)
+
+    @staticmethod
+    def _row_to_dict(row) -> Dict[str, Any]:
+        file_id, filename, chunks, size, content_hash, metadata, created_at, status, ingested = row
+        try:
+            meta = json.loads(metadata) if metadata else {}
+        except (TypeError, ValueError):
+            meta = {}
+        return {
+            'file_id': file_id,
+            'filename': filename,
+            'chunks': chunks,
+            'size': size,
+            'content_hash': content_hash,
+            'created_at': created_at,
+            'metadata': meta,
+            'status': status,
+            'ingested_chunks': ingested,
+        }
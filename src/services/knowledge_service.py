@@ -2,24 +2,31 @@
 知识库服务 - 轻量级 RAG 实现
 
 不使用 LangChain，基于：
-- sentence-transformers: 文本向量化
+- Embedding 提供商: 文本向量化（sentence-transformers 或 ONNX Runtime int8，见 src/providers/embedding），
+  可选在独立子进程中运行
 - chromadb: 向量数据库
 - 自定义文本分块逻辑
+- 可选的交叉编码器重排（多召回候选，重排后按相关度阈值过滤）
 """
 import os
 import uuid
+import time
 import asyncio
-from typing import List, Dict, Any, Optional
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable, Iterator, Tuple
 from pathlib import Path
 import logging
 
-# 条件导入（如果未安装这些包，会给出友好提示）
-try:
-    from sentence_transformers import SentenceTransformer
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
+from src.services.embedding_cache import EmbeddingCache
+from src.services.knowledge_manifest import KnowledgeManifest
+from src.services.search_cache import SearchCache
+from src.services.text_chunker import iter_chunks, iter_file_pieces
+from src.services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from src.services.reranker import Reranker
+from src.providers.embedding import ProcessEmbeddingProvider, create_embedding_provider
 
+# 条件导入（如果未安装这些包，会给出友好提示）
 try:
     import chromadb
     from chromadb.config import Settings
@@ -31,20 +38,31 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+def _source_name(metadata: Dict[str, Any]) -> str:
+    """检索结果的来源名称（上传文件为文件名，笔记记录为笔记标题）"""
+    return metadata.get('filename') or metadata.get('title') or 'unknown'
+
+
 class KnowledgeService:
     """知识库服务
     
     功能：
-    - 上传文件（.md, .txt）
+    - 上传文件（.md, .txt），大文件流式导入（可断点续传）
     - 自动文本分块
     - 向量化存储
-    - 语义检索
+    - 语义检索 + 词法检索（FTS5），按倒数排名融合
+    - 可选交叉编码器重排，过滤弱相关的文本块
+    - 可选检索笔记记录（独立集合，由 RecordIndexer 后台增量索引）
     - 文件管理（列表/删除/获取）
     """
     
-    DEFAULT_CHUNK_SIZE = 500  # 默认分块大小（字符数）
-    DEFAULT_CHUNK_OVERLAP = 50  # 默认分块重叠（字符数）
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 最大文件大小：10MB
+    DEFAULT_CHUNK_SIZE = 200  # 默认分块大小（估算 token 数，不超过 Embedding 模型的最大序列长度）
+    DEFAULT_CHUNK_OVERLAP = 1  # 默认分块重叠（句子数）
+    MAX_FILE_SIZE = 10 * 1024 * 1024  # 最大文件大小：10MB（JSON 上传）
+    MAX_STREAM_FILE_SIZE = 200 * 1024 * 1024  # 流式上传最大文件大小：200MB
+    SUPPORTED_EXTENSIONS = ('.md', '.txt')
+    SEARCH_MODES = ('vector', 'lexical', 'hybrid')
+    HYBRID_CANDIDATES = 4  # 混合检索时每路召回 top_k 的倍数
     
     def __init__(
         self, 
@@ -52,7 +70,19 @@ class KnowledgeService:
         knowledge_relative_path: Path,
         embedding_model: str = "all-MiniLM-L6-v2",
         collection_name: str = "mindvoice_knowledge",
-        lazy_load: bool = True
+        lazy_load: bool = True,
+        embedding_cache: bool = True,
+        search_cache_size: int = 512,
+        search_result_ttl: float = 60.0,
+        embed_batch_size: int = 64,
+        search_mode: str = "hybrid",
+        rrf_k: int = 60,
+        embedding_backend: str = "sentence_transformers",
+        embedding_options: Optional[Dict[str, Any]] = None,
+        records_collection_name: str = "mindvoice_records",
+        include_records: bool = False,
+        embedding_worker: Optional[Dict[str, Any]] = None,
+        reranker: Optional[Dict[str, Any]] = None
     ):
         """初始化知识库服务
         
@@ -62,6 +92,19 @@ class KnowledgeService:
             embedding_model: Embedding模型名称
             collection_name: 向量数据库集合名称
             lazy_load: 是否延迟加载模型（默认True，启动时不加载模型）
+            embedding_cache: 是否缓存文本块向量（重复上传时只对新文本块计算向量）
+            search_cache_size: 查询向量缓存条数（0 表示不缓存检索）
+            search_result_ttl: 检索结果缓存有效期（秒，0 表示只缓存查询向量）
+            embed_batch_size: 导入时每批计算向量并写入向量库的文本块数
+            search_mode: 默认检索模式（vector / lexical / hybrid），可按请求覆盖
+            rrf_k: 倒数排名融合的平滑常数
+            embedding_backend: Embedding 后端（sentence_transformers / onnx）
+            embedding_options: 后端选项（如 onnx 的 quantize、threads、batch_size）
+            records_collection_name: 笔记记录向量集合名称（由 RecordIndexer 维护）
+            include_records: 检索时是否同时检索笔记记录集合
+            embedding_worker: 子进程选项（enabled 为 True 时模型加载和向量计算在独立进程中执行，
+                其余选项见 ProcessEmbeddingProvider）
+            reranker: 重排选项（enabled 为 True 时启用，其余选项见 Reranker；sentence-transformers 未安装时不启用）
         """
         self.data_dir = data_dir
         self.knowledge_relative_path = knowledge_relative_path
@@ -72,11 +115,17 @@ class KnowledgeService:
         self.embedding_model_name = embedding_model
         self.lazy_load = lazy_load
         
-        # 检查依赖
-        if not SENTENCE_TRANSFORMERS_AVAILABLE:
-            raise ImportError(
-                "sentence-transformers 未安装。请运行: pip install sentence-transformers"
-            )
+        # 检查依赖（Embedding 后端依赖未安装时抛出 ImportError）
+        options = dict(embedding_options or {})
+        if embedding_backend == 'onnx':
+            options.setdefault('quantized_dir', str(self.storage_path / "models" / embedding_model.replace('/', '_')))
+        self.embedding_provider = create_embedding_provider(embedding_backend, embedding_model, options)
+        worker_options = dict(embedding_worker or {})
+        if worker_options.pop('enabled', False):
+            # 向量计算不与 API 服务、ASR 回调争用 GIL；向量与进程内计算一致，缓存键不变
+            self.embedding_provider = ProcessEmbeddingProvider(self.embedding_provider, worker_options)
+        # 向量缓存 / 查询缓存中的模型标识（不同后端的向量不互相复用）
+        self.embedding_key = self.embedding_provider.cache_key
         
         if not CHROMADB_AVAILABLE:
             raise ImportError(
@@ -98,6 +147,58 @@ class KnowledgeService:
             metadata={"description": "MindVoice 知识库"}
         )
         
+        # 笔记记录集合（与上传文件分开存放，由后台索引任务增量维护）
+        self.records_collection_name = records_collection_name
+        self.include_records = include_records
+        self.records_collection = self.chroma_client.get_or_create_collection(
+            name=records_collection_name,
+            metadata={"description": "MindVoice 笔记记录"}
+        )
+        
+        # 文件清单（列出 / 删除文件时不扫描全部文本块）
+        self.manifest = KnowledgeManifest(self.storage_path / "manifest.db")
+        self._backfill_manifest()
+        
+        # 词法索引（FTS5，与向量库同步维护）
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError(f"不支持的检索模式: {search_mode}")
+        self.search_mode = search_mode
+        self.rrf_k = max(1, int(rrf_k))
+        self.lexical_index = LexicalIndex(self.storage_path / "lexical_index.db")
+        self._backfill_lexical_index()
+        
+        # 文本块向量缓存（按模型名 + 文本块哈希）
+        self.embedding_cache = (
+            EmbeddingCache(self.storage_path / "embedding_cache.db") if embedding_cache else None
+        )
+        
+        # 第二阶段重排（交叉编码器，延迟加载）
+        self.reranker = None
+        rerank_options = dict(reranker or {})
+        if rerank_options.get('enabled', False):
+            if Reranker.is_installed():
+                self.reranker = Reranker(
+                    model_name=rerank_options.get('model', Reranker.DEFAULT_MODEL),
+                    candidates=rerank_options.get('candidates', 4),
+                    min_candidates=rerank_options.get('min_candidates', 20),
+                    min_score=rerank_options.get('min_score', 0.3),
+                    batch_size=rerank_options.get('batch_size', 16),
+                    max_length=rerank_options.get('max_length', 512),
+                    cache_size=rerank_options.get('cache_size', 4096),
+                )
+            else:
+                logger.warning("[KnowledgeService] sentence-transformers 未安装，不启用检索重排")
+        
+        # 检索缓存（查询向量 LRU + 结果短 TTL，上传 / 删除时失效）
+        self.search_cache = (
+            SearchCache(max_queries=search_cache_size, result_ttl_seconds=search_result_ttl)
+            if search_cache_size > 0 else None
+        )
+        
+        # 导入流水线：分块 + 向量计算在专用线程中按批执行，写入向量库与下一批计算重叠
+        self.embed_batch_size = max(1, int(embed_batch_size))
+        self._embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="knowledge-embed")
+        
         # Embedding 模型（延迟加载）
         self.embedding_model = None
         self._model_loading = False
@@ -111,46 +212,48 @@ class KnowledgeService:
         else:
             logger.info(f"[KnowledgeService] 初始化完成（延迟加载模式），集合: {collection_name}")
     
+    def _backfill_manifest(self):
+        """升级前已有文本块但清单为空时，从向量库重建一次清单"""
+        if self.manifest.count() > 0 or self.collection.count() == 0:
+            return
+        
+        all_data = self.collection.get(include=['metadatas'])
+        sizes = {}
+        files_dir = self.storage_path / "files"
+        if files_dir.exists():
+            for file_path in files_dir.iterdir():
+                sizes[file_path.name.split('_', 1)[0]] = file_path.stat().st_size
+        rebuilt = self.manifest.rebuild(all_data['metadatas'], sizes)
+        logger.info(f"[KnowledgeService] 已从向量库重建文件清单，共 {rebuilt} 个文件")
+    
+    def _backfill_lexical_index(self, page_size: int = 1000):
+        """升级前已有文本块但词法索引为空时，分页从向量库重建一次"""
+        total = self.collection.count()
+        if total == 0 or self.lexical_index.count() > 0:
+            return
+        
+        for offset in range(0, total, page_size):
+            page = self.collection.get(include=['documents', 'metadatas'], limit=page_size, offset=offset)
+            self.lexical_index.add(
+                (chunk_id, (meta or {}).get('file_id', ''), document or '')
+                for chunk_id, document, meta in zip(page['ids'], page['documents'], page['metadatas'])
+            )
+        logger.info(f"[KnowledgeService] 已从向量库重建词法索引，共 {total} 个文本块")
+    
     def _load_model(self):
         """加载 Embedding 模型（同步方法）"""
         if self.embedding_model is not None:
             return
         
-        logger.info(f"[KnowledgeService] 开始加载 Embedding 模型: {self.embedding_model_name}")
-        
-        # 禁用进度条（避免在后台线程中访问 stderr 失败）
-        import os
-        import sys
-        
-        # 设置环境变量禁用进度条
-        os.environ['TRANSFORMERS_VERBOSITY'] = 'error'
-        os.environ['HF_HUB_DISABLE_PROGRESS_BARS'] = '1'
-        
-        # 配置 HuggingFace 镜像源（如果未设置）
-        # 使用国内镜像加速下载
-        if not os.getenv('HF_ENDPOINT'):
-            os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
-            logger.info("[KnowledgeService] 已设置 HuggingFace 镜像源: https://hf-mirror.com")
-        
-        # 如果设置了代理，也配置给 huggingface_hub
-        if os.getenv('HTTP_PROXY') or os.getenv('HTTPS_PROXY'):
-            logger.debug(f"[KnowledgeService] 检测到代理设置: HTTP_PROXY={os.getenv('HTTP_PROXY')}, HTTPS_PROXY={os.getenv('HTTPS_PROXY')}")
-        
-        # 临时重定向 stderr 到 devnull（避免 tqdm 访问失败）
-        original_stderr = sys.stderr
+        logger.info(f"[KnowledgeService] 开始加载 Embedding 模型: {self.embedding_model_name} "
+                    f"(后端: {self.embedding_provider.name})")
         try:
-            # 在 Windows 上，使用 devnull 重定向 stderr
-            import io
-            sys.stderr = io.StringIO()
-            
-            self.embedding_model = SentenceTransformer(self.embedding_model_name)
+            self.embedding_provider.load()
+            self.embedding_model = self.embedding_provider
             logger.info(f"[KnowledgeService] Embedding 模型加载完成")
         except Exception as e:
             logger.error(f"[KnowledgeService] Embedding 模型加载失败: {e}", exc_info=True)
             raise
-        finally:
-            # 恢复 stderr
-            sys.stderr = original_stderr
     
     async def _load_model_async(self):
         """异步加载 Embedding 模型"""
@@ -192,60 +295,55 @@ class KnowledgeService:
     ) -> List[str]:
         """将文本分块
         
-        简单的字符级分块策略，优先在句子边界分割
+        与流式导入使用同一分块规则（text_chunker.iter_chunks）：一次扫描切出句子，按 token 数贪心打包，
+        Markdown 标题开始新块
         
         Args:
             text: 原始文本
-            chunk_size: 块大小
-            chunk_overlap: 重叠大小
+            chunk_size: 块大小（估算 token 数）
+            chunk_overlap: 重叠句子数
             
         Returns:
             文本块列表
         """
-        if len(text) <= chunk_size:
-            return [text]
-        
-        # 确保 chunk_overlap < chunk_size，避免无限循环
-        if chunk_overlap >= chunk_size:
-            chunk_overlap = chunk_size // 4
-        
-        chunks = []
-        start = 0
-        max_iterations = len(text) // max(1, chunk_size - chunk_overlap) + 100  # 安全上限
-        iteration_count = 0
-        
-        while start < len(text):
-            iteration_count += 1
-            if iteration_count > max_iterations:
-                logger.error(f"[KnowledgeService] 分块迭代次数超过上限 ({max_iterations})，可能存在无限循环")
-                raise RuntimeError(f"文本分块失败：迭代次数超过上限，可能存在无限循环")
-            
-            end = start + chunk_size
-            
-            # 如果不是最后一块，尝试在句子边界分割
-            if end < len(text):
-                # 查找最近的句子结束符
-                for sep in ['。', '！', '？', '\n\n', '. ', '! ', '? ']:
-                    last_sep = text.rfind(sep, start, end)
-                    if last_sep != -1:
-                        end = last_sep + len(sep)
-                        break
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            # 下一块的起始位置（考虑重叠）
-            next_start = end - chunk_overlap if end < len(text) else end
-            
-            # 防止无限循环：确保 start 必须前进
-            if next_start <= start:
-                logger.warning(f"[KnowledgeService] 检测到 start 未前进 (start={start}, next_start={next_start})，强制前进")
-                next_start = start + max(1, chunk_size - chunk_overlap)
-            
-            start = next_start
+        return list(iter_chunks([text], chunk_size, chunk_overlap))
+    
+    def _encode_chunks(self, chunks: List[str]):
+        """计算文本块向量（同步方法，在线程池中执行）
+        
+        启用缓存时只对未缓存的文本块调用模型。
         
-        return chunks
+        Returns:
+            (向量列表, 复用缓存的文本块数)
+        """
+        if self.embedding_cache is None:
+            return self.embedding_model.encode(chunks).tolist(), 0
+        return self.embedding_cache.encode(self.embedding_key, chunks, self.embedding_model.encode)
+    
+    def _new_file_path(self, filename: str) -> Tuple[str, Path]:
+        """校验文件类型并生成文件ID与保存路径"""
+        file_ext = Path(filename).suffix.lower()
+        if file_ext not in self.SUPPORTED_EXTENSIONS:
+            raise ValueError(f"不支持的文件类型: {file_ext}，仅支持 .md 和 .txt")
+        
+        file_id = str(uuid.uuid4())
+        file_path = self.storage_path / "files" / f"{file_id}_{filename}"
+        file_path.parent.mkdir(exist_ok=True)
+        return file_id, file_path
+    
+    def _find_file(self, file_id: str) -> Optional[Path]:
+        files_dir = self.storage_path / "files"
+        return next(files_dir.glob(f"{file_id}_*"), None) if files_dir.exists() else None
+    
+    def _remove_file_data(self, file_id: str):
+        """删除文件的全部文本块、清单条目与原始文件"""
+        self.collection.delete(where={'file_id': file_id})
+        self.lexical_index.delete_file(file_id)
+        self.manifest.remove(file_id)
+        self._invalidate_search_cache()
+        files_dir = self.storage_path / "files"
+        for file_path in files_dir.glob(f"{file_id}_*"):
+            file_path.unlink()
     
     async def upload_file(
         self, 
@@ -263,145 +361,356 @@ class KnowledgeService:
         Returns:
             上传结果信息
         """
+        # 检查文件大小（防止 MemoryError，更大的文件使用 save_upload_stream + ingest_file）
+        content_size = len(content.encode('utf-8'))
+        if content_size > self.MAX_FILE_SIZE:
+            error_msg = f"文件大小超过限制：{content_size / 1024 / 1024:.2f}MB > {self.MAX_FILE_SIZE / 1024 / 1024}MB"
+            logger.error(f"[KnowledgeService] {error_msg}")
+            raise ValueError(error_msg)
+        
+        logger.info(f"[KnowledgeService] 开始上传文件: {filename} (大小: {content_size / 1024:.2f}KB)")
+        
+        file_id, file_path = self._new_file_path(filename)
+        
+        # 保存原始文件（不转换换行符，导入时按原样读取）
         try:
-            # 检查文件大小（防止 MemoryError）
-            content_size = len(content.encode('utf-8'))
-            if content_size > self.MAX_FILE_SIZE:
-                error_msg = f"文件大小超过限制：{content_size / 1024 / 1024:.2f}MB > {self.MAX_FILE_SIZE / 1024 / 1024}MB"
-                logger.error(f"[KnowledgeService] {error_msg}")
-                raise ValueError(error_msg)
-            
-            logger.info(f"[KnowledgeService] 开始上传文件: {filename} (大小: {content_size / 1024:.2f}KB)")
-            
-            # 确保模型已加载
-            await self.ensure_model_loaded()
-            
-            # 验证文件类型
-            file_ext = Path(filename).suffix.lower()
-            if file_ext not in ['.md', '.txt']:
-                raise ValueError(f"不支持的文件类型: {file_ext}，仅支持 .md 和 .txt")
-            
-            # 生成文件ID
-            file_id = str(uuid.uuid4())
-            
-            # 保存原始文件
-            file_path = self.storage_path / "files" / f"{file_id}_{filename}"
-            file_path.parent.mkdir(exist_ok=True)
-            
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                logger.debug(f"[KnowledgeService] 文件已保存到: {file_path}")
-            except Exception as e:
-                logger.error(f"[KnowledgeService] 保存文件失败: {e}", exc_info=True)
-                raise
-            
-            # 文本分块
-            try:
-                chunks = self._chunk_text(content)
-                logger.info(f"[KnowledgeService] 文件 {filename} 分成 {len(chunks)} 块")
-            except Exception as e:
-                logger.error(f"[KnowledgeService] 文本分块失败: {e}", exc_info=True)
-                raise
-            
-            # 生成向量（在线程池中执行，避免阻塞）
-            try:
-                loop = asyncio.get_event_loop()
-                embeddings = await loop.run_in_executor(
-                    None,
-                    lambda: self.embedding_model.encode(chunks, show_progress_bar=False).tolist()
-                )
-                logger.debug(f"[KnowledgeService] 向量生成完成，共 {len(embeddings)} 个向量")
-            except MemoryError as e:
-                error_msg = f"内存不足，无法处理文件 {filename}（大小: {content_size / 1024 / 1024:.2f}MB）"
-                logger.error(f"[KnowledgeService] {error_msg}: {e}", exc_info=True)
-                # 清理已保存的文件
-                if file_path.exists():
-                    file_path.unlink()
-                raise MemoryError(error_msg) from e
-            except Exception as e:
-                logger.error(f"[KnowledgeService] 向量生成失败: {e}", exc_info=True)
-                raise
+            with open(file_path, 'w', encoding='utf-8', newline='') as f:
+                f.write(content)
+            logger.debug(f"[KnowledgeService] 文件已保存到: {file_path}")
+        except Exception as e:
+            logger.error(f"[KnowledgeService] 保存文件失败: {e}", exc_info=True)
+            raise
+        
+        self.manifest.add(file_id, filename, 0, content_size, metadata=metadata, status='ingesting')
+        
+        result = None
+        try:
+            async for event in self.ingest_file(file_id):
+                if event['event'] == 'done':
+                    result = event
+        except Exception as e:
+            logger.error(f"[KnowledgeService] 上传文件失败: {filename}, 错误: {e}", exc_info=True)
+            # 一次性上传不保留半成品
+            self._remove_file_data(file_id)
+            raise
+        
+        logger.info(f"[KnowledgeService] 文件 {filename} 上传成功，ID: {file_id}")
+        
+        return {
+            'file_id': file_id,
+            'filename': filename,
+            'chunks': result['chunks'],
+            'size': len(content),
+            'path': str(file_path),
+            'cached_chunks': result['cached_chunks']
+        }
+    
+    async def save_upload_stream(
+        self,
+        filename: str,
+        read: Callable[[int], Awaitable[bytes]],
+        metadata: Optional[Dict[str, Any]] = None,
+        read_size: int = 1024 * 1024
+    ) -> str:
+        """流式保存上传的文件（不把整个文件读入内存），登记为待导入
+        
+        Args:
+            filename: 文件名
+            read: 异步读取函数（如 UploadFile.read），返回空字节表示结束
+            metadata: 元数据（可选）
+            read_size: 每次读取的字节数
             
-            # 准备数据
-            chunk_ids = [f"{file_id}_chunk_{i}" for i in range(len(chunks))]
-            chunk_metadata = [
+        Returns:
+            文件ID（随后调用 ingest_file 导入）
+        """
+        file_id, file_path = self._new_file_path(filename)
+        size = 0
+        try:
+            with open(file_path, 'wb') as f:
+                while True:
+                    data = await read(read_size)
+                    if not data:
+                        break
+                    size += len(data)
+                    if size > self.MAX_STREAM_FILE_SIZE:
+                        raise ValueError(
+                            f"文件大小超过限制：> {self.MAX_STREAM_FILE_SIZE / 1024 / 1024:.0f}MB"
+                        )
+                    await asyncio.to_thread(f.write, data)
+        except Exception:
+            if file_path.exists():
+                file_path.unlink()
+            raise
+        
+        self.manifest.add(file_id, filename, 0, size, metadata=metadata, status='ingesting')
+        logger.info(f"[KnowledgeService] 文件已保存，等待导入: {filename} (ID: {file_id}, 大小: {size / 1024:.2f}KB)")
+        return file_id
+    
+    def _next_batch(self, chunk_iter: Iterator[Tuple[int, str]], skip: int):
+        """取下一批文本块并计算向量（在专用线程中执行，分块生成器只由该线程推进）
+        
+        Returns:
+            (文本块序号列表, 文本块列表, 向量列表, 复用缓存数)，没有更多文本块时返回 None
+        """
+        indices, texts = [], []
+        for index, text in chunk_iter:
+            if index < skip:
+                continue
+            indices.append(index)
+            texts.append(text)
+            if len(texts) >= self.embed_batch_size:
+                break
+        if not texts:
+            return None
+        embeddings, cached_count = self._encode_chunks(texts)
+        return indices, texts, embeddings, cached_count
+    
+    def _write_batch(self, entry: Dict[str, Any], indices: List[int], texts: List[str],
+                     embeddings: List[List[float]]) -> int:
+        """写入一批文本块（upsert，断点续传时重复写入同一批也不会产生重复数据）
+        
+        Returns:
+            已写入的文本块数（最大序号 + 1）
+        """
+        file_id = entry['file_id']
+        self.collection.upsert(
+            ids=[f"{file_id}_chunk_{i}" for i in indices],
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=[
                 {
                     'file_id': file_id,
-                    'filename': filename,
+                    'filename': entry['filename'],
                     'chunk_index': i,
-                    'total_chunks': len(chunks),
-                    **(metadata or {})
+                    **(entry['metadata'] or {})
                 }
-                for i in range(len(chunks))
+                for i in indices
             ]
+        )
+        self.lexical_index.add(
+            (f"{file_id}_chunk_{i}", file_id, text) for i, text in zip(indices, texts)
+        )
+        return indices[-1] + 1
+    
+    async def ingest_file(self, file_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """导入已保存的文件（流式分块 → 按批计算向量 → 增量写入向量库）
+        
+        内存占用与文件大小无关：同时只保留分块窗口、正在计算的一批和正在写入的一批。
+        每批写入后记录进度，中断或失败后再次调用会从已写入的文本块之后继续。
+        
+        Args:
+            file_id: 文件ID（upload_file / save_upload_stream 登记的文件）
             
-            # 存储到向量数据库
-            try:
-                self.collection.add(
-                    ids=chunk_ids,
-                    embeddings=embeddings,
-                    documents=chunks,
-                    metadatas=chunk_metadata
+        Yields:
+            进度事件：
+            - {'event': 'started', 'file_id', 'filename', 'resume_from', 'total_bytes'}
+            - {'event': 'progress', 'file_id', 'chunks', 'cached_chunks', 'bytes_read', 'total_bytes'}
+            - {'event': 'done', 'file_id', 'filename', 'chunks', 'cached_chunks', 'size'}
+        """
+        entry = self.manifest.get(file_id)
+        file_path = self._find_file(file_id)
+        if entry is None or file_path is None:
+            raise ValueError(f"文件不存在: {file_id}")
+        
+        if entry['status'] == 'ready':
+            yield {'event': 'done', 'file_id': file_id, 'filename': entry['filename'],
+                   'chunks': entry['chunks'], 'cached_chunks': 0, 'size': entry['size']}
+            return
+        
+        await self.ensure_model_loaded()
+        
+        skip = entry['ingested_chunks']
+        total_bytes = file_path.stat().st_size
+        hasher = hashlib.sha256()
+        progress = {'bytes_read': 0}
+        
+        def on_read(piece: str):
+            data = piece.encode('utf-8')
+            hasher.update(data)
+            progress['bytes_read'] += len(data)
+        
+        pieces = iter_file_pieces(file_path, on_read=on_read)
+        chunk_iter = enumerate(iter_chunks(pieces, self.DEFAULT_CHUNK_SIZE, self.DEFAULT_CHUNK_OVERLAP))
+        
+        logger.info(f"[KnowledgeService] 开始导入文件: {entry['filename']} (ID: {file_id}, 从第 {skip} 块继续)")
+        yield {'event': 'started', 'file_id': file_id, 'filename': entry['filename'],
+               'resume_from': skip, 'total_bytes': total_bytes}
+        
+        loop = asyncio.get_event_loop()
+        written = skip
+        cached_total = 0
+        write_task = None
+        try:
+            while True:
+                batch = await loop.run_in_executor(self._embed_executor, self._next_batch, chunk_iter, skip)
+                if write_task is not None:
+                    written = await write_task
+                    write_task = None
+                    self.manifest.update_progress(file_id, written)
+                    self._invalidate_search_cache()
+                    yield {'event': 'progress', 'file_id': file_id, 'chunks': written,
+                           'cached_chunks': cached_total, 'bytes_read': progress['bytes_read'],
+                           'total_bytes': total_bytes}
+                if batch is None:
+                    break
+                indices, texts, embeddings, cached_count = batch
+                cached_total += cached_count
+                write_task = asyncio.ensure_future(
+                    asyncio.to_thread(self._write_batch, entry, indices, texts, embeddings)
                 )
-                logger.debug(f"[KnowledgeService] 数据已存储到向量数据库")
-            except Exception as e:
-                logger.error(f"[KnowledgeService] 存储到向量数据库失败: {e}", exc_info=True)
-                # 清理已保存的文件
-                if file_path.exists():
-                    file_path.unlink()
-                raise
-            
-            logger.info(f"[KnowledgeService] 文件 {filename} 上传成功，ID: {file_id}")
-            
-            return {
-                'file_id': file_id,
-                'filename': filename,
-                'chunks': len(chunks),
-                'size': len(content),
-                'path': str(file_path)
-            }
-        except ValueError as e:
-            # 重新抛出 ValueError（如文件大小超限、文件类型不支持）
-            raise
-        except MemoryError as e:
-            # 重新抛出 MemoryError
-            raise
-        except Exception as e:
-            # 其他异常，记录详细日志并重新抛出
-            logger.error(f"[KnowledgeService] 上传文件失败: {filename}, 错误: {e}", exc_info=True)
+        except BaseException as e:
+            if write_task is not None:
+                try:
+                    written = await write_task
+                except Exception:
+                    pass
+            self.manifest.update_progress(file_id, written, status='failed')
+            if isinstance(e, Exception):
+                logger.error(f"[KnowledgeService] 导入文件失败: {entry['filename']}，已写入 {written} 块: {e}")
             raise
+        
+        self.manifest.update_progress(file_id, written, status='ready', content_hash=hasher.hexdigest())
+        self._invalidate_search_cache()
+        logger.info(f"[KnowledgeService] 文件 {entry['filename']} 导入完成，共 {written} 块（复用缓存 {cached_total} 块）")
+        yield {'event': 'done', 'file_id': file_id, 'filename': entry['filename'],
+               'chunks': written, 'cached_chunks': cached_total, 'size': total_bytes}
     
     async def search(
         self, 
         query: str, 
         top_k: int = 3,
-        filter_metadata: Optional[Dict[str, Any]] = None
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        rerank: Optional[bool] = None
     ) -> List[Dict[str, Any]]:
-        """语义搜索知识库
+        """搜索知识库
+        
+        - vector: 语义检索（Embedding 向量）
+        - lexical: 词法检索（FTS5 BM25，适合中文与型号等精确词）
+        - hybrid: 两路并发检索，各召回 top_k * HYBRID_CANDIDATES 个，按倒数排名融合
+        
+        启用重排时先召回 Reranker.fetch_size(top_k) 个候选，交叉编码器打分后返回不超过 top_k 个
+        高于阈值的结果（可能少于 top_k 或为空）；重排失败时退回第一阶段结果。
         
         Args:
             query: 查询文本
             top_k: 返回前K个结果
-            filter_metadata: 过滤条件（可选）
+            filter_metadata: 过滤条件（可选；词法检索只支持字段相等条件）
+            mode: 检索模式（默认使用配置 knowledge.search_mode）
+            rerank: 是否重排（默认启用了重排器即重排）
             
         Returns:
-            搜索结果列表
+            搜索结果列表（hybrid 模式下 score 为归一化的融合分数，并附带 vector_rank / lexical_rank；
+            重排后 score 为 0~1 的相关度，原分数保存在 retrieval_score）
         """
+        reranker = self.reranker if rerank is not False else None
+        if reranker is None:
+            return await self._retrieve(query, top_k, filter_metadata, mode)
+        
+        candidates = await self._retrieve(query, reranker.fetch_size(top_k), filter_metadata, mode)
+        try:
+            results = await asyncio.to_thread(reranker.rerank, query, candidates, top_k)
+        except Exception as e:
+            logger.warning(f"[KnowledgeService] 重排失败，返回第一阶段结果: {e}")
+            return candidates[:top_k]
+        logger.info(f"[KnowledgeService] 重排完成，{len(candidates)} 个候选保留 {len(results)} 个")
+        return results
+    
+    async def _retrieve(
+        self,
+        query: str,
+        top_k: int,
+        filter_metadata: Optional[Dict[str, Any]],
+        mode: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """第一阶段检索（检索结果缓存以召回数为键，重排分数另行缓存）"""
+        mode = mode or self.search_mode
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"不支持的检索模式: {mode}")
+        if mode != 'vector' and not self._lexical_filter_supported(filter_metadata):
+            if mode == 'lexical':
+                raise ValueError("词法检索只支持字段相等的过滤条件")
+            mode = 'vector'
+        
+        candidates = top_k if mode == 'vector' else max(top_k * self.HYBRID_CANDIDATES, 10)
+        # 检索开始前的语料代数：检索期间语料变化时不缓存本次结果
+        cache = self.search_cache
+        generation = cache.generation if cache else None
+        lexical_task = None
+        if mode != 'vector':
+            # 词法检索与查询向量计算并发执行
+            lexical_task = asyncio.ensure_future(
+                asyncio.to_thread(self._lexical_search, query, candidates, filter_metadata)
+            )
+            if mode == 'lexical':
+                results = (await lexical_task)[:top_k]
+                logger.info(f"[KnowledgeService] 词法检索完成，返回 {len(results)} 个结果")
+                return results
+        
+        try:
+            embedding = await self._embed_query(query)
+            
+            if cache:
+                cached_results = cache.get_results(embedding, top_k, filter_metadata, mode)
+                if cached_results is not None:
+                    logger.debug(f"[KnowledgeService] 检索结果命中缓存，返回 {len(cached_results)} 个结果")
+                    return cached_results
+            
+            start = time.perf_counter()
+            results = await asyncio.to_thread(self._vector_search, embedding, candidates, filter_metadata)
+            if lexical_task is not None:
+                results = self._fuse(results, await lexical_task, top_k)
+            query_ms = (time.perf_counter() - start) * 1000
+        finally:
+            if lexical_task is not None and not lexical_task.done():
+                lexical_task.cancel()
+        
+        if cache:
+            cache.put_results(embedding, top_k, filter_metadata, results, query_ms, mode, generation=generation)
+        
+        logger.info(f"[KnowledgeService] 搜索完成（{mode}），返回 {len(results)} 个结果")
+        return results
+    
+    async def _embed_query(self, query: str) -> List[float]:
+        """计算查询向量（按规范化后的查询文本缓存）"""
+        cache = self.search_cache
+        embedding = cache.get_embedding(self.embedding_key, query) if cache else None
+        if embedding is not None:
+            return embedding
+        
         # 确保模型已加载
         await self.ensure_model_loaded()
         
         # 生成查询向量（在线程池中执行，避免阻塞）
+        start = time.perf_counter()
         loop = asyncio.get_event_loop()
-        query_embedding = await loop.run_in_executor(
+        embedding = await loop.run_in_executor(
             None,
-            lambda: self.embedding_model.encode([query], show_progress_bar=False).tolist()
+            lambda: self.embedding_model.encode([query]).tolist()[0]
         )
+        if cache:
+            cache.put_embedding(self.embedding_key, query, embedding,
+                                (time.perf_counter() - start) * 1000)
+        return embedding
+    
+    def _vector_search(self, embedding: List[float], n_results: int,
+                       filter_metadata: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """查询向量数据库（同步方法）
         
-        # 查询向量数据库
-        results = self.collection.query(
-            query_embeddings=query_embedding,
-            n_results=top_k,
+        启用 include_records 且没有过滤条件时（过滤字段针对上传文件），同时查询笔记记录集合，按相似度合并。
+        """
+        results = self._query_collection(self.collection, embedding, n_results, filter_metadata)
+        if self.include_records and not filter_metadata and self.records_collection.count() > 0:
+            records = self._query_collection(self.records_collection, embedding, n_results, None)
+            results = sorted(results + records, key=lambda r: r['score'], reverse=True)[:n_results]
+        return results
+    
+    @staticmethod
+    def _query_collection(collection, embedding: List[float], n_results: int,
+                          filter_metadata: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        results = collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
             where=filter_metadata
         )
         
@@ -414,12 +723,80 @@ class KnowledgeService:
                     'content': results['documents'][0][i],
                     'metadata': results['metadatas'][0][i],
                     'score': 1 - results['distances'][0][i],  # 转换为相似度分数
-                    'source': results['metadatas'][0][i].get('filename', 'unknown')
+                    'source': _source_name(results['metadatas'][0][i])
                 })
-        
-        logger.info(f"[KnowledgeService] 搜索完成，返回 {len(formatted_results)} 个结果")
         return formatted_results
     
+    @staticmethod
+    def _lexical_filter_supported(filter_metadata: Optional[Dict[str, Any]]) -> bool:
+        """词法检索只支持 {字段: 值} 形式的相等条件（不支持 $and / $in 等运算符）"""
+        return not filter_metadata or all(
+            not key.startswith('$') and not isinstance(value, dict)
+            for key, value in filter_metadata.items()
+        )
+    
+    def _lexical_search(self, query: str, n_results: int,
+                        filter_metadata: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """词法检索（同步方法），按 BM25 排序，文本与元数据从向量库按 ID 读取
+        
+        score 为相对最佳命中的 BM25 分数（0~1，最佳命中为 1），与语义检索、融合分数同一量纲；原始分数保存在 bm25。
+        """
+        # 有过滤条件时多取一些，过滤后再截断
+        hits = self.lexical_index.search(query, limit=n_results * (4 if filter_metadata else 1))
+        if not hits:
+            return []
+        
+        data = self.collection.get(ids=[chunk_id for chunk_id, _ in hits], include=['documents', 'metadatas'])
+        rows = {
+            chunk_id: (document, meta or {})
+            for chunk_id, document, meta in zip(data['ids'], data['documents'], data['metadatas'])
+        }
+        
+        best = hits[0][1]
+        results = []
+        for rank, (chunk_id, score) in enumerate(hits, 1):
+            if chunk_id not in rows:
+                continue
+            document, meta = rows[chunk_id]
+            if filter_metadata and any(meta.get(k) != v for k, v in filter_metadata.items()):
+                continue
+            results.append({
+                'id': chunk_id,
+                'content': document,
+                'metadata': meta,
+                'score': round(score / best, 4) if best > 0 else round(1.0 / rank, 4),
+                'bm25': score,
+                'source': _source_name(meta)
+            })
+            if len(results) >= n_results:
+                break
+        return results
+    
+    def _fuse(self, vector_results: List[Dict[str, Any]], lexical_results: List[Dict[str, Any]],
+              top_k: int) -> List[Dict[str, Any]]:
+        """倒数排名融合两路结果"""
+        by_id: Dict[str, Dict[str, Any]] = {}
+        ranks: Dict[str, Dict[str, int]] = {}
+        for key, results in (('vector_rank', vector_results), ('lexical_rank', lexical_results)):
+            for rank, result in enumerate(results, 1):
+                by_id.setdefault(result['id'], result)
+                ranks.setdefault(result['id'], {})[key] = rank
+        
+        fused = reciprocal_rank_fusion(
+            [[r['id'] for r in vector_results], [r['id'] for r in lexical_results]], k=self.rrf_k
+        )
+        # 两路都排第一时融合分数最高，以此归一化到 0~1
+        best = 2.0 / (self.rrf_k + 1)
+        merged = []
+        for chunk_id, fused_score in fused[:top_k]:
+            merged.append({
+                **by_id[chunk_id],
+                'score': round(fused_score / best, 4),
+                'vector_rank': ranks[chunk_id].get('vector_rank'),
+                'lexical_rank': ranks[chunk_id].get('lexical_rank'),
+            })
+        return merged
+    
     async def delete_file(self, file_id: str) -> bool:
         """删除文件及其所有文本块
         
@@ -430,22 +807,11 @@ class KnowledgeService:
             是否删除成功
         """
         try:
-            # 删除向量数据库中的所有块
-            # 先查询该文件的所有块
-            all_data = self.collection.get()
-            chunk_ids_to_delete = [
-                id for id, meta in zip(all_data['ids'], all_data['metadatas'])
-                if meta.get('file_id') == file_id
-            ]
-            
-            if chunk_ids_to_delete:
-                self.collection.delete(ids=chunk_ids_to_delete)
-                logger.info(f"[KnowledgeService] 删除文件 {file_id}，共 {len(chunk_ids_to_delete)} 个块")
-            
-            # 删除原始文件（如果存在）
-            files_dir = self.storage_path / "files"
-            for file_path in files_dir.glob(f"{file_id}_*"):
-                file_path.unlink()
+            # 按元数据过滤删除，不需要先取出全部文本块
+            entry = self.manifest.get(file_id)
+            self._remove_file_data(file_id)
+            if entry:
+                logger.info(f"[KnowledgeService] 删除文件 {file_id}，共 {entry['ingested_chunks'] or entry['chunks']} 个块")
             
             return True
             
@@ -454,27 +820,12 @@ class KnowledgeService:
             return False
     
     async def list_files(self) -> List[Dict[str, Any]]:
-        """列出所有文件
+        """列出所有文件（读取文件清单）
         
         Returns:
             文件列表
         """
-        all_data = self.collection.get()
-        
-        # 按 file_id 分组
-        files_dict = {}
-        for meta in all_data['metadatas']:
-            file_id = meta.get('file_id')
-            if file_id and file_id not in files_dict:
-                files_dict[file_id] = {
-                    'file_id': file_id,
-                    'filename': meta.get('filename', 'unknown'),
-                    'chunks': meta.get('total_chunks', 0),
-                    'metadata': {k: v for k, v in meta.items() 
-                               if k not in ['file_id', 'filename', 'chunk_index', 'total_chunks']}
-                }
-        
-        files_list = list(files_dict.values())
+        files_list = self.manifest.list()
         logger.info(f"[KnowledgeService] 共有 {len(files_list)} 个文件")
         return files_list
     
@@ -494,6 +845,38 @@ class KnowledgeService:
         
         return None
     
+    def reset_records_collection(self):
+        """清空笔记记录集合（Embedding 模型变化后由索引任务调用，重新建立索引）"""
+        self.chroma_client.delete_collection(self.records_collection_name)
+        self.records_collection = self.chroma_client.get_or_create_collection(
+            name=self.records_collection_name,
+            metadata={"description": "MindVoice 笔记记录"}
+        )
+        self._invalidate_search_cache()
+    
+    def _invalidate_search_cache(self):
+        """语料变化后使检索结果缓存失效"""
+        if self.search_cache:
+            self.search_cache.invalidate()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """知识库统计（集合大小、向量缓存与检索缓存命中率）"""
+        return {
+            'files': self.manifest.count(),
+            'chunks': self.collection.count(),
+            'lexical_chunks': self.lexical_index.count(),
+            'record_chunks': self.records_collection.count(),
+            'search_mode': self.search_mode,
+            'embedding_model': self.embedding_model_name,
+            'embedding_backend': self.embedding_provider.name,
+            'model_loaded': self.embedding_model is not None,
+            'embedding_worker': (self.embedding_provider.get_stats()
+                                 if isinstance(self.embedding_provider, ProcessEmbeddingProvider) else None),
+            'embedding_cache': self.embedding_cache.get_stats() if self.embedding_cache else None,
+            'search_cache': self.search_cache.get_stats() if self.search_cache else None,
+            'reranker': self.reranker.get_stats() if self.reranker else None,
+        }
+    
     def is_available(self) -> bool:
         """检查服务是否可用
         
@@ -502,10 +885,15 @@ class KnowledgeService:
         """
         # 在延迟加载模式下，只要依赖安装且集合初始化，就认为服务可用
         # 模型会在 upload_file/search 时通过 ensure_model_loaded() 自动加载
-        return (SENTENCE_TRANSFORMERS_AVAILABLE and 
+        return (self.embedding_provider.is_installed() and 
                 CHROMADB_AVAILABLE and 
                 self.collection is not None)
     
+    def cleanup(self):
+        """释放导入流水线线程和 Embedding 工作进程"""
+        self._embed_executor.shutdown(wait=False, cancel_futures=True)
+        self.embedding_provider.close()
+    
     def start_background_load(self):
         """在后台开始加载模型（非阻塞）
         
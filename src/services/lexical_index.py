@@ -0,0 +1,180 @@
+"""
+知识库词法索引（SQLite FTS5）
+
+与向量检索互补：英文 Embedding 模型对中文和产品型号等精确词效果较差，词法索引按词项匹配。
+- 分词：中日韩字符按单字 + 相邻二字切分（无需词典），英文 / 数字按词切分，
+  带连字符的型号（如 MV-2048X）同时保留整体和各部分
+- 预分词后的词项以空格拼接写入 FTS5（unicode61），按 BM25 排序
+- 与向量检索结果按倒数排名融合（Reciprocal Rank Fusion）
+"""
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from src.core.logger import get_logger
+
+logger = get_logger("LexicalIndex")
+
+_CJK_RUN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]+')
+_WORD = re.compile(r'[0-9a-z]+(?:[-_.][0-9a-z]+)*')
+_WORD_PART = re.compile(r'[0-9a-z]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """将文本切分为词项（保持出现顺序，可能重复）"""
+    text = text.lower()
+    tokens: List[str] = []
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    for word in _WORD.findall(_CJK_RUN.sub(' ', text)):
+        tokens.append(word)
+        parts = _WORD_PART.findall(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def build_match_query(query: str) -> str:
+    """构造 FTS5 查询：查询词项的 OR 组合（每个词项加引号，避免被解析为语法）
+
+    中文查询只使用二字词项（单字匹配面太宽），查询只有一个汉字时使用单字。
+    """
+    terms: List[str] = []
+    for token in tokenize(query):
+        is_cjk_char = len(token) == 1 and _CJK_RUN.match(token)
+        if token not in terms and not is_cjk_char:
+            terms.append(token)
+    if not terms:
+        terms = list(dict.fromkeys(tokenize(query)))
+    return ' OR '.join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """倒数排名融合
+
+    Args:
+        rankings: 多个按相关度排序的 ID 列表
+        k: 平滑常数（越大越弱化头部名次的优势）
+
+    Returns:
+        [(id, 融合分数)]，按分数降序
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, 1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """文本块词法索引"""
+
+    def __init__(self, db_path: Path):
+        """
+        Args:
+            db_path: 索引数据库路径
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _get_connection(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_db(self):
+        conn = self._get_connection()
+        try:
+            # chunks 记录文本块 ID 与 FTS 行号的对应关系，按 ID / 文件删除时走索引而不是扫描全文表
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS chunks (
+                    row_id INTEGER PRIMARY KEY,
+                    chunk_id TEXT NOT NULL UNIQUE,
+                    file_id TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file_id)')
+            conn.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5(
+                    terms,
+                    tokenize = "unicode61 tokenchars '-_.'"
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add(self, chunks: Iterable[Tuple[str, str, str]]):
+        """写入文本块（已存在的同 ID 文本块会被替换）
+
+        Args:
+            chunks: [(chunk_id, file_id, 文本)]
+        """
+        rows = [(chunk_id, file_id, ' '.join(tokenize(text))) for chunk_id, file_id, text in chunks]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                for chunk_id, file_id, terms in rows:
+                    existing = conn.execute('SELECT row_id FROM chunks WHERE chunk_id = ?', (chunk_id,)).fetchone()
+                    if existing:
+                        conn.execute('UPDATE chunk_terms SET terms = ? WHERE rowid = ?', (terms, existing[0]))
+                        continue
+                    row_id = conn.execute(
+                        'INSERT INTO chunks (chunk_id, file_id) VALUES (?, ?)', (chunk_id, file_id)
+                    ).lastrowid
+                    conn.execute('INSERT INTO chunk_terms (rowid, terms) VALUES (?, ?)', (row_id, terms))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def delete_file(self, file_id: str):
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                conn.execute(
+                    'DELETE FROM chunk_terms WHERE rowid IN (SELECT row_id FROM chunks WHERE file_id = ?)',
+                    (file_id,)
+                )
+                conn.execute('DELETE FROM chunks WHERE file_id = ?', (file_id,))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """按 BM25 检索
+
+        Returns:
+            [(chunk_id, 分数)]，分数越大越相关
+        """
+        match = build_match_query(query)
+        if not match:
+            return []
+        conn = self._get_connection()
+        try:
+            rows = conn.execute(
+                'SELECT c.chunk_id, bm25(chunk_terms) AS rank FROM chunk_terms '
+                'JOIN chunks c ON c.row_id = chunk_terms.rowid '
+                'WHERE chunk_terms MATCH ? ORDER BY rank LIMIT ?',
+                (match, int(limit))
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"[LexicalIndex] 查询失败: {e}")
+            return []
+        finally:
+            conn.close()
+        # bm25() 越小越相关，取负数使分数越大越相关
+        return [(chunk_id, -rank) for chunk_id, rank in rows]
+
+    def count(self) -> int:
+        conn = self._get_connection()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+        finally:
+            conn.close()
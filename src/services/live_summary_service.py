@@ -0,0 +1,238 @@
+"""
+录音过程中的滚动小结服务
+
+功能：
+- 接收 ASR 确定的 utterance，累计到一定条数或时长后增量更新小结
+- 每次更新只发送"上一版小结 + 新增文本"，token 消耗随录音时长线性增长
+- 停止录音时只需处理最后一小段新增文本，最终小结几乎立即可用
+- 每次更新通过回调推送（由 API 层广播给前端）
+
+ASR 回调可能来自其他线程，所有 LLM 调用都提交到录音使用的事件循环中执行，同一时间只进行一次更新。
+"""
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from src.core.logger import get_logger
+from src.agents.prompts import PromptLoader
+
+logger = get_logger("LiveSummary")
+
+
+class LiveSummaryService:
+    """滚动小结服务"""
+
+    def __init__(
+        self,
+        llm_service,
+        config: Optional[Dict[str, Any]] = None,
+        on_update: Optional[Callable[[Dict[str, Any]], None]] = None
+    ):
+        """
+        Args:
+            llm_service: LLM服务实例
+            config: live_summary 配置
+                - enabled: 是否启用（默认 False）
+                - apps: 启用滚动小结的应用ID列表（默认 ['voice-note']）
+                - every_utterances: 累计多少条 utterance 后更新（默认 8）
+                - every_seconds: 距上次更新超过多少秒后，有新内容即更新（默认 60）
+                - max_tokens: 每次更新的最大输出长度（默认 800）
+            on_update: 小结更新回调，参数为 get_state() 的结果
+        """
+        config = config or {}
+        self.llm_service = llm_service
+        self.enabled = bool(config.get('enabled', False))
+        self.apps = config.get('apps', ['voice-note'])
+        self.every_utterances = max(1, int(config.get('every_utterances', 8)))
+        self.every_seconds = float(config.get('every_seconds', 60))
+        self.max_tokens = int(config.get('max_tokens', 800))
+        self.on_update = on_update
+
+        prompt_config = PromptLoader.load('summary_agent')
+        self.system_prompt = prompt_config.get('rolling_system_prompt', "请根据新增内容更新会议小结。")
+        self.update_template = prompt_config.get(
+            'rolling_update_prompt', "上一版小结：\n{summary}\n\n新增内容：\n{content}"
+        )
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._update_lock: Optional[asyncio.Lock] = None
+        self._active = False
+        self._finished = False  # 已停止录音（之后到达的 utterance 直接并入最终小结）
+        self._session = 0
+        self._app_id: Optional[str] = None
+        self._pending: List[str] = []
+        self._summary = ""
+        self._utterances = 0  # 已收到的 utterance 数
+        self._covered = 0     # 小结已覆盖的 utterance 数
+        self._updates = 0
+        self._tokens = 0
+        self._last_update_at = 0.0
+        self._final = False
+        self._running = False
+
+    def start(self, app_id: Optional[str], loop: Optional[asyncio.AbstractEventLoop]):
+        """开始新的录音会话（清空上一次的小结）
+
+        Args:
+            app_id: 当前录音的应用ID
+            loop: 执行 LLM 调用的事件循环
+        """
+        with self._lock:
+            self._session += 1
+            self._active = (self.enabled and loop is not None and self.llm_service is not None
+                            and (not self.apps or app_id in self.apps))
+            self._finished = False
+            self._loop = loop
+            self._update_lock = None
+            self._app_id = app_id
+            self._pending = []
+            self._summary = ""
+            self._utterances = 0
+            self._covered = 0
+            self._updates = 0
+            self._tokens = 0
+            self._last_update_at = time.time()
+            self._final = False
+            self._running = False
+        if self._active:
+            logger.info(f"[LiveSummary] 开始滚动小结: app_id={app_id}")
+
+    def add_utterance(self, text: str):
+        """添加一条确定的 utterance，满足条件时触发增量更新"""
+        text = (text or '').strip()
+        if not text:
+            return
+        with self._lock:
+            if not self._active and not self._finished:
+                return
+            self._pending.append(text)
+            self._utterances += 1
+            final = self._finished
+            should_update = not self._running and (final or self._due())
+            if should_update:
+                self._running = True
+        if should_update:
+            self._submit(final=final)
+
+    def finish(self):
+        """录音停止：处理剩余的新增文本并推送最终小结
+        
+        停止后 ASR 仍可能返回最后几句，这些内容到达时会再更新一次最终小结。
+        """
+        with self._lock:
+            if not self._active:
+                return
+            self._active = False
+            self._finished = True
+            self._running = True
+        self._submit(final=True)
+
+    def get_state(self) -> Dict[str, Any]:
+        """获取当前小结状态"""
+        with self._lock:
+            return {
+                'app_id': self._app_id,
+                'summary': self._summary,
+                'final': self._final,
+                'utterances': self._utterances,
+                'covered_utterances': self._covered,
+                'pending_utterances': len(self._pending),
+                'updates': self._updates,
+                'total_tokens': self._tokens,
+            }
+
+    def _due(self) -> bool:
+        """是否需要更新（调用方持有 _lock）"""
+        if not self._pending:
+            return False
+        return (len(self._pending) >= self.every_utterances
+                or time.time() - self._last_update_at >= self.every_seconds)
+
+    def _submit(self, final: bool):
+        try:
+            asyncio.run_coroutine_threadsafe(self._run(final, self._session), self._loop)
+        except Exception as e:
+            logger.error(f"[LiveSummary] 提交小结更新失败: {e}")
+            with self._lock:
+                self._running = False
+
+    async def _run(self, final: bool, session: int):
+        """执行更新；未完成期间到达的内容在本次结束后继续处理"""
+        if self._update_lock is None:
+            self._update_lock = asyncio.Lock()
+        async with self._update_lock:
+            try:
+                while True:
+                    with self._lock:
+                        if session != self._session:
+                            return
+                        if not (self._pending and (final or self._due())):
+                            break
+                        batch = self._pending
+                        self._pending = []
+                        previous = self._summary
+                    if not await self._update(previous, batch, session):
+                        break
+            finally:
+                with self._lock:
+                    current = session == self._session
+                    if current:
+                        self._running = False
+                        # 最后一次更新失败时仍有未处理的文本，不能标记为最终小结
+                        complete = not self._pending
+                        if final and complete:
+                            self._final = True
+
+        if final and current:
+            if complete:
+                logger.info(f"[LiveSummary] 最终小结已就绪，共 {self._updates} 次更新，{self._tokens} tokens")
+                self._notify()
+            else:
+                logger.warning(f"[LiveSummary] 最终小结更新失败，{len(self._pending)} 句未计入小结")
+                self._notify(error='final_update_failed')
+
+    async def _update(self, previous: str, batch: List[str], session: int) -> bool:
+        """用上一版小结 + 新增文本生成新一版小结，失败返回 False"""
+        prompt = self.update_template.format(summary=previous or "（暂无）", content='\n'.join(batch))
+        try:
+            with self.llm_service.track_usage() as usage:
+                summary = await self.llm_service.simple_chat(
+                    user_message=prompt,
+                    system_prompt=self.system_prompt,
+                    stream=False,
+                    temperature=0.3,
+                    max_tokens=self.max_tokens
+                )
+        except Exception as e:
+            # 失败时把这批文本放回队首，下次更新时一并处理
+            logger.warning(f"[LiveSummary] 小结更新失败，稍后重试: {e}")
+            with self._lock:
+                if session == self._session:
+                    self._pending = batch + self._pending
+                    self._last_update_at = time.time()
+            return False
+
+        with self._lock:
+            if session != self._session:
+                return False
+            if summary and summary.strip():
+                self._summary = summary.strip()
+            self._covered += len(batch)
+            self._updates += 1
+            self._tokens += usage.total_tokens
+            self._last_update_at = time.time()
+        self._notify(usage.to_usage())
+        return True
+
+    def _notify(self, usage: Optional[Dict[str, int]] = None, error: Optional[str] = None):
+        if not self.on_update:
+            return
+        try:
+            state = {**self.get_state(), 'usage': usage}
+            if error:
+                state['error'] = error
+            self.on_update(state)
+        except Exception as e:
+            logger.error(f"[LiveSummary] 推送小结更新失败: {e}")
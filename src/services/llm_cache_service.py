@@ -0,0 +1,213 @@
+"""
+LLM 响应缓存服务
+
+功能：
+- 以 (model, messages, temperature, max_tokens) 规范化后的哈希为键缓存完整响应
+- SQLite 持久化，重启后仍然有效
+- TTL 过期 + 按最近访问时间的 LRU 淘汰
+- 命中率统计（命中数、未命中数、节省的 token）
+
+只缓存调用方显式开启缓存的请求（小结、翻译、简单对话），多轮对话不经过缓存。
+"""
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.core.logger import get_logger
+
+logger = get_logger("LLMCache")
+
+_INLINE_SPACES = re.compile(r'[ \t]+')
+
+
+def _normalize_content(content: str) -> str:
+    """去掉首尾空白、每行行尾空白，行内连续的空格 / 制表符合并为一个空格，保留换行"""
+    lines = content.replace('\r\n', '\n').strip().split('\n')
+    return '\n'.join(_INLINE_SPACES.sub(' ', line).rstrip() for line in lines)
+
+
+def make_cache_key(model: str, messages: List[Dict[str, str]],
+                   temperature: Optional[float], max_tokens: Optional[int]) -> str:
+    """计算缓存键
+
+    消息内容去掉首尾空白并合并行内连续空白（换行保留，行结构不同的输入不共用缓存），
+    温度保留三位小数，避免前端刷新后细微的格式差异导致缓存失效。
+    """
+    normalized_messages = [
+        {'role': m.get('role', ''), 'content': _normalize_content(str(m.get('content', '')))}
+        for m in messages
+    ]
+    payload = {
+        'model': model or '',
+        'messages': normalized_messages,
+        'temperature': round(float(temperature), 3) if temperature is not None else None,
+        'max_tokens': int(max_tokens) if max_tokens is not None else None,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """LLM 响应缓存（SQLite）"""
+
+    def __init__(self, db_path: Path, max_entries: int = 5000, ttl_seconds: float = 7 * 24 * 3600):
+        """
+        Args:
+            db_path: 缓存数据库路径
+            max_entries: 最大缓存条数，超出后淘汰最久未访问的条目
+            ttl_seconds: 条目有效期（秒）
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._tokens_saved = 0
+
+        self._init_db()
+        self.purge_expired()
+
+    def _get_connection(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_db(self):
+        conn = self._get_connection()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    prompt_tokens INTEGER DEFAULT 0,
+                    completion_tokens INTEGER DEFAULT 0,
+                    hits INTEGER DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_access_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access_at)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存
+
+        Returns:
+            {'response', 'prompt_tokens', 'completion_tokens'}，未命中或已过期返回 None
+        """
+        now = time.time()
+        conn = self._get_connection()
+        try:
+            row = conn.execute(
+                'SELECT response, prompt_tokens, completion_tokens, created_at FROM llm_cache WHERE cache_key = ?',
+                (key,)
+            ).fetchone()
+            if row is None or now - row[3] > self.ttl_seconds:
+                if row is not None:
+                    conn.execute('DELETE FROM llm_cache WHERE cache_key = ?', (key,))
+                    conn.commit()
+                with self._lock:
+                    self._misses += 1
+                return None
+
+            conn.execute(
+                'UPDATE llm_cache SET hits = hits + 1, last_access_at = ? WHERE cache_key = ?',
+                (now, key)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._hits += 1
+            self._tokens_saved += (row[1] or 0) + (row[2] or 0)
+        return {'response': row[0], 'prompt_tokens': row[1] or 0, 'completion_tokens': row[2] or 0}
+
+    def put(self, key: str, model: str, response: str, usage: Optional[Dict[str, int]] = None):
+        """写入缓存（空响应不缓存）"""
+        if not response:
+            return
+        usage = usage or {}
+        now = time.time()
+        conn = self._get_connection()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO llm_cache
+                (cache_key, model, response, prompt_tokens, completion_tokens, hits, created_at, last_access_at)
+                VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+            ''', (key, model, response, usage.get('prompt_tokens', 0) or 0,
+                  usage.get('completion_tokens', 0) or 0, now, now))
+
+            count = conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+            evicted = 0
+            if count > self.max_entries:
+                cursor = conn.execute('''
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache ORDER BY last_access_at ASC LIMIT ?
+                    )
+                ''', (count - self.max_entries,))
+                evicted = cursor.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stores += 1
+            self._evictions += evicted
+
+    def purge_expired(self) -> int:
+        """删除过期条目"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+            conn.commit()
+            purged = cursor.rowcount
+        finally:
+            conn.close()
+        if purged:
+            logger.info(f"[LLMCache] 清理过期缓存: {purged} 条")
+        return purged
+
+    def clear(self) -> int:
+        """清空缓存"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.execute('DELETE FROM llm_cache')
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中率统计"""
+        conn = self._get_connection()
+        try:
+            entries = conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'stores': self._stores,
+                'evictions': self._evictions,
+                'tokens_saved': self._tokens_saved,
+            }
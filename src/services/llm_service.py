@@ -1,16 +1,98 @@
 """
 LLM 服务 - 提供大语言模型对话功能
 """
+import asyncio
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
 from typing import Optional, AsyncIterator, Union, Dict, Any
 from ..core.config import Config
 from ..core.logger import get_logger, get_system_logger
 from ..core.error_codes import SystemError, SystemErrorInfo
+from ..providers.llm.base_llm import LLMResponse
 from ..providers.llm.litellm_provider import LiteLLMProvider
+from ..providers.llm.router_provider import LLMRouterProvider
+from .llm_cache_service import LLMResponseCache, make_cache_key
 
 logger = get_logger("LLM")
 
 
+class LLMUsageTracker:
+    """累计一组 LLM 调用的 token 使用量（用于批量请求合并计费）"""
+    
+    def __init__(self, parent: Optional['LLMUsageTracker'] = None):
+        self.parent = parent  # 嵌套统计时同时累计到外层
+        self.calls = 0
+        self.cached_calls = 0
+        self.unknown_calls = 0  # 提供商未返回 usage 的调用
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.served_by: Dict[tuple, int] = {}  # (provider, model) -> tokens，多端点路由时标注实际服务的模型
+    
+    def add(self, usage: Optional[Dict[str, Any]]):
+        if self.parent:
+            self.parent.add(usage)
+        self.calls += 1
+        if not usage:
+            self.unknown_calls += 1
+            return
+        if usage.get('cached'):
+            self.cached_calls += 1
+        self.prompt_tokens += usage.get('prompt_tokens', 0) or 0
+        self.completion_tokens += usage.get('completion_tokens', 0) or 0
+        self.total_tokens += usage.get('total_tokens', 0) or 0
+        if usage.get('model'):
+            key = (usage.get('provider'), usage['model'])
+            self.served_by[key] = self.served_by.get(key, 0) + (usage.get('total_tokens', 0) or 0)
+    
+    @property
+    def model(self) -> Optional[str]:
+        """实际服务的模型（多个模型时取 token 最多的一个）；提供商未标注时为 None"""
+        if not self.served_by:
+            return None
+        return max(self.served_by, key=self.served_by.get)[1]
+    
+    @property
+    def provider(self) -> Optional[str]:
+        """实际服务的提供商，规则同 model"""
+        if not self.served_by:
+            return None
+        return max(self.served_by, key=self.served_by.get)[0]
+    
+    def to_usage(self) -> Optional[Dict[str, Any]]:
+        """转换为消费记录使用的 usage 字典；没有任何调用时返回 None
+        
+        经多端点路由的调用额外包含 model/provider，计费时应优先使用
+        """
+        if not self.calls:
+            return None
+        usage = {
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+        }
+        if self.served_by:
+            usage['model'] = self.model
+            usage['provider'] = self.provider
+        return usage
+    
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            'calls': self.calls,
+            'cached_calls': self.cached_calls,
+            'unknown_calls': self.unknown_calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+        }
+
+
+# 当前任务的用量累计器；在 track_usage() 内创建的子任务共享同一个累计器
+_usage_tracker: ContextVar[Optional[LLMUsageTracker]] = ContextVar('llm_usage_tracker', default=None)
+
+
 class LLMService:
     """LLM 服务主类"""
     
@@ -21,8 +103,10 @@ class LLMService:
             config: 配置对象
         """
         self.config = config
-        self.llm_provider: Optional[LiteLLMProvider] = None
+        self.llm_provider: Optional[Union[LiteLLMProvider, LLMRouterProvider]] = None
+        self.response_cache: Optional[LLMResponseCache] = None
         self._initialize_provider()
+        self._initialize_cache()
     
     def _initialize_provider(self):
         """初始化 LLM 提供商"""
@@ -43,8 +127,11 @@ class LLMService:
                 logger.warning("[LLM服务] 未找到 LLM 配置，服务将不可用")
                 return
             
-            # 创建并初始化 LiteLLM 提供商
-            self.llm_provider = LiteLLMProvider()
+            # 配置了备用端点时使用多端点路由，否则直接使用 LiteLLM 提供商
+            if llm_config.get('endpoints'):
+                self.llm_provider = LLMRouterProvider()
+            else:
+                self.llm_provider = LiteLLMProvider()
             success = self.llm_provider.initialize(llm_config)
             
             if success:
@@ -72,6 +159,26 @@ class LLMService:
             logger.error(f"[LLM服务] 初始化 LLM 提供商异常: {e}")
             self.llm_provider = None
     
+    def _initialize_cache(self):
+        """初始化响应缓存（llm_cache.enabled 为 false 时不启用）"""
+        cache_config = self.config.get('llm_cache', {}) or {}
+        if not cache_config.get('enabled', True):
+            logger.info("[LLM服务] 响应缓存已禁用")
+            return
+        
+        try:
+            data_dir = Path(self.config.get('storage.data_dir', '~/Library/Application Support/MindVoice')).expanduser()
+            db_path = data_dir / cache_config.get('database', 'database/llm_cache.db')
+            self.response_cache = LLMResponseCache(
+                db_path,
+                max_entries=cache_config.get('max_entries', 5000),
+                ttl_seconds=cache_config.get('ttl_hours', 168) * 3600,
+            )
+            logger.info(f"[LLM服务] 响应缓存已启用: {db_path}")
+        except Exception as e:
+            logger.error(f"[LLM服务] 初始化响应缓存失败，将不使用缓存: {e}")
+            self.response_cache = None
+    
     def is_available(self) -> bool:
         """检查 LLM 服务是否可用"""
         return self.llm_provider is not None and self.llm_provider.is_available()
@@ -98,6 +205,7 @@ class LLMService:
             temperature: 温度参数（0-1），控制随机性
             max_tokens: 最大生成 token 数
             **kwargs: 其他参数
+                - cache: 是否使用响应缓存（默认 False，仅适合结果可复用的单轮请求）
             
         Returns:
             如果 stream=True，返回 AsyncIterator[str]（流式生成）
@@ -117,6 +225,24 @@ class LLMService:
             sys_logger.log_error("LLM", error_info)
             raise RuntimeError("LLM 服务不可用，请检查配置")
         
+        use_cache = kwargs.pop('cache', False) and self.response_cache is not None
+        cache_key = None
+        if use_cache:
+            model = self.config.get('llm.model', '')
+            cache_key = make_cache_key(model, messages, temperature, max_tokens)
+            try:
+                cached = await asyncio.to_thread(self.response_cache.get, cache_key)
+            except Exception as e:
+                logger.warning(f"[LLM服务] 读取响应缓存失败: {e}")
+                cached = None
+            if cached is not None:
+                logger.info(f"[LLM服务] 命中响应缓存，流式: {stream}")
+                # 命中缓存不消耗 token，调用方按 0 token 记录消费
+                self._track({'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'cached': True})
+                if stream:
+                    return self._replay_stream(cached['response'])
+                return cached['response']
+        
         try:
             # 准备参数
             params = {
@@ -134,9 +260,17 @@ class LLMService:
                                      stream=stream,
                                      temperature=temperature)
             
-            result = await self.llm_provider.chat(messages, stream=stream, **params)
+            # 每次调用返回独立的结果对象，并发调用的用量互不干扰
+            response = await self.llm_provider.chat_with_usage(messages, stream=stream, **params)
+            
+            if stream:
+                return self._wrap_stream(response, cache_key, _usage_tracker.get())
+            
+            self._track(response.usage)
+            if cache_key:
+                await self._store_cache(cache_key, response.text, response.usage)
             
-            return result
+            return response.text
             
         except Exception as e:
             # 根据异常类型确定错误码
@@ -178,6 +312,84 @@ class LLMService:
             logger.error(f"[LLM服务] 对话请求失败: {e}")
             raise
     
+    @staticmethod
+    def _track(usage: Optional[Dict[str, Any]], tracker: Optional[LLMUsageTracker] = None):
+        tracker = tracker or _usage_tracker.get()
+        if tracker is not None:
+            tracker.add(usage)
+    
+    @contextmanager
+    def track_usage(self, propagate: bool = False):
+        """累计上下文内所有 LLM 调用的用量
+        
+        用法：
+            with llm_service.track_usage() as usage:
+                await asyncio.gather(...)
+            usage.total_tokens
+        
+        Args:
+            propagate: 嵌套使用时是否同时累计到外层（默认不累计，即单独统计）
+        """
+        tracker = LLMUsageTracker(parent=_usage_tracker.get() if propagate else None)
+        token = _usage_tracker.set(tracker)
+        try:
+            yield tracker
+        finally:
+            try:
+                _usage_tracker.reset(token)
+            except ValueError:
+                # 流式生成器在其他上下文中被关闭（如客户端断开后由事件循环回收）
+                _usage_tracker.set(None)
+    
+    async def _store_cache(self, cache_key: str, response: str, usage: Optional[Dict[str, Any]]):
+        """写入响应缓存（失败不影响调用方）"""
+        try:
+            await asyncio.to_thread(
+                self.response_cache.put,
+                cache_key,
+                self.config.get('llm.model', ''),
+                response,
+                usage,
+            )
+        except Exception as e:
+            logger.warning(f"[LLM服务] 写入响应缓存失败: {e}")
+    
+    async def _wrap_stream(self, response: LLMResponse, cache_key: Optional[str],
+                           tracker: Optional[LLMUsageTracker]) -> AsyncIterator[str]:
+        """透传流式响应，结束后记录本次调用的用量并写入缓存（中途断开不缓存）
+        
+        累计器在发起调用时确定，流在其他任务中迭代也能计入正确的请求。
+        """
+        chunks = []
+        try:
+            async for chunk in response.stream:
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            # 中途断开时已生成的 token 同样计费；提供商未返回 usage 时记为未知
+            self._track(response.usage, tracker)
+        if cache_key:
+            await self._store_cache(cache_key, ''.join(chunks), response.usage)
+    
+    @staticmethod
+    async def _replay_stream(text: str, chunk_size: int = 16) -> AsyncIterator[str]:
+        """以流式形式回放缓存的响应"""
+        for offset in range(0, len(text), chunk_size):
+            yield text[offset:offset + chunk_size]
+            await asyncio.sleep(0)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取响应缓存统计"""
+        if not self.response_cache:
+            return {'enabled': False}
+        return {'enabled': True, **self.response_cache.get_stats()}
+    
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """获取多端点路由统计（未配置备用端点时 enabled 为 False）"""
+        if not isinstance(self.llm_provider, LLMRouterProvider):
+            return {'enabled': False}
+        return {'enabled': True, **self.llm_provider.get_stats()}
+    
     async def simple_chat(
         self,
         user_message: str,
@@ -0,0 +1,472 @@
+"""
+笔记记录索引（后台任务）
+
+将 records 表中的笔记增量写入知识库的独立向量集合，使智能对话检索可以引用用户自己的录音笔记：
+- 水位线：按 (修改时间, 记录ID) 增量读取，水位线与每条记录的内容哈希保存在 record_index.db
+- 内容未变化（如只切换收藏 / 归档）时不重新计算向量
+- 软删除或不在索引范围内的记录删除其向量；永久删除的记录按存储层的删除登记（records_tombstones）清理，
+  并定期与 records 表对账（覆盖登记表出现之前删除的记录）
+- 低优先级：专用线程（Linux 下调低线程优先级）、按批计算、限制每秒文本块数，录音进行中暂停
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from src.core.logger import get_logger
+from src.services.text_chunker import iter_chunks
+
+logger = get_logger("RecordIndexer")
+
+_SUMMARY_MARKER = re.compile(r'\[SUMMARY_BLOCK_(?:START|END)\]')
+_IMAGE_PLACEHOLDER = re.compile(r'\[IMAGE: [^\]]*\] ?')
+
+
+def record_text(record: Dict[str, Any]) -> str:
+    """用于索引的记录文本（去掉小结标记和图片占位符，保留图片说明）"""
+    text = _SUMMARY_MARKER.sub('', record.get('text') or '')
+    return _IMAGE_PLACEHOLDER.sub('', text).strip()
+
+
+def record_title(record: Dict[str, Any]) -> str:
+    """记录标题（笔记信息块中的标题，没有时使用创建时间）"""
+    metadata = record.get('metadata') or {}
+    blocks = metadata.get('blocks') if isinstance(metadata, dict) else None
+    for block in blocks if isinstance(blocks, list) else []:
+        if isinstance(block, dict) and block.get('type') == 'note-info':
+            title = ((block.get('noteInfo') or {}).get('title') or '').strip()
+            if title:
+                return title[:80]
+    return f"笔记 {(record.get('created_at') or '')[:16]}".strip()
+
+
+def _lower_thread_priority():
+    """降低当前线程的调度优先级（Linux 下 setpriority 作用于单个线程，其他平台忽略）"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+class RecordIndexState:
+    """索引状态（水位线 + 已索引记录的内容哈希）"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _get_connection(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_db(self):
+        conn = self._get_connection()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS indexer_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS indexed_records (
+                    record_id TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    chunks INTEGER NOT NULL,
+                    indexed_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_value(self, key: str, default: str = '') -> str:
+        conn = self._get_connection()
+        try:
+            row = conn.execute('SELECT value FROM indexer_state WHERE key = ?', (key,)).fetchone()
+            return row[0] if row and row[0] is not None else default
+        finally:
+            conn.close()
+
+    def set_value(self, key: str, value: str):
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                conn.execute('INSERT OR REPLACE INTO indexer_state (key, value) VALUES (?, ?)', (key, value))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def get_hash(self, record_id: str) -> Optional[str]:
+        conn = self._get_connection()
+        try:
+            row = conn.execute(
+                'SELECT content_hash FROM indexed_records WHERE record_id = ?', (record_id,)
+            ).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def put(self, record_id: str, content_hash: str, chunks: int):
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO indexed_records (record_id, content_hash, chunks, indexed_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (record_id, content_hash, chunks, time.time())
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+    def remove(self, record_ids: List[str]):
+        if not record_ids:
+            return
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                conn.executemany('DELETE FROM indexed_records WHERE record_id = ?', [(r,) for r in record_ids])
+                conn.commit()
+            finally:
+                conn.close()
+
+    def page_record_ids(self, after_id: str, limit: int) -> List[str]:
+        conn = self._get_connection()
+        try:
+            rows = conn.execute(
+                'SELECT record_id FROM indexed_records WHERE record_id > ? ORDER BY record_id LIMIT ?',
+                (after_id, limit)
+            ).fetchall()
+            return [row[0] for row in rows]
+        finally:
+            conn.close()
+
+    def totals(self) -> Dict[str, int]:
+        conn = self._get_connection()
+        try:
+            records, chunks = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM indexed_records'
+            ).fetchone()
+            return {'records': records, 'chunks': chunks}
+        finally:
+            conn.close()
+
+    def clear(self):
+        with self._lock:
+            conn = self._get_connection()
+            try:
+                conn.execute('DELETE FROM indexed_records')
+                conn.execute('DELETE FROM indexer_state')
+                conn.commit()
+            finally:
+                conn.close()
+
+
+class RecordIndexer:
+    """笔记记录后台索引任务"""
+
+    def __init__(self, storage_provider, knowledge_service, config: Optional[dict] = None,
+                 is_busy: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            storage_provider: 存储提供者（需支持 list_records_changed_since / get_existing_record_ids）
+            knowledge_service: 知识库服务（提供 Embedding 模型、向量缓存与笔记记录集合）
+            config: knowledge.record_indexer 配置，包含（均为可选）：
+                - interval_seconds: 轮询间隔（默认 30）
+                - batch_size: 每次读取的记录数（默认 20）
+                - max_chunks_per_second: 向量计算速率上限（默认 16，0 表示不限制）
+                - app_types: 索引的记录类型（默认 ['voice-note']）
+                - reconcile_interval_seconds: 与 records 表对账的间隔（默认 3600）
+            is_busy: 返回 True 时暂停索引（如录音进行中）
+        """
+        config = config or {}
+        self.storage_provider = storage_provider
+        self.knowledge_service = knowledge_service
+        self.is_busy = is_busy or (lambda: False)
+        self.interval_seconds = float(config.get('interval_seconds', 30))
+        self.batch_size = max(1, int(config.get('batch_size', 20)))
+        self.max_chunks_per_second = float(config.get('max_chunks_per_second', 16))
+        self.app_types = set(config.get('app_types') or ['voice-note'])
+        self.reconcile_interval_seconds = float(config.get('reconcile_interval_seconds', 3600))
+        self.busy_poll_seconds = 1.0
+
+        self.state = RecordIndexState(Path(knowledge_service.storage_path) / "record_index.db")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="record-indexer",
+                                            initializer=_lower_thread_priority)
+        self._running = False
+        self._stopped = False
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._last_reconcile: Optional[float] = None
+
+        # 统计
+        self._records_indexed = 0
+        self._records_removed = 0
+        self._records_unchanged = 0
+        self._chunks_embedded = 0
+        self._cached_chunks = 0
+        self._paused_seconds = 0.0
+        self._last_run_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+
+    # ==================== 生命周期 ====================
+
+    async def start(self):
+        """启动后台索引任务"""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._index_loop())
+        logger.info(f"[RecordIndexer] 笔记索引已启动 (interval={self.interval_seconds}s, "
+                    f"batch={self.batch_size}, max_chunks_per_second={self.max_chunks_per_second})")
+
+    async def stop(self):
+        """停止后台任务（水位线按记录推进，下次启动从中断处继续）"""
+        self._running = False
+        self._stopped = True
+        self._wake.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await asyncio.wait_for(self._task, timeout=1.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            except Exception as e:
+                logger.error(f"[RecordIndexer] 停止后台任务时出错: {e}")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("[RecordIndexer] 笔记索引已停止")
+
+    def wake(self):
+        """立即开始下一轮索引（不等待轮询间隔）"""
+        self._wake.set()
+
+    async def _index_loop(self):
+        try:
+            while self._running:
+                try:
+                    await self.run_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._last_error = str(e)
+                    logger.error(f"[RecordIndexer] 索引失败: {e}", exc_info=True)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+        except asyncio.CancelledError:
+            pass
+
+    # ==================== 索引 ====================
+
+    async def run_once(self) -> int:
+        """处理删除登记与水位线之后的全部变化（启动后首轮及每隔 reconcile_interval_seconds 对账一次）
+
+        Returns:
+            本轮重新写入或删除向量的记录数
+        """
+        await asyncio.to_thread(self._check_embedding_key)
+        changed = await asyncio.to_thread(self._process_tombstones)
+
+        # 从水位线所在的那一秒重新读取：同一秒内后修改、但 ID 更小的记录也不会漏掉
+        # （已索引且内容未变的记录只比较哈希）
+        since = self.state.get_value('watermark')
+        after_id = ''
+        while not self._stopped:
+            rows = await asyncio.to_thread(
+                self.storage_provider.list_records_changed_since, since, after_id, self.batch_size
+            )
+            for row in rows:
+                await self._wait_until_idle()
+                if await self._index_record(row):
+                    changed += 1
+                since, after_id = row['changed_at'], row['id']
+            if rows:
+                self.state.set_value('watermark', since)
+            if len(rows) < self.batch_size:
+                break
+
+        if self._last_reconcile is None or time.monotonic() - self._last_reconcile >= self.reconcile_interval_seconds:
+            changed += await asyncio.to_thread(self.reconcile)
+            self._last_reconcile = time.monotonic()
+
+        self._last_run_at = time.time()
+        if changed:
+            self.knowledge_service._invalidate_search_cache()
+            logger.info(f"[RecordIndexer] 本轮更新 {changed} 条记录的向量")
+        return changed
+
+    async def _wait_until_idle(self):
+        """录音等实时任务进行中时暂停"""
+        start = time.monotonic()
+        while self.is_busy() and not self._stopped:
+            await asyncio.sleep(self.busy_poll_seconds)
+        self._paused_seconds += time.monotonic() - start
+
+    async def _index_record(self, row: Dict[str, Any]) -> bool:
+        """索引单条记录
+
+        Returns:
+            是否写入或删除了向量
+        """
+        record_id = row['id']
+        text = record_text(row)
+        previous_hash = self.state.get_hash(record_id)
+
+        if row['is_deleted'] or row['app_type'] not in self.app_types or not text:
+            if previous_hash is None:
+                return False
+            await asyncio.to_thread(self._delete_vectors, [record_id])
+            self._records_removed += 1
+            return True
+
+        title = record_title(row)
+        content_hash = hashlib.sha256(f"{title}\n{text}".encode('utf-8')).hexdigest()
+        if content_hash == previous_hash:
+            self._records_unchanged += 1
+            return False
+
+        service = self.knowledge_service
+        await service.ensure_model_loaded()
+
+        chunks = list(iter_chunks([text], service.DEFAULT_CHUNK_SIZE, service.DEFAULT_CHUNK_OVERLAP))
+        embeddings: List[List[float]] = []
+        loop = asyncio.get_event_loop()
+        for offset in range(0, len(chunks), service.embed_batch_size):
+            batch = chunks[offset:offset + service.embed_batch_size]
+            start = time.monotonic()
+            batch_embeddings, cached_count = await loop.run_in_executor(
+                self._executor, service._encode_chunks, batch
+            )
+            embeddings.extend(batch_embeddings)
+            self._chunks_embedded += len(batch) - cached_count
+            self._cached_chunks += cached_count
+            await self._throttle(len(batch) - cached_count, time.monotonic() - start)
+
+        metadata = {
+            'record_id': record_id,
+            'app_type': row['app_type'],
+            'title': title,
+            'created_at': row.get('created_at') or '',
+        }
+        if row.get('user_id'):
+            metadata['user_id'] = row['user_id']
+        await asyncio.to_thread(self._replace_vectors, record_id, chunks, embeddings, metadata)
+        self.state.put(record_id, content_hash, len(chunks))
+        self._records_indexed += 1
+        return True
+
+    async def _throttle(self, embedded: int, elapsed: float):
+        """按 max_chunks_per_second 限速（命中向量缓存的文本块不计入）"""
+        if self.max_chunks_per_second <= 0 or embedded <= 0:
+            return
+        delay = embedded / self.max_chunks_per_second - elapsed
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _replace_vectors(self, record_id: str, chunks: List[str], embeddings: List[List[float]],
+                         metadata: Dict[str, Any]):
+        """替换记录的全部文本块（文本块数可能变少，先删除旧的）"""
+        collection = self.knowledge_service.records_collection
+        collection.delete(where={'record_id': record_id})
+        collection.upsert(
+            ids=[f"record_{record_id}_chunk_{i}" for i in range(len(chunks))],
+            embeddings=embeddings,
+            documents=chunks,
+            metadatas=[{**metadata, 'chunk_index': i} for i in range(len(chunks))]
+        )
+
+    def _delete_vectors(self, record_ids: List[str]):
+        collection = self.knowledge_service.records_collection
+        for record_id in record_ids:
+            collection.delete(where={'record_id': record_id})
+        self.state.remove(record_ids)
+
+    def _process_tombstones(self, page_size: int = 500) -> int:
+        """按删除登记清理永久删除的记录（永久删除不会留下 updated_at，水位线无法感知）
+
+        Returns:
+            清理的记录数
+        """
+        if not hasattr(self.storage_provider, 'list_record_tombstones'):
+            return 0
+        removed = 0
+        after_seq = int(self.state.get_value('tombstone_seq') or 0)
+        while True:
+            rows = self.storage_provider.list_record_tombstones(after_seq, page_size)
+            if not rows:
+                break
+            record_ids = [record_id for _, record_id in rows if self.state.get_hash(record_id) is not None]
+            if record_ids:
+                self._delete_vectors(record_ids)
+                removed += len(record_ids)
+            after_seq = rows[-1][0]
+            self.state.set_value('tombstone_seq', str(after_seq))
+            self.storage_provider.prune_record_tombstones(after_seq)
+        self._records_removed += removed
+        return removed
+
+    def reconcile(self, page_size: int = 500) -> int:
+        """与 records 表对账，清理已不存在的记录的向量
+
+        Returns:
+            清理的记录数
+        """
+        removed = 0
+        after_id = ''
+        while True:
+            record_ids = self.state.page_record_ids(after_id, page_size)
+            if not record_ids:
+                break
+            existing = self.storage_provider.get_existing_record_ids(record_ids)
+            missing = [record_id for record_id in record_ids if record_id not in existing]
+            if missing:
+                self._delete_vectors(missing)
+                removed += len(missing)
+            after_id = record_ids[-1]
+        self._records_removed += removed
+        if removed:
+            logger.info(f"[RecordIndexer] 对账清理 {removed} 条已永久删除的记录")
+        return removed
+
+    def _check_embedding_key(self):
+        """Embedding 模型或后端变化后，旧向量不可比较：清空集合并从头索引"""
+        key = self.knowledge_service.embedding_key
+        previous = self.state.get_value('embedding_key')
+        if previous == key:
+            return
+        if previous:
+            logger.info(f"[RecordIndexer] Embedding 模型已变化（{previous} → {key}），重新建立笔记索引")
+            self.knowledge_service.reset_records_collection()
+            self.state.clear()
+        self.state.set_value('embedding_key', key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        totals = self.state.totals()
+        return {
+            'running': self._running,
+            'paused': self.is_busy(),
+            'watermark': self.state.get_value('watermark') or None,
+            'indexed_records': totals['records'],
+            'indexed_chunks': totals['chunks'],
+            'records_indexed': self._records_indexed,
+            'records_removed': self._records_removed,
+            'records_unchanged': self._records_unchanged,
+            'chunks_embedded': self._chunks_embedded,
+            'cached_chunks': self._cached_chunks,
+            'paused_seconds': round(self._paused_seconds, 1),
+            'last_run_at': self._last_run_at,
+            'last_error': self._last_error,
+        }
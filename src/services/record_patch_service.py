@@ -0,0 +1,367 @@
+"""
+记录增量保存服务
+
+功能：
+- 接收块级增量（新增/修改的块、删除的块ID、块顺序），在内存中合并到文档
+- 服务端合并快速连续的编辑：最后一次编辑后静默 debounce 秒才落库，
+  持续编辑时最多延迟 max_delay 秒，控制异常退出时的数据损失
+- 写入失败的记录按指数退避重试，连续失败期间只记录一次完整堆栈
+- 空闲时批量重建全文索引（配合 records_fts_pending 队列）
+
+整篇保存（PUT /api/records/{id}）仍然可用，调用前应先 flush 该记录的待写入补丁。
+"""
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_BLOCK_START = "[SUMMARY_BLOCK_START]"
+SUMMARY_BLOCK_END = "[SUMMARY_BLOCK_END]"
+
+
+class RecordPatchConflictError(Exception):
+    """补丁与服务器上的文档不一致（前端应回退为整篇保存）"""
+
+
+def blocks_to_text(blocks: List[Dict[str, Any]]) -> str:
+    """由块列表生成记录的纯文本（与前端 VoiceNoteAdapter.toSaveData 保持一致）"""
+    parts = []
+    for block in blocks:
+        if block.get('type') == 'note-info' or block.get('isBufferBlock'):
+            continue
+        content = block.get('content') or ''
+        if block.get('isSummary'):
+            text = f"{SUMMARY_BLOCK_START}{content}{SUMMARY_BLOCK_END}"
+        elif block.get('type') == 'image':
+            # 图片块写入占位符，便于清理服务和全文搜索识别
+            text = f"[IMAGE: {block.get('imageUrl') or ''}]"
+            if block.get('imageCaption'):
+                text += f" {block['imageCaption']}"
+        else:
+            text = content
+        if text.strip():
+            parts.append(text)
+    return '\n'.join(parts)
+
+
+def apply_block_patch(blocks: List[Dict[str, Any]],
+                      upserts: Optional[List[Dict[str, Any]]] = None,
+                      deletes: Optional[List[str]] = None,
+                      order: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """将块级增量应用到块列表，返回新列表（不修改传入的列表和块）
+
+    Args:
+        blocks: 当前块列表
+        upserts: 新增或整体替换的块（按 id 匹配）
+        deletes: 删除的块ID
+        order: 完整的块ID顺序（可选）；未提供时保持原有顺序，新块追加到末尾
+
+    Raises:
+        RecordPatchConflictError: 块缺少 id，或 order 与合并后的块集合不一致
+    """
+    index: Dict[str, Dict[str, Any]] = {b['id']: b for b in blocks if b.get('id')}
+    for block_id in deletes or []:
+        index.pop(block_id, None)
+
+    new_ids = []
+    for block in upserts or []:
+        block_id = block.get('id')
+        if not block_id:
+            raise RecordPatchConflictError("块缺少 id")
+        if block_id not in index:
+            new_ids.append(block_id)
+        index[block_id] = block
+
+    if order is not None:
+        if len(order) != len(index) or set(order) != set(index):
+            raise RecordPatchConflictError("块顺序与服务器文档不一致")
+        return [index[block_id] for block_id in order]
+
+    result = []
+    for block in blocks:
+        block_id = block.get('id')
+        if not block_id:
+            # 历史数据中没有 id 的块保持原位
+            result.append(block)
+        elif block_id in index:
+            result.append(index[block_id])
+    result.extend(index[block_id] for block_id in new_ids)
+    return result
+
+
+class _PendingDocument:
+    """内存中的待写入文档"""
+
+    def __init__(self, metadata: Dict[str, Any]):
+        self.metadata = metadata
+        self.version = 0
+        self.saved_version = 0
+        self.first_dirty_at: Optional[float] = None
+        self.last_dirty_at: Optional[float] = None
+        self.last_access_at = time.monotonic()
+        self.lock = asyncio.Lock()
+        # 写入失败后的退避：连续失败次数与下次自动重试的时间
+        self.failures = 0
+        self.retry_at: Optional[float] = None
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.saved_version
+
+
+class RecordPatchService:
+    """记录增量保存服务"""
+
+    def __init__(self, storage_provider, config: Optional[dict] = None):
+        """
+        Args:
+            storage_provider: 存储提供者
+            config: 配置字典，包含（均为可选）：
+                - autosave.debounce_seconds: 最后一次编辑后的静默时间（默认 1.5）
+                - autosave.max_delay_seconds: 持续编辑时的最长落库延迟（默认 10）
+                - autosave.fts_idle_seconds: 空闲多久后重建全文索引（默认 5）
+        """
+        autosave_config = (config or {}).get('autosave', {}) or {}
+        self.storage_provider = storage_provider
+        self.debounce_seconds = autosave_config.get('debounce_seconds', 1.5)
+        self.max_delay_seconds = autosave_config.get('max_delay_seconds', 10.0)
+        self.fts_idle_seconds = autosave_config.get('fts_idle_seconds', 5.0)
+        # 已落库的文档在内存中保留的时间
+        self.cache_ttl_seconds = 60.0
+        self.tick_seconds = 0.25
+        # 写入失败后的重试间隔：从 retry_initial_seconds 起每次翻倍，最长 retry_max_seconds
+        self.retry_initial_seconds = 1.0
+        self.retry_max_seconds = 60.0
+
+        self._documents: Dict[str, _PendingDocument] = {}
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._last_activity = time.monotonic()
+        self._last_fts_check = 0.0
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计
+        self._patches_applied = 0
+        self._writes = 0
+        self._fts_reindexed = 0
+
+    # ==================== 生命周期 ====================
+
+    async def start(self):
+        """启动后台落库任务"""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(f"[Autosave] 增量保存服务已启动 (debounce={self.debounce_seconds}s, max_delay={self.max_delay_seconds}s)")
+
+    async def stop(self):
+        """停止后台任务，并写入所有未落库的修改"""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await asyncio.wait_for(self._task, timeout=1.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            except Exception as e:
+                logger.error(f"[Autosave] 停止后台任务时出错: {e}")
+        flushed = await self.flush()
+        logger.info(f"[Autosave] 增量保存服务已停止，退出前写入 {flushed} 条记录")
+
+    # ==================== 补丁 ====================
+
+    async def _get_document(self, record_id: str) -> _PendingDocument:
+        doc = self._documents.get(record_id)
+        if doc:
+            return doc
+
+        lock = self._load_locks.setdefault(record_id, asyncio.Lock())
+        async with lock:
+            doc = self._documents.get(record_id)
+            if doc:
+                return doc
+            record = await asyncio.to_thread(self.storage_provider.get_record, record_id)
+            if not record:
+                raise KeyError(record_id)
+            metadata = record.get('metadata') or {}
+            if not isinstance(metadata.get('blocks'), list):
+                raise RecordPatchConflictError("记录不是块文档，请使用整篇保存")
+            doc = _PendingDocument(metadata)
+            self._documents[record_id] = doc
+        self._load_locks.pop(record_id, None)
+        return doc
+
+    async def apply_patch(self, record_id: str,
+                          upserts: Optional[List[Dict[str, Any]]] = None,
+                          deletes: Optional[List[str]] = None,
+                          order: Optional[List[str]] = None,
+                          metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """应用块级增量（只修改内存中的文档，由后台任务合并落库）
+
+        Args:
+            record_id: 记录ID
+            upserts: 新增或修改的块
+            deletes: 删除的块ID
+            order: 完整的块ID顺序（可选）
+            metadata: 需要合并的顶层元数据字段（blocks 字段会被忽略）
+
+        Returns:
+            {'version', 'blocks', 'pending'}
+
+        Raises:
+            KeyError: 记录不存在
+            RecordPatchConflictError: 补丁无法应用
+        """
+        doc = await self._get_document(record_id)
+
+        blocks = apply_block_patch(doc.metadata.get('blocks', []), upserts, deletes, order)
+
+        # 整体替换 metadata 对象（而不是原地修改），落库线程持有的快照不受影响
+        new_metadata = dict(doc.metadata)
+        if metadata:
+            new_metadata.update({k: v for k, v in metadata.items() if k != 'blocks'})
+        new_metadata['blocks'] = blocks
+        if 'block_count' in new_metadata:
+            new_metadata['block_count'] = len(blocks)
+        new_metadata['updated_at'] = datetime.now().isoformat()
+
+        now = time.monotonic()
+        doc.metadata = new_metadata
+        doc.version += 1
+        doc.last_dirty_at = now
+        doc.last_access_at = now
+        if doc.first_dirty_at is None:
+            doc.first_dirty_at = now
+
+        self._last_activity = now
+        self._patches_applied += 1
+
+        return {'version': doc.version, 'blocks': len(blocks), 'pending': True}
+
+    def discard(self, record_id: str):
+        """丢弃记录的内存文档（整篇保存或删除记录后调用）"""
+        self._documents.pop(record_id, None)
+
+    def has_pending(self, record_id: Optional[str] = None) -> bool:
+        """是否有未落库的修改"""
+        if record_id is not None:
+            doc = self._documents.get(record_id)
+            return bool(doc and doc.dirty)
+        return any(doc.dirty for doc in self._documents.values())
+
+    # ==================== 落库 ====================
+
+    async def _flush_document(self, record_id: str) -> bool:
+        doc = self._documents.get(record_id)
+        if not doc or not doc.dirty:
+            return False
+
+        async with doc.lock:
+            if not doc.dirty:
+                return False
+            version = doc.version
+            metadata = doc.metadata
+
+            try:
+                text = blocks_to_text(metadata.get('blocks', []))
+                success = await asyncio.to_thread(self.storage_provider.update_record, record_id, text, metadata)
+            except Exception as e:
+                doc.failures += 1
+                delay = min(self.retry_max_seconds, self.retry_initial_seconds * 2 ** (doc.failures - 1))
+                doc.retry_at = time.monotonic() + delay
+                if doc.failures == 1:
+                    logger.error(f"[Autosave] 写入记录失败，{delay:.1f}s 后重试: {record_id}: {e}", exc_info=True)
+                else:
+                    logger.warning(f"[Autosave] 写入记录仍然失败（第 {doc.failures} 次），{delay:.1f}s 后重试: {record_id}: {e}")
+                return False
+
+            if not success:
+                # 记录已被删除
+                logger.warning(f"[Autosave] 记录不存在，丢弃未写入的修改: {record_id}")
+                self._documents.pop(record_id, None)
+                return False
+
+            if doc.failures:
+                logger.info(f"[Autosave] 记录写入已恢复（此前连续失败 {doc.failures} 次）: {record_id}")
+            doc.failures = 0
+            doc.retry_at = None
+            doc.saved_version = version
+            if not doc.dirty:
+                doc.first_dirty_at = None
+            self._writes += 1
+            logger.debug(f"[Autosave] 已写入记录: {record_id} (version={version})")
+            return True
+
+    async def flush(self, record_id: Optional[str] = None) -> int:
+        """立即写入未落库的修改
+
+        Args:
+            record_id: 指定记录；为空时写入全部
+
+        Returns:
+            写入的记录数
+        """
+        record_ids = [record_id] if record_id is not None else list(self._documents.keys())
+        flushed = 0
+        for rid in record_ids:
+            if await self._flush_document(rid):
+                flushed += 1
+        return flushed
+
+    async def _flush_loop(self):
+        try:
+            while self._running:
+                await asyncio.sleep(self.tick_seconds)
+                now = time.monotonic()
+
+                for record_id, doc in list(self._documents.items()):
+                    # 单条记录出错不影响其他记录，也不终止后台任务
+                    try:
+                        if doc.dirty:
+                            if doc.retry_at is not None and now < doc.retry_at:
+                                continue
+                            quiet = now - doc.last_dirty_at >= self.debounce_seconds
+                            overdue = now - doc.first_dirty_at >= self.max_delay_seconds
+                            if quiet or overdue:
+                                await self._flush_document(record_id)
+                        elif now - doc.last_access_at >= self.cache_ttl_seconds:
+                            self._documents.pop(record_id, None)
+                    except Exception as e:
+                        logger.error(f"[Autosave] 处理记录失败: {record_id}: {e}", exc_info=True)
+
+                # 空闲时重建全文索引
+                try:
+                    idle = not self.has_pending() and now - self._last_activity >= self.fts_idle_seconds
+                    if idle and now - self._last_fts_check >= self.fts_idle_seconds:
+                        self._last_fts_check = now
+                        await self._reindex_fts()
+                except Exception as e:
+                    logger.error(f"[Autosave] 重建全文索引失败: {e}", exc_info=True)
+        except asyncio.CancelledError:
+            pass
+
+    async def _reindex_fts(self):
+        if not hasattr(self.storage_provider, 'reindex_pending_fts'):
+            return
+        try:
+            count = await asyncio.to_thread(self.storage_provider.reindex_pending_fts)
+            if count:
+                self._fts_reindexed += count
+                logger.debug(f"[Autosave] 空闲重建全文索引: {count} 条记录")
+        except Exception as e:
+            logger.error(f"[Autosave] 重建全文索引失败: {e}", exc_info=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'documents': len(self._documents),
+            'pending': sum(1 for doc in self._documents.values() if doc.dirty),
+            'failing': sum(1 for doc in self._documents.values() if doc.failures),
+            'patches_applied': self._patches_applied,
+            'writes': self._writes,
+            'fts_reindexed': self._fts_reindexed,
+        }
@@ -0,0 +1,173 @@
+"""
+知识库检索重排（交叉编码器，CPU）
+
+第一阶段（向量 / 词法 / 混合检索）多召回一些候选，由交叉编码器对 (查询, 文本块) 逐对打分后重新排序，
+低于阈值的候选直接丢弃，只有真正相关的文本块进入提示词。
+- 按批打分（batch_size），同一 (规范化查询, 文本块) 的分数缓存在进程内 LRU 中，重复提问不再重算
+- 分数为 0~1 的相关度（单输出交叉编码器默认经过 Sigmoid），阈值 min_score 按此设置
+"""
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from src.services.search_cache import normalize_query
+
+# 条件导入（未安装时不启用重排）
+try:
+    from sentence_transformers import CrossEncoder
+    CROSS_ENCODER_AVAILABLE = True
+except ImportError:
+    CROSS_ENCODER_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """交叉编码器重排器（延迟加载模型）"""
+
+    DEFAULT_MODEL = 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1'  # 多语言（含中文）的小型交叉编码器
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        candidates: int = 4,
+        min_candidates: int = 20,
+        min_score: float = 0.3,
+        batch_size: int = 16,
+        max_length: int = 512,
+        cache_size: int = 4096,
+        device: Optional[str] = 'cpu'
+    ):
+        """
+        Args:
+            model_name: 交叉编码器模型名（HuggingFace 模型 ID 或本地路径）
+            candidates: 召回候选数为 top_k 的倍数
+            min_candidates: 最少召回的候选数
+            min_score: 相关度阈值（0~1），低于阈值的候选不返回
+            batch_size: 每批打分的 (查询, 文本块) 对数
+            max_length: 每对输入的最大 token 数（超出部分截断）
+            cache_size: 分数缓存条数（LRU，0 表示不缓存）
+            device: 推理设备（默认 CPU）
+        """
+        self.model_name = model_name
+        self.candidates = max(1, int(candidates))
+        self.min_candidates = max(1, int(min_candidates))
+        self.min_score = float(min_score)
+        self.batch_size = max(1, int(batch_size))
+        self.max_length = int(max_length)
+        self.cache_size = max(0, int(cache_size))
+        self.device = device
+
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._scores: "OrderedDict[tuple, float]" = OrderedDict()
+
+        self._queries = 0
+        self._pairs_scored = 0
+        self._cache_hits = 0
+        self._dropped = 0
+        self._model_ms = 0.0
+
+    @staticmethod
+    def is_installed() -> bool:
+        return CROSS_ENCODER_AVAILABLE
+
+    def fetch_size(self, top_k: int) -> int:
+        """第一阶段召回的候选数"""
+        return max(top_k * self.candidates, self.min_candidates)
+
+    def load(self):
+        """加载交叉编码器（同步方法，首次打分时自动调用）"""
+        with self._load_lock:
+            if self.model is not None:
+                return
+            if not CROSS_ENCODER_AVAILABLE:
+                raise ImportError("sentence-transformers 未安装。请运行: pip install sentence-transformers")
+            from src.providers.embedding.base_embedding import configure_hf_hub
+            configure_hf_hub()
+            logger.info(f"[Reranker] 开始加载交叉编码器: {self.model_name}")
+            self.model = CrossEncoder(self.model_name, max_length=self.max_length, device=self.device)
+            logger.info("[Reranker] 交叉编码器加载完成")
+
+    def score(self, query: str, documents: List[str]) -> List[float]:
+        """计算查询与每个文本块的相关度（同步方法，命中缓存的文本块不重算）"""
+        normalized = normalize_query(query)
+        keys = [(normalized, hashlib.sha1(doc.encode('utf-8')).hexdigest()) for doc in documents]
+        scores: List[Optional[float]] = [None] * len(documents)
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._scores.get(key)
+                if cached is not None:
+                    self._scores.move_to_end(key)
+                    scores[i] = cached
+                    self._cache_hits += 1
+
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if missing:
+            if self.model is None:
+                self.load()
+            start = time.perf_counter()
+            predicted = self.model.predict(
+                [(query, documents[i]) for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            self._model_ms += (time.perf_counter() - start) * 1000
+            self._pairs_scored += len(missing)
+            with self._cache_lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = min(1.0, max(0.0, float(value)))
+                    if self.cache_size:
+                        self._scores[keys[i]] = scores[i]
+                        self._scores.move_to_end(keys[i])
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """按相关度重排检索结果，丢弃低于阈值的候选
+
+        Args:
+            query: 查询文本
+            results: 第一阶段的检索结果
+            top_k: 最多返回的结果数
+
+        Returns:
+            重排后的结果（score 为交叉编码器相关度，原分数保存在 retrieval_score）
+        """
+        self._queries += 1
+        if not results:
+            return []
+
+        scores = self.score(query, [r.get('content') or '' for r in results])
+        # 稳定排序：相关度相同时保持第一阶段的顺序
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+        reranked = []
+        for i in order:
+            if scores[i] < self.min_score:
+                self._dropped += 1
+                continue
+            reranked.append({**results[i], 'score': round(scores[i], 4), 'retrieval_score': results[i].get('score')})
+        return reranked[:top_k]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """重排统计（打分对数、缓存命中、阈值丢弃数、模型耗时）"""
+        with self._cache_lock:
+            cached = len(self._scores)
+        lookups = self._pairs_scored + self._cache_hits
+        return {
+            'model': self.model_name,
+            'model_loaded': self.model is not None,
+            'min_score': self.min_score,
+            'queries': self._queries,
+            'pairs_scored': self._pairs_scored,
+            'cache_entries': cached,
+            'cache_hits': self._cache_hits,
+            'cache_hit_rate': round(self._cache_hits / lookups, 4) if lookups else 0.0,
+            'dropped': self._dropped,
+            'model_ms': round(self._model_ms, 1),
+        }
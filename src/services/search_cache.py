@@ -0,0 +1,150 @@
+"""
+知识库检索缓存（进程内）
+
+两级缓存：
+- 查询向量：规范化后的查询文本 → 向量（LRU），重复或仅有空白/大小写/标点差异的问题不再重复计算向量
+- 检索结果：(查询向量, top_k, 过滤条件, 检索模式) → 结果（短 TTL），同时以语料代数为键的一部分
+
+上传或删除文件时递增语料代数（generation），旧代数的结果全部失效；查询向量与语料无关，不受影响。
+统计命中率以及命中时省下的耗时（按该条目首次计算时的实际耗时累计）。
+"""
+import json
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+_WHITESPACE = re.compile(r'\s+')
+_EDGE_PUNCTUATION = '？?。.！!，,、；;：:…~～ 　'
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本：合并空白、统一大小写、去掉首尾标点"""
+    return _WHITESPACE.sub(' ', query).strip().casefold().strip(_EDGE_PUNCTUATION)
+
+
+def _vector_digest(vector: Sequence[float]) -> str:
+    raw = json.dumps([round(float(v), 6) for v in vector], separators=(',', ':'))
+    return hashlib.sha1(raw.encode('ascii')).hexdigest()
+
+
+class SearchCache:
+    """查询向量 LRU + 检索结果 TTL 缓存"""
+
+    def __init__(self, max_queries: int = 512, max_results: int = 256, result_ttl_seconds: float = 60.0):
+        """
+        Args:
+            max_queries: 查询向量缓存条数上限（LRU 淘汰）
+            max_results: 检索结果缓存条数上限（LRU 淘汰）
+            result_ttl_seconds: 检索结果有效期（秒），0 表示不缓存结果
+        """
+        self.max_queries = max(1, int(max_queries))
+        self.max_results = max(1, int(max_results))
+        self.result_ttl_seconds = float(result_ttl_seconds)
+
+        self._lock = threading.Lock()
+        self._embeddings: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._results: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.generation = 0
+
+        self._embedding_hits = 0
+        self._embedding_misses = 0
+        self._result_hits = 0
+        self._result_misses = 0
+        self._saved_ms = 0.0
+
+    # ---------- 查询向量 ----------
+
+    def get_embedding(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, normalize_query(query))
+        with self._lock:
+            entry = self._embeddings.get(key)
+            if entry is None:
+                self._embedding_misses += 1
+                return None
+            self._embeddings.move_to_end(key)
+            self._embedding_hits += 1
+            self._saved_ms += entry[1]
+            return entry[0]
+
+    def put_embedding(self, model: str, query: str, embedding: List[float], cost_ms: float = 0.0):
+        key = (model, normalize_query(query))
+        with self._lock:
+            self._embeddings[key] = (list(embedding), float(cost_ms))
+            self._embeddings.move_to_end(key)
+            while len(self._embeddings) > self.max_queries:
+                self._embeddings.popitem(last=False)
+
+    # ---------- 检索结果 ----------
+
+    def _result_key(self, embedding: Sequence[float], top_k: int,
+                    filter_metadata: Optional[Dict[str, Any]], mode: str,
+                    generation: Optional[int] = None) -> tuple:
+        filter_key = json.dumps(filter_metadata, ensure_ascii=False, sort_keys=True) if filter_metadata else ''
+        generation = self.generation if generation is None else generation
+        return (generation, _vector_digest(embedding), int(top_k), filter_key, mode)
+
+    def get_results(self, embedding: Sequence[float], top_k: int,
+                    filter_metadata: Optional[Dict[str, Any]] = None,
+                    mode: str = 'vector') -> Optional[List[Dict[str, Any]]]:
+        """读取检索结果（返回副本，调用方可以修改）"""
+        if self.result_ttl_seconds <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            key = self._result_key(embedding, top_k, filter_metadata, mode)
+            entry = self._results.get(key)
+            if entry is None or now - entry[2] > self.result_ttl_seconds:
+                if entry is not None:
+                    del self._results[key]
+                self._result_misses += 1
+                return None
+            self._results.move_to_end(key)
+            self._result_hits += 1
+            self._saved_ms += entry[1]
+            return [dict(item) for item in entry[0]]
+
+    def put_results(self, embedding: Sequence[float], top_k: int,
+                    filter_metadata: Optional[Dict[str, Any]], results: List[Dict[str, Any]],
+                    cost_ms: float = 0.0, mode: str = 'vector', generation: Optional[int] = None):
+        """写入检索结果
+
+        Args:
+            generation: 检索开始时的语料代数（为空表示当前代数）；检索期间语料已变化时不写入，
+                避免旧语料的结果以新代数缓存
+        """
+        if self.result_ttl_seconds <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            key = self._result_key(embedding, top_k, filter_metadata, mode, generation)
+            self._results[key] = ([dict(item) for item in results], float(cost_ms), time.monotonic())
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+    def invalidate(self):
+        """语料变化（上传 / 删除）后调用：递增代数并清空结果缓存"""
+        with self._lock:
+            self.generation += 1
+            self._results.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            embedding_total = self._embedding_hits + self._embedding_misses
+            result_total = self._result_hits + self._result_misses
+            return {
+                'generation': self.generation,
+                'embedding_entries': len(self._embeddings),
+                'embedding_hits': self._embedding_hits,
+                'embedding_misses': self._embedding_misses,
+                'embedding_hit_rate': round(self._embedding_hits / embedding_total, 4) if embedding_total else 0.0,
+                'result_entries': len(self._results),
+                'result_hits': self._result_hits,
+                'result_misses': self._result_misses,
+                'result_hit_rate': round(self._result_hits / result_total, 4) if result_total else 0.0,
+                'saved_ms': round(self._saved_ms, 2),
+            }
@@ -0,0 +1,194 @@
+"""
+流式文本分块（按句子打包）
+
+从文本片段迭代器（例如按 64KB 读取的文件）逐块产出文本块，只在内存中保留当前句子和当前块，
+大文件分块时内存占用与文件大小无关，耗时与文本长度成线性关系：
+- 切句：一次正则扫描找出句子边界（中文句末标点、英文句末标点后跟空白、换行），
+  每个字符只扫描一次，不再对每个窗口逐个分隔符 rfind
+- 打包：按估算的 token 数把句子贪心装入文本块（不超过 chunk_size），相邻块重叠 chunk_overlap 个句子
+- Markdown 标题（行首 # ~ ######）开始新的文本块，重叠不跨越章节
+- 超长句子（超过 chunk_size）在空白或逗号处切开，找不到时硬切
+
+token 数按字符估算（src.utils.token_estimate，与上下文预算同一口径：中日韩字符 1 token/字，其余 4 字符/token），
+chunk_size 应不超过 Embedding 模型的最大序列长度，超出部分会被模型截断。
+"""
+import re
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from src.utils.token_estimate import CJK_CHAR, estimate_tokens
+
+# 句子边界（匹配结束位置即句子结束位置，其后的空白归入下一句）
+_BOUNDARY = re.compile(
+    r'[。！？；…]+[”’」』）》]*'  # 中文句末标点（可跟右引号 / 括号）
+    r'|[.!?;]+["\')\]]*(?=\s)'  # 英文句末标点，后面必须是空白（避免切开 3.14、e.g. 中的点、网址）
+    r'|\n'  # 换行（列表项、段落、标题各自成句）
+)
+_HEADING = re.compile(r'[ \t]*#{1,6}[ \t]')
+_SOFT_BREAKS = frozenset(' \t，,、：:')
+
+
+def _split_long(sentence: str, chunk_size: int, first_size: Optional[int] = None) -> List[str]:
+    """将超过 chunk_size 的句子切成多段，优先在后半段最后一个空白 / 逗号处切分
+
+    Args:
+        sentence: 句子
+        chunk_size: 每段大小（估算 token 数）
+        first_size: 第一段大小（用于填满当前块的剩余空间，默认 chunk_size）
+    """
+    pieces = []
+    start = 0
+    weight = 0.0
+    soft = -1
+    limit = first_size or chunk_size
+    for i, ch in enumerate(sentence):
+        w = 1.0 if CJK_CHAR.match(ch) else 0.25
+        # 留出估算取整的余量，切出的每段估算值不超过限制
+        if weight + w > limit - 0.75 and i > start:
+            cut = soft if soft > start + (i - start) // 2 else i
+            pieces.append(sentence[start:cut])
+            start = cut
+            weight = sum(1.0 if CJK_CHAR.match(c) else 0.25 for c in sentence[cut:i])
+            soft = -1
+            limit = chunk_size
+        weight += w
+        if ch in _SOFT_BREAKS:
+            soft = i + 1
+    pieces.append(sentence[start:])
+    return pieces
+
+
+def iter_sentences(pieces: Iterable[str], max_chars: int = 4096) -> Iterator[str]:
+    """从文本片段中切出句子（句子首尾相连即原文，片段边界不影响结果）
+
+    Args:
+        pieces: 文本片段迭代器
+        max_chars: 单句最大字符数，超过时按该长度切开（限制没有标点的长文本占用的缓冲区）
+    """
+    tail = ''
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer = tail + piece
+        start = 0
+        for match in _BOUNDARY.finditer(buffer):
+            end = match.end()
+            if end >= len(buffer):
+                # 位于缓冲区末尾的边界可能随下一个片段延长（如 。」 或连续标点），留到下一轮
+                break
+            for i in range(start, end, max_chars):
+                yield buffer[i:min(i + max_chars, end)]
+            start = end
+        tail = buffer[start:]
+        while len(tail) > max_chars:
+            yield tail[:max_chars]
+            tail = tail[max_chars:]
+    if tail:
+        yield tail
+
+
+def _pack(sentences: Iterable[str], chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    """把句子贪心装入文本块"""
+    # 当前块：[(句子, token 数, 是否有非空白内容, 是否标题)]
+    current: List[Tuple[str, int, bool, bool]] = []
+    current_tokens = 0
+    has_body = False  # 当前块是否含有标题以外的内容
+    at_line_start = True
+
+    def emit() -> Optional[str]:
+        text = ''.join(item[0] for item in current).strip()
+        return text or None
+
+    def overlap_tail() -> List[Tuple[str, int, bool, bool]]:
+        """取末尾 chunk_overlap 个句子作为下一块的开头（最多占半块，且少于上一块的句子数，保证前进）"""
+        limit = min(chunk_overlap, sum(item[2] for item in current) - 1)
+        keep: List[Tuple[str, int, bool, bool]] = []
+        kept, tokens = 0, 0
+        for item in reversed(current):
+            if item[2] and (kept >= limit or tokens + item[1] > chunk_size // 2):
+                break
+            keep.append(item)
+            tokens += item[1]
+            kept += item[2]
+        # 开头的空白句子（空行等）不保留
+        while keep and not keep[-1][2]:
+            keep.pop()
+        keep.reverse()
+        return keep
+
+    for raw in sentences:
+        is_heading = at_line_start and bool(_HEADING.match(raw))
+        at_line_start = raw.endswith('\n')
+
+        if is_heading and has_body:
+            chunk = emit()
+            if chunk:
+                yield chunk
+            current, current_tokens, has_body = [], 0, False
+
+        # token 数按原文（含空白）估算：各句之和不小于整块的估算值，块大小不会超过 chunk_size
+        tokens = estimate_tokens(raw)
+        if tokens > chunk_size:
+            # 超长句子先填满当前块的剩余空间（剩余不到四分之一块时另起一块）
+            room = chunk_size - current_tokens
+            parts = _split_long(raw, chunk_size, room if room >= chunk_size // 4 else None)
+        else:
+            parts = [raw]
+        for part in parts:
+            part_tokens = tokens if len(parts) == 1 else estimate_tokens(part)
+            if current and current_tokens + part_tokens > chunk_size:
+                chunk = emit()
+                if chunk:
+                    yield chunk
+                current = overlap_tail()
+                current_tokens = sum(item[1] for item in current)
+                # 重叠部分放不下新句子时从前面丢弃
+                while current and current_tokens + part_tokens > chunk_size:
+                    current_tokens -= current.pop(0)[1]
+                has_body = any(item[2] and not item[3] for item in current)
+            has_content = bool(part.strip())
+            current.append((part, part_tokens, has_content, is_heading))
+            current_tokens += part_tokens
+            if has_content and not is_heading:
+                has_body = True
+
+    chunk = emit()
+    if chunk:
+        yield chunk
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = 200, chunk_overlap: int = 1) -> Iterator[str]:
+    """逐块产出文本块
+
+    Args:
+        pieces: 文本片段迭代器（片段边界不影响分块结果）
+        chunk_size: 块大小（估算 token 数）
+        chunk_overlap: 相邻块重叠的句子数（重叠部分最多占半块）
+
+    Yields:
+        去掉首尾空白后的非空文本块（原文的连续片段）
+    """
+    chunk_size = max(1, int(chunk_size))
+    # 没有标点的长文本按字符数先切开，限制缓冲区大小（切开处之后再按 token 数细分）
+    sentences = iter_sentences(pieces, max_chars=max(chunk_size * 4, 64 * 1024))
+    return _pack(sentences, chunk_size, max(0, int(chunk_overlap)))
+
+
+def iter_file_pieces(path, piece_size: int = 64 * 1024, encoding: str = 'utf-8',
+                     on_read: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+    """按固定大小读取文本文件
+
+    Args:
+        path: 文件路径
+        piece_size: 每次读取的字符数
+        encoding: 文件编码
+        on_read: 每读取一段后回调（参数为该段文本），用于统计进度或计算哈希
+    """
+    # newline='' 保留原始换行符，与直接对文件内容分块的结果一致
+    with open(path, 'r', encoding=encoding, newline='') as f:
+        while True:
+            piece = f.read(piece_size)
+            if not piece:
+                break
+            if on_read:
+                on_read(piece)
+            yield piece
@@ -64,6 +64,9 @@ class VoiceService:
         # ASR时间追踪（用于消费记录）
         self._asr_session_start_time: Optional[int] = None  # 毫秒时间戳
         
+        # 滚动小结（录音过程中增量更新，由 API 层注入）
+        self.live_summary_service = None
+        
         self._initialize_providers()
         self._initialize_membership_services()
     
@@ -266,6 +269,10 @@ class VoiceService:
         logger.info("[语音服务] 设置录音器")
         self.recorder = recorder
     
+    def set_live_summary_service(self, service):
+        """设置滚动小结服务（确定的 utterance 会送入其中增量更新小结）"""
+        self.live_summary_service = service
+    
     def set_on_text_callback(self, callback: Callable[[str, bool, dict], None]):
         """设置文本回调函数
         
@@ -361,6 +368,8 @@ class VoiceService:
         logger.info("[语音服务] 启动录音器（Audio先行启动，保证缓冲）...")
         success = self.recorder.start_recording()
         if success:
+            if self.live_summary_service:
+                self.live_summary_service.start(app_id, self._loop)
             logger.info("[语音服务] 录音已开始，状态: RECORDING")
             logger.info("[语音服务] AudioASRGateway 将根据配置控制 ASR 启停")
             self._notify_state_change(RecordingState.RECORDING)
@@ -532,6 +541,9 @@ class VoiceService:
             logger.info(f"[语音服务] 收到确定utterance: '{text}'{time_info_str}")
         self._current_text = text
         
+        if is_definite_utterance and self.live_summary_service:
+            self.live_summary_service.add_utterance(text)
+        
         if self._on_text_callback:
             self._on_text_callback(text, is_definite_utterance, time_info)
     
@@ -612,6 +624,10 @@ class VoiceService:
             final_text = self._current_text
             logger.info(f"[语音服务] ✓ 录音已停止，返回当前文本: '{final_text}'")
             
+            # 处理滚动小结中剩余的新增文本，生成最终小结
+            if self.live_summary_service:
+                self.live_summary_service.finish()
+            
             self._current_session_id = None
             if final_text:
                 self._current_text = final_text
@@ -239,7 +239,7 @@ class SoundDeviceRecorder(AudioRecorder):
             
             logger.info("[音频] 音频流已启动")
             
-            self.thread = threading.Thread(target=self._consume_audio, daemon=True)
+            self.thread = threading.Thread(target=self._consume_audio, name="AudioConsumer", daemon=True)
             self.thread.start()
             logger.info("[音频] 音频消费线程已启动")
             
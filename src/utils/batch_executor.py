@@ -0,0 +1,77 @@
+"""
+有限并发批量执行器
+
+用于批量 LLM 调用（如批量翻译）：
+- 信号量限制同时进行的请求数
+- 遇到限流错误时按指数退避 + 随机抖动重试
+- 结果按输入顺序返回
+"""
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """判断是否为限流错误（与 LLMService 的错误分类规则一致）"""
+    if type(error).__name__ == 'RateLimitError' or getattr(error, 'status_code', None) == 429:
+        return True
+    message = str(error).lower()
+    return 'rate' in message and 'limit' in message or '429' in message
+
+
+async def run_batch(
+    items: Sequence[T],
+    worker: Callable[[T], Awaitable[R]],
+    concurrency: int = 8,
+    max_retries: int = 3,
+    base_delay: float = 1.0,
+    max_delay: float = 20.0,
+) -> List[R]:
+    """并发执行批量任务，结果顺序与输入一致
+
+    Args:
+        items: 输入列表
+        worker: 处理单个输入的协程函数
+        concurrency: 最大并发数
+        max_retries: 限流时的最大重试次数
+        base_delay: 首次重试的基础等待时间（秒）
+        max_delay: 单次等待时间上限（秒）
+
+    Returns:
+        结果列表
+
+    Raises:
+        任一任务重试后仍失败时抛出该异常，并取消其余任务
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _run(index: int, item: T) -> R:
+        attempt = 0
+        while True:
+            async with semaphore:
+                try:
+                    return await worker(item)
+                except Exception as e:
+                    if attempt >= max_retries or not is_rate_limit_error(e):
+                        raise
+                    # 指数退避 + 抖动，避免所有任务同时重试
+                    delay = min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.5)
+                    attempt += 1
+                    logger.warning(f"[Batch] 第 {index} 项触发限流，{delay:.1f}s 后第 {attempt} 次重试: {e}")
+            # 等待期间释放信号量，让其他任务继续
+            await asyncio.sleep(delay)
+
+    tasks = [asyncio.ensure_future(_run(i, item)) for i, item in enumerate(items)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,39 @@
+"""
+分阶段耗时统计
+
+记录一次请求中各阶段的耗时（毫秒）。并发执行的阶段各自计时，
+因此各阶段之和可能大于总耗时，总耗时以 elapsed 为准。
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimer:
+    """阶段耗时记录器"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """记录 with 块的耗时（同名阶段累加）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name: str, ms: float):
+        self.stages[name] = round(self.stages.get(name, 0.0) + ms, 2)
+
+    def mark(self, name: str):
+        """记录从创建到当前的时间点（如首 token 时间）"""
+        self.stages[name] = self.elapsed()
+
+    def elapsed(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 2)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {**self.stages, 'elapsed': self.elapsed()}
@@ -0,0 +1,19 @@
+"""
+token 数字符估算
+
+中日韩字符（含全角标点）按 1 token/字，其余按 4 字符/token。
+知识库分块预算（text_chunker）、SmartChat 上下文预算（context_builder）、打包翻译预算
+与本地 LLM 模拟服务都使用这里的估算，保证各处预算口径一致。
+"""
+import re
+
+# 中日韩字符范围（含 CJK 标点、假名、扩展 A、统一表意文字、谚文、全角字符）
+CJK_CLASS = r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]'
+CJK_CHAR = re.compile(CJK_CLASS)
+_CJK_RUN = re.compile(CJK_CLASS + '+')
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数：中日韩字符按 1 token/字，其余按 4 字符/token"""
+    cjk = sum(len(run) for run in _CJK_RUN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
@@ -0,0 +1,227 @@
+"""
+测试公共夹具
+提供模拟配置对象、模拟 LLM 提供商、接入模拟提供商的 LLMService，
+以及不依赖 chromadb / sentence-transformers 的 KnowledgeService
+"""
+
+import sys
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.llm_service import LLMService
+from src.services.knowledge_manifest import KnowledgeManifest
+from src.services.knowledge_service import KnowledgeService
+from src.services.lexical_index import LexicalIndex
+from src.providers.llm.base_llm import LLMResponse
+
+
+DEFAULT_USAGE = {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}
+
+
+class MockConfig:
+    """模拟配置对象（默认关闭 LLM 响应缓存）"""
+
+    def __init__(self, values=None):
+        self.values = {'llm_cache': {'enabled': False}, **(values or {})}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+class MockLLMProvider:
+    """模拟 LLM 提供商：固定用量，记录成功的调用和最大并发数
+
+    reply 为回复文本，或根据 messages 生成回复的函数（可为协程函数，抛出异常模拟调用失败）；
+    usage 为用量字典，或根据 messages 计算用量的函数。流式调用逐字输出，首字前等待 first_token_delay 秒。
+    """
+
+    name = 'mock'
+
+    def __init__(self, reply='回答', usage=None, first_token_delay=0.0):
+        self.reply = reply
+        self.usage = usage or DEFAULT_USAGE
+        self.first_token_delay = first_token_delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def prompts(self):
+        """每次成功调用的最后一条消息内容"""
+        return [messages[-1]['content'] for messages in self.calls]
+
+    def is_available(self):
+        return True
+
+    async def chat_with_usage(self, messages, stream=False, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            text = self.reply(messages) if callable(self.reply) else self.reply
+            if inspect.isawaitable(text):
+                text = await text
+        finally:
+            self.in_flight -= 1
+        self.calls.append(messages)
+        usage = dict(self.usage(messages) if callable(self.usage) else self.usage)
+        if not stream:
+            return LLMResponse(text=text, usage=usage)
+
+        result = LLMResponse()
+
+        async def _stream():
+            if self.first_token_delay:
+                await asyncio.sleep(self.first_token_delay)
+            for ch in text:
+                yield ch
+            result.usage = usage
+        result.stream = _stream()
+        return result
+
+
+@pytest.fixture
+def mock_llm_provider():
+    """模拟 LLM 提供商的工厂，参数同 MockLLMProvider"""
+    return MockLLMProvider
+
+
+@pytest.fixture
+def mock_llm_service():
+    """创建 LLMService 的工厂：mock_llm_service(provider=None, config=None)
+
+    provider 默认为 MockLLMProvider()，config 中的配置项覆盖 MockConfig 的默认值
+    """
+    def make(provider=None, config=None):
+        service = LLMService(MockConfig(config))
+        service.llm_provider = provider if provider is not None else MockLLMProvider()
+        return service
+    return make
+
+
+class FakeEmbeddingModel:
+    """模拟 Embedding 模型：向量由文本长度决定，记录编码的文本块数"""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded += len(texts)
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+
+class FakeCollection:
+    """模拟向量库集合：rows 为 {id: (文本, 元数据)}，query 按预设距离升序返回
+
+    记录每次 query 请求的结果数与 upsert 次数，fail_on_upsert 指定第 N 次写入时失败
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.distances = {}
+        self.requested = []
+        self.upserts = 0
+        self.fail_on_upsert = None
+
+    @staticmethod
+    def _matches(meta, where):
+        return not where or all(meta.get(k) == v for k, v in where.items())
+
+    def count(self):
+        return len(self.rows)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.upserts += 1
+        if self.upserts == self.fail_on_upsert:
+            raise RuntimeError('向量库写入失败')
+        for i, doc, meta in zip(ids, documents, metadatas):
+            self.rows[i] = (doc, meta)
+
+    def delete(self, where):
+        self.rows = {k: v for k, v in self.rows.items() if not self._matches(v[1], where)}
+
+    def get(self, ids=None, include=None, **kwargs):
+        ids = [i for i in (ids if ids is not None else self.rows) if i in self.rows]
+        return {'ids': ids, 'documents': [self.rows[i][0] for i in ids],
+                'metadatas': [self.rows[i][1] for i in ids]}
+
+    def query(self, query_embeddings, n_results, where=None):
+        self.requested.append(n_results)
+        ids = sorted((i for i, (_, meta) in self.rows.items() if self._matches(meta, where)),
+                     key=lambda i: self.distances.get(i, 0.0))[:n_results]
+        return {'ids': [ids], 'documents': [[self.rows[i][0] for i in ids]],
+                'metadatas': [[self.rows[i][1] for i in ids]],
+                'distances': [[self.distances.get(i, 0.0) for i in ids]]}
+
+
+class FakeChromaClient:
+    """模拟 ChromaDB 客户端：按名称保存集合"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def get_or_create_collection(self, name, metadata=None):
+        return self.collections.setdefault(name, FakeCollection())
+
+    def delete_collection(self, name):
+        self.collections.pop(name, None)
+
+
+@pytest.fixture
+def make_knowledge_service(tmp_path):
+    """创建 KnowledgeService 的工厂：make_knowledge_service(chunks=None, records=None, **attrs)
+
+    不经过 __init__（不需要 chromadb / sentence-transformers），默认不启用缓存、重排与笔记记录检索。
+    chunks / records 为 [(id, 文本, 元数据, 距离)]，分别预置到文件集合（同时写入词法索引）与笔记记录集合；
+    attrs 覆盖服务属性。
+    """
+    executors = []
+
+    def make(chunks=None, records=None, **attrs):
+        service = KnowledgeService.__new__(KnowledgeService)
+        service.storage_path = tmp_path / 'knowledge'
+        service.storage_path.mkdir(parents=True, exist_ok=True)
+        service.chroma_client = FakeChromaClient()
+        service.collection_name = 'knowledge'
+        service.records_collection_name = 'records'
+        service.collection = service.chroma_client.get_or_create_collection(service.collection_name)
+        service.records_collection = service.chroma_client.get_or_create_collection(service.records_collection_name)
+        service.include_records = False
+        service.manifest = KnowledgeManifest(service.storage_path / 'manifest.db')
+        service.search_mode = 'vector'
+        service.rrf_k = 60
+        service.lexical_index = LexicalIndex(service.storage_path / 'lexical_index.db')
+        service.embedding_cache = None
+        service.search_cache = None
+        service.reranker = None
+        service.embed_batch_size = 64
+        service._embed_executor = ThreadPoolExecutor(max_workers=1)
+        executors.append(service._embed_executor)
+        service.embedding_model_name = 'fake'
+        service.embedding_key = 'fake'
+        service.embedding_model = FakeEmbeddingModel()
+        service._model_loading = False
+        service._model_loaded = True
+        service._load_task = None
+        for name, value in attrs.items():
+            setattr(service, name, value)
+
+        for collection, rows in ((service.collection, chunks), (service.records_collection, records)):
+            for chunk_id, document, meta, distance in rows or []:
+                collection.rows[chunk_id] = (document, meta)
+                collection.distances[chunk_id] = distance
+        if chunks:
+            service.lexical_index.add((chunk_id, meta.get('file_id', ''), document)
+                                      for chunk_id, document, meta, _ in chunks)
+        return service
+
+    yield make
+    for executor in executors:
+        executor.shutdown(wait=False)
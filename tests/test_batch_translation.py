@@ -0,0 +1,147 @@
+"""
+并发批量翻译测试
+验证并发上限、结果顺序、限流重试以及批量调用的用量累计
+"""
+
+import sys
+import random
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.batch_executor import run_batch, is_rate_limit_error
+from src.agents.translation_agent import TranslationAgent
+
+
+class RateLimitError(Exception):
+    """模拟 litellm.RateLimitError"""
+
+
+async def _delayed_reply(messages):
+    """随机延迟后返回 T(原文)"""
+    await asyncio.sleep(random.uniform(0, 0.02))
+    return f"T({messages[-1]['content']})"
+
+
+def _length_usage(messages):
+    """用量与输入长度相关"""
+    text = messages[-1]['content']
+    return {'prompt_tokens': len(text), 'completion_tokens': 1, 'total_tokens': len(text) + 1}
+
+
+class TestRunBatch:
+    """批量执行器测试"""
+
+    def test_results_keep_input_order(self):
+        async def worker(i):
+            await asyncio.sleep(random.uniform(0, 0.01))
+            return i * 2
+
+        assert asyncio.run(run_batch(list(range(30)), worker, concurrency=5)) == [i * 2 for i in range(30)]
+
+    def test_retries_rate_limit_with_backoff(self):
+        attempts = {}
+
+        async def worker(item):
+            attempts[item] = attempts.get(item, 0) + 1
+            if attempts[item] < 3:
+                raise RateLimitError("429 Too Many Requests")
+            return item
+
+        result = asyncio.run(run_batch(['a', 'b'], worker, max_retries=3, base_delay=0.001))
+        assert result == ['a', 'b']
+        assert attempts == {'a': 3, 'b': 3}
+
+    def test_other_errors_are_not_retried(self):
+        attempts = []
+
+        async def worker(item):
+            attempts.append(item)
+            raise ValueError("bad input")
+
+        with pytest.raises(ValueError):
+            asyncio.run(run_batch([1], worker, base_delay=0.001))
+        assert attempts == [1]
+        assert not is_rate_limit_error(ValueError("bad input"))
+
+
+class TestBatchTranslate:
+    """TranslationAgent 批量翻译测试"""
+
+    def test_concurrent_batch_aggregates_usage(self, mock_llm_service, mock_llm_provider):
+        provider = mock_llm_provider(reply=_delayed_reply, usage=_length_usage)
+        service = mock_llm_service(provider)
+        agent = TranslationAgent(service, config={'batch_concurrency': 4})
+        texts = [f"第{i}句话" for i in range(20)] + ["  "]
+
+        async def run():
+            with service.track_usage() as usage:
+                results = await agent.batch_translate(texts, 'zh', 'en')
+            return results, usage
+
+        results, usage = asyncio.run(run())
+        assert results == [f"T({t})" for t in texts[:-1]] + [""]
+        assert 1 < provider.max_in_flight <= 4
+        assert usage.calls == 20
+        assert usage.total_tokens == sum(len(t) + 1 for t in texts[:-1])
+
+
+def _packing_reply(drop_source=None):
+    """理解打包格式的回复函数，可指定丢弃某段模拟对齐失败"""
+    def reply(messages):
+        text = messages[-1]['content']
+        if '<<1>>' not in text:
+            return f"T({text})"
+        lines = []
+        for line in text.split('\n'):
+            marker, source = line.split(' ', 1)
+            if source != drop_source:
+                lines.append(f"{marker} T({source})")
+        return '\n'.join(lines)
+    return reply
+
+
+class TestPackedTranslation:
+    """打包翻译测试"""
+
+    @pytest.fixture
+    def make_agent(self, mock_llm_service, mock_llm_provider):
+        """创建打包翻译的 TranslationAgent：make_agent(drop_source=None, **config)"""
+        def make(drop_source=None, **config):
+            usage = {'prompt_tokens': 100, 'completion_tokens': 10, 'total_tokens': 110}
+            provider = mock_llm_provider(reply=_packing_reply(drop_source), usage=usage)
+            service = mock_llm_service(provider)
+            return TranslationAgent(service, config=config), service, provider
+        return make
+
+    def test_parse_pack_rejects_duplicates_and_empty(self):
+        parsed = TranslationAgent.parse_pack("<<1>> one\n<<2>>\n<<3>> three\n<<3>> again\n<<9>> x", 4)
+        assert parsed == {1: 'one'}
+
+    def test_packs_reduce_request_count(self, make_agent):
+        agent, service, provider = make_agent(pack_max_segments=10)
+        texts = [f"第{i}句" for i in range(25)] + [""]
+
+        async def run():
+            with service.track_usage() as usage:
+                return await agent.batch_translate(texts, 'zh', 'en', packed=True), usage
+
+        results, usage = asyncio.run(run())
+        assert results == [f"T({t})" for t in texts[:-1]] + [""]
+        assert len(provider.prompts) == 3
+        assert usage.total_tokens == 330
+
+    def test_misaligned_segment_falls_back(self, make_agent):
+        agent, _, provider = make_agent(drop_source="第2句")
+        texts = ["第1句", "第2句", "第3句", "Hello there", "こんにちは"]
+
+        results = asyncio.run(agent.batch_translate_with_pair(texts, 'zh-en', packed=True))
+        assert results[:4] == ["T(第1句)", "T(第2句)", "T(第3句)", "T(Hello there)"]
+        assert results[4]['error'] == 'language_not_detected'
+        # zh->en 一个打包请求 + 一次逐条回退；en->zh 只有一条，直接单条翻译
+        assert len(provider.prompts) == 3
+        assert "第2句" in provider.prompts
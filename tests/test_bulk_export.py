@@ -0,0 +1,106 @@
+"""
+批量导出测试
+验证流式 ZIP 可正常解压、图片跨记录去重以及导出清单内容
+"""
+
+import io
+import sys
+import json
+import asyncio
+import zipfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.bulk_export_service import BulkExportService
+
+
+class MockStorage:
+    """模拟存储提供者"""
+
+    def __init__(self, records):
+        self.records = {r['id']: r for r in records}
+
+    def get_record(self, record_id):
+        return self.records.get(record_id)
+
+
+def _make_record(record_id, title, images):
+    blocks = [{'type': 'note-info', 'noteInfo': {'title': title}},
+              {'type': 'paragraph', 'content': f'{title} 正文'}]
+    blocks += [{'type': 'image', 'imageUrl': url, 'imageCaption': '截图'} for url in images]
+    return {'id': record_id, 'text': title, 'metadata': {'blocks': blocks}}
+
+
+def _collect(exporter, record_ids, note_format='md'):
+    async def run():
+        chunks = []
+        async for chunk in exporter.stream_zip(record_ids, note_format=note_format):
+            chunks.append(chunk)
+        return chunks
+    return asyncio.run(run())
+
+
+class TestBulkExport:
+    """批量导出测试"""
+
+    def test_stream_zip_dedups_images(self, tmp_path):
+        images_dir = tmp_path / 'images'
+        images_dir.mkdir()
+        shared = b'\x89PNG' + bytes(range(256)) * 600  # 大于一个读取分块
+        (images_dir / 'shared.png').write_bytes(shared)
+        (images_dir / 'only.png').write_bytes(b'\x89PNG-only')
+
+        storage = MockStorage([
+            _make_record('aaaaaaaa-1', '会议', ['images/shared.png', 'images/only.png']),
+            _make_record('bbbbbbbb-2', '周报', ['images/shared.png', 'images/missing.png']),
+        ])
+        exporter = BulkExportService(storage, tmp_path, max_workers=2)
+        try:
+            chunks = _collect(exporter, ['aaaaaaaa-1', 'bbbbbbbb-2', 'not-exist'])
+        finally:
+            exporter.shutdown()
+
+        assert len(chunks) > 2
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        names = archive.namelist()
+        assert names.count('images/shared.png') == 1
+        assert archive.read('images/shared.png') == shared
+        assert '会议_aaaaaaaa.md' in names
+        assert 'images/shared.png' in archive.read('周报_bbbbbbbb.md').decode('utf-8')
+
+        manifest = json.loads(archive.read('manifest.json'))
+        assert manifest['records'] == 2
+        assert manifest['images'] == 2
+        assert manifest['missing_records'] == ['not-exist']
+        assert manifest['missing_images'] == ['images/missing.png']
+        assert archive.testzip() is None
+
+    def test_html_notes_reference_images(self, tmp_path):
+        (tmp_path / 'images').mkdir()
+        (tmp_path / 'images' / 'a.png').write_bytes(b'\x89PNG-a')
+        storage = MockStorage([_make_record('cccccccc-3', '笔记', ['images/a.png'])])
+        exporter = BulkExportService(storage, tmp_path)
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(_collect(exporter, ['cccccccc-3'], 'html'))))
+        finally:
+            exporter.shutdown()
+
+        html = archive.read('笔记_cccccccc.html').decode('utf-8')
+        assert 'src="images/a.png"' in html
+        assert 'base64' not in html
+
+    def test_rejects_path_traversal(self, tmp_path):
+        (tmp_path / 'secret.txt').write_text('secret')
+        data_dir = tmp_path / 'data'
+        data_dir.mkdir()
+        storage = MockStorage([_make_record('dddddddd-4', '笔记', ['../secret.txt'])])
+        exporter = BulkExportService(storage, data_dir)
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(_collect(exporter, ['dddddddd-4']))))
+        finally:
+            exporter.shutdown()
+
+        assert '../secret.txt' not in archive.namelist()
+        assert json.loads(archive.read('manifest.json'))['missing_images'] == ['../secret.txt']
@@ -0,0 +1,119 @@
+"""
+SmartChat 上下文构建测试
+验证按 token 预算的优先级填充、滚动摘要替代更早的对话，以及节省 token 的统计
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.agents.context_builder import ContextBuilder, estimate_tokens
+from src.agents.smart_chat_agent import SmartChatAgent
+
+
+def _history(n, size=40):
+    history = []
+    for i in range(n):
+        history.append({'role': 'user', 'content': f"问题{i} " + 'q' * size})
+        history.append({'role': 'assistant', 'content': f"回答{i} " + 'a' * size})
+    return history
+
+
+def _chunks(n, size=200):
+    return [{'source': f"doc{i}", 'content': 'k' * size, 'score': 1 - i / 10} for i in range(n)]
+
+
+class TestContextBuilder:
+    """预算填充测试"""
+
+    def _builder(self, recent_turns=2):
+        return ContextBuilder(recent_turns=recent_turns, token_counter=estimate_tokens)
+
+    def test_everything_fits(self):
+        result = self._builder().build('系统', '你好', 10000, history=_history(5), knowledge=_chunks(2))
+        report = result.report
+        assert report['turns_included'] == 5
+        assert report['chunks_included'] == 2
+        assert report['saved_tokens'] == 0
+        assert report['prompt_tokens'] == report['naive_tokens']
+
+    def test_priority_under_tight_budget(self):
+        builder = self._builder()
+        # 足够放下最近两轮 + 一条知识，放不下更早的对话
+        budget = 150
+        result = builder.build('系统', '你好', budget, history=_history(6), knowledge=_chunks(3))
+        report = result.report
+        assert report['turns_included'] == 2
+        assert report['chunks_included'] == 1
+        assert "问题5" in result.prompt and "问题4" in result.prompt
+        assert "问题3" not in result.prompt
+        assert report['prompt_tokens'] <= budget
+        assert report['saved_tokens'] == report['naive_tokens'] - report['prompt_tokens'] > 0
+
+    def test_summary_replaces_covered_turns(self):
+        builder = self._builder()
+        result = builder.build('系统', '你好', 10000, history=_history(6),
+                               summary='早先讨论了项目计划', summary_turns=3)
+        report = result.report
+        assert report['summary_used']
+        assert report['turns_summarized'] == 3
+        # 摘要覆盖前三轮，第 4 轮尚未摘要，原文保留
+        assert report['turns_included'] == 3
+        assert "早先讨论了项目计划" in result.prompt
+        assert "问题2" not in result.prompt and "问题3" in result.prompt
+        assert report['saved_tokens'] > 0
+
+
+def _reply(messages):
+    """摘要请求返回固定摘要，其余请求返回较长的回答"""
+    if '压缩对话历史' in messages[0]['content']:
+        return '用户在规划旅行'
+    return '好的 ' + 'r' * 40
+
+
+class TestSmartChatContext:
+    """SmartChatAgent 集成测试"""
+
+    def test_running_summary_and_savings(self, mock_llm_service, mock_llm_provider):
+        provider = mock_llm_provider(reply=_reply)
+        service = mock_llm_service(provider)
+        billed = []
+        agent = SmartChatAgent(service, config={'recent_turns': 2, 'max_history_turns': 5},
+                               on_summary_usage=lambda *args: billed.append(args))
+        agent.set_user_info('user-1', 'device-1')
+
+        async def run():
+            for i in range(8):
+                await agent.chat(f"第{i}个问题 " + 'x' * 200, use_knowledge=False)
+                if agent._summary_task:
+                    await agent._summary_task
+
+        asyncio.run(run())
+
+        # 8 轮后历史只保留 5 轮，最早的轮次已由摘要覆盖
+        assert len(agent.conversation_history) == 10
+        assert agent.running_summary == '用户在规划旅行'
+        assert agent.summary_covered_turns == 6
+        assert agent.summary_tokens_used > 0
+        # 后台摘要的用量按触发它的用户单独计费
+        assert billed and all(b[:2] == ('user-1', 'device-1') for b in billed)
+        assert sum(b[2]['total_tokens'] for b in billed) == agent.summary_tokens_used
+
+        # 最后一次对话请求（不含摘要请求）的提示词
+        chat_calls = [m for m in provider.calls if '压缩对话历史' not in m[0]['content']]
+        last_prompt = chat_calls[-1][-1]['content']
+        assert '用户在规划旅行' in last_prompt
+        assert '第6个问题' in last_prompt
+        assert '第3个问题' not in last_prompt
+
+        summary = agent.get_conversation_summary()['context']
+        assert summary['totals']['requests'] == 8
+        assert summary['last_request']['summary_used']
+        assert summary['totals']['saved_tokens'] > 0
+
+        agent.clear_history()
+        assert agent.running_summary is None
+        assert agent.summary_covered_turns == 0
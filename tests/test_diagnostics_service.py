@@ -0,0 +1,104 @@
+"""
+运行时诊断服务测试
+验证栈采样输出的折叠栈格式和 tracemalloc 快照对比
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.diagnostics_service import DiagnosticsService, ProfilerBusyError
+
+
+def _busy_worker(stop_event: threading.Event):
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+class TestStackSampler:
+    """栈采样器测试"""
+
+    def test_samples_named_thread_as_collapsed_stacks(self):
+        service = DiagnosticsService()
+        stop_event = threading.Event()
+        worker = threading.Thread(target=_busy_worker, args=(stop_event,), name="AudioConsumer", daemon=True)
+        worker.start()
+        try:
+            result = service.profile(0.2, interval_ms=2)
+        finally:
+            stop_event.set()
+            worker.join()
+
+        assert result['samples'] > 0
+        assert 'AudioConsumer' in result['threads']
+
+        text = service.sampler.to_collapsed(result['stacks'])
+        worker_lines = [line for line in text.splitlines() if line.startswith('AudioConsumer;')]
+        assert worker_lines
+        for line in worker_lines:
+            stack, count = line.rsplit(' ', 1)
+            assert int(count) > 0
+            assert '_busy_worker' in stack
+
+    def test_rejects_concurrent_profile(self):
+        service = DiagnosticsService()
+        runner = threading.Thread(target=service.profile, args=(0.3,), daemon=True)
+        runner.start()
+        time.sleep(0.05)
+        with pytest.raises(ProfilerBusyError):
+            service.profile(0.1)
+        runner.join()
+
+    def test_rejects_invalid_duration(self):
+        service = DiagnosticsService()
+        with pytest.raises(ValueError):
+            service.profile(0)
+        with pytest.raises(ValueError):
+            service.profile(DiagnosticsService.MAX_SAMPLE_SECONDS + 1)
+
+
+class TestMemorySnapshots:
+    """内存快照测试"""
+
+    def test_diff_reports_growth(self):
+        service = DiagnosticsService(max_snapshots=3)
+        service.memory.start(nframes=5)
+        try:
+            base = service.memory.take('base')
+            retained = [bytearray(1024) for _ in range(200)]
+            target = service.memory.take('target')
+
+            diff = service.memory.diff(base['id'], target['id'], path_filters=['test_diagnostics_service.py'])
+            assert diff['total_size_diff'] >= 200 * 1024
+            assert diff['stats'][0]['size_diff'] > 0
+            assert len(retained) == 200
+        finally:
+            service.memory.stop()
+
+    def test_evicts_oldest_snapshot(self):
+        service = DiagnosticsService(max_snapshots=2)
+        service.memory.start(nframes=1)
+        try:
+            first = service.memory.take()
+            service.memory.take()
+            service.memory.take()
+            ids = [item['id'] for item in service.memory.list()]
+            assert first['id'] not in ids
+            with pytest.raises(KeyError):
+                service.memory.diff(first['id'])
+        finally:
+            service.memory.stop()
+
+    def test_probes_isolate_failures(self):
+        service = DiagnosticsService()
+        service.register_probe('ok', lambda: {'size': 1})
+        service.register_probe('broken', lambda: 1 / 0)
+        probes = service.collect_probes()
+        assert probes['ok'] == {'size': 1}
+        assert 'error' in probes['broken']
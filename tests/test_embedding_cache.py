@@ -0,0 +1,60 @@
+"""
+Embedding 向量缓存测试
+验证 float16 持久化、按模型隔离，以及只对未缓存的文本块计算向量
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.embedding_cache import EmbeddingCache, chunk_hash
+
+
+class CountingEncoder:
+    """模拟 Embedding 模型：记录被编码的文本"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(t), 0.5, -0.25] for t in texts], dtype=np.float32)
+
+
+class TestEmbeddingCache:
+    """向量缓存"""
+
+    def test_only_new_chunks_encoded(self, tmp_path):
+        cache = EmbeddingCache(tmp_path / 'cache.db')
+        encoder = CountingEncoder()
+
+        first, hits = cache.encode('m', ['甲', '乙乙', '甲'], encoder)
+        assert hits == 0
+        # 同一批内重复的文本块只计算一次
+        assert encoder.calls == [['甲', '乙乙']]
+        assert first[0] == first[2] == [1.0, 0.5, -0.25]
+
+        second, hits = cache.encode('m', ['乙乙', '丙丙丙'], encoder)
+        assert hits == 1
+        assert encoder.calls[-1] == ['丙丙丙']
+        assert second == [[2.0, 0.5, -0.25], [3.0, 0.5, -0.25]]
+
+    def test_persistent_and_model_scoped(self, tmp_path):
+        vector = np.linspace(-1, 1, 384, dtype=np.float32)
+        EmbeddingCache(tmp_path / 'cache.db').put_many('m', {chunk_hash('文本'): vector})
+
+        cache = EmbeddingCache(tmp_path / 'cache.db')
+        found = cache.get_many('m', [chunk_hash('文本')])
+        restored = found[chunk_hash('文本')]
+        assert restored.dtype == np.float32
+        assert np.allclose(restored, vector, atol=1e-3)
+        assert cache.get_many('other-model', [chunk_hash('文本')]) == {}
+
+        stats = cache.get_stats()
+        assert stats['entries'] == 1
+        assert stats['vector_bytes'] == 384 * 2
+        assert stats['hits'] == 1 and stats['misses'] == 1
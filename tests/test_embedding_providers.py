@@ -0,0 +1,68 @@
+"""
+Embedding 提供商测试
+验证 ONNX 后端的池化 / 归一化，以及（依赖与模型可用时）int8 ONNX 与 PyTorch 向量的一致性
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.providers.embedding import create_embedding_provider, get_embedding_provider_class
+from src.providers.embedding.onnx_provider import l2_normalize, mean_pool
+
+PARITY_TEXTS = [
+    '本项目的总预算为一百二十万元，其中研发人力占六成。',
+    'MV-2048X 支持双麦克风降噪，续航时间约为二十小时。',
+    'The ASR pipeline streams 16 kHz mono PCM audio over a WebSocket.',
+    'Recordings are stored locally by default and never uploaded without consent.',
+    '快捷键 Ctrl+Shift+S 生成小结。',
+]
+
+
+class TestPooling:
+    """均值池化与归一化"""
+
+    def test_mean_pool_ignores_padding(self):
+        hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+        mask = np.array([[1, 1, 0]])
+        assert np.allclose(mean_pool(hidden, mask), [[2.0, 3.0]])
+        assert np.allclose(np.linalg.norm(l2_normalize(np.array([[3.0, 4.0]])), axis=1), 1.0)
+
+    def test_registry(self):
+        assert get_embedding_provider_class('onnx').__name__ == 'ONNXEmbeddingProvider'
+        with pytest.raises(ValueError):
+            create_embedding_provider('unknown', 'all-MiniLM-L6-v2')
+
+
+class TestParity:
+    """int8 ONNX 与 PyTorch 向量一致性（需要 sentence-transformers、onnxruntime 和模型文件）"""
+
+    def test_onnx_int8_matches_pytorch(self, tmp_path):
+        pytest.importorskip('sentence_transformers')
+        pytest.importorskip('onnxruntime')
+
+        torch_provider = create_embedding_provider('sentence_transformers', 'all-MiniLM-L6-v2')
+        onnx_provider = create_embedding_provider(
+            'onnx', 'all-MiniLM-L6-v2', {'quantize': True, 'quantized_dir': str(tmp_path)}
+        )
+        try:
+            torch_provider.load()
+            onnx_provider.load()
+        except Exception as e:
+            pytest.skip(f"模型不可用: {e}")
+
+        expected = torch_provider.encode(PARITY_TEXTS)
+        actual = onnx_provider.encode(PARITY_TEXTS)
+        assert actual.shape == expected.shape
+
+        cosine = (l2_normalize(expected) * l2_normalize(actual)).sum(axis=1)
+        assert cosine.min() > 0.98
+
+        # 检索排序保持一致：每个文本与自身在另一后端中的向量最相似
+        similarity = l2_normalize(actual) @ l2_normalize(expected).T
+        assert (similarity.argmax(axis=1) == np.arange(len(PARITY_TEXTS))).all()
@@ -0,0 +1,130 @@
+"""
+Embedding 工作进程测试
+验证子进程计算的向量与进程内一致、并发请求合并成批、加载后预热、崩溃后自动重启
+"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.providers.embedding import BaseEmbeddingProvider, ProcessEmbeddingProvider
+
+
+class FakeProvider(BaseEmbeddingProvider):
+    """模拟提供商（在工作进程中创建）：向量由文本长度决定，每次 encode 把文本写入日志文件"""
+
+    @property
+    def name(self) -> str:
+        return "fake"
+
+    @classmethod
+    def is_installed(cls) -> bool:
+        return True
+
+    @property
+    def is_loaded(self) -> bool:
+        return True
+
+    def load(self):
+        pass
+
+    def encode(self, texts):
+        with open(self.options['log'], 'a', encoding='utf-8') as f:
+            f.write(f"{os.getpid()}\t{'|'.join(texts)}\n")
+        if '__error__' in texts:
+            raise ValueError('bad input')
+        crash_marker = Path(self.options['log'] + '.crashed')
+        if '__crash_once__' in texts and not crash_marker.exists():
+            crash_marker.touch()
+            os._exit(3)
+        return np.array([[float(len(t)), float(i)] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+def _read_log(path):
+    return [line.rstrip('\n').split('\t') for line in open(path, encoding='utf-8')]
+
+
+@pytest.fixture
+def worker(tmp_path):
+    log = str(tmp_path / 'encode.log')
+    provider = ProcessEmbeddingProvider(
+        FakeProvider('fake-model', {'log': log}),
+        {'batch_wait_ms': 100, 'max_restarts': 2, 'request_timeout_seconds': 30, 'load_timeout_seconds': 60},
+    )
+    yield provider, log
+    provider.close()
+
+
+class TestProcessEmbeddingProvider:
+    """子进程 Embedding"""
+
+    def test_encode_and_warmup(self, worker):
+        provider, log = worker
+        assert provider.cache_key == 'fake-model#fake'
+
+        vectors = provider.encode(['甲', 'abc'])
+        assert vectors.dtype == np.float32
+        assert np.array_equal(vectors, [[1.0, 0.0], [3.0, 1.0]])
+        assert provider.encode([]).shape[0] == 0
+
+        entries = _read_log(log)
+        assert entries[0][1] == 'warmup'
+        assert int(entries[0][0]) == provider.get_stats()['pid'] != os.getpid()
+
+    def test_concurrent_requests_batched(self, worker):
+        provider, log = worker
+        provider.load()
+        results = {}
+
+        def call(i):
+            results[i] = provider.encode([f'text-{i}' * (i + 1)])
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # 每个调用方拿到自己的向量
+        for i in range(8):
+            assert results[i].shape == (1, 2)
+            assert results[i][0][0] == len(f'text-{i}') * (i + 1)
+        stats = provider.get_stats()
+        assert stats['requests'] == 8
+        assert stats['batches'] < 8
+        assert stats['avg_batch_texts'] > 1
+
+    def test_restart_after_crash(self, worker):
+        provider, log = worker
+        provider.load()
+        first_pid = provider.get_stats()['pid']
+
+        vectors = provider.encode(['__crash_once__', 'ok'])
+        assert vectors[:, 0].tolist() == [14.0, 2.0]
+        stats = provider.get_stats()
+        assert stats['restarts'] == 1
+        assert stats['pid'] != first_pid and stats['alive']
+        # 新进程加载后重新预热
+        assert [entry[1] for entry in _read_log(log) if entry[0] == str(stats['pid'])][0] == 'warmup'
+
+    def test_encode_error_does_not_restart(self, worker):
+        provider, log = worker
+        with pytest.raises(RuntimeError, match='bad input'):
+            provider.encode(['__error__'])
+        assert provider.get_stats()['restarts'] == 0
+        assert provider.encode(['x']).shape == (1, 2)
+
+    def test_closed(self, worker):
+        provider, log = worker
+        provider.encode(['x'])
+        provider.close()
+        assert not provider.is_loaded
+        with pytest.raises(RuntimeError):
+            provider.encode(['x'])
@@ -0,0 +1,148 @@
+"""
+图片存储测试
+验证内容寻址去重、ETag 计算、缩略图生成以及删除记录时保留共享图片
+"""
+
+import io
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.image_store_service import (
+    ImageStoreService, ImageTooLargeError, UnsupportedImageTypeError, PIL_AVAILABLE
+)
+from src.providers.storage.sqlite import SQLiteStorageProvider
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+class TestImageStore:
+    """内容寻址图片存储测试"""
+
+    def test_same_content_is_stored_once(self, tmp_path):
+        store = ImageStoreService(tmp_path / 'images', thumbnail_widths=())
+        try:
+            data = PNG_HEADER + b'x' * 1000
+            first = asyncio.run(store.save_bytes(data))
+            second = asyncio.run(store.save_bytes(data))
+        finally:
+            store.shutdown()
+
+        assert first['image_url'] == second['image_url']
+        assert first['filename'].endswith('.png')
+        assert not first['deduplicated']
+        assert second['deduplicated']
+        # 不残留临时文件
+        assert [p.name for p in (tmp_path / 'images').iterdir()] == [first['filename']]
+
+    def test_rejects_oversized_upload(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ImageStoreService, 'MAX_IMAGE_SIZE', 10)
+        store = ImageStoreService(tmp_path, thumbnail_widths=())
+        try:
+            with pytest.raises(ImageTooLargeError):
+                asyncio.run(store.save_bytes(PNG_HEADER + b'too large'))
+        finally:
+            store.shutdown()
+        assert list(tmp_path.iterdir()) == []
+
+    def test_rejects_svg(self, tmp_path):
+        store = ImageStoreService(tmp_path, thumbnail_widths=())
+        try:
+            for data in (b'<svg onload="alert(1)"></svg>', b'  <?xml version="1.0"?><svg/>'):
+                with pytest.raises(UnsupportedImageTypeError):
+                    asyncio.run(store.save_bytes(data))
+        finally:
+            store.shutdown()
+        assert list(tmp_path.iterdir()) == []
+
+    def test_etag_and_cache_policy(self, tmp_path):
+        store = ImageStoreService(tmp_path, thumbnail_widths=())
+        try:
+            saved = asyncio.run(store.save_bytes(b'\xff\xd8\xff' + b'jpeg'))
+            legacy = tmp_path / '1700000000-abcd1234.png'
+            legacy.write_bytes(PNG_HEADER)
+
+            etag = store.get_etag(saved['filename'], store.resolve(saved['filename']))
+            assert etag == f'"{saved["sha256"]}"'
+            assert store.etag_matches(f'W/{etag}, "other"', etag)
+            assert not store.etag_matches('"other"', etag)
+            assert 'immutable' in store.get_cache_control(saved['filename'])
+            assert store.get_cache_control(legacy.name) == 'no-cache'
+            assert store.resolve('../secret') is None
+        finally:
+            store.shutdown()
+
+    @pytest.mark.skipif(not PIL_AVAILABLE, reason="Pillow 未安装")
+    def test_thumbnail_generated_in_background(self, tmp_path):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 500), 'red').save(buffer, format='PNG')
+        store = ImageStoreService(tmp_path, thumbnail_widths=(320,))
+        try:
+            saved = asyncio.run(store.save_bytes(buffer.getvalue()))
+            deadline = time.time() + 5
+            thumb = None
+            while time.time() < deadline and thumb is None:
+                thumb = store.get_thumbnail(saved['filename'], store.normalize_width(300))
+                time.sleep(0.05)
+        finally:
+            store.shutdown()
+
+        assert thumb is not None
+        with Image.open(thumb) as img:
+            assert img.size == (320, 160)
+
+
+class TestSharedImageDeletion:
+    """删除记录时保留仍被引用的图片"""
+
+    def test_shared_image_kept_until_last_reference(self, tmp_path):
+        storage = SQLiteStorageProvider()
+        storage.initialize({'data_dir': str(tmp_path), 'database': 'history.db', 'images': 'images'})
+        images_dir = tmp_path / 'images'
+        images_dir.mkdir()
+        image = images_dir / ('a' * 64 + '.png')
+        image.write_bytes(PNG_HEADER)
+
+        metadata = {'blocks': [{'type': 'image', 'imageUrl': f'images/{image.name}'}]}
+        first = storage.save_record('第一条', dict(metadata))
+        second = storage.save_record('第二条', dict(metadata))
+
+        assert storage.delete_record(first)
+        assert image.exists()
+
+        assert storage.delete_record(second)
+        assert not image.exists()
+
+
+class TestOrphanCleanup:
+    """孤儿图片清理"""
+
+    def test_skips_in_flight_uploads(self, tmp_path):
+        from src.services.cleanup_service import CleanupService
+
+        storage = SQLiteStorageProvider()
+        storage.initialize({'data_dir': str(tmp_path), 'database': 'history.db', 'images': 'images'})
+        images_dir = tmp_path / 'images'
+        images_dir.mkdir()
+        kept = images_dir / ('a' * 64 + '.png')
+        orphan = images_dir / ('b' * 64 + '.png')
+        uploading = images_dir / '.upload-tmp123'
+        for path in (kept, orphan, uploading):
+            path.write_bytes(PNG_HEADER)
+        storage.save_record('图片', {'blocks': [{'type': 'image', 'imageUrl': f'images/{kept.name}'}]})
+
+        service = CleanupService({'storage': {'data_dir': str(tmp_path), 'database': 'history.db',
+                                              'images': 'images'}})
+        result = asyncio.run(service._cleanup_orphan_images())
+
+        assert result['deleted'] == 1
+        assert kept.exists() and uploading.exists()
+        assert not orphan.exists()
@@ -0,0 +1,88 @@
+"""
+知识库流式导入测试
+验证流式分块与整篇分块结果一致、按批写入与进度事件，以及中断后断点续传
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.text_chunker import estimate_tokens, iter_chunks
+
+
+def _text():
+    return ''.join(f'第{i}段说明了预算和进度安排。' * 3 + '\n\n' for i in range(120))
+
+
+class TestStreamingChunker:
+    """流式分块"""
+
+    def test_pieces_do_not_change_chunks(self):
+        text = _text()
+        whole = list(iter_chunks([text], 100, 20))
+        pieces = [text[i:i + 37] for i in range(0, len(text), 37)]
+        assert list(iter_chunks(pieces, 100, 20)) == whole
+        assert all(estimate_tokens(chunk) <= 100 for chunk in whole)
+        assert list(iter_chunks(['短文本'], 100, 20)) == ['短文本']
+        assert list(iter_chunks(['', '  '], 100, 20)) == []
+
+
+class TestIngestPipeline:
+    """按批导入与断点续传"""
+
+    def test_upload_writes_batches(self, make_knowledge_service):
+        service = make_knowledge_service(embed_batch_size=4)
+        collection = service.collection
+        text = _text()
+
+        result = asyncio.run(service.upload_file('plan.md', text, metadata={'tag': '计划'}))
+        expected = service._chunk_text(text)
+        assert result['chunks'] == len(expected)
+        assert collection.upserts == -(-len(expected) // 4)
+        assert [collection.rows[f"{result['file_id']}_chunk_{i}"][0] for i in range(len(expected))] == expected
+
+        entry = service.manifest.get(result['file_id'])
+        assert entry['status'] == 'ready' and entry['chunks'] == len(expected)
+        assert service.lexical_index.count() == len(expected)
+        assert entry['content_hash'] is not None
+
+    def test_resume_after_failure(self, make_knowledge_service):
+        service = make_knowledge_service(embed_batch_size=4)
+        collection = service.collection
+        collection.fail_on_upsert = 3
+        content = _text().encode('utf-8')
+
+        async def read_all():
+            state = {'pos': 0}
+
+            async def read(size):
+                data = content[state['pos']:state['pos'] + size]
+                state['pos'] += size
+                return data
+            return await service.save_upload_stream('plan.txt', read, read_size=1000)
+
+        async def collect(file_id):
+            events = []
+            try:
+                async for event in service.ingest_file(file_id):
+                    events.append(event)
+            except RuntimeError:
+                events.append({'event': 'error'})
+            return events
+
+        file_id = asyncio.run(read_all())
+        first = asyncio.run(collect(file_id))
+        assert [e['event'] for e in first] == ['started', 'progress', 'progress', 'error']
+        entry = service.manifest.get(file_id)
+        assert entry['status'] == 'failed' and entry['ingested_chunks'] == 8
+
+        second = asyncio.run(collect(file_id))
+        assert second[0]['resume_from'] == 8
+        assert second[-1]['event'] == 'done'
+        # 续传只写入剩余的文本块
+        total = len(service._chunk_text(content.decode('utf-8')))
+        assert second[-1]['chunks'] == total == len(collection.rows)
+        assert collection.upserts == 3 + -(-(total - 8) // 4)
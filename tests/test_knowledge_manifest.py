@@ -0,0 +1,45 @@
+"""
+知识库文件清单测试
+验证增删查以及从文本块元数据重建清单
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.knowledge_manifest import KnowledgeManifest
+
+
+class TestKnowledgeManifest:
+    """文件清单"""
+
+    def test_add_list_remove(self, tmp_path):
+        manifest = KnowledgeManifest(tmp_path / 'manifest.db')
+        manifest.add('f1', 'a.md', 3, 1200, content_hash='h1', metadata={'tag': '会议'}, created_at=1.0)
+        manifest.add('f2', 'b.txt', 1, 20, created_at=2.0)
+
+        files = manifest.list()
+        assert [f['file_id'] for f in files] == ['f1', 'f2']
+        assert files[0]['metadata'] == {'tag': '会议'}
+        assert files[0]['chunks'] == 3 and files[0]['size'] == 1200
+
+        assert manifest.remove('f1') is True
+        assert manifest.remove('f1') is False
+        assert manifest.get('f1') is None
+        assert manifest.count() == 1
+
+    def test_rebuild_from_chunks(self, tmp_path):
+        manifest = KnowledgeManifest(tmp_path / 'manifest.db')
+        metadatas = [
+            {'file_id': 'f1', 'filename': 'a.md', 'chunk_index': 0, 'total_chunks': 2, 'tag': 'x'},
+            {'file_id': 'f1', 'filename': 'a.md', 'chunk_index': 1, 'total_chunks': 2, 'tag': 'x'},
+            {'file_id': 'f2', 'filename': 'b.md', 'chunk_index': 0},
+            {'filename': 'orphan.md'},
+        ]
+        assert manifest.rebuild(metadatas, sizes={'f1': 99}) == 2
+
+        f1 = manifest.get('f1')
+        assert f1['chunks'] == 2 and f1['size'] == 99 and f1['metadata'] == {'tag': 'x'}
+        assert manifest.get('f2')['chunks'] == 1
@@ -0,0 +1,91 @@
+"""
+知识库词法索引测试
+验证中英文分词、FTS5 检索与替换/删除，以及倒数排名融合
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+class TestTokenize:
+    """分词"""
+
+    def test_cjk_and_codes(self):
+        tokens = tokenize('项目预算 MV-2048X')
+        assert '预算' in tokens and '项' in tokens
+        assert 'mv-2048x' in tokens and '2048x' in tokens
+
+
+class TestLexicalIndex:
+    """FTS5 检索"""
+
+    def test_search_replace_delete(self, tmp_path):
+        index = LexicalIndex(tmp_path / 'lexical.db')
+        index.add([
+            ('f1_chunk_0', 'f1', '本项目的总预算为一百二十万元'),
+            ('f1_chunk_1', 'f1', 'MV-2048X 支持离线转写'),
+            ('f2_chunk_0', 'f2', 'Error E2003 means the websocket was closed'),
+        ])
+        assert index.search('项目预算是多少')[0][0] == 'f1_chunk_0'
+        assert index.search('2048X 离线')[0][0] == 'f1_chunk_1'
+        assert index.search('e2003')[0][0] == 'f2_chunk_0'
+        assert index.search('"') == []
+
+        # 同 ID 重新写入时替换内容
+        index.add([('f1_chunk_0', 'f1', '人员安排')])
+        assert index.search('预算') == []
+        assert index.count() == 3
+
+        index.delete_file('f1')
+        assert index.count() == 1
+        assert index.search('人员安排') == []
+
+
+class TestRankFusion:
+    """倒数排名融合"""
+
+    def test_rrf(self):
+        fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['c', 'a']], k=60)
+        assert [item_id for item_id, _ in fused] == ['a', 'c', 'b']
+        assert fused[0][1] == 1 / 61 + 1 / 62
+
+
+# 语义检索固定返回 ['b', 'a']
+CHUNKS = [
+    ('a', 'MV-2048X 续航二十小时', {'file_id': 'f1', 'filename': 'mv.md'}, 0.4),
+    ('b', 'Battery life of recorders', {'file_id': 'f2', 'filename': 'en.md'}, 0.2),
+]
+
+
+class TestHybridSearch:
+    """KnowledgeService 混合检索"""
+
+    def test_modes(self, make_knowledge_service):
+        service = make_knowledge_service(chunks=CHUNKS, search_mode='hybrid')
+
+        vector = asyncio.run(service.search('MV-2048X 续航', top_k=2, mode='vector'))
+        assert [r['id'] for r in vector] == ['b', 'a']
+
+        lexical = asyncio.run(service.search('MV-2048X 续航', top_k=2, mode='lexical'))
+        assert [r['id'] for r in lexical] == ['a']
+        assert lexical[0]['score'] == 1.0 and lexical[0]['bm25'] > 0
+        assert lexical[0]['source'] == 'mv.md'
+
+        # 分数相对最佳命中归一化到 0~1
+        both = asyncio.run(service.search('续航 Battery recorders', top_k=2, mode='lexical'))
+        assert len(both) == 2 and both[0]['score'] == 1.0
+        assert 0 < both[1]['score'] <= 1.0
+
+        hybrid = asyncio.run(service.search('MV-2048X 续航', top_k=2))
+        assert [r['id'] for r in hybrid] == ['a', 'b']
+        assert hybrid[0]['vector_rank'] == 2 and hybrid[0]['lexical_rank'] == 1
+        assert hybrid[1]['lexical_rank'] is None
+
+        filtered = asyncio.run(service.search('MV-2048X', top_k=2, mode='lexical', filter_metadata={'file_id': 'f2'}))
+        assert filtered == []
@@ -0,0 +1,148 @@
+"""
+滚动小结服务测试
+验证按条数触发增量更新、每次只发送上一版小结和新增文本、停止后生成最终小结
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.live_summary_service import LiveSummaryService
+
+
+class VersionedReply:
+    """返回带版本号的小结，可指定失败次数"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.version = 0
+
+    async def __call__(self, messages):
+        await asyncio.sleep(0.005)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("temporary failure")
+        self.version += 1
+        return f"小结v{self.version}"
+
+
+@pytest.fixture
+def make_service(mock_llm_service, mock_llm_provider):
+    """创建滚动小结服务：make_service(failures=0, **config)，返回 (服务, 推送记录, 模拟提供商)"""
+    def make(failures=0, **config):
+        provider = mock_llm_provider(reply=VersionedReply(failures))
+        updates = []
+        service = LiveSummaryService(
+            mock_llm_service(provider),
+            {'enabled': True, 'every_utterances': 3, 'every_seconds': 3600, **config},
+            on_update=updates.append
+        )
+        return service, updates, provider
+    return make
+
+
+async def _idle(service):
+    for _ in range(200):
+        await asyncio.sleep(0.01)
+        if not service._running:
+            return
+
+
+class TestLiveSummary:
+    """滚动小结测试"""
+
+    def test_incremental_updates_and_final(self, make_service):
+        service, updates, provider = make_service()
+
+        async def run():
+            service.start('voice-note', asyncio.get_running_loop())
+            for i in range(7):
+                service.add_utterance(f"第{i}句")
+                await _idle(service)
+            service.finish()
+            await _idle(service)
+
+        asyncio.run(run())
+
+        assert len(provider.prompts) == 3
+        # 第二次更新只包含上一版小结和新增的三句
+        assert '小结v1' in provider.prompts[1]
+        assert '第3句' in provider.prompts[1] and '第0句' not in provider.prompts[1]
+        assert '第6句' in provider.prompts[2]
+
+        state = service.get_state()
+        assert state['final'] is True
+        assert state['summary'] == '小结v3'
+        assert state['covered_utterances'] == 7
+        assert state['total_tokens'] == 45
+        assert updates[-1]['final'] is True
+        assert all(u['usage'] == {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}
+                   for u in updates[:-1])
+
+    def test_late_utterance_updates_final_summary(self, make_service):
+        service, _, provider = make_service()
+
+        async def run():
+            service.start('voice-note', asyncio.get_running_loop())
+            service.add_utterance("第一句")
+            service.finish()
+            await _idle(service)
+            # 停止后 ASR 返回的最后一句
+            service.add_utterance("最后一句")
+            await _idle(service)
+
+        asyncio.run(run())
+        assert len(provider.prompts) == 2
+        assert '最后一句' in provider.prompts[1]
+        assert service.get_state()['covered_utterances'] == 2
+
+    def test_failed_update_keeps_text(self, make_service):
+        service, _, provider = make_service(failures=1)
+
+        async def run():
+            service.start('voice-note', asyncio.get_running_loop())
+            for i in range(3):
+                service.add_utterance(f"第{i}句")
+            await _idle(service)
+            assert service.get_state()['pending_utterances'] == 3
+            service.finish()
+            await _idle(service)
+
+        asyncio.run(run())
+        assert len(provider.prompts) == 1
+        assert '第0句' in provider.prompts[0] and '第2句' in provider.prompts[0]
+
+    def test_failed_final_update_is_not_final(self, make_service):
+        service, updates, provider = make_service(failures=2)
+
+        async def run():
+            service.start('voice-note', asyncio.get_running_loop())
+            for i in range(3):
+                service.add_utterance(f"第{i}句")
+            await _idle(service)
+            service.finish()
+            await _idle(service)
+
+        asyncio.run(run())
+        state = service.get_state()
+        assert state['final'] is False and state['pending_utterances'] == 3
+        assert updates[-1]['error'] == 'final_update_failed'
+
+    def test_inactive_for_other_apps(self, make_service):
+        service, updates, provider = make_service()
+
+        async def run():
+            service.start('smart-chat', asyncio.get_running_loop())
+            for i in range(5):
+                service.add_utterance(f"第{i}句")
+            service.finish()
+            await _idle(service)
+
+        asyncio.run(run())
+        assert provider.prompts == []
+        assert updates == []
@@ -0,0 +1,103 @@
+"""
+LLM 响应缓存测试
+验证缓存键规范化、LRU/TTL 淘汰、流式回放以及命中时按 0 token 计费
+"""
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.llm_cache_service import LLMResponseCache, make_cache_key
+
+
+@pytest.fixture
+def cached_service(tmp_path, mock_llm_service, mock_llm_provider):
+    """开启响应缓存的 LLMService，模拟提供商回复“回复:<最后一条消息>”"""
+    provider = mock_llm_provider(reply=lambda messages: f"回复:{messages[-1]['content']}")
+    return mock_llm_service(provider, {
+        'storage.data_dir': str(tmp_path),
+        'llm_cache': {'enabled': True},
+        'llm.model': 'test-model',
+    })
+
+
+class TestCacheKey:
+    """缓存键测试"""
+
+    def test_whitespace_normalized(self):
+        a = make_cache_key('m', [{'role': 'user', 'content': ' 你好  \t世界\n再见 \r\n'}], 0.5, 100)
+        b = make_cache_key('m', [{'role': 'user', 'content': '你好 世界\n再见'}], 0.5000001, 100)
+        assert a == b
+        # 换行保留：行结构不同的输入不共用缓存
+        assert a != make_cache_key('m', [{'role': 'user', 'content': '你好 世界 再见'}], 0.5, 100)
+        assert a != make_cache_key('m', [{'role': 'user', 'content': '你好 世界'}], 0.7, 100)
+        assert a != make_cache_key('other', [{'role': 'user', 'content': '你好 世界'}], 0.5, 100)
+
+
+class TestResponseCache:
+    """SQLite 缓存测试"""
+
+    def test_lru_eviction_and_ttl(self, tmp_path):
+        cache = LLMResponseCache(tmp_path / 'cache.db', max_entries=2, ttl_seconds=3600)
+        cache.put('a', 'm', 'A')
+        time.sleep(0.01)
+        cache.put('b', 'm', 'B')
+        time.sleep(0.01)
+        assert cache.get('a')['response'] == 'A'  # 访问 a，b 成为最久未使用
+        time.sleep(0.01)
+        cache.put('c', 'm', 'C')
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+
+        cache.ttl_seconds = 0
+        assert cache.get('c') is None
+        stats = cache.get_stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 2
+        assert stats['evictions'] == 1
+        assert stats['hit_rate'] == 0.5
+
+
+class TestLLMServiceCache:
+    """LLMService 缓存集成测试"""
+
+    def test_non_stream_hit_is_free(self, cached_service):
+        service = cached_service
+        messages = [{'role': 'user', 'content': '翻译这句话'}]
+
+        async def call():
+            with service.track_usage() as usage:
+                text = await service.chat(messages, temperature=0.3, cache=True)
+            return text, usage
+
+        first, first_usage = asyncio.run(call())
+        second, second_usage = asyncio.run(call())
+
+        assert first == second
+        assert len(service.llm_provider.calls) == 1
+        assert first_usage.total_tokens == 15
+        assert second_usage.to_usage() == {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        assert second_usage.cached_calls == 1
+        assert service.get_cache_stats()['tokens_saved'] == 15
+
+        # 未开启缓存的调用不受影响
+        asyncio.run(service.chat(messages, temperature=0.3))
+        assert len(service.llm_provider.calls) == 2
+
+    def test_stream_replay(self, cached_service):
+        service = cached_service
+
+        async def collect():
+            result = await service.simple_chat('你好', system_prompt='助手', stream=True, cache=True)
+            return [chunk async for chunk in result]
+
+        first = asyncio.run(collect())
+        second = asyncio.run(collect())
+        assert ''.join(first) == ''.join(second) == '回复:你好'
+        assert len(service.llm_provider.calls) == 1
@@ -0,0 +1,143 @@
+"""
+多端点 LLM 路由测试
+验证首 token 前失败自动切换、连续失败熔断、对冲请求取消落败方，以及按实际服务端点计费
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.providers.llm.base_llm import BaseLLMProvider, LLMResponse
+from src.providers.llm.router_provider import LLMRouterProvider
+
+
+class MockEndpoint(BaseLLMProvider):
+    """模拟端点：按 base_url 查表得到首 token 延迟和是否失败"""
+
+    behaviors = {}
+
+    def initialize(self, config):
+        super().initialize(config)
+        self.calls = 0
+        self.closed = 0
+        return True
+
+    async def chat_with_usage(self, messages, stream=False, **kwargs):
+        delay, fail = self.behaviors[self._config['base_url']]
+        self.calls += 1
+        usage = {'prompt_tokens': 10, 'completion_tokens': 2, 'total_tokens': 12}
+        if not stream:
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError(f"{self._config['base_url']} unavailable")
+            return LLMResponse(text=self._config['base_url'], usage=usage)
+
+        result = LLMResponse()
+
+        async def _stream():
+            try:
+                await asyncio.sleep(delay)
+                if fail:
+                    raise RuntimeError(f"{self._config['base_url']} unavailable")
+                for piece in ('a', 'b'):
+                    yield piece
+                result.usage = usage
+            finally:
+                self.closed += 1
+        result.stream = _stream()
+        return result
+
+
+def _router(behaviors, **routing):
+    MockEndpoint.behaviors = behaviors
+    router = LLMRouterProvider(provider_factory=MockEndpoint)
+    config = {
+        'model': 'primary-model', 'provider': 'vendor-a', 'base_url': 'a',
+        'endpoints': [{'name': 'backup', 'model': 'backup-model', 'provider': 'vendor-b', 'base_url': 'b'}],
+        'routing': routing,
+    }
+    assert router.initialize(config)
+    return router
+
+
+def _stats(router, name):
+    return next(e for e in router.get_stats()['endpoints'] if e['name'] == name)
+
+
+class TestFailover:
+    """故障切换与熔断"""
+
+    def test_failover_and_billing_attribution(self, mock_llm_service):
+        router = _router({'a': (0, True), 'b': (0, False)})
+        service = mock_llm_service(router)
+
+        async def run():
+            with service.track_usage() as usage:
+                text = await service.chat([{'role': 'user', 'content': 'hi'}])
+            return text, usage
+
+        text, usage = asyncio.run(run())
+        assert text == 'b'
+        # 只计入实际服务的端点，model/provider 按该端点记录
+        assert usage.calls == 1
+        assert usage.to_usage() == {'prompt_tokens': 10, 'completion_tokens': 2, 'total_tokens': 12,
+                                    'model': 'backup-model', 'provider': 'vendor-b'}
+        assert _stats(router, 'primary')['failures'] == 1
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        router = _router({'a': (0, True), 'b': (0, False)}, failure_threshold=2)
+
+        async def run():
+            for _ in range(4):
+                await router.chat_with_usage([{'role': 'user', 'content': 'hi'}])
+
+        asyncio.run(run())
+        primary = _stats(router, 'primary')
+        # 连续失败两次后熔断，之后的请求直接发往备用端点
+        assert primary['requests'] == 2
+        assert primary['circuit_open']
+        assert _stats(router, 'backup')['successes'] == 4
+
+    def test_all_endpoints_failing_raises(self):
+        router = _router({'a': (0, True), 'b': (0, True)})
+        try:
+            asyncio.run(router.chat_with_usage([{'role': 'user', 'content': 'hi'}]))
+        except RuntimeError as e:
+            assert 'unavailable' in str(e)
+        else:
+            raise AssertionError("expected RuntimeError")
+
+
+class TestHedging:
+    """对冲请求"""
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        router = _router({'a': (1.0, False), 'b': (0.01, False)}, hedge_after_ms=30)
+
+        async def run():
+            response = await router.chat_with_usage([{'role': 'user', 'content': 'hi'}], stream=True)
+            chunks = [chunk async for chunk in response.stream]
+            return chunks, response.usage
+
+        chunks, usage = asyncio.run(run())
+        assert chunks == ['a', 'b']
+        assert usage['model'] == 'backup-model' and usage['total_tokens'] == 12
+        primary, backup = router.endpoints
+        # 落败的主端点被取消并关闭流
+        assert primary.provider.closed == 1
+        assert _stats(router, 'primary')['cancelled'] == 1
+        assert _stats(router, 'backup')['hedge_wins'] == 1
+
+    def test_fast_primary_does_not_hedge(self):
+        router = _router({'a': (0, False), 'b': (0, False)}, hedge_after_ms=200)
+
+        async def run():
+            response = await router.chat_with_usage([{'role': 'user', 'content': 'hi'}], stream=True)
+            return [chunk async for chunk in response.stream]
+
+        assert asyncio.run(run()) == ['a', 'b']
+        assert router.endpoints[1].provider.calls == 0
+        assert _stats(router, 'primary')['latency_ms'] is not None
@@ -0,0 +1,99 @@
+"""
+LLM 模拟服务与事件循环延迟监控测试
+验证 LiteLLMProvider 可以通过 base_url 使用模拟服务（含流式 usage、首 token 延迟），
+以及延迟监控能发现阻塞事件循环的同步调用
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# 测试只访问本地模拟服务，不需要在导入时下载远程价格表
+os.environ.setdefault('LITELLM_LOCAL_MODEL_COST_MAP', 'True')
+litellm = pytest.importorskip("litellm")
+uvicorn = pytest.importorskip("uvicorn")
+
+from scripts.llm_stub_server import create_app
+from src.providers.llm.litellm_provider import LiteLLMProvider
+from src.services.diagnostics_service import EventLoopLagMonitor
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    app = create_app(first_token_ms=100, tokens_per_sec=200, completion_tokens=5)
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='error'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if server.started:
+            break
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def _provider(url):
+    provider = LiteLLMProvider()
+    assert provider.initialize({'model': 'openai/stub-model', 'api_key': 'stub', 'base_url': url})
+    return provider
+
+
+class TestStubServer:
+    """通过 LiteLLMProvider 调用模拟服务"""
+
+    def test_non_stream_usage(self, stub_url):
+        response = asyncio.run(_provider(stub_url).chat_with_usage(
+            [{'role': 'user', 'content': '你好'}], max_tokens=3))
+        assert response.text.split() == ['词0', '词1', '词2']
+        assert response.usage == {'prompt_tokens': 2, 'completion_tokens': 3, 'total_tokens': 5}
+
+    def test_stream_first_token_delay_and_usage(self, stub_url):
+        async def run():
+            start = time.perf_counter()
+            response = await _provider(stub_url).chat_with_usage(
+                [{'role': 'user', 'content': 'hello'}], stream=True)
+            ttft = None
+            chunks = []
+            async for chunk in response.stream:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                chunks.append(chunk)
+            return ttft, ''.join(chunks), response.usage
+
+        ttft, text, usage = asyncio.run(run())
+        assert ttft >= 0.1
+        assert text.split() == [f"词{i}" for i in range(5)]
+        assert usage['completion_tokens'] == 5
+
+
+class TestLoopLag:
+    """事件循环延迟监控"""
+
+    def test_detects_blocking_call(self):
+        async def run():
+            monitor = EventLoopLagMonitor(interval=0.01)
+            monitor.start()
+            await asyncio.sleep(0.05)
+            time.sleep(0.2)  # 阻塞事件循环
+            await asyncio.sleep(0.05)
+            stats = monitor.get_stats(reset=True)
+            monitor.stop()
+            return stats, monitor.get_stats()
+
+        stats, after_reset = asyncio.run(run())
+        assert stats['max_ms'] >= 150
+        assert stats['samples'] > 0
+        assert after_reset['samples'] == 0 and after_reset['max_ms'] == 0
@@ -0,0 +1,87 @@
+"""
+LLM 调用用量统计测试
+验证并发调用（含流式）各自返回独立的 token 用量，不会互相覆盖
+"""
+
+import sys
+import random
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+litellm = pytest.importorskip("litellm")
+
+from src.providers.llm.litellm_provider import LiteLLMProvider
+
+
+def _usage(n):
+    return SimpleNamespace(prompt_tokens=n, completion_tokens=1, total_tokens=n + 1)
+
+
+async def fake_acompletion(**params):
+    """用量 = 最后一条消息的长度，随机延迟以制造交错"""
+    n = len(params['messages'][-1]['content'])
+    await asyncio.sleep(random.uniform(0, 0.01))
+    if not params['stream']:
+        message = SimpleNamespace(content=f"ok{n}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(n))
+
+    async def chunks():
+        for piece in ('a', 'b'):
+            await asyncio.sleep(random.uniform(0, 0.005))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        # 最后一个 chunk 只携带 usage
+        yield SimpleNamespace(choices=[], usage=_usage(n))
+    return chunks()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(litellm, 'acompletion', fake_acompletion)
+    p = LiteLLMProvider()
+    assert p.initialize({'model': 'test/model'})
+    return p
+
+
+class TestPerCallUsage:
+    """每次调用独立统计用量"""
+
+    def test_concurrent_calls_keep_their_own_usage(self, provider):
+        async def call(n, stream):
+            response = await provider.chat_with_usage([{'role': 'user', 'content': 'x' * n}], stream=stream)
+            if stream:
+                text = ''.join([chunk async for chunk in response.stream])
+            else:
+                text = response.text
+            return text, response.usage['prompt_tokens']
+
+        async def run():
+            return await asyncio.gather(*(call(n, n % 2 == 0) for n in range(1, 21)))
+
+        for n, (text, prompt_tokens) in enumerate(asyncio.run(run()), 1):
+            assert prompt_tokens == n
+            assert text == ('ab' if n % 2 == 0 else f"ok{n}")
+
+    def test_service_attributes_usage_per_request(self, provider, mock_llm_service):
+        service = mock_llm_service(provider)
+
+        async def request(n):
+            # 模拟一个 HTTP 请求：一次非流式调用 + 一次流式调用
+            with service.track_usage() as usage:
+                await service.chat([{'role': 'user', 'content': 'x' * n}])
+                stream = await service.chat([{'role': 'user', 'content': 'y' * n}], stream=True)
+                async for _ in stream:
+                    pass
+            return usage
+
+        async def run():
+            return await asyncio.gather(*(request(n) for n in range(1, 11)))
+
+        for n, usage in enumerate(asyncio.run(run()), 1):
+            assert usage.calls == 2
+            assert usage.to_usage() == {'prompt_tokens': 2 * n, 'completion_tokens': 2, 'total_tokens': 2 * n + 2}
@@ -0,0 +1,96 @@
+"""
+笔记块规范化存储测试
+验证 record_blocks 增量同步、已有数据迁移、块级搜索以及删除记录时同步删除块
+"""
+
+import sys
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.providers.storage.sqlite import SQLiteStorageProvider
+
+
+def _block(block_id, content, **extra):
+    return {'id': block_id, 'type': 'paragraph', 'content': content, **extra}
+
+
+def _new_storage(tmp_path):
+    provider = SQLiteStorageProvider()
+    provider.initialize({'data_dir': str(tmp_path), 'database': 'history.db', 'images': 'images'})
+    return provider
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return _new_storage(tmp_path)
+
+
+def _block_times(storage, record_id):
+    conn = sqlite3.connect(str(storage.db_path))
+    rows = conn.execute(
+        'SELECT block_id, updated_at FROM record_blocks WHERE record_id = ?', (record_id,)
+    ).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+class TestRecordBlocks:
+    """record_blocks 同步测试"""
+
+    def test_save_and_update_only_touch_changed_blocks(self, storage):
+        blocks = [_block('a', '一'), _block('b', '二'), _block('c', '三', isSummary=True)]
+        record_id = storage.save_record('一\n二\n三', {'blocks': blocks})
+        assert [b['block_id'] for b in storage.get_record_blocks(record_id)] == ['a', 'b', 'c']
+        assert [b['block_id'] for b in storage.get_record_blocks(record_id, summary_only=True)] == ['c']
+
+        conn = sqlite3.connect(str(storage.db_path))
+        conn.execute("UPDATE record_blocks SET updated_at = '2000-01-01 00:00:00'")
+        conn.commit()
+        conn.close()
+
+        # 修改 b，删除 c，a 和 d 调换到不同位置
+        new_blocks = [_block('d', '四'), _block('b', '二改'), _block('a', '一')]
+        assert storage.update_record(record_id, '四\n二改\n一', {'blocks': new_blocks})
+
+        result = storage.get_record_blocks(record_id)
+        assert [(b['block_id'], b['position']) for b in result] == [('d', 0), ('b', 1), ('a', 2)]
+        times = _block_times(storage, record_id)
+        assert times['a'] == '2000-01-01 00:00:00'  # 只移动位置
+        assert times['b'] != '2000-01-01 00:00:00'
+        assert 'c' not in times
+
+    def test_search_and_delete_cascade(self, storage):
+        first = storage.save_record('x', {'blocks': [_block('a', '项目周会纪要'), _block('b', '其他')]})
+        second = storage.save_record('y', {'blocks': [_block('a', '周会安排')]})
+
+        hits = storage.search_record_blocks('周会')
+        assert {(h['record_id'], h['block_id']) for h in hits} == {(first, 'a'), (second, 'a')}
+        assert storage.search_record_blocks('100%') == []
+
+        assert storage.delete_record(first)
+        conn = sqlite3.connect(str(storage.db_path))
+        remaining = conn.execute('SELECT DISTINCT record_id FROM record_blocks').fetchall()
+        conn.close()
+        assert remaining == [(second,)]
+
+    def test_migration_backfills_existing_records(self, tmp_path):
+        storage = _new_storage(tmp_path)
+        record_id = storage.save_record('x', {'blocks': [_block('a', '一'), {'type': 'image', 'imageUrl': 'images/p.png'}]})
+
+        # 模拟升级前的数据库：没有块数据，也没有迁移版本
+        conn = sqlite3.connect(str(storage.db_path))
+        conn.execute('DELETE FROM record_blocks')
+        conn.execute("DELETE FROM schema_versions WHERE version = '1.3.0'")
+        conn.commit()
+        conn.close()
+
+        upgraded = _new_storage(tmp_path)
+        blocks = upgraded.get_record_blocks(record_id)
+        assert [b['block_id'] for b in blocks] == ['a', 'pos-1']
+        assert blocks[1]['image_url'] == 'images/p.png'
+        assert blocks[1]['type'] == 'image'
@@ -0,0 +1,204 @@
+"""
+笔记记录索引测试
+验证按水位线增量索引、内容未变时跳过、软删除 / 永久删除后删除向量，以及录音进行中暂停
+"""
+
+import sys
+import sqlite3
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.providers.storage.sqlite import SQLiteStorageProvider
+from src.services.cleanup_service import CleanupService
+from src.services.record_indexer import RecordIndexer, record_text, record_title
+
+
+def _record_ids(collection):
+    return {meta['record_id'] for _, meta in collection.rows.values()}
+
+
+@pytest.fixture
+def make_indexer(tmp_path, make_knowledge_service):
+    """创建存储、知识库服务和索引任务：make_indexer(busy=None)"""
+    def make(busy=None):
+        storage = SQLiteStorageProvider()
+        storage.initialize({'data_dir': str(tmp_path), 'database': 'history.db'})
+        service = make_knowledge_service(DEFAULT_CHUNK_SIZE=50, embed_batch_size=4)
+        indexer = RecordIndexer(storage, service, {'max_chunks_per_second': 0}, is_busy=busy)
+        indexer.busy_poll_seconds = 0.01
+        return storage, service, indexer
+    return make
+
+
+def _note(title, text):
+    return {'app_type': 'voice-note', 'blocks': [
+        {'id': 'info', 'type': 'note-info', 'noteInfo': {'title': title}},
+        {'id': 'b1', 'type': 'paragraph', 'content': text},
+    ]}
+
+
+def _set_updated_at(storage, record_id, value):
+    conn = sqlite3.connect(str(storage.db_path))
+    conn.execute('UPDATE records SET updated_at = ? WHERE id = ?', (value, record_id))
+    conn.commit()
+    conn.close()
+
+
+class TestRecordText:
+    """索引文本与标题"""
+
+    def test_strip_markers(self):
+        record = {'text': '[SUMMARY_BLOCK_START]小结[SUMMARY_BLOCK_END]\n[IMAGE: /api/images/a.png] 白板照片'}
+        assert record_text(record) == '小结\n白板照片'
+
+    def test_title(self):
+        assert record_title({'metadata': _note('周会', '')}) == '周会'
+        assert record_title({'metadata': {}, 'created_at': '2024-05-01 10:20:30'}) == '笔记 2024-05-01 10:20'
+
+
+class TestRecordIndexer:
+    """增量索引"""
+
+    def test_incremental_index_and_delete(self, make_indexer):
+        storage, service, indexer = make_indexer()
+        text = '第一段会议内容。' * 20
+        note_id = storage.save_record(text, _note('周会', text))
+        chat_id = storage.save_record('对话内容', {'app_type': 'smart-chat'})
+
+        assert asyncio.run(indexer.run_once()) == 1
+        collection = service.records_collection
+        assert _record_ids(collection) == {note_id}
+        assert all(meta['title'] == '周会' for _, meta in collection.rows.values())
+        encoded = service.embedding_model.encoded
+        assert encoded == len(collection.rows) > 1
+
+        # 没有变化时不重新计算向量
+        assert asyncio.run(indexer.run_once()) == 0
+        assert service.embedding_model.encoded == encoded
+
+        # 只更新修改时间（如切换收藏）时比较内容哈希，不重新计算
+        _set_updated_at(storage, note_id, '2999-01-01 00:00:00')
+        assert asyncio.run(indexer.run_once()) == 0
+        assert service.embedding_model.encoded == encoded
+
+        # 内容变短：旧的多余文本块被替换
+        storage.update_record(note_id, '新的内容', _note('周会', '新的内容'))
+        _set_updated_at(storage, note_id, '2999-01-01 00:00:01')
+        assert asyncio.run(indexer.run_once()) == 1
+        assert [doc for doc, _ in collection.rows.values()] == ['新的内容']
+
+        # 软删除
+        conn = sqlite3.connect(str(storage.db_path))
+        conn.execute("UPDATE records SET is_deleted = 1, updated_at = '2999-01-01 00:00:02' WHERE id = ?", (note_id,))
+        conn.commit()
+        conn.close()
+        assert asyncio.run(indexer.run_once()) == 1
+        assert collection.rows == {}
+        assert indexer.get_stats()['indexed_records'] == 0
+        assert chat_id not in _record_ids(collection)
+
+    def test_same_second_update_not_missed(self, make_indexer):
+        storage, service, indexer = make_indexer()
+        first = storage.save_record('甲', _note('甲', '甲'))
+        asyncio.run(indexer.run_once())
+        watermark = indexer.state.get_value('watermark')
+
+        # 与水位线同一秒修改、ID 更小的记录
+        second = storage.save_record('乙', _note('乙', '乙'))
+        conn = sqlite3.connect(str(storage.db_path))
+        conn.execute('UPDATE records SET id = ? WHERE id = ?', ('0' + first, second))
+        conn.commit()
+        conn.close()
+        _set_updated_at(storage, '0' + first, watermark)
+
+        asyncio.run(indexer.run_once())
+        assert _record_ids(service.records_collection) == {first, '0' + first}
+
+    def test_permanent_delete(self, make_indexer):
+        storage, service, indexer = make_indexer()
+        ids = [storage.save_record(f'笔记{i}', _note(f'笔记{i}', f'笔记{i}')) for i in range(3)]
+        asyncio.run(indexer.run_once())
+        assert _record_ids(service.records_collection) == set(ids)
+
+        storage.delete_records(ids[:2])
+        assert asyncio.run(indexer.run_once()) == 2
+        assert _record_ids(service.records_collection) == {ids[2]}
+        assert storage.list_record_tombstones() == []
+
+        # 登记表之外删除的记录由对账清理
+        conn = sqlite3.connect(str(storage.db_path))
+        conn.execute('DELETE FROM records WHERE id = ?', (ids[2],))
+        conn.execute('DELETE FROM records_tombstones')
+        conn.commit()
+        conn.close()
+        assert indexer.reconcile() == 1
+        assert service.records_collection.rows == {}
+
+    def test_pause_while_busy(self, make_indexer):
+        state = {'busy': True}
+        storage, service, indexer = make_indexer(busy=lambda: state['busy'])
+        storage.save_record('内容', _note('标题', '内容'))
+
+        async def run():
+            task = asyncio.ensure_future(indexer.run_once())
+            await asyncio.sleep(0.05)
+            assert service.records_collection.rows == {}
+            state['busy'] = False
+            return await task
+
+        assert asyncio.run(run()) == 1
+        assert len(service.records_collection.rows) == 1
+
+    def test_embedding_key_change_rebuilds(self, make_indexer):
+        storage, service, indexer = make_indexer()
+        storage.save_record('内容', _note('标题', '内容'))
+        asyncio.run(indexer.run_once())
+
+        service.embedding_key = 'other-model'
+        assert asyncio.run(indexer.run_once()) == 1
+        assert len(service.records_collection.rows) == 1
+        assert indexer.get_stats()['indexed_records'] == 1
+
+
+class TestTombstoneCleanup:
+    """记录删除登记清理"""
+
+    def test_prunes_old_tombstones(self, tmp_path):
+        storage = SQLiteStorageProvider()
+        storage.initialize({'data_dir': str(tmp_path), 'database': 'history.db'})
+        old_id = storage.save_record('旧', {})
+        new_id = storage.save_record('新', {})
+        storage.delete_records([old_id, new_id])
+        conn = sqlite3.connect(str(storage.db_path))
+        conn.execute("UPDATE records_tombstones SET deleted_at = '2000-01-01 00:00:00' WHERE record_id = ?", (old_id,))
+        conn.commit()
+        conn.close()
+
+        service = CleanupService({'storage': {'data_dir': str(tmp_path), 'database': 'history.db'},
+                                  'cleanup': {'tombstone_retention_days': 7}})
+        assert service._cleanup_record_tombstones() == 1
+        assert [record_id for _, record_id in storage.list_record_tombstones()] == [new_id]
+
+
+class TestRecordSearch:
+    """知识库检索合并笔记记录集合"""
+
+    def test_vector_search_includes_records(self, make_knowledge_service):
+        service = make_knowledge_service(
+            chunks=[('f1_chunk_0', '文件内容', {'file_id': 'f1', 'filename': 'a.md'}, 0.4)],
+            records=[('record_r1_chunk_0', '笔记内容', {'record_id': 'r1', 'title': '周会'}, 0.2)],
+        )
+
+        service.include_records = False
+        assert [r['id'] for r in service._vector_search([0.0], 2, None)] == ['f1_chunk_0']
+
+        service.include_records = True
+        results = service._vector_search([0.0], 2, None)
+        assert [(r['id'], r['source']) for r in results] == [('record_r1_chunk_0', '周会'), ('f1_chunk_0', 'a.md')]
+        # 过滤条件针对上传文件，不检索笔记记录
+        assert [r['id'] for r in service._vector_search([0.0], 2, {'file_id': 'f1'})] == ['f1_chunk_0']
@@ -0,0 +1,157 @@
+"""
+块级增量保存测试
+验证补丁合并、连续编辑合并落库以及全文索引延迟重建
+"""
+
+import sys
+import sqlite3
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.record_patch_service import (
+    RecordPatchService, RecordPatchConflictError, apply_block_patch, blocks_to_text
+)
+from src.providers.storage.sqlite import SQLiteStorageProvider
+
+
+def _block(block_id, content, **extra):
+    return {'id': block_id, 'type': 'paragraph', 'content': content, **extra}
+
+
+class CountingStorage(SQLiteStorageProvider):
+    """统计 update_record 调用次数的存储"""
+
+    def __init__(self):
+        super().__init__()
+        self.update_calls = 0
+
+    def update_record(self, *args, **kwargs):
+        self.update_calls += 1
+        return super().update_record(*args, **kwargs)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    provider = CountingStorage()
+    provider.initialize({'data_dir': str(tmp_path), 'database': 'history.db', 'images': 'images'})
+    return provider
+
+
+class TestApplyBlockPatch:
+    """补丁合并测试"""
+
+    def test_upsert_delete_and_append(self):
+        blocks = [_block('a', '一'), _block('b', '二'), _block('c', '三')]
+        result = apply_block_patch(blocks, upserts=[_block('b', '二改'), _block('d', '四')], deletes=['c'])
+        assert [b['id'] for b in result] == ['a', 'b', 'd']
+        assert result[1]['content'] == '二改'
+        assert blocks[1]['content'] == '二'
+
+    def test_explicit_order(self):
+        blocks = [_block('a', '一'), _block('b', '二')]
+        result = apply_block_patch(blocks, upserts=[_block('c', '三')], order=['c', 'b', 'a'])
+        assert [b['id'] for b in result] == ['c', 'b', 'a']
+
+    def test_order_mismatch_is_conflict(self):
+        with pytest.raises(RecordPatchConflictError):
+            apply_block_patch([_block('a', '一')], order=['a', 'missing'])
+
+    def test_text_matches_frontend_format(self):
+        blocks = [
+            {'id': 'info', 'type': 'note-info', 'noteInfo': {'title': 't'}},
+            _block('a', '正文'),
+            _block('s', '小结', isSummary=True),
+            {'id': 'img', 'type': 'image', 'content': '', 'imageUrl': 'images/x.png', 'imageCaption': '图'},
+            _block('empty', '  '),
+            _block('buf', '', isBufferBlock=True),
+        ]
+        assert blocks_to_text(blocks) == (
+            '正文\n[SUMMARY_BLOCK_START]小结[SUMMARY_BLOCK_END]\n[IMAGE: images/x.png] 图'
+        )
+
+
+class TestRecordPatchService:
+    """增量保存服务测试"""
+
+    def test_rapid_patches_coalesce_into_one_write(self, storage):
+        record_id = storage.save_record('一', {'app_type': 'voice-note', 'blocks': [_block('a', '一')]})
+
+        async def run():
+            service = RecordPatchService(storage, {'autosave': {'debounce_seconds': 0.3, 'fts_idle_seconds': 0.2}})
+            service.tick_seconds = 0.05
+            await service.start()
+            for i in range(10):
+                await service.apply_patch(record_id, upserts=[_block('a', f'一{i}')])
+            await asyncio.sleep(0.1)
+            assert service.has_pending(record_id)
+            await asyncio.sleep(0.8)
+            stats = service.get_stats()
+            await service.stop()
+            return stats
+
+        stats = asyncio.run(run())
+        assert storage.update_calls == 1
+        assert stats['patches_applied'] == 10
+        assert stats['fts_reindexed'] == 1
+
+        record = storage.get_record(record_id)
+        assert record['text'] == '一9'
+        conn = sqlite3.connect(str(storage.db_path))
+        fts_text = conn.execute('SELECT text FROM records_fts WHERE record_id = ?', (record_id,)).fetchone()[0]
+        pending = conn.execute('SELECT COUNT(*) FROM records_fts_pending').fetchone()[0]
+        conn.close()
+        assert fts_text == '一9'
+        assert pending == 0
+
+    def test_stop_flushes_pending_changes(self, storage):
+        record_id = storage.save_record('一', {'blocks': [_block('a', '一')]})
+
+        async def run():
+            service = RecordPatchService(storage, {'autosave': {'debounce_seconds': 60}})
+            await service.start()
+            await service.apply_patch(record_id, upserts=[_block('b', '二')], metadata={'noteInfo': {'title': '标题'}})
+            await service.stop()
+
+        asyncio.run(run())
+        record = storage.get_record(record_id)
+        assert [b['id'] for b in record['metadata']['blocks']] == ['a', 'b']
+        assert record['metadata']['noteInfo'] == {'title': '标题'}
+        assert record['text'] == '一\n二'
+
+    def test_bad_record_does_not_stop_autosave(self, storage):
+        bad_id = storage.save_record('一', {'blocks': [_block('a', '一')]})
+        good_id = storage.save_record('二', {'blocks': [_block('a', '二')]})
+
+        async def run():
+            service = RecordPatchService(storage, {'autosave': {'debounce_seconds': 0.05}})
+            service.tick_seconds = 0.05
+            service.retry_initial_seconds = 0.2
+            await service.start()
+            # 内容不是字符串，生成文本时出错
+            await service.apply_patch(bad_id, upserts=[_block('a', 123)])
+            await asyncio.sleep(0.2)
+            await service.apply_patch(good_id, upserts=[_block('a', '二改')])
+            await asyncio.sleep(0.5)
+            running = not service._task.done()
+            saved = not service.has_pending(good_id)
+            # 失败的记录按退避重试（0.2s、0.4s…），而不是每个 tick 都重试
+            failures = service._documents[bad_id].failures
+            stats = service.get_stats()
+            await service.stop()
+            return running, saved, failures, stats
+
+        running, saved, failures, stats = asyncio.run(run())
+        assert running and saved
+        assert 2 <= failures <= 3
+        assert stats['failing'] == 1 and stats['pending'] == 1
+        assert storage.get_record(good_id)['text'] == '二改'
+
+    def test_missing_record(self, storage):
+        service = RecordPatchService(storage)
+        with pytest.raises(KeyError):
+            asyncio.run(service.apply_patch('missing', upserts=[_block('a', '一')]))
@@ -0,0 +1,115 @@
+"""
+检索重排测试
+验证交叉编码器打分后的排序与阈值过滤、(查询, 文本块) 分数缓存，以及知识库检索多召回候选后重排
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.reranker import Reranker
+
+
+class FakeCrossEncoder:
+    """模拟交叉编码器：文本块包含查询中的词越多分数越高"""
+
+    def __init__(self):
+        self.pairs = 0
+        self.batch_sizes = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.pairs += len(pairs)
+        self.batch_sizes.append(batch_size)
+        return [sum(word in doc for word in query.split()) / len(query.split()) for query, doc in pairs]
+
+
+def _reranker(**kwargs):
+    reranker = Reranker(**kwargs)
+    reranker.model = FakeCrossEncoder()
+    return reranker
+
+
+def _result(chunk_id, content, score):
+    return {'id': chunk_id, 'content': content, 'score': score, 'source': 'a.md', 'metadata': {}}
+
+
+class TestReranker:
+    """重排与分数缓存"""
+
+    def test_order_and_threshold(self):
+        reranker = _reranker(min_score=0.5, batch_size=8)
+        results = [
+            _result('weak', '无关内容', 0.9),
+            _result('half', '预算 说明', 0.8),
+            _result('full', '预算 续航 说明', 0.7),
+        ]
+        reranked = reranker.rerank('预算 续航', results, top_k=3)
+        assert [(r['id'], r['score'], r['retrieval_score']) for r in reranked] == [
+            ('full', 1.0, 0.7), ('half', 0.5, 0.8)
+        ]
+        assert reranker.get_stats()['dropped'] == 1
+        assert reranker.model.batch_sizes == [8]
+        assert reranker.rerank('预算 续航', results, top_k=1)[0]['id'] == 'full'
+        assert reranker.rerank('预算', [], top_k=3) == []
+
+    def test_score_cache(self):
+        reranker = _reranker(cache_size=2)
+        docs = ['预算 说明', '续航 说明']
+        first = reranker.score('预算 续航', docs)
+        assert reranker.model.pairs == 2
+
+        # 规范化后相同的查询命中缓存
+        assert reranker.score(' 预算 续航？', docs) == first
+        assert reranker.model.pairs == 2
+        assert reranker.get_stats()['cache_hits'] == 2
+
+        # 只对新文本块打分，超出容量时淘汰最早的条目
+        reranker.score('预算 续航', docs + ['新的 预算'])
+        assert reranker.model.pairs == 3
+        assert reranker.get_stats()['cache_entries'] == 2
+
+    def test_fetch_size(self):
+        reranker = _reranker(candidates=4, min_candidates=20)
+        assert reranker.fetch_size(3) == 20
+        assert reranker.fetch_size(10) == 40
+
+
+CHUNKS = [
+    ('c1', '项目 介绍', {'filename': 'a.md'}, 0.1),
+    ('c2', '预算 一百万', {'filename': 'a.md'}, 0.2),
+    ('c3', '续航 二十小时', {'filename': 'a.md'}, 0.3),
+    ('c4', '预算 明细 续航', {'filename': 'a.md'}, 0.4),
+]
+
+
+class TestRerankedSearch:
+    """知识库检索的第二阶段"""
+
+    def test_overfetch_and_filter(self, make_knowledge_service):
+        service = make_knowledge_service(chunks=CHUNKS,
+                                         reranker=_reranker(min_score=0.5, candidates=2, min_candidates=4))
+        results = asyncio.run(service.search('预算 续航', top_k=2))
+        assert service.collection.requested == [4]
+        assert [r['id'] for r in results] == ['c4', 'c2']
+        assert results[0]['retrieval_score'] == 0.6
+
+        # 关闭重排时按第一阶段返回 top_k
+        plain = asyncio.run(service.search('预算 续航', top_k=2, rerank=False))
+        assert [r['id'] for r in plain] == ['c1', 'c2']
+        assert service.collection.requested[-1] == 2
+
+        # 没有相关文本块时返回空列表
+        assert asyncio.run(service.search('天气', top_k=2)) == []
+
+    def test_fallback_on_error(self, make_knowledge_service):
+        reranker = _reranker()
+
+        def broken(pairs, **kwargs):
+            raise RuntimeError('model error')
+        reranker.model.predict = broken
+        service = make_knowledge_service(chunks=CHUNKS, reranker=reranker)
+        results = asyncio.run(service.search('预算', top_k=2))
+        assert [r['id'] for r in results] == ['c1', 'c2']
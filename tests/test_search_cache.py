@@ -0,0 +1,68 @@
+"""
+知识库检索缓存测试
+验证查询规范化、LRU 淘汰、结果 TTL 与语料代数失效
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.search_cache import SearchCache, normalize_query
+
+
+class TestSearchCache:
+    """检索缓存"""
+
+    def test_normalized_query_embedding_lru(self):
+        assert normalize_query('  项目的  预算是多少？ ') == normalize_query('项目的 预算是多少')
+        assert normalize_query('What is RAG?') == 'what is rag'
+
+        cache = SearchCache(max_queries=2)
+        cache.put_embedding('m', 'What is RAG?', [0.1, 0.2], cost_ms=30)
+        assert cache.get_embedding('m', 'what is  rag') == [0.1, 0.2]
+        assert cache.get_embedding('other', 'what is rag') is None
+
+        cache.put_embedding('m', 'b', [1.0])
+        cache.put_embedding('m', 'c', [2.0])
+        # 'What is RAG?' 最近被访问过，但之后又插入两条，超出上限被淘汰
+        assert cache.get_embedding('m', 'What is RAG?') is None
+        assert cache.get_embedding('m', 'c') == [2.0]
+
+        stats = cache.get_stats()
+        assert stats['embedding_hits'] == 2 and stats['embedding_misses'] == 2
+        assert stats['saved_ms'] == 30
+
+    def test_results_ttl_and_generation(self):
+        cache = SearchCache(result_ttl_seconds=0.05)
+        results = [{'id': 'c1', 'content': '预算为十万元', 'score': 0.9}]
+        cache.put_results([0.1, 0.2], 3, {'file_id': 'f1'}, results, cost_ms=12)
+
+        hit = cache.get_results([0.1, 0.2], 3, {'file_id': 'f1'})
+        assert hit == results
+        hit[0]['score'] = 0.0
+        assert cache.get_results([0.1, 0.2], 3, {'file_id': 'f1'})[0]['score'] == 0.9
+        assert cache.get_results([0.1, 0.2], 5, {'file_id': 'f1'}) is None
+        assert cache.get_results([0.1, 0.2], 3) is None
+
+        cache.invalidate()
+        assert cache.get_results([0.1, 0.2], 3, {'file_id': 'f1'}) is None
+        assert cache.generation == 1
+
+        cache.put_results([0.1, 0.2], 3, None, results)
+        time.sleep(0.08)
+        assert cache.get_results([0.1, 0.2], 3) is None
+        assert cache.get_stats()['result_hits'] == 2
+
+    def test_results_from_before_invalidate_not_cached(self):
+        cache = SearchCache()
+        generation = cache.generation
+        # 检索进行中语料发生变化（导入 / 删除）
+        cache.invalidate()
+        cache.put_results([0.1], 3, None, [{'id': 'old'}], generation=generation)
+        assert cache.get_results([0.1], 3) is None
+
+        cache.put_results([0.1], 3, None, [{'id': 'new'}], generation=cache.generation)
+        assert cache.get_results([0.1], 3) == [{'id': 'new'}]
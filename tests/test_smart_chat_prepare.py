@@ -0,0 +1,103 @@
+"""
+SmartChat LLM 调用前阶段测试
+验证检索判定规则、跳过检索、分阶段耗时记录，以及复用已完成的准备结果
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.agents.retrieval_gate import classify_retrieval
+from src.agents.smart_chat_agent import SmartChatAgent
+
+
+class MockKnowledge:
+    """模拟知识库：记录查询次数"""
+
+    def __init__(self):
+        self.queries = []
+
+    async def search(self, query, top_k=3):
+        self.queries.append(query)
+        await asyncio.sleep(0.02)
+        return [{'source': 'doc', 'content': '预算为十万元', 'score': 0.9}]
+
+
+@pytest.fixture
+def make_agent(mock_llm_service, mock_llm_provider):
+    """创建 SmartChatAgent 与模拟知识库：make_agent(**config)"""
+    def make(**config):
+        service = mock_llm_service(mock_llm_provider(first_token_delay=0.01))
+        knowledge = MockKnowledge()
+        return SmartChatAgent(service, knowledge_service=knowledge, config=config), knowledge
+    return make
+
+
+class TestRetrievalGate:
+    """检索判定规则"""
+
+    def test_classify(self):
+        assert classify_retrieval('你好！') == (False, 'small_talk')
+        assert classify_retrieval('Thanks!') == (False, 'small_talk')
+        assert classify_retrieval('继续') == (False, 'follow_up')
+        assert classify_retrieval('翻译一下上面的内容') == (False, 'follow_up')
+        assert classify_retrieval('嗯，行') == (False, 'too_short')
+        assert classify_retrieval('预算多少？')[0]
+        assert classify_retrieval('项目的预算是多少')[0]
+        assert classify_retrieval('What is RAG')[0]
+
+    def test_gate_skips_retrieval(self, make_agent):
+        agent, knowledge = make_agent(retrieval_gate=True)
+
+        async def run():
+            skipped = await agent.prepare_context('谢谢')
+            used = await agent.prepare_context('项目的预算是多少？')
+            return skipped, used
+
+        skipped, used = asyncio.run(run())
+        assert skipped.retrieval == 'skipped:small_talk' and skipped.knowledge == []
+        assert used.retrieval == 'used' and '预算为十万元' in used.context.prompt
+        assert knowledge.queries == ['项目的预算是多少？']
+
+    def test_gate_disabled_by_default(self, make_agent):
+        agent, knowledge = make_agent()
+        prepared = asyncio.run(agent.prepare_context('谢谢'))
+        assert prepared.retrieval == 'used'
+        assert knowledge.queries == ['谢谢']
+
+
+class TestStageTimings:
+    """分阶段耗时"""
+
+    def test_non_stream_timings(self, make_agent):
+        agent, _ = make_agent()
+
+        async def run():
+            await agent.chat('第一个问题', use_knowledge=False)
+            return await agent.chat('项目的预算是多少？')
+
+        assert asyncio.run(run()) == '回答'
+        timings = agent.last_timings
+        for stage in ('preprocess', 'retrieval', 'history', 'context', 'pre_llm', 'llm', 'elapsed'):
+            assert stage in timings
+        assert timings['retrieval'] >= 15
+        assert timings['pre_llm'] <= timings['elapsed']
+
+    def test_stream_first_token_and_prepared_reuse(self, make_agent):
+        agent, knowledge = make_agent()
+
+        async def run():
+            prepared = await agent.prepare_context('项目的预算是多少？')
+            result = await agent.chat('项目的预算是多少？', stream=True, prepared=prepared)
+            return ''.join([chunk async for chunk in result])
+
+        assert asyncio.run(run()) == '回答'
+        # 准备结果被复用，不会重复检索
+        assert len(knowledge.queries) == 1
+        assert agent.last_timings['first_token'] >= 10
+        assert len(agent.conversation_history) == 2
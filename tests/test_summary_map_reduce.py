@@ -0,0 +1,123 @@
+"""
+长文本分段汇总测试
+验证按段落切分、并发提炼、进度事件，以及编辑后只重新处理改动的分段
+"""
+
+import sys
+import random
+import asyncio
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.agents.summary_agent import SummaryAgent
+
+
+class MapReduceReply:
+    """分段请求随机延迟后返回首行要点，汇总请求返回固定小结"""
+
+    def __init__(self):
+        self.map_calls = []
+        self.reduce_inputs = []
+
+    async def __call__(self, messages):
+        content = messages[-1]['content']
+        if '连续片段' in messages[0]['content']:
+            self.map_calls.append(content)
+            await asyncio.sleep(random.uniform(0, 0.01))
+            return f"要点:{content.splitlines()[0][:8]}"
+        self.reduce_inputs.append(content)
+        return '小结'
+
+
+def _note(n, edited=None):
+    lines = [f"第{i:03d}段发言，讨论项目进度和下一步计划安排。" for i in range(n)]
+    if edited is not None:
+        lines[edited] = f"第{edited:03d}段发言，改为讨论预算问题。"
+    return '\n'.join(lines)
+
+
+@pytest.fixture
+def make_agent(tmp_path, mock_llm_service, mock_llm_provider):
+    """创建开启响应缓存的 SummaryAgent：make_agent(**config)，返回 (agent, 回复记录, LLMService)"""
+    def make(**config):
+        reply = MapReduceReply()
+        service = mock_llm_service(mock_llm_provider(reply=reply), {
+            'storage.data_dir': str(tmp_path),
+            'llm_cache': {'enabled': True},
+            'llm.model': 'test-model',
+        })
+        agent_config = {'map_reduce_threshold_tokens': 300, 'chunk_max_tokens': 150, 'map_concurrency': 3, **config}
+        return SummaryAgent(service, config=agent_config), reply, service
+    return make
+
+
+class TestSplitChunks:
+    """分段测试"""
+
+    def test_chunks_respect_boundaries_and_budget(self, make_agent):
+        agent, _, _ = make_agent()
+        text = _note(60)
+        chunks = agent.split_chunks(text)
+        assert len(chunks) > 1
+        # 不会切断段落，拼接后与原文一致
+        assert '\n'.join(chunks) == text
+        # 超长段落按句切分
+        long_line = '很长的一句话。' * 200
+        long_chunks = agent.split_chunks(long_line)
+        assert len(long_chunks) > 1
+        assert ''.join(long_chunks).replace('\n', '') == long_line
+
+    def test_edit_only_changes_nearby_chunks(self, make_agent):
+        agent, _, _ = make_agent()
+        before = agent.split_chunks(_note(120))
+        after = agent.split_chunks(_note(120, edited=60))
+        changed = set(after) - set(before)
+        assert len(before) >= 10
+        assert 1 <= len(changed) <= 3
+
+
+class TestMapReduce:
+    """分段汇总测试"""
+
+    def test_short_text_uses_single_call(self, make_agent):
+        agent, reply, _ = make_agent()
+        assert asyncio.run(agent.generate_summary(_note(3))) == '小结'
+        assert reply.map_calls == []
+
+    def test_progress_events_and_usage(self, make_agent):
+        agent, reply, service = make_agent()
+
+        async def run():
+            with service.track_usage() as usage:
+                events = [event async for event in agent.generate_summary_events(_note(60), cache=True)]
+            return events, usage
+
+        events, usage = asyncio.run(run())
+        progress = [e['progress'] for e in events if 'progress' in e]
+        chunks = len(reply.map_calls)
+        assert progress[0] == {'stage': 'split', 'level': 1, 'total': chunks}
+        assert [p['done'] for p in progress if p['stage'] == 'map'] == list(range(1, chunks + 1))
+        assert progress[-1]['stage'] == 'reduce'
+        assert ''.join(e['chunk'] for e in events if 'chunk' in e) == '小结'
+        assert 1 < service.llm_provider.max_in_flight <= 3
+        # 分段提炼与汇总的用量都计入本次请求
+        assert usage.calls == chunks + 1
+        assert '要点:第000段' in reply.reduce_inputs[0]
+
+    def test_resummarize_reuses_unchanged_chunks(self, make_agent):
+        agent, reply, _ = make_agent()
+        asyncio.run(agent.generate_summary(_note(120)))
+        first = len(reply.map_calls)
+
+        async def collect():
+            return [e['progress'] async for e in agent.generate_summary_events(_note(120, edited=60))
+                    if 'progress' in e]
+
+        progress = asyncio.run(collect())
+        recomputed = len(reply.map_calls) - first
+        assert 1 <= recomputed <= 3
+        assert sum(1 for p in progress if p.get('cached')) >= first - 3
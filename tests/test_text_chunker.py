@@ -0,0 +1,150 @@
+"""
+句子分块器测试
+用随机生成的中英文 / Markdown 文本验证分块性质：片段边界不影响结果、块大小不超限、
+块是原文的连续片段且覆盖全部内容、相邻块按句子重叠、标题开始新块
+"""
+
+import sys
+import random
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.text_chunker import estimate_tokens, iter_chunks, iter_sentences
+
+_ZH = ['今天讨论了项目{n}预算。', '进度比计划慢了{n}周！', '需要增加{n}名测试人员吗？', '结论{n}：下周再评审；',
+       '他说：“先做原型{n}。”', '版本号是 3.{n}，不要切开。', '会议记录{n}如下……']
+_EN = ['Budget {n} was approved. ', 'Is schedule {n} realistic? ', 'Ship {n}! ',
+       'See e.g. section 3.{n} for details. ', 'He said "ok {n}." ', 'Visit example{n}.com today; ']
+
+
+def _random_text(rng: random.Random, paragraphs: int = 30) -> str:
+    """随机文本（每个句子带序号，块在原文中的位置唯一）"""
+    counter = iter(range(10 ** 6))
+    parts = []
+    for _ in range(paragraphs):
+        kind = rng.random()
+        if kind < 0.15:
+            parts.append('#' * rng.randint(1, 3) + f' 第{next(counter)}节\n')
+        elif kind < 0.25:
+            parts.append('- ' + rng.choice(_ZH).format(n=next(counter)) + '\n')
+        elif kind < 0.3:
+            # 没有标点的长句
+            n = next(counter)
+            if rng.random() < 0.5:
+                parts.append(''.join(chr(0x4e00 + (n * 300 + k) % 20000) for k in range(300)) + '\n')
+            else:
+                parts.append(' '.join(f'w{n}x{k}' for k in range(300)) + '\n')
+        else:
+            pool = _ZH if rng.random() < 0.5 else _EN
+            sentences = ''.join(rng.choice(pool).format(n=next(counter)) for _ in range(rng.randint(1, 8)))
+            parts.append(sentences + rng.choice(['\n', '\n\n', '']))
+    return ''.join(parts)
+
+
+def _random_pieces(rng: random.Random, text: str):
+    pieces, pos = [], 0
+    while pos < len(text):
+        size = rng.randint(1, 120)
+        pieces.append(text[pos:pos + size])
+        pos += size
+    return pieces
+
+
+def _locate(text, chunks):
+    """定位每个块在原文中的位置（块按顺序出现，允许与前一块重叠）"""
+    spans, search_from = [], 0
+    for chunk in chunks:
+        start = text.find(chunk, search_from)
+        assert start != -1, chunk
+        spans.append((start, start + len(chunk)))
+        search_from = start + 1
+    return spans
+
+
+class TestSentences:
+    """切句"""
+
+    def test_boundaries(self):
+        text = '第一句。第二句！“第三句？”Next one. Version 3.14 stays. 末尾'
+        assert list(iter_sentences([text])) == [
+            '第一句。', '第二句！', '“第三句？”', 'Next one.', ' Version 3.14 stays.', ' 末尾'
+        ]
+
+    def test_pieces_and_join(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            text = _random_text(rng)
+            sentences = list(iter_sentences([text], max_chars=200))
+            assert ''.join(sentences) == text
+            assert list(iter_sentences(_random_pieces(rng, text), max_chars=200)) == sentences
+            assert all(len(s) <= 200 for s in sentences)
+
+
+class TestChunkProperties:
+    """分块性质（随机输入）"""
+
+    def test_properties(self):
+        rng = random.Random(2024)
+        for _ in range(200):
+            text = _random_text(rng, paragraphs=rng.randint(1, 60))
+            chunk_size = rng.choice([16, 40, 100, 200])
+            overlap = rng.choice([0, 1, 2])
+            chunks = list(iter_chunks([text], chunk_size, overlap))
+
+            # 片段边界不影响结果
+            assert list(iter_chunks(_random_pieces(rng, text), chunk_size, overlap)) == chunks
+
+            # 块大小不超过 chunk_size，且没有空块
+            assert all(chunk and chunk == chunk.strip() for chunk in chunks)
+            assert all(estimate_tokens(chunk) <= chunk_size for chunk in chunks)
+
+            # 块是原文的连续片段，依次推进，覆盖全部非空白字符
+            spans = _locate(text, chunks)
+            covered = [False] * len(text)
+            for (start, end), (prev_start, _) in zip(spans[1:], spans):
+                assert start > prev_start
+            for start, end in spans:
+                covered[start:end] = [True] * (end - start)
+            assert all(covered[i] or text[i].isspace() for i in range(len(text)))
+
+            # 不重叠时块之间没有重复内容
+            if overlap == 0:
+                assert all(start >= prev_end for (start, _), (_, prev_end) in zip(spans[1:], spans))
+
+    def test_sentence_overlap(self):
+        text = ''.join(f'这是第{i}句话。' for i in range(40))
+        chunks = list(iter_chunks([text], 30, 1))
+        assert len(chunks) > 3
+        for prev, chunk in zip(chunks, chunks[1:]):
+            last_sentence = prev[prev.rindex('第'):]
+            assert chunk.startswith('这是' + last_sentence)
+            assert chunk.endswith('。')
+
+    def test_headings_start_chunks(self):
+        text = '# 概述\n项目背景介绍。\n## 预算\n预算一百万。\n### 明细\n人员五十万。\n'
+        chunks = list(iter_chunks([text], 200, 1))
+        assert chunks == ['# 概述\n项目背景介绍。', '## 预算\n预算一百万。', '### 明细\n人员五十万。']
+        # 连续标题不会单独成块
+        assert list(iter_chunks(['# 一\n## 二\n内容。'], 200, 1)) == ['# 一\n## 二\n内容。']
+        # 行内的 # 不是标题
+        assert list(iter_chunks(['编号 # 1。下一句。'], 200, 1)) == ['编号 # 1。下一句。']
+
+    def test_long_sentence_split(self):
+        text = 'alpha beta, ' * 200
+        chunks = list(iter_chunks([text], 50, 1))
+        assert all(estimate_tokens(chunk) <= 50 for chunk in chunks)
+        assert all(chunk.endswith(',') or chunk == chunks[-1] for chunk in chunks)
+        assert ''.join(chunks).replace(' ', '') == text.replace(' ', '')
+
+    def test_edge_cases(self):
+        assert list(iter_chunks(['短文本'])) == ['短文本']
+        assert list(iter_chunks(['', '  \n\n '])) == []
+        assert list(iter_chunks(['字' * 10], 1, 1)) == ['字'] * 10
+
+    def test_budget_matches_context_builder(self):
+        # 分块预算与上下文预算使用同一估算
+        from src.agents.context_builder import estimate_tokens as context_estimate
+        assert estimate_tokens is context_estimate
+        assert estimate_tokens('预算 budget。') == 5